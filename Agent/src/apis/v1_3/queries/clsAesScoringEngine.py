@@ -0,0 +1,211 @@
+"""
+WHAT: In-process Advanced Explanation System (AES) evidence scoring, see the AES/*.md design documents
+WHY: send_to_aes used to POST the whole response to the remote AES service on the request critical path. The scoring itself is a cosine similarity
+     between Boolean feature vectors of the KP answers and of the AES-derived answers, which is cheap to compute locally in one batched matrix product.
+ASSUMES: Every feature set is stored in modConfig.aesDataFolder as two files:
+         <name>.npy:  uint8 array of the Boolean feature matrix packed with np.packbits(axis=1), one row per entity
+         <name>.json: {"feature_count": int, "rows": [entity id of every row], "answers": {query id: [AES-derived answer ids]}}
+         KP answer ids are matched to rows as-is, no node normalization is done.
+         Nothing in this repository produces these files: the AES-derived answers and feature matrices are built by the AES service (see AES/*.md).
+         Until they are exported to modConfig.aesDataFolder no feature set is loaded, and every query is sent to the remote AES service.
+FUTURE IMPROVEMENTS: Export the feature sets from the AES service, normalize KP answer ids before matching them to feature rows
+WHO: TZ 2023-03-16, TZ 2023-04-03
+"""
+
+import json
+import logging
+import os
+import threading
+import numpy as np
+import modConfig
+
+
+class clsAesFeatureSet:
+    """
+    A bit-packed Boolean feature matrix (e.g. HPO x MONDO, protein x GO or 5217 bit chemical fingerprints) and the AES-derived answers of each query id
+    """
+
+    def __init__(self, name: str, row_ids: list, packed_features: np.ndarray, feature_count: int, answers: dict):
+        """
+        Constructor
+        :param name: Feature set name
+        :param row_ids: Entity id of every matrix row
+        :param packed_features: uint8 array, rows packed with np.packbits(axis=1)
+        :param feature_count: Number of features (columns) before packing
+        :param answers: Dictionary of query id -> list of AES-derived answer ids
+        """
+        self.name = name
+        self.row_ids = row_ids
+        self.row_index = {row_id: i for i, row_id in enumerate(row_ids)}
+        self.packed_features = packed_features
+        self.feature_count = feature_count
+        self.answers = answers
+
+    @classmethod
+    def from_folder(cls, folder: str, name: str):
+        """
+        Loads a feature set, memory mapping the packed matrix so only the rows that are used are read
+        :param folder: Folder containing <name>.npy and <name>.json
+        :param name: Feature set name
+        :return: clsAesFeatureSet
+        """
+        with open(os.path.join(folder, f"{name}.json")) as file:
+            description = json.load(file)
+        packed_features = np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r")
+        return cls(name=name, row_ids=description["rows"], packed_features=packed_features, feature_count=description["feature_count"],
+                   answers=description.get("answers", {}))
+
+    def features(self, ids: list):
+        """
+        Unpacks the feature rows of the ids that are present in the matrix
+        :param ids: Entity ids
+        :return: Tuple of the found ids and a float32 matrix with one row per found id
+        """
+        found_ids = [entity_id for entity_id in dict.fromkeys(ids) if entity_id in self.row_index]
+        rows = [self.row_index[entity_id] for entity_id in found_ids]
+        unpacked = np.unpackbits(self.packed_features[rows], axis=1)[:, :self.feature_count]
+        return found_ids, unpacked.astype(np.float32)
+
+    def reference_answers(self, query_ids: list) -> list:
+        """
+        AES-derived answers of the query ids
+        :param query_ids: Ids of the query graph input node
+        :return: List of answer ids
+        """
+        return [answer for query_id in query_ids for answer in self.answers.get(query_id, [])]
+
+    def score(self, candidate_ids: list, reference_ids: list) -> dict:
+        """
+        Average cosine similarity of every candidate against all reference answers, computed with one matrix product
+        :param candidate_ids: KP answer ids
+        :param reference_ids: AES-derived answer ids
+        :return: Dictionary of candidate id -> score, only for candidates present in the matrix
+        """
+        found_candidates, candidates = self.features(candidate_ids)
+        _, references = self.features(reference_ids)
+        if len(found_candidates) == 0 or len(references) == 0:
+            return {}
+
+        candidate_norms = np.sqrt(candidates.sum(axis=1))
+        reference_norms = np.sqrt(references.sum(axis=1))
+        # Boolean vectors: the dot product is the number of shared features
+        shared = candidates @ references.T
+        norms = np.outer(candidate_norms, reference_norms)
+        cosine = np.divide(shared, norms, out=np.zeros_like(shared), where=norms > 0)
+        return dict(zip(found_candidates, cosine.mean(axis=1).tolist()))
+
+
+class clsAesScoringEngine:
+    """
+    See header
+    """
+    attribute_type_id = "biolink:aes_evidence_score"
+
+    # (query subject category, query object category) -> feature set scoring the object answers, as described in AES/*.md
+    workflows = {
+        ("biolink:Disease", "biolink:PhenotypicFeature"): "disease_phenotype",
+        ("biolink:PhenotypicFeature", "biolink:Protein"): "phenotype_protein",
+        ("biolink:Protein", "biolink:ChemicalEntity"): "protein_chemical",
+        ("biolink:Protein", "biolink:SmallMolecule"): "protein_chemical",
+        ("biolink:Protein", "biolink:Drug"): "protein_chemical",
+    }
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, feature_sets: dict):
+        """
+        Constructor
+        :param feature_sets: Dictionary of feature set name -> clsAesFeatureSet
+        """
+        self.feature_sets = feature_sets
+
+    @classmethod
+    def from_folder(cls, folder: str):
+        """
+        Loads every feature set of the workflows that exists in the folder
+        :param folder: Folder with the AES feature sets, may be missing or None
+        :return: clsAesScoringEngine
+        """
+        feature_sets = {}
+        if folder and os.path.isdir(folder):
+            for name in set(cls.workflows.values()):
+                if os.path.exists(os.path.join(folder, f"{name}.npy")):
+                    feature_sets[name] = clsAesFeatureSet.from_folder(folder, name)
+        logging.debug(f"Loaded AES feature sets {sorted(feature_sets)} from '{folder}'")
+        return cls(feature_sets)
+
+    @classmethod
+    def instance(cls):
+        """
+        Returns the process-wide engine, loading modConfig.aesDataFolder on first use
+        :return: clsAesScoringEngine
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls.from_folder(modConfig.aesDataFolder)
+        return cls._instance
+
+    def find_workflow(self, query_graph: dict):
+        """
+        Finds the first query edge with a locally available feature set
+        :param query_graph: TRAPI query graph
+        :return: Tuple of (query edge id, subject query node id, object query node id, feature set), or None
+        """
+        nodes = query_graph.get("nodes", {})
+        for edge_id, edge in query_graph.get("edges", {}).items():
+            subject_categories = nodes.get(edge["subject"], {}).get("categories") or []
+            object_categories = nodes.get(edge["object"], {}).get("categories") or []
+            for subject_category in subject_categories:
+                for object_category in object_categories:
+                    feature_set = self.feature_sets.get(self.workflows.get((subject_category, object_category)))
+                    if feature_set is not None:
+                        return edge_id, edge["subject"], edge["object"], feature_set
+        return None
+
+    def create_attribute(self, score: float) -> dict:
+        return {
+            "attribute_type_id": self.attribute_type_id,
+            "value": score,
+            "value_type_id": "EDAM:data_1772",
+            "original_attribute_name": "aes_evidence_score",
+            "description": "Average cosine similarity between the features of this answer and the features of the AES-derived answers",
+        }
+
+    def score_response(self, query_graph: dict, knowledge_graph: dict, results: list) -> bool:
+        """
+        Adds an AES evidence score attribute to the knowledge graph edge and the edge binding of every result whose answer is in the feature matrix
+        :param query_graph: TRAPI query graph
+        :param knowledge_graph: TRAPI knowledge graph, edited in place
+        :param results: TRAPI results, edited in place
+        :return: True if the query was scored locally, False if there is no local data for it
+        """
+        workflow = self.find_workflow(query_graph)
+        if workflow is None:
+            return False
+        edge_id, subject_node_id, object_node_id, feature_set = workflow
+
+        query_ids = query_graph["nodes"][subject_node_id].get("ids") or []
+        reference_ids = feature_set.reference_answers(query_ids)
+        if len(reference_ids) == 0:
+            return False
+
+        answer_ids = [binding["id"] for result in results for binding in result.get("node_bindings", {}).get(object_node_id, [])]
+        scores = feature_set.score(answer_ids, reference_ids)
+
+        kg_edges = knowledge_graph.get("edges", {})
+        scored_kg_edges = set()
+        for result in results:
+            result_scores = [scores[binding["id"]] for binding in result.get("node_bindings", {}).get(object_node_id, []) if binding["id"] in scores]
+            if not result_scores:
+                continue
+            score = max(result_scores)
+            for edge_binding in result.get("edge_bindings", {}).get(edge_id, []):
+                # attribute lists may be shared between results (see modTrapiCopy), so they are replaced rather than appended to
+                edge_binding["attributes"] = (edge_binding.get("attributes") or []) + [self.create_attribute(score)]
+                kg_edge = kg_edges.get(edge_binding["id"])
+                if kg_edge is not None and edge_binding["id"] not in scored_kg_edges:
+                    kg_edge["attributes"] = (kg_edge.get("attributes") or []) + [self.create_attribute(score)]
+                    scored_kg_edges.add(edge_binding["id"])
+        return True
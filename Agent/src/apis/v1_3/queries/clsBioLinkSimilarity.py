@@ -8,12 +8,14 @@ WHO: YR 2021-08-13
 
 from modDatabase import db
 from .clsKnowledgeType import clsKnowledgeType
+from .clsLocalSimilarityStore import clsLocalSimilarityStore
 from bmt import Toolkit
 import logging
 from time import time
 import pandas as pd
 import numpy as np
 import os
+import modConfig
 from typing import List
 
 # t = Toolkit()
@@ -33,26 +35,44 @@ class clsBiolinkSimilarity:
             and x."Node_2"=:node2
         """
 
-    sqlGetAllNodeSimilarityScore = \
+    sqlGetPrecomputedGlobalSimilarityVersion = \
         """
         select
-            x."NEW_CASE_NODE",
-            x."CANDIDATE_CASE_NODE",
-            x."SIMILARITY_SCORE"
-            from "xARA_LocalSimNodes" x
+            v."VERSION",
+            v."MIN_THRESHOLD",
+            v."SUBJECT_NODE_WEIGHT",
+            v."OBJECT_NODE_WEIGHT",
+            v."PREDICATE_WEIGHT",
+            v."LOCAL_SIM_FINGERPRINT"
+            from "xARA_GlobalSimilarityVersion" v
+            order by v."VERSION" desc
+            limit 1
         """
 
-    sqlGetAllPredicateSimilarityScore = \
+    # no row when the triplet isn't precomputed, one row with a null CASE_ID when none of its cases reach the threshold
+    sqlGetPrecomputedGlobalSimilarity = \
         """
         select
-            x."NEW_CASE_PREDICATE",
-            x."CANDIDATE_CASE_PREDICATE",
-            x."SIMILARITY_SCORE"
-            from "xARA_LocalSimPredicates" x
+            t."VERSION",
+            g."CASE_ID",
+            g."GLOBAL_SIM"
+            from "xARA_GlobalSimilarityTriplets" t
+            left join "xARA_GlobalSimilarity" g
+            on g."SUBJECT"=t."SUBJECT"
+            and g."PREDICATE"=t."PREDICATE"
+            and g."OBJECT"=t."OBJECT"
+            and g."GLOBAL_SIM">=:threshold
+            where
+            t."SUBJECT"=:subject
+            and t."PREDICATE"=:predicate
+            and t."OBJECT"=:object
         """
 
     timeoutSeconds = 60
 
+    # False once the precomputed global similarity tables turned out to be missing, so they aren't queried again by this process
+    precomputed_tables_available = True
+
     def __init__(self, _app):
         """
         Constructor
@@ -62,6 +82,8 @@ class clsBiolinkSimilarity:
 
         self.node_similarities = None
         self.predicate_similarities = None
+        # the shared local similarity snapshot used for the lifetime of this object
+        self.similarity_snapshot = None
 
         self.logs = None
 
@@ -88,43 +110,42 @@ class clsBiolinkSimilarity:
             cls._instance = cls.__new__(cls, None)
         return cls._instance
 
-    def cache_node_similarity(self):
+    def get_similarity_snapshot(self):
+        """
+        Retrieves the process-wide local similarity snapshot (see clsLocalSimilarityStore). The snapshot is kept for the lifetime of this object so the node
+        and predicate similarities always come from the same load.
+        :return: clsLocalSimilaritySnapshot
         """
-        Retrieves all rows from "xARA_LocalSimNodes" table and stores in-memory for faster access. This data is used for every request thousands of times,
-        so hitting a DB is inefficient.
+        if self.similarity_snapshot is None:
+            self.similarity_snapshot = clsLocalSimilarityStore.instance(self.app).get_snapshot()
+        return self.similarity_snapshot
 
-        Generates a dictionary of node pairs as keys (node1, node2) and their similarity as the value.
-        :return: None
+    def get_case_problem_matrix(self):
         """
-        with self.app.app_context():
-            sim_score_results = db.session.execute(statement=self.sqlGetAllNodeSimilarityScore).fetchall()
-        self.node_similarities = {}
+        Retrieves the integer encoded case problems that belong to the similarity snapshot of this object (see clsCaseProblemMatrix)
+        :return: clsCaseProblemMatrix
+        """
+        return clsLocalSimilarityStore.instance(self.app).get_case_problem_matrix(self.get_similarity_snapshot())
 
-        for result in sim_score_results:
-            node_pair = (result[0], result[1])
-            node_pair_inverse = (result[1], result[0])
-            similarity = result[2]
+    def cache_node_similarity(self):
+        """
+        Uses the "xARA_LocalSimNodes" rows stored in-memory by the shared clsLocalSimilarityStore. This data is used for every request thousands of times,
+        so hitting a DB is inefficient, and the table is only loaded once per process.
 
-            self.node_similarities[node_pair] = similarity
-            self.node_similarities[node_pair_inverse] = similarity
+        Provides a dictionary of node pairs as keys (node1, node2) and their similarity as the value.
+        :return: None
+        """
+        self.node_similarities = self.get_similarity_snapshot().node_similarities
 
     def cache_predicate_similarity(self):
         """
-        Retrieves all rows from "xARA_LocalSimPredicates" table and stores in-memory for faster access. This data is used for every request thousands of times,
-        so hitting a DB is inefficient.
+        Uses the "xARA_LocalSimPredicates" rows stored in-memory by the shared clsLocalSimilarityStore. This data is used for every request thousands of
+        times, so hitting a DB is inefficient, and the table is only loaded once per process.
 
-        Generates a dictionary of predicate pairs as keys (predicate1, predicate2) and their similarity as the value.
+        Provides a dictionary of predicate pairs as keys (predicate1, predicate2) and their similarity as the value.
         :return: None
         """
-        with self.app.app_context():
-            sim_score_results = db.session.execute(statement=self.sqlGetAllPredicateSimilarityScore).fetchall()
-        self.predicate_similarities = {}
-
-        for result in sim_score_results:
-            predicate_pair = (result[0], result[1])
-            similarity = result[2]
-
-            self.predicate_similarities[predicate_pair] = similarity
+        self.predicate_similarities = self.get_similarity_snapshot().predicate_similarities
 
     def get_local_sim_score_nodes(self, node1, node2):
         """
@@ -201,50 +222,80 @@ class clsBiolinkSimilarity:
         Sort Global_Similarity
         return top  caseid's from global_similarity
         """
-        all_sorted_global_similarity = global_similarity.sort_values(['global_sim', 'CASE_ID'], ascending=[False, True])
-
+        case_ids = global_similarity['CASE_ID'].to_numpy(dtype=object)
+        case_id_ranks = np.empty(len(case_ids), dtype=np.int64)
+        case_id_ranks[np.argsort(case_ids, kind="stable")] = np.arange(len(case_ids))
+        return self.select_top_global_sim_cases(case_ids, case_id_ranks, global_similarity['global_sim'].to_numpy(dtype=np.float64), query_threshold, global_precision,
+                                                max_cases, knowledge_type, max_similarity_lt=max_similarity_lt)
+
+    @staticmethod
+    def lowest_ranked_rows(rows: np.ndarray, ranks: np.ndarray, count: int) -> np.ndarray:
+        """
+        Picks the rows with the lowest ranks, in rank order, without sorting all of them
+        :param rows: Row indices
+        :param ranks: Rank of every row (same length as rows)
+        :param count: Maximum number of rows to return
+        :return: Row indices
+        """
+        if count <= 0:
+            return rows[:0]
+        if count < len(rows):
+            lowest = np.argpartition(ranks, count - 1)[:count]
+            rows, ranks = rows[lowest], ranks[lowest]
+        return rows[np.argsort(ranks)]
+
+    def select_top_global_sim_cases(self, case_ids: np.ndarray, case_id_ranks: np.ndarray, global_sim: np.ndarray, query_threshold, global_precision, max_cases: int,
+                                    knowledge_type: str, max_similarity_lt: float = None):
+        """
+        Same selection as ordering all cases by global similarity (descending) and CASE_ID (ascending), but only the groups of cases with the top (two)
+        scores are ever ordered.
+        :param case_ids: CASE_ID of every candidate case
+        :param case_id_ranks: Unique position of every candidate when ordered by CASE_ID
+        :param global_sim: Global similarity of every candidate
+        :return: List of selected case ids
+        """
         # Step Sim P1a3
         # Keep all cases above or equal to query_threshold
-        sorted_global_similarity = all_sorted_global_similarity[all_sorted_global_similarity["global_sim"] >= query_threshold]
+        mask = global_sim >= query_threshold
         if max_similarity_lt:
-            sorted_global_similarity = sorted_global_similarity[sorted_global_similarity["global_sim"] < max_similarity_lt]
+            mask &= global_sim < max_similarity_lt
+        rows = np.flatnonzero(mask)
+        scores = global_sim[rows]
 
         # if all cases (or all but one) have been filtered, then we can return immediately. The next logic operates assuming 2+ cases are present.
-        if len(sorted_global_similarity) <= 1:
-            selected_cases = sorted_global_similarity
+        if len(rows) <= 1:
+            selected_rows = rows
         else:
-            # if executing Regular Mode:
-            if knowledge_type == clsKnowledgeType.LOOKUP:
-                # Execute all solutions from all cases with GSS at the first highest score greater than the REGULAR_GLOBAL_QUERY_THRESHOLD
-                top_score = sorted_global_similarity['global_sim'].unique()[0]
-                selected_cases = sorted_global_similarity[sorted_global_similarity['global_sim'] == top_score]
+            # otherwise we're in a mode that isnt regular or creative? That's bad
+            if knowledge_type not in (clsKnowledgeType.LOOKUP, clsKnowledgeType.CREATIVE_MODE):
+                raise NotImplementedError
+
+            # Execute all solutions from all cases with GSS at the first highest score greater than the REGULAR_GLOBAL_QUERY_THRESHOLD
+            # Only the first max_cases cases (by CASE_ID) of the top score group can ever be selected, so the rest is never sorted
+            top_score = scores.max()
+            top_rows = rows[scores == top_score]
+            selected_rows = self.lowest_ranked_rows(top_rows, case_id_ranks[top_rows], max_cases)
+
             # if executing Creative Mode:
-            elif knowledge_type == clsKnowledgeType.CREATIVE_MODE:
+            if knowledge_type == clsKnowledgeType.CREATIVE_MODE:
                 # IF the second highest GSS in the list is above 0.9499
-                # THEN execute all solutions from all cases with GSS at the first and second highest similarity scores except for those with GSS=1 
+                # THEN execute all solutions from all cases with GSS at the first and second highest similarity scores except for those with GSS=1 
                 # ELSE execute all solutions from all cases with GSS at the first highest score greater than the CREATIVE_GLOBAL_QUERY_THRESHOLD except for those with GSS=1
 
                 # Use all cases with the top score. If the second highest score is > 0.9499 include all of those cases as well.
-                top_two_scores = sorted_global_similarity['global_sim'].unique()[:2]
-
-                top_score = top_two_scores[0]
-
                 # if only one score was viable, set the runner up score to -1 so that logic won't be triggered
-                if len(top_two_scores) == 1:
-                    runner_up_score = -1
-                else:
-                    runner_up_score = top_two_scores[1]
-
-                selected_cases = sorted_global_similarity[sorted_global_similarity['global_sim'] == top_score]
-                if runner_up_score > 0.9499:
-                    runner_up_selected_cases = sorted_global_similarity[sorted_global_similarity['global_sim'] == runner_up_score].head(self.second_highest_max_reuse)
-                    selected_cases = pd.concat((selected_cases, runner_up_selected_cases))
-            # otherwise we're in a mode that isnt regular or creative? That's bad
-            else:
-                raise NotImplementedError
+                lower_scores = scores[scores < top_score]
+                runner_up_score = lower_scores.max() if len(lower_scores) > 0 else -1
+
+                if runner_up_score > 0.9499 and len(selected_rows) < max_cases:
+                    runner_up_rows = rows[scores == runner_up_score]
+                    runner_up_selected_rows = self.lowest_ranked_rows(runner_up_rows, case_id_ranks[runner_up_rows], self.second_highest_max_reuse)
+                    selected_rows = np.concatenate((selected_rows, runner_up_selected_rows))
 
         # return top n caseId from sorted list, based on the knowledge type
-        self.selected_case_ids_and_similarities = list(selected_cases.iloc[:max_cases][['CASE_ID', 'global_sim']].to_records(index=False))
+        selected_rows = selected_rows[:max(max_cases, 0)]
+        selected_cases = pd.DataFrame({'CASE_ID': case_ids[selected_rows], 'global_sim': global_sim[selected_rows]})
+        self.selected_case_ids_and_similarities = list(selected_cases.to_records(index=False))
 
         final_cases = [x[0] for x in self.selected_case_ids_and_similarities]
         return final_cases
@@ -293,6 +344,68 @@ class clsBiolinkSimilarity:
     def fetch_cases(self, origins, exclude_matching_n0_n1):
         return self.fetch_cases_from_db(origins, exclude_matching_n0_n1)
 
+    def get_precomputed_global_similarity_version(self) -> tuple:
+        """
+        Reads the current version of the table precomputed by the xARA-ETL clsPrecomputedGlobalSimilarityJob once per similarity snapshot
+        :return: Tuple of the version, minimum threshold, subject, object and predicate weights and local similarity fingerprint, empty if there is none
+        """
+        snapshot = self.get_similarity_snapshot()
+        if snapshot.precomputed_global_similarity_version is None:
+            with self.app.app_context():
+                version = db.session.execute(statement=self.sqlGetPrecomputedGlobalSimilarityVersion).fetchone()
+            snapshot.precomputed_global_similarity_version = () if version is None else tuple(version)
+        return snapshot.precomputed_global_similarity_version
+
+    def lookup_global_sim_triplets(self, new_subject, new_object, new_predicate, origins, exclude_matching_n0_n1: bool, weights: tuple, threshold: float):
+        """
+        Reads the case problems at or above the threshold from the table precomputed by the xARA-ETL clsPrecomputedGlobalSimilarityJob, instead of
+        scoring them. The table can only be used if it was computed from the local similarities of this object's snapshot, with the same query weights
+        and a threshold no higher than this one, for this triplet, and knows every case id.
+        :param new_subject: New case subject category
+        :param new_object: New case object category
+        :param new_predicate: New case predicate
+        :param origins: List of origins to keep
+        :param exclude_matching_n0_n1: See clsCaseProblemMatrix.filter_rows
+        :param weights: Tuple of the subject, object and predicate weights
+        :param threshold: Query threshold
+        :return: Tuple of the row indices and their global similarity, or None to fall back to the live computation
+        """
+        if not modConfig.globalSimilarityTableEnabled or not clsBiolinkSimilarity.precomputed_tables_available or threshold is None:
+            return None
+
+        parameters = {"subject": new_subject, "predicate": new_predicate, "object": new_object, "threshold": threshold}
+        try:
+            version = self.get_precomputed_global_similarity_version()
+            if not version or version[5] != self.get_similarity_snapshot().local_similarity_fingerprint or float(version[1]) > threshold \
+                    or tuple(float(weight) for weight in version[2:5]) != weights:
+                return None
+            with self.app.app_context():
+                data = db.session.execute(statement=self.sqlGetPrecomputedGlobalSimilarity, params=parameters).fetchall()
+        except Exception as e:
+            with self.app.app_context():
+                db.session.rollback()
+            clsBiolinkSimilarity.precomputed_tables_available = False
+            logging.warning(f"Precomputed global similarity unavailable, computing it live from now on: {e}")
+            return None
+
+        # triplets recomputed after the version this snapshot checked may come from other local similarities
+        if not data or data[0][0] > version[0]:
+            return None
+        triplet_version = data[0][0]
+        data = [result for result in data if result[1] is not None]
+
+        case_problem_matrix = self.get_case_problem_matrix()
+        rows = case_problem_matrix.rows_of_case_ids([result[1] for result in data])
+        if rows is None:
+            # computed from other case problems than the ones loaded by this process
+            return None
+        global_sim = np.array([result[2] for result in data], dtype=np.float64)
+        keep = case_problem_matrix.filter_mask(rows, origins, exclude_matching_n0_n1)
+        rows, global_sim = rows[keep], global_sim[keep]
+        order = np.argsort(rows, kind="stable")
+        logging.debug(f"Read {len(rows)} precomputed cases of version {triplet_version}")
+        return rows[order], global_sim[order]
+
     def get_global_sim_triplets(self, new_subject, new_object, new_predicate, origins, knowledge_type: str, max_similarity_lt: float = None):
         """
         :param new_subject:
@@ -325,20 +438,22 @@ class clsBiolinkSimilarity:
         weightSum = sum(list(weights_results[0]))
 
         start = time()
+        case_problem_matrix = self.get_case_problem_matrix()
         # As per "RE: 2 ITEMS", exclude any case problems with matching n0 and n1 categories IFF the new subject and object categories are not the same
         # As per discussion on 2-14-2023, we can remove the limitation of exact matches for n00 categories
-        cases = self.fetch_cases(origins, exclude_matching_n0_n1=(new_subject != new_object))
-        logging.debug(f"Fetched {len(cases)} cases in {time() - start}")
-
-        start = time()
-        cases['subject_local_sim'] = cases['N00_NODE_CATEGORY'].map(lambda x: self.get_local_sim_score_nodes(new_subject, x))
-        cases['object_local_sim'] = cases['N01_NODE_CATEGORY'].map(lambda x: self.get_local_sim_score_nodes(new_object, x))
-        cases['pred_local_sim'] = cases['E00_EDGE_PREDICATE'].map(lambda x: self.get_local_sim_score_preds(new_predicate, x))
-        cases['global_sim'] = ((cases['subject_local_sim'] * float(SUBJECT_NODE_WEIGHT) + cases['object_local_sim']
-                                * float(OBJECT_NODE_WEIGHT) + cases['pred_local_sim'] * float(PREDICATE_WEIGHT)) / float(weightSum))
-        logging.debug(f'Calculated global similarity in {time() - start}')
-
-        return self.get_top_global_sim_cases(cases, query_threshold, global_precision, max_cases, knowledge_type=knowledge_type, max_similarity_lt=max_similarity_lt)
+        weights = (float(SUBJECT_NODE_WEIGHT), float(OBJECT_NODE_WEIGHT), float(PREDICATE_WEIGHT))
+        threshold = None if query_threshold is None else float(query_threshold)
+        # Precomputed cases when the triplet is in the global similarity table, otherwise only the case problems that can reach the query threshold are
+        # scored, see clsCaseProblemMatrix.candidate_rows
+        candidates = self.lookup_global_sim_triplets(new_subject, new_object, new_predicate, origins, (new_subject != new_object), weights, threshold)
+        if candidates is None:
+            candidates = case_problem_matrix.candidate_rows(origins, (new_subject != new_object), new_subject, new_object, new_predicate, *weights,
+                                                            float(weightSum), threshold)
+        rows, global_sim = candidates
+        logging.debug(f'Selected {len(rows)} cases at or above the query threshold in {time() - start}')
+
+        return self.select_top_global_sim_cases(case_problem_matrix.case_ids[rows], case_problem_matrix.case_id_ranks[rows], global_sim, query_threshold,
+                                                global_precision, max_cases, knowledge_type=knowledge_type, max_similarity_lt=max_similarity_lt)
 
 
 def direct_compare(new_category, candidate_category):
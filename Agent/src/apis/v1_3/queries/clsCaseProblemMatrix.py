@@ -0,0 +1,299 @@
+"""
+WHAT: An integer encoded copy of the "xARA_CaseProblems" one hop columns together with dense local similarity matrices
+WHY: Global similarity used to be calculated with three pandas .map(lambda) passes per triplet, i.e. several Python calls per case problem. With every
+     category and predicate replaced by a code, the local similarity of all case problems is a numpy fancy index into a dense matrix.
+ASSUMES: The number of distinct categories and predicates is small (hundreds), so dense square matrices fit comfortably in memory.
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-08, inverted triplet index TZ 2023-03-24
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class clsCaseProblemMatrix:
+    """
+    See header
+    """
+    ANY_PREDICATE = "ANY"
+
+    # As per "still pruning responses" on 2022-02-07 4:38 pm if the node score is 0, set to -20
+    ZERO_NODE_SCORE = -20
+
+    # slack on the pruning bounds so float rounding never drops a case the exact score keeps
+    PRUNING_TOLERANCE = 1e-9
+
+    def __init__(self, cases: pd.DataFrame, node_similarities: dict, predicate_similarities: dict):
+        """
+        Constructor
+        :param cases: DataFrame with the "N00_NODE_CATEGORY", "N01_NODE_CATEGORY", "E00_EDGE_PREDICATE", "CASE_ID" and "ORIGIN" columns of every case problem
+        :param node_similarities: Dictionary of (node1, node2) -> similarity, see clsLocalSimilarityStore
+        :param predicate_similarities: Dictionary of (predicate1, predicate2) -> similarity, see clsLocalSimilarityStore
+        """
+        self.node_similarities = node_similarities
+        self.predicate_similarities = predicate_similarities
+
+        self.case_ids = cases["CASE_ID"].to_numpy(dtype=object)
+        # unique position of every row when sorted by CASE_ID, used to break global similarity ties without sorting strings
+        self.case_id_ranks = np.empty(len(self.case_ids), dtype=np.int64)
+        self.case_id_ranks[np.argsort(self.case_ids, kind="stable")] = np.arange(len(self.case_ids))
+
+        # nulls may come back as None or NaN depending on the column dtype, they are all encoded as None
+        subjects, objects = self.none_for_nulls(cases["N00_NODE_CATEGORY"]), self.none_for_nulls(cases["N01_NODE_CATEGORY"])
+        predicates, origins = self.none_for_nulls(cases["E00_EDGE_PREDICATE"]), self.none_for_nulls(cases["ORIGIN"])
+
+        self.node_categories = self.vocabulary(subjects, objects, [pair[0] for pair in node_similarities])
+        self.node_codes = {category: code for code, category in enumerate(self.node_categories)}
+        self.subject_codes = self.encode(subjects, self.node_codes)
+        self.object_codes = self.encode(objects, self.node_codes)
+        # code of a null category, or None if no case problem has one
+        self.null_node_code = self.node_codes.get(None)
+
+        self.predicates = self.vocabulary(predicates, [pair[0] for pair in predicate_similarities], [pair[1] for pair in predicate_similarities])
+        self.predicate_codes = {predicate: code for code, predicate in enumerate(self.predicates)}
+        self.predicate_case_codes = self.encode(predicates, self.predicate_codes)
+
+        self.origins = self.vocabulary(origins)
+        self.origin_codes = self.encode(origins, {origin: code for code, origin in enumerate(self.origins)})
+
+        self.node_similarity_matrix = self.build_node_similarity_matrix()
+        self.predicate_similarity_matrix = self.build_predicate_similarity_matrix()
+
+        self.build_triplet_index()
+        # CASE_ID -> row, built on first use by rows_of_case_ids()
+        self.case_id_rows = None
+
+    def __len__(self):
+        return len(self.case_ids)
+
+    @staticmethod
+    def none_for_nulls(column) -> list:
+        """
+        :param column: Iterable of values
+        :return: List of the values with None in place of every null (None, NaN, NaT)
+        """
+        return [None if pd.isna(value) else value for value in column]
+
+    @staticmethod
+    def vocabulary(*columns) -> list:
+        """
+        Collects the distinct values of several columns, keeping the order they are first seen in
+        :param columns: Iterables of values
+        :return: List of distinct values
+        """
+        values = {}
+        for column in columns:
+            for value in column:
+                values.setdefault(value, None)
+        return list(values)
+
+    @staticmethod
+    def encode(column, codes: dict) -> np.ndarray:
+        """
+        Replaces every value of a column by its code
+        :param column: Iterable of values
+        :param codes: Dictionary of value -> code
+        :return: Integer numpy array
+        """
+        return np.fromiter((codes[value] for value in column), dtype=np.int64, count=len(column))
+
+    def build_node_similarity_matrix(self) -> np.ndarray:
+        """
+        Dense matrix where [i, j] is clsBiolinkSimilarity.get_local_sim_score_nodes(node_categories[i], node_categories[j])
+        :return: Square float numpy array
+        """
+        matrix = np.identity(len(self.node_categories), dtype=np.float64)
+        for (node1, node2), similarity in self.node_similarities.items():
+            matrix[self.node_codes[node1], self.node_codes[node2]] = similarity
+        matrix[matrix == 0] = self.ZERO_NODE_SCORE
+        return matrix
+
+    def build_predicate_similarity_matrix(self) -> np.ndarray:
+        """
+        Dense matrix where [i, j] is clsBiolinkSimilarity.get_local_sim_score_preds(predicates[i], predicates[j])
+        :return: Square float numpy array
+        """
+        matrix = np.identity(len(self.predicates), dtype=np.float64)
+        for (predicate1, predicate2), similarity in self.predicate_similarities.items():
+            matrix[self.predicate_codes[predicate1], self.predicate_codes[predicate2]] = similarity
+        if self.ANY_PREDICATE in self.predicate_codes:
+            any_code = self.predicate_codes[self.ANY_PREDICATE]
+            matrix[any_code, :] = 1
+            matrix[:, any_code] = 1
+        return matrix
+
+    def build_triplet_index(self):
+        """
+        Inverted index of the distinct (subject category, predicate, object category) triplets. Case problems repeat a small number of triplets,
+        so candidate_rows() scores triplets and only expands the ones above the threshold to their rows.
+        triplets[k] holds the (subject, predicate, object) codes of triplet k, and its rows are triplet_rows[triplet_offsets[k]:triplet_offsets[k + 1]]
+        :return: None
+        """
+        if len(self.case_ids) == 0:
+            self.triplets = np.empty((0, 3), dtype=np.int64)
+            self.triplet_rows = np.empty(0, dtype=np.int64)
+            self.triplet_offsets = np.zeros(1, dtype=np.int64)
+            return
+        keys = np.stack((self.subject_codes, self.predicate_case_codes, self.object_codes), axis=1)
+        self.triplets, triplet_of_row = np.unique(keys, axis=0, return_inverse=True)
+        triplet_of_row = triplet_of_row.reshape(-1)
+        # rows of each triplet stay in ascending order
+        self.triplet_rows = np.argsort(triplet_of_row, kind="stable")
+        self.triplet_offsets = np.concatenate(([0], np.cumsum(np.bincount(triplet_of_row, minlength=len(self.triplets)))))
+
+    def node_similarity_row(self, new_node) -> np.ndarray:
+        """
+        Local similarity of a new node against every known category
+        :param new_node: New case node category
+        :return: Float numpy array indexed by node code
+        """
+        code = self.node_codes.get(new_node)
+        if code is not None:
+            return self.node_similarity_matrix[code]
+
+        # an unseen category has no similarity rows, so it only matches itself
+        row = np.array([self.node_similarities.get((new_node, category), int(new_node == category)) for category in self.node_categories], dtype=np.float64)
+        row[row == 0] = self.ZERO_NODE_SCORE
+        return row
+
+    def predicate_similarity_row(self, new_predicate) -> np.ndarray:
+        """
+        Local similarity of a new predicate against every known predicate
+        :param new_predicate: New case predicate
+        :return: Float numpy array indexed by predicate code
+        """
+        if new_predicate == self.ANY_PREDICATE:
+            return np.ones(len(self.predicates), dtype=np.float64)
+
+        code = self.predicate_codes.get(new_predicate)
+        if code is not None:
+            return self.predicate_similarity_matrix[code]
+
+        return np.array([1 if predicate == self.ANY_PREDICATE else self.predicate_similarities.get((new_predicate, predicate), int(new_predicate == predicate))
+                         for predicate in self.predicates], dtype=np.float64)
+
+    def filter_rows(self, origins, exclude_matching_n0_n1: bool) -> np.ndarray:
+        """
+        Selects the case problems the old "xARA_CaseProblems" query returned
+        :param origins: List of origins to keep
+        :param exclude_matching_n0_n1: Boolean whether to drop case problems where both node categories are the same
+        :return: Ascending numpy array of row indices
+        """
+        return np.flatnonzero(self.filter_mask(slice(None), origins, exclude_matching_n0_n1))
+
+    def filter_mask(self, rows, origins, exclude_matching_n0_n1: bool) -> np.ndarray:
+        """
+        Same filter as filter_rows() over the given rows
+        :param rows: Row indices or a slice
+        :param origins: List of origins to keep
+        :param exclude_matching_n0_n1: Boolean whether to drop case problems where both node categories are the same
+        :return: Boolean numpy array aligned with rows
+        """
+        origin_codes = [code for code, origin in enumerate(self.origins) if origin is not None and origin in origins]
+        mask = np.isin(self.origin_codes[rows], origin_codes)
+        if exclude_matching_n0_n1:
+            subject_codes, object_codes = self.subject_codes[rows], self.object_codes[rows]
+            mask &= subject_codes != object_codes
+            # like SQL, a null category is never different from anything
+            if self.null_node_code is not None:
+                mask &= (subject_codes != self.null_node_code) & (object_codes != self.null_node_code)
+        return mask
+
+    def rows_of_case_ids(self, case_ids) -> np.ndarray:
+        """
+        Looks up the rows of case problems by CASE_ID
+        :param case_ids: Iterable of CASE_ID values
+        :return: Numpy array of row indices, or None if any of the case ids is unknown
+        """
+        if self.case_id_rows is None:
+            self.case_id_rows = {case_id: row for row, case_id in enumerate(self.case_ids)}
+        rows = [self.case_id_rows.get(case_id) for case_id in case_ids]
+        if None in rows:
+            return None
+        return np.array(rows, dtype=np.int64)
+
+    def global_similarity(self, rows: np.ndarray, new_subject, new_object, new_predicate, subject_weight: float, object_weight: float,
+                          predicate_weight: float, weight_sum: float) -> np.ndarray:
+        """
+        Weighted global similarity of a new one hop case against the given case problems
+        :param rows: Row indices from filter_rows()
+        :param new_subject: New case subject category
+        :param new_object: New case object category
+        :param new_predicate: New case predicate
+        :param subject_weight: Weight of the subject local similarity
+        :param object_weight: Weight of the object local similarity
+        :param predicate_weight: Weight of the predicate local similarity
+        :param weight_sum: Sum of the weights
+        :return: Float numpy array aligned with rows
+        """
+        subject_local_sim = self.node_similarity_row(new_subject)[self.subject_codes[rows]]
+        object_local_sim = self.node_similarity_row(new_object)[self.object_codes[rows]]
+        pred_local_sim = self.predicate_similarity_row(new_predicate)[self.predicate_case_codes[rows]]
+        return (subject_local_sim * subject_weight + object_local_sim * object_weight + pred_local_sim * predicate_weight) / weight_sum
+
+    def candidate_rows(self, origins, exclude_matching_n0_n1: bool, new_subject, new_object, new_predicate, subject_weight: float, object_weight: float,
+                       predicate_weight: float, weight_sum: float, threshold: float):
+        """
+        Same case problems and scores as global_similarity(filter_rows(...)) restricted to the scores >= threshold, without scoring every case problem.
+        The local similarity rows of the new categories and predicate list every related (ancestor or descendant) category, and with the query weights
+        they bound the best score a triplet can reach: a category is only a candidate if its score, with the best possible scores of the other two
+        parts, reaches the threshold. The triplets of the index made of candidates only are scored exactly and expanded to their case problems.
+        :param origins: List of origins to keep
+        :param exclude_matching_n0_n1: See filter_rows()
+        :param new_subject: New case subject category
+        :param new_object: New case object category
+        :param new_predicate: New case predicate
+        :param subject_weight: Weight of the subject local similarity
+        :param object_weight: Weight of the object local similarity
+        :param predicate_weight: Weight of the predicate local similarity
+        :param weight_sum: Sum of the weights
+        :param threshold: Global similarity threshold, e.g. REGULAR_GLOBAL_QUERY_THRESHOLD
+        :return: Tuple of the ascending row indices and their global similarity
+        """
+        if threshold is None or min(subject_weight, object_weight, predicate_weight) < 0 or weight_sum <= 0:
+            # the bounds below only hold for non negative weights
+            rows = self.filter_rows(origins, exclude_matching_n0_n1=exclude_matching_n0_n1)
+            global_sim = self.global_similarity(rows, new_subject, new_object, new_predicate, subject_weight, object_weight, predicate_weight, weight_sum)
+            if threshold is not None:
+                keep = global_sim >= threshold
+                rows, global_sim = rows[keep], global_sim[keep]
+            return rows, global_sim
+
+        subject_similarity = self.node_similarity_row(new_subject)
+        object_similarity = self.node_similarity_row(new_object)
+        predicate_similarity = self.predicate_similarity_row(new_predicate)
+        if len(self.triplets) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        best_subject = subject_weight * subject_similarity.max()
+        best_object = object_weight * object_similarity.max()
+        best_predicate = predicate_weight * predicate_similarity.max()
+        target = threshold * weight_sum - self.PRUNING_TOLERANCE * max(1.0, abs(threshold * weight_sum))
+        subject_candidates = subject_weight * subject_similarity >= target - best_object - best_predicate
+        object_candidates = object_weight * object_similarity >= target - best_subject - best_predicate
+        predicate_candidates = predicate_weight * predicate_similarity >= target - best_subject - best_object
+
+        subjects, predicates, objects = self.triplets[:, 0], self.triplets[:, 1], self.triplets[:, 2]
+        mask = subject_candidates[subjects] & predicate_candidates[predicates] & object_candidates[objects]
+        if exclude_matching_n0_n1:
+            mask &= subjects != objects
+            if self.null_node_code is not None:
+                mask &= (subjects != self.null_node_code) & (objects != self.null_node_code)
+        triplets = np.flatnonzero(mask)
+
+        # exact score, same expression as global_similarity()
+        triplet_sim = (subject_similarity[subjects[triplets]] * subject_weight + object_similarity[objects[triplets]] * object_weight
+                       + predicate_similarity[predicates[triplets]] * predicate_weight) / weight_sum
+        keep = triplet_sim >= threshold
+        triplets, triplet_sim = triplets[keep], triplet_sim[keep]
+
+        starts = self.triplet_offsets[triplets]
+        counts = self.triplet_offsets[triplets + 1] - starts
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        rows = self.triplet_rows[positions]
+        global_sim = np.repeat(triplet_sim, counts)
+
+        keep = self.filter_mask(rows, origins, exclude_matching_n0_n1=False)
+        rows, global_sim = rows[keep], global_sim[keep]
+        order = np.argsort(rows, kind="stable")
+        return rows[order], global_sim[order]
@@ -6,7 +6,9 @@ from utils.clsLog import clsLogEvent
 from .clsExplanationSolutionFinder import ExplanationSolutionFinder
 from ..modSettings import version
 from utils.multithreading.modDispatcher import runner
+from utils.multithreading.clsCancellationToken import clsOperationCancelled
 from .clsMultiHop import clsMultiHop
+from .modTrapiCopy import copy_query_graph, copy_knowledge_graph
 import random
 import string
 import json
@@ -129,6 +131,14 @@ class clsCaseSolution(clsElement):
             self.knowledge_graph = {"nodes": {}, "edges": {}}
             if len(self.paths) == 1:
                 self.generateQueryGraphForOnePath()
+        except clsOperationCancelled as e:
+            self.logs.append(clsLogEvent(
+                identifier=self.log_id,
+                level="WARNING",
+                code="Cancelled",
+                message=f"Case cancelled before completion: {e}"
+            ))
+            raise
         except Exception as e:
             print(traceback.format_exc())
             self.logs.append(clsLogEvent(
@@ -177,11 +187,14 @@ class clsCaseSolution(clsElement):
 
     def generateKnowledgeGraphForOnePath(self):
         self.paths[0].knowledgeProvider.requestBody = deepcopy(self.nominalKnowledgeProviderRequestBody)
-        self.paths[0].knowledgeProvider.requestBody['message']['query_graph'] = deepcopy(self.query_graph)
+        self.paths[0].knowledgeProvider.requestBody['message']['query_graph'] = copy_query_graph(self.query_graph)
 
+        self.checkCancellation()
+        self.paths[0].knowledgeProvider.cancellationToken = self.dispatchCancellationToken
         self.paths[0].knowledgeProvider.execute()
 
-        self.knowledge_graph = deepcopy(self.paths[0].knowledgeProvider.responseBody['message']['knowledge_graph'])
+        # the edges get a provenance attribute below, the rest of the knowledge provider response is shared
+        self.knowledge_graph = copy_knowledge_graph(self.paths[0].knowledgeProvider.responseBody['message']['knowledge_graph'])
 
         # adding knowledge provider to the edge of the knowledge_graph
         # adding unique identifier to each edge, as some KPs do not
@@ -201,15 +214,15 @@ class clsCaseSolution(clsElement):
     def generateQueryGraphForOnePath(self):
         path = self.paths[0]
 
-        query_graph = deepcopy(self.nominalKnowledgeProviderRequestBody)['message']['query_graph']
+        query_graph = copy_query_graph(self.nominalKnowledgeProviderRequestBody['message']['query_graph'])
         query_graph['edges'][self.predicate_query_graph_edge_id]['predicates'] = [path.predicate]
         query_graph['nodes'][self.subject_query_graph_node_id]['categories'] = [path.subject]
         query_graph['nodes'][self.object_query_graph_node_id]['categories'] = [path.object]
 
         if self.subjectCurieIds is not None:
-            query_graph['nodes'][self.subject_query_graph_node_id]['ids'] = deepcopy(self.subjectCurieIds)
+            query_graph['nodes'][self.subject_query_graph_node_id]['ids'] = list(self.subjectCurieIds)
         if self.objectCurieIds is not None:
-            query_graph['nodes'][self.object_query_graph_node_id]['ids'] = deepcopy(self.objectCurieIds)
+            query_graph['nodes'][self.object_query_graph_node_id]['ids'] = list(self.objectCurieIds)
 
         if self.subjectConstraints is not None:
             query_graph['nodes'][self.subject_query_graph_node_id]['constraints'] = deepcopy(self.subjectConstraints)
@@ -327,6 +340,7 @@ class clsCaseSolution(clsElement):
             self.path_solutions.append(caseSolution)
 
         self.multihop = clsMultiHop(self.dispatchId, self.dispatchDescription, self.path_solutions)
+        self.multihop.dispatchCancellationToken = self.dispatchCancellationToken
 
     def generateKnowledgeGraphForTwoPaths(self):
         self.multihop.execute()
@@ -407,8 +421,9 @@ class clsCaseSolution(clsElement):
             # if the case solution has no query graph is wasn't called because the prior case failed. We can still build a skeleton query graph, though.
             if case_solution.query_graph is None:
                 case_solution.generateQueryGraphForOnePath()
-            query_graph['nodes'].update(deepcopy(case_solution.query_graph['nodes']))
-            query_graph['edges'].update(deepcopy(case_solution.query_graph['edges']))
+            case_query_graph = copy_query_graph(case_solution.query_graph)
+            query_graph['nodes'].update(case_query_graph['nodes'])
+            query_graph['edges'].update(case_query_graph['edges'])
 
         # remove the specified IDs from the second KP query graph, as they weren't specified in the original query.
         if 'ids' in query_graph['nodes']['n01']:
@@ -0,0 +1,118 @@
+"""
+WHAT: The node categories a knowledge provider treats as the same (e.g. biolink:Gene and biolink:Protein) and how specific each one is, used to drop
+      redundant one hop case solutions
+WHY: clsCaseSolutionManager.filter_case_solutions compared every case solution with every other one. Mapping each solution to a conflation key
+     (knowledge provider and canonical categories) finds the duplicates in a single pass, and the conflated categories come from the
+     "xARA_LocalSimNodes" rows already held by clsLocalSimilarityStore instead of a hard-coded dictionary.
+ASSUMES: Node pairs with a local similarity above modConfig.caseSolutionConflationThreshold, in either direction, are conflations. Conflation is not
+         transitive: a group only holds categories conflated with each other, so biolink:A ~ biolink:B ~ biolink:C doesn't conflate A and C.
+         The specificity order is not stored in the database, so it remains a constant.
+FUTURE IMPROVEMENTS: Store the specificity order in the database
+WHO: TZ 2023-03-27, pairwise groups TZ 2023-04-03
+"""
+
+
+class clsCaseSolutionConflations:
+    """
+    See header
+    """
+    # always conflated, whatever the similarity table contains
+    DEFAULT_CONFLATIONS = [
+        ("biolink:Gene", "biolink:Protein"),
+        ("biolink:ChemicalEntity", "biolink:SmallMolecule"),
+    ]
+    # most specific category first
+    PRIORITIES = [
+        ["biolink:SmallMolecule", "biolink:ChemicalEntity"],
+        ["biolink:Protein", "biolink:Gene"]
+    ]
+
+    def __init__(self, conflated_pairs: list = None):
+        """
+        Constructor
+        :param conflated_pairs: List of (category, category) that are conflated in addition to DEFAULT_CONFLATIONS
+        """
+        conflated = {}
+        for category_a, category_b in self.DEFAULT_CONFLATIONS + list(conflated_pairs or []):
+            if category_a != category_b:
+                conflated.setdefault(category_a, set()).add(category_b)
+                conflated.setdefault(category_b, set()).add(category_a)
+
+        # categories are added in sorted order to the first group whose members they are all conflated with, so the canonical category of a group is
+        # its smallest member
+        groups = []
+        for category in sorted(conflated):
+            for group in groups:
+                if group <= conflated[category]:
+                    group.add(category)
+                    break
+            else:
+                groups.append({category})
+
+        # category -> canonical category, only for categories that are conflated with another one
+        self.canonical = {category: min(group) for group in groups if len(group) > 1 for category in group}
+
+        # category -> position in its priority list, lower is more specific
+        self.ranks = {}
+        for priority_set in self.PRIORITIES:
+            for index, category in enumerate(priority_set):
+                self.ranks[category] = index
+        self.unranked = max([len(priority_set) for priority_set in self.PRIORITIES], default=0)
+
+    @classmethod
+    def from_node_similarities(cls, node_similarities: dict, threshold: float):
+        """
+        :param node_similarities: Dictionary of (node1, node2) -> similarity, see clsLocalSimilarityStore
+        :param threshold: Similarity above which two different categories are conflated
+        :return: clsCaseSolutionConflations
+        """
+        return cls([
+            (category_a, category_b) for (category_a, category_b), similarity in node_similarities.items()
+            if category_a != category_b and similarity is not None and similarity > threshold
+        ])
+
+    def key(self, solution):
+        """
+        :param solution: Case solution row
+        :return: Tuple of the knowledge provider and canonical categories, or None if the solution is never conflated (two hops, or no conflated category)
+        """
+        if solution["KP_PATH2"] is not None:
+            return None
+        canonical_subject = self.canonical.get(solution["NODE1_PATH1_CATEGORY"])
+        canonical_object = self.canonical.get(solution["NODE2_PATH1_CATEGORY"])
+        if canonical_subject is None and canonical_object is None:
+            return None
+        return (
+            solution["KP_PATH1"],
+            solution["NODE1_PATH1_CATEGORY"] if canonical_subject is None else canonical_subject,
+            solution["NODE2_PATH1_CATEGORY"] if canonical_object is None else canonical_object
+        )
+
+    def rank(self, solution) -> tuple:
+        """
+        :param solution: Case solution row
+        :return: Sort key of a solution within its conflation group: most specific subject, then object, then lowest solution id
+        """
+        return (
+            self.ranks.get(solution["NODE1_PATH1_CATEGORY"], self.unranked),
+            self.ranks.get(solution["NODE2_PATH1_CATEGORY"], self.unranked),
+            solution["SOLUTION_ID"]
+        )
+
+    def filter(self, solutions: list) -> list:
+        """
+        Keeps the most specific solution of every conflation group
+        :param solutions: List of case solution rows
+        :return: List of the remaining rows, in their original order
+        """
+        best = {}
+        keys = []
+        for solution in solutions:
+            key = self.key(solution)
+            keys.append(key)
+            if key is not None:
+                current = best.get(key)
+                if current is None or self.rank(solution) < self.rank(current):
+                    best[key] = solution
+
+        return [solution for solution, key in zip(solutions, keys) if key is None or best[key] is solution]
@@ -0,0 +1,151 @@
+"""
+WHAT: A process-wide loader of the "xARA_CaseSolutions" rows of case ids, together with the URLs of their knowledge providers, backed by a cache
+      keyed by case id
+WHY: Every case solution manager of a request ran its own case solution query and its own "xARA_KP_Info" URL query. The case ids requested by
+     managers running at the same time are now micro-batched (see clsBatchScheduler) into one "= ANY(:caseIds)" query, and since case solutions
+     rarely change, the rows of a case id are served from memory until the TTL expires.
+ASSUMES: The rows are only read by the managers, never modified
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-26
+"""
+
+from modDatabase import db
+from modConfig import environmentModeKPURLColumn, environmentMode
+from utils.clsTtlCache import clsTtlCache
+from utils.multithreading.clsBatchScheduler import clsBatchScheduler
+import modConfig
+import threading
+import logging
+
+
+class clsCaseSolutionLoader:
+    """
+    See header
+    """
+    sqlFindCaseSolutions = \
+        """
+        select
+            A."SOLUTION_ID", A."CASE_ID",
+            A."SOLUTION_FIRST_KP_NAME" as "KP_PATH1", A."NODE1_PATH1_CATEGORY", A."NODE2_PATH1_CATEGORY", A."EDGE1_PATH1_PREDICATE",
+            A."SOLUTION_SECOND_KP_NAME" as "KP_PATH2", A."NODE1_PATH2_CATEGORY", A."NODE2_PATH2_CATEGORY", A."EDGE1_PATH2_PREDICATE",
+            {kp_path1_url} as "KP_PATH1_URL", {kp_path2_url} as "KP_PATH2_URL",
+        case
+            when K1."Priority" IS NULL THEN 0
+            else K1."Priority" END AS "Priority"
+        from(
+            select
+                "SOLUTION_ID", "CASE_ID",
+                "SOLUTION_FIRST_KP_NAME", "NODE1_PATH1_CATEGORY", "NODE2_PATH1_CATEGORY", "EDGE1_PATH1_PREDICATE",
+                "SOLUTION_SECOND_KP_NAME", "NODE1_PATH2_CATEGORY", "NODE2_PATH2_CATEGORY", "EDGE1_PATH2_PREDICATE"
+            from "xARA_CaseSolutions"
+            where "CASE_ID" = ANY(:caseIds)
+        )
+        A LEFT OUTER JOIN "xARA_KP_Info" K1
+        ON A."SOLUTION_FIRST_KP_NAME" = K1."KP_Name"
+        LEFT OUTER JOIN "xARA_KP_Info" K2
+        ON A."SOLUTION_SECOND_KP_NAME" = K2."KP_Name"
+        """
+
+    # case id -> tuple of case solution rows, shared by every query
+    cache = clsTtlCache(name="case_solutions", ttl_seconds=modConfig.caseSolutionCacheTtlSeconds, max_size=modConfig.caseSolutionCacheMaxSize)
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, app, max_batch_size: int = None, max_wait_seconds: float = None):
+        """
+        Constructor
+        :param app: Flask application context, used to send requests to the database.
+        :param max_batch_size: Largest number of case ids per query. Defaults to modConfig.caseSolutionMaxBatchSize
+        :param max_wait_seconds: Longest time case ids wait for the ids of other managers. Defaults to modConfig.caseSolutionMaxBatchWaitSeconds
+        """
+        self.app = app
+        self.sql = self.sqlFindCaseSolutions.format(kp_path1_url=self.kp_url_expression("K1"), kp_path2_url=self.kp_url_expression("K2"))
+        self.query_count = 0
+        self.scheduler = clsBatchScheduler(
+            run_batch=self.fetch_batch,
+            max_batch_size=max_batch_size or modConfig.caseSolutionMaxBatchSize,
+            max_wait_seconds=modConfig.caseSolutionMaxBatchWaitSeconds if max_wait_seconds is None else max_wait_seconds,
+            name="case_solution_loader"
+        )
+
+    @classmethod
+    def instance(cls, app):
+        """
+        Returns the process-wide loader, creating it on first use
+        :param app: Flask application, only used if the loader does not exist yet
+        :return: The shared loader
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(app)
+        return cls._instance
+
+    @classmethod
+    def reset(cls):
+        """
+        Stops the process-wide loader and empties the cache
+        :return: None
+        """
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance.scheduler.close()
+            cls._instance = None
+        cls.cache.clear()
+
+    @staticmethod
+    def kp_url_expression(table_alias: str) -> str:
+        """
+        Select the current environment mode as the primary URL column to request, failing over to more mature URLs if there is no URL present.
+        Order is currently Development -> Staging (CI) -> Testing -> Prod
+        :param table_alias: Alias of the "xARA_KP_Info" table
+        :return: SQL expression
+        """
+        for environment_mode_index, mode_label in enumerate(environmentModeKPURLColumn.keys()):
+            if mode_label == environmentMode:
+                break
+        else:
+            environment_mode_index = -1
+
+        coalesce_arguments = []
+        for column_name in list(environmentModeKPURLColumn.keys())[environment_mode_index:]:
+            coalesce_arguments.append(f"""NULLIF({table_alias}."{environmentModeKPURLColumn[column_name]}",'')""")
+        if len(coalesce_arguments) == 1:
+            return coalesce_arguments[0]
+        return f"COALESCE({', '.join(coalesce_arguments)})"
+
+    def query_rows(self, case_ids: list) -> list:
+        """
+        :param case_ids: Distinct case ids
+        :return: Case solution rows of all the case ids
+        """
+        with self.app.app_context():
+            return db.session.execute(statement=self.sql, params={"caseIds": case_ids}).fetchall()
+
+    def fetch_batch(self, case_ids: list) -> list:
+        """
+        Runs one query for the case ids of every manager in the batch and caches the rows per case id, including case ids without solutions
+        :param case_ids: Case ids, possibly repeated by several managers
+        :return: Tuple of rows per case id, in case id order
+        """
+        solutions = {case_id: [] for case_id in case_ids}
+        self.query_count += 1
+        rows = self.query_rows(list(solutions))
+        for row in rows:
+            solutions[row["CASE_ID"]].append(row)
+        solutions = {case_id: tuple(case_rows) for case_id, case_rows in solutions.items()}
+        logging.debug(f"Loaded {len(rows)} case solutions of {len(solutions)} cases in one query")
+        self.cache.set_many(solutions)
+        return [solutions[case_id] for case_id in case_ids]
+
+    def load(self, case_ids) -> dict:
+        """
+        Looks up the case solutions of case ids, cached ones first
+        :param case_ids: Iterable of case ids
+        :return: Dictionary of case id -> tuple of case solution rows
+        """
+        found, missing = self.cache.get_many(list(case_ids))
+        if missing:
+            found.update(zip(missing, self.scheduler.submit(missing).result()))
+        return found
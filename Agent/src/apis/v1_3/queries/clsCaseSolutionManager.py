@@ -17,7 +17,6 @@ for i = 0 i < smallest solution list length:
 
 """
 
-from modDatabase import db
 from .clsCaseSolution import clsCaseSolution
 from .clsCaseSolutionPath import clsCaseSolutionPath
 from .clsKnowledgeProvider import clsKnowledgeProvider
@@ -27,12 +26,13 @@ from utils.multithreading.clsNode import clsNode
 from utils.modMiscUtils import isNullOrEmptyList
 from .clsBioLinkSimilarity import clsBiolinkSimilarity
 from .clsCaseSolutionRetrival import clsCaseSolutionRetrival
+from .clsCaseSolutionLoader import clsCaseSolutionLoader
+from .clsCaseSolutionConflations import clsCaseSolutionConflations
+from .clsLocalSimilarityStore import clsLocalSimilarityStore
 from ..models.workflow.clsWorkflow import Workflow
 from ..models.workflow.clsOperations import FillOperation
 from .clsKnowledgeType import clsKnowledgeType
-import copy
 from utils.clsLog import clsLogEvent
-from modConfig import environmentModeKPURLColumn, environmentMode
 import logging
 
 
@@ -74,27 +74,6 @@ class clsCaseSolutionManager(clsNode):
         limit 2;
         """
 
-    sqlFindCaseSolutions = \
-        """
-        select
-            A."SOLUTION_ID", A."CASE_ID",
-            A."SOLUTION_FIRST_KP_NAME" as "KP_PATH1", A."NODE1_PATH1_CATEGORY", A."NODE2_PATH1_CATEGORY", A."EDGE1_PATH1_PREDICATE",
-            A."SOLUTION_SECOND_KP_NAME" as "KP_PATH2", A."NODE1_PATH2_CATEGORY", A."NODE2_PATH2_CATEGORY", A."EDGE1_PATH2_PREDICATE",
-        case
-            when "xARA_KP_Info"."Priority" IS NULL THEN 0
-            else "xARA_KP_Info"."Priority" END AS "Priority" 
-        from( 
-            select 
-                "SOLUTION_ID", "CASE_ID", 
-                "SOLUTION_FIRST_KP_NAME", "NODE1_PATH1_CATEGORY", "NODE2_PATH1_CATEGORY", "EDGE1_PATH1_PREDICATE",
-                "SOLUTION_SECOND_KP_NAME", "NODE1_PATH2_CATEGORY", "NODE2_PATH2_CATEGORY", "EDGE1_PATH2_PREDICATE"
-            from "xARA_CaseSolutions" 
-            where "CASE_ID" = ANY(array[:caseIds])
-        )
-        A LEFT OUTER JOIN "xARA_KP_Info"
-        ON A."SOLUTION_FIRST_KP_NAME" = "xARA_KP_Info"."KP_Name"
-        """
-
     def __init__(self, dispatchId: int, dispatchDescription: str, userRequestBody: dict, workflow: Workflow):
         """
         Constructor
@@ -135,7 +114,12 @@ class clsCaseSolutionManager(clsNode):
         # class that finds a case problem list for a subject, predicate, and object
         self.case_problem_searcher = None
 
-        self.kp_urls = None
+        # knowledge provider name -> URL, filled from the loaded case solutions
+        self.kp_urls = {}
+        # process-wide loader batching the case solution queries of all managers, see clsCaseSolutionLoader
+        self.case_solution_loader = None
+        # conflated node categories used by filter_case_solutions, the built-in ones if None
+        self.case_solution_conflations = None
 
         self.one_hop_origin = ["fromKP", "derived"]
         self.multiple_hop_origin = ["fromKP"]
@@ -158,37 +142,10 @@ class clsCaseSolutionManager(clsNode):
         Gathers all data that is needed from the database
         :return:
         """
-        self.retrieve_kp_urls()
-
-    def retrieve_kp_urls(self):
-        """
-
-        :return:
-        """
-        self.kp_urls = {}
-
-        # Select the current environment mode as the primary URL column to request, failing over to more mature URLs if there is no URL present.
-        # Order is currently Development -> Staging (CI) -> Testing -> Prod
-        for environment_mode_index, mode_label in enumerate(environmentModeKPURLColumn.keys()):
-            if mode_label == environmentMode:
-                break
-        else:
-            environment_mode_index = -1
-
-        coalesce_arguments = []
-        for column_name in list(environmentModeKPURLColumn.keys())[environment_mode_index:]:
-            coalesce_arguments.append(f"""NULLIF("{environmentModeKPURLColumn[column_name]}",'')""")
-        query = f"""
-        SELECT "KP_Name", COALESCE({", ".join(coalesce_arguments)}) as "URL" FROM public."xARA_KP_Info";
-        """
-
-        with self.app.app_context():
-            results = db.session.execute(query).fetchall()
-
-        for result in results:
-            kp_name = result[0]
-            url = result[1]
-            self.kp_urls[kp_name] = url
+        self.case_solution_loader = clsCaseSolutionLoader.instance(self.app)
+        # conflations of the local similarity snapshot the case problems are matched with
+        snapshot = self.case_problem_searcher.get_similarity_snapshot() if self.case_problem_searcher is not None else None
+        self.case_solution_conflations = clsLocalSimilarityStore.instance(self.app).get_case_solution_conflations(snapshot)
 
     def extractMetadataFromUserRequestBody(self):
 
@@ -383,73 +340,14 @@ class clsCaseSolutionManager(clsNode):
 
     def filter_case_solutions(self, solutions):
         """
-        Removes redundant case solutions: remove all solutions that use the same KP as another and have ontologically similar node types.
+        Removes redundant case solutions: of the one hop solutions that use the same KP and ontologically similar node types, keeps the most specific.
         :param solutions: List of tuples
         :return:
         """
-        # TODO: Load conflations from DB:
-        # SELECT "NEW_CASE_NODE", "CANDIDATE_CASE_NODE", "SIMILARITY_SCORE" FROM public."xARA_LocalSimNodes" WHERE "SIMILARITY_SCORE" > 0.9 AND "NEW_CASE_NODE" != "CANDIDATE_CASE_NODE";
-
-        CONFLATIONS = {
-            "biolink:Gene": {"biolink:Protein"},
-            "biolink:Protein": {"biolink:Gene"},
-            "biolink:ChemicalEntity": {"biolink:SmallMolecule"},
-            "biolink:SmallMolecule": {"biolink:ChemicalEntity"},
-        }
-        PRIORITIES = [
-            ["biolink:SmallMolecule", "biolink:ChemicalEntity"],
-            ["biolink:Protein", "biolink:Gene"]
-        ]
-
-        # first filter the results to those that only have one hop and are the same KP
-        excluding_solutions = list(filter(lambda row: row["KP_PATH2"] is None, solutions))
-        # filter cases that don't have any potential conflations
-        excluding_solutions = list(filter(lambda row: row["NODE1_PATH1_CATEGORY"] in CONFLATIONS or row["NODE2_PATH1_CATEGORY"] in CONFLATIONS, excluding_solutions))
-
-        duplicate_solutions = {}
-
-        # only compare those that have the same KP
-        for i, solution_a in enumerate(excluding_solutions):
-            for j, solution_b in enumerate(excluding_solutions):
-                if solution_a["SOLUTION_ID"] != solution_b["SOLUTION_ID"] and solution_a["KP_PATH1"] == solution_b["KP_PATH1"]:
-                    if solution_a["KP_PATH1"] not in duplicate_solutions:
-                        duplicate_solutions[solution_a["KP_PATH1"]] = set()
-                    duplicate_solutions[solution_a["KP_PATH1"]].add(solution_a)
-                    duplicate_solutions[solution_a["KP_PATH1"]].add(solution_b)
-
-        excluded_solutions = set()
-        for kp, conflated_solutions in duplicate_solutions.items():
-            if len(conflated_solutions) > 1:
-                # of all the solutions, select the one that has the lowest index in PRIORITIES, meaning it is most specific
-                solution_subject_priorities = {}
-                solution_object_priorities = {}
-                for solution in conflated_solutions:
-                    for priority_set in PRIORITIES:
-                        if solution["NODE1_PATH1_CATEGORY"] in priority_set:
-                            subject_index = priority_set.index(solution["NODE1_PATH1_CATEGORY"])
-                            if subject_index > -1:
-                                solution_subject_priorities[solution] = subject_index
-
-                        if solution["NODE2_PATH1_CATEGORY"] in priority_set:
-                            object_index = priority_set.index(solution["NODE2_PATH1_CATEGORY"])
-                            if object_index > -1:
-                                solution_object_priorities[solution] = object_index
-
-                if len(solution_subject_priorities) > 0:
-                    lowest_solution = min(solution_subject_priorities, key=solution_subject_priorities.get)
-                elif len(solution_object_priorities) > 0:
-                    lowest_solution = min(solution_object_priorities, key=solution_object_priorities.get)
-                else:
-                    lowest_solution = list(conflated_solutions)[0]
-
-                # keep the lowest solution, discard all others
-                for solution in conflated_solutions:
-                    if solution != lowest_solution:
-                        excluded_solutions.add(solution)
-
-        filtered_solutions = list(filter(lambda row: row not in excluded_solutions, solutions))
-
-        return filtered_solutions
+        conflations = self.case_solution_conflations
+        if conflations is None:
+            conflations = clsCaseSolutionConflations()
+        return conflations.filter(solutions)
 
     def findCaseSolutions(self):
         case_solution_sorter = clsCaseSolutionRetrival()
@@ -469,51 +367,49 @@ class clsCaseSolutionManager(clsNode):
                 kp_deny_list = operation.deny_list
 
         case_id_to_solutions = {}
-        with self.app.app_context():
-            # add a WHERE clause to the solution retrieval query to select a subset based on the Fill operation
-            find_case_solutions = copy.copy(self.sqlFindCaseSolutions)
-            if kp_allow_list:
-                kp_list = kp_allow_list
-                find_case_solutions += """ WHERE A."SOLUTION_FIRST_KP_NAME" = ANY(array[:kpList])"""
-                logging.debug(f"Using allow list: {kp_list}")
-            elif kp_deny_list:
-                kp_list = kp_deny_list
-                find_case_solutions += """ WHERE NOT (A."SOLUTION_FIRST_KP_NAME" = ANY(array[:kpList]))"""
-                logging.debug(f"Using deny list: {kp_list}")
-            else:
-                kp_list = None
-                logging.debug(f"No fill list provided, retrieving all solutions")
-
-            results = db.session.execute(
-                statement=find_case_solutions,
-                params={
-                    "caseIds": list(all_case_ids),
-                    "kpList": kp_list
-                }
-            ).fetchall()
-            logging.debug(f"Matched {len(results)} Case Solutions.")
-
-            self.logs.append(clsLogEvent(
-                identifier=f"Case Solution Manager",
-                level="DEBUG",
-                code="",
-                message=f"Matched {len(results)} Case Solutions with {'allow' if kp_allow_list else 'deny'} list: {kp_list}"
-            ))
-
-            filtered_results = self.filter_case_solutions(results)
-
-            self.logs.append(clsLogEvent(
-                identifier=f"Case Solution Manager",
-                level="DEBUG",
-                code="",
-                message=f"Filtered {len(results) - len(filtered_results)} conflated Case Solutions: {[solution['SOLUTION_ID'] for solution in sorted(list(set(results) - set(filtered_results)))]}"
-            ))
-
-            for result in filtered_results:
-                case_id = result[1]
-                if case_id not in case_id_to_solutions:
-                    case_id_to_solutions[case_id] = []
-                case_id_to_solutions[case_id].append(result)
+        # the rows of all managers are loaded in one query and cached, so the Fill operation is applied here rather than in SQL.
+        # A solution without a first KP is excluded by both lists, as by "= ANY" in SQL.
+        loaded_solutions = self.case_solution_loader.load(all_case_ids)
+        results = [row for rows in loaded_solutions.values() for row in rows]
+        if kp_allow_list:
+            kp_list = kp_allow_list
+            results = [row for row in results if row["KP_PATH1"] is not None and row["KP_PATH1"] in kp_list]
+            logging.debug(f"Using allow list: {kp_list}")
+        elif kp_deny_list:
+            kp_list = kp_deny_list
+            results = [row for row in results if row["KP_PATH1"] is not None and row["KP_PATH1"] not in kp_list]
+            logging.debug(f"Using deny list: {kp_list}")
+        else:
+            kp_list = None
+            logging.debug(f"No fill list provided, retrieving all solutions")
+        logging.debug(f"Matched {len(results)} Case Solutions.")
+
+        for row in results:
+            self.kp_urls[row["KP_PATH1"]] = row["KP_PATH1_URL"]
+            if row["KP_PATH2"] is not None:
+                self.kp_urls[row["KP_PATH2"]] = row["KP_PATH2_URL"]
+
+        self.logs.append(clsLogEvent(
+            identifier=f"Case Solution Manager",
+            level="DEBUG",
+            code="",
+            message=f"Matched {len(results)} Case Solutions with {'allow' if kp_allow_list else 'deny'} list: {kp_list}"
+        ))
+
+        filtered_results = self.filter_case_solutions(results)
+
+        self.logs.append(clsLogEvent(
+            identifier=f"Case Solution Manager",
+            level="DEBUG",
+            code="",
+            message=f"Filtered {len(results) - len(filtered_results)} conflated Case Solutions: {[solution['SOLUTION_ID'] for solution in sorted(list(set(results) - set(filtered_results)))]}"
+        ))
+
+        for result in filtered_results:
+            case_id = result[1]
+            if case_id not in case_id_to_solutions:
+                case_id_to_solutions[case_id] = []
+            case_id_to_solutions[case_id].append(result)
 
         caseSolutionDispatchId = 1
 
@@ -6,7 +6,10 @@ FUTURE IMPROVEMENTS: See clsKnowledgeProvider for log style
 WHO: SL 2021-05-18
 """
 
+from typing import Optional, Tuple
 from extensions.requests_extension import request_with_global_timeout
+from utils.clsTtlCache import clsTtlCache
+import modConfig
 
 
 class clsCategoriesProvider:
@@ -17,6 +20,10 @@ class clsCategoriesProvider:
 
     url = "https://nodenormalization-sri.renci.org/1.3/get_normalized_nodes"
 
+    # curie id -> first category, or None when the service has none, shared by every query
+    cache = clsTtlCache(name="categories", ttl_seconds=modConfig.sriCacheTtlSeconds, max_size=modConfig.sriCacheMaxSize,
+                        sqlite_path=modConfig.sriCacheSqlitePath)
+
     def __init__(self, curieIds: list):
         """
         Constructor
@@ -27,33 +34,56 @@ class clsCategoriesProvider:
         self.responseBody = None
         self.categories = None
 
-    def getCategories(self):
+    @staticmethod
+    def extract_category(metadata):
         """
-        Method to call the provider via http and get the valid categories
-        :returns: None
+        Gets the first category of a node normalizer response entry, making sure their response is consistent
+        :param metadata: Response entry of one curie id
+        :return: Category or None
         """
+        if metadata is None: return None
+        if type(metadata) != dict: return None
+        if 'type' not in metadata: return None
+        if type(metadata['type']) != list: return None
+        if len(metadata['type']) == 0: return None
+        if type(metadata['type'][0]) != str: return None
+        return metadata['type'][0]
+
+    @classmethod
+    def resolve_categories(cls, curieIds: list) -> Tuple[dict, Optional[dict]]:
+        """
+        Gets the categories of many curie ids at once, the curie ids missing from the cache are sent in one request
+        :param curieIds: List of curie ids
+        :return: Tuple of the dictionary of curie id -> category (None for a curie id without a category) and the response body of the request for
+                 the missing curie ids (None if every curie id was cached)
+        """
+        categories, missing_curie_ids = cls.cache.get_many(curieIds)
+        if not missing_curie_ids:
+            return categories, None
 
         response = request_with_global_timeout(
             method="post",
-            url=self.url,
-            # global_timeout=self.timeoutSeconds,
+            url=cls.url,
+            # global_timeout=cls.timeoutSeconds,
             global_timeout=None,
-            json=self.requestBody
+            json={"curies": missing_curie_ids}
         )
         response.raise_for_status()
-        self.responseBody = response.json()
-
-        # making sure their response is consistent
-        categories = set()
-        for curieId in self.curieIds:
-            metadata = self.responseBody.get(curieId)
-            if metadata is None: continue
-            if type(metadata) != dict: continue
-            if 'type' not in metadata: continue
-            if type(metadata['type']) != list: continue
-            if len(metadata['type']) == 0: continue
-            if type(metadata['type'][0]) != str: continue
-            categories.add(metadata['type'][0])
+        responseBody = response.json()
+
+        looked_up = {curieId: cls.extract_category(responseBody.get(curieId)) for curieId in missing_curie_ids}
+        cls.cache.set_many(looked_up)
+        categories.update(looked_up)
+        return categories, responseBody
+
+    def getCategories(self):
+        """
+        Method to call the provider via http and get the valid categories
+        :returns: None
+        """
+
+        curie_categories, self.responseBody = self.resolve_categories(self.curieIds)
+        categories = set(category for category in curie_categories.values() if category is not None)
 
         self.categories = sorted(list(categories))
 
@@ -7,6 +7,9 @@ WHO: SL 2021-05-31
 """
 
 from extensions.requests_extension import request_with_global_timeout
+from concurrent.futures import ThreadPoolExecutor
+from utils.clsTtlCache import clsTtlCache
+import modConfig
 
 
 class clsCurieIdsProvider:
@@ -17,6 +20,10 @@ class clsCurieIdsProvider:
 
     url = "https://name-resolution-sri.renci.org/lookup"
 
+    # normalized name -> curie ids, shared by every query
+    cache = clsTtlCache(name="curie_ids", ttl_seconds=modConfig.sriCacheTtlSeconds, max_size=modConfig.sriCacheMaxSize,
+                        sqlite_path=modConfig.sriCacheSqlitePath)
+
     def __init__(self, names: list):
         """
         Constructor
@@ -25,6 +32,54 @@ class clsCurieIdsProvider:
         self.names = sorted(list(set(names)))
         self.curieIds = None
 
+    @staticmethod
+    def normalize_name(name: str) -> str:
+        return " ".join(str(name).split()).lower()
+
+    @classmethod
+    def lookup(cls, name: str) -> list:
+        """
+        Looks up one name, the lookup service has no bulk endpoint
+        :param name: Name to look up
+        :return: List of curie ids
+        """
+        response = request_with_global_timeout(
+            method="post",
+            url=cls.url,
+            # global_timeout=cls.timeoutSeconds,
+            global_timeout=None,
+            params={
+                "string": name,
+                "offset": 0,
+                "limit": 1
+            }
+        )
+        response.raise_for_status()
+        return list(response.json().keys())
+
+    @classmethod
+    def resolve_names(cls, names: list) -> dict:
+        """
+        Gets the curie ids of many names at once. Names missing from the cache are looked up in parallel, at most modConfig.sriLookupMaxWorkers at a time.
+        :param names: List of names
+        :return: Dictionary of name -> list of curie ids
+        """
+        normalized_names = {name: cls.normalize_name(name) for name in names}
+        curie_ids, missing_names = cls.cache.get_many(list(normalized_names.values()))
+
+        if missing_names:
+            # the first spelling of each missing name is sent upstream
+            original_names = {}
+            for name, normalized_name in normalized_names.items():
+                original_names.setdefault(normalized_name, name)
+            with ThreadPoolExecutor(max_workers=min(len(missing_names), modConfig.sriLookupMaxWorkers)) as executor:
+                curie_id_lists = executor.map(cls.lookup, [original_names[normalized_name] for normalized_name in missing_names])
+                looked_up = dict(zip(missing_names, curie_id_lists))
+            cls.cache.set_many(looked_up)
+            curie_ids.update(looked_up)
+
+        return {name: curie_ids[normalized_name] for name, normalized_name in normalized_names.items()}
+
     def getCurieIds(self):
         """
         Method to call the provider via http and get the valid curie ids
@@ -32,22 +87,8 @@ class clsCurieIdsProvider:
         """
 
         curieIds = set()
-        for name in self.names:
-            response = request_with_global_timeout(
-                method="post",
-                url=self.url,
-                # global_timeout=self.timeoutSeconds,
-                global_timeout=None,
-                params={
-                    "string": name,
-                    "offset": 0,
-                    "limit": 1
-                }
-            )
-            response.raise_for_status()
-            responseBody = response.json()
-            for curieId, names in responseBody.items():
-                curieIds.add(curieId)
+        for names_curie_ids in self.resolve_names(self.names).values():
+            curieIds.update(names_curie_ids)
 
         self.curieIds = sorted(list(curieIds))
 
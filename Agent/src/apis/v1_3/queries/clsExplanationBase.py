@@ -1,12 +1,40 @@
+from typing import Callable, Optional
+
+
+class clsAttributeCriterion:
+    """
+    A condition one attribute of an edge meets, see clsExplanationBase.attribute_criteria
+    """
+
+    def __init__(self, attribute_type_id: Optional[str], test: Callable[[dict], bool]):
+        """
+        Constructor
+        :param attribute_type_id: "attribute_type_id" the attribute must have, None for any
+        :param test: Rest of the condition, only called for attributes of that type
+        """
+        self.attribute_type_id = attribute_type_id
+        self.test = test
+
+    def matches(self, attribute) -> bool:
+        return (self.attribute_type_id is None or attribute['attribute_type_id'] == self.attribute_type_id) and self.test(attribute)
+
+
 class clsExplanationBase:
 
+    # conditions that are each met by an attribute of the same edge when the case applies to that edge, None if the case has no attribute criteria.
+    # clsExplanationRegistry indexes them to test every case against a knowledge graph in one pass.
+    attribute_criteria = None
+
     def edgeAttributeValidate(self, edge):
         """
-        Returns how many attributes in the edge meet the case criteria
+        Checks if the attributes in the edge meet every case criterion
         """
-        raise NotImplementedError
+        if self.attribute_criteria is None:
+            return False
+        return all(any(criterion.matches(attribute) for attribute in edge["attributes"]) for criterion in self.attribute_criteria)
 
-    def attribute_has_value(self, attribute_value, test_value):
+    @staticmethod
+    def attribute_has_value(attribute_value, test_value):
         """
         Checks if an attribute object has a key with the specified value. As there are no standards on value content (e.g. a string or a list of strings)
         we have to check thoroughly.
@@ -0,0 +1,187 @@
+"""
+WHAT: The explanation case problems, their result weights, the KPs excluded from explanations and the global result threshold, loaded together
+WHY: ExplanationSolutionFinder re-read these four tables for every request. The catalog is now built once per local similarity snapshot (see
+     clsLocalSimilarityStore.get_explanation_catalog), so a reload swaps it together with the similarities it is scored against. The scored problems
+     are encoded like the case problems (see clsCaseProblemMatrix), so all of them are scored against a request with a few numpy operations.
+ASSUMES: The tables change rarely, same as the local similarity tables
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-31, vectorized scoring TZ 2023-04-01
+"""
+
+from modDatabase import db
+from .clsCaseProblemMatrix import clsCaseProblemMatrix
+import logging
+import numpy as np
+import pandas as pd
+
+
+class clsExplanationProblem:
+    """
+    An explanation case problem that can be scored by similarity, with its weights converted to floats
+    """
+
+    def __init__(self, case_id: str, kp_name: str, subject_node: str, object_node: str, predicate: str, weights: dict):
+        self.case_id = case_id
+        self.kp_name = kp_name
+        self.subject_node = subject_node
+        self.object_node = object_node
+        self.predicate = predicate
+        self.kp_weight = weights["KP_WEIGHT"]
+        # the node similarity is the best average of both node pairs, so it gets the average of both node weights
+        self.node_weight = (weights["SUBJECT_NODE_WEIGHT"] + weights["OBJECT_NODE_WEIGHT"]) / 2
+        self.predicate_weight = weights["PREDICATE_WEIGHT"]
+        self.weight_sum = sum((self.kp_weight, self.node_weight, self.predicate_weight))
+
+
+class clsExplanationCatalog:
+    """
+    See header
+    """
+    sqlRetrieveExplanationProblems = \
+        """
+        SELECT "CASE_ID", "CASE_NAME", "KP_NAME", "SUBJECT_NODE", "OBJECT_NODE", "PREDICATE",
+        "SELECTION CRITERION 1", "SELECTION CRITERION 2"
+        FROM "xARA_ExplanationCaseProblems";
+        """
+
+    sqlRetrieveExplanationExcludedKPs = \
+        """
+        SELECT "KP" FROM "xARA_KP_ExplanationExclusions";
+        """
+
+    sqlRetrieveResultWeights = \
+        """
+        SELECT "XCASE_ID", "SUBJECT_NODE_WEIGHT", "OBJECT_NODE_WEIGHT", "PREDICATE_WEIGHT", "KP_WEIGHT"
+        FROM "xARA_ResultWeights";
+        """
+
+    sqlRetrieveGlobalResultThreshold = \
+        """
+        SELECT "GLOBAL_RESULT_THRESHOLD" FROM "xARA_Config";
+        """
+
+    weightKeys = ["SUBJECT_NODE_WEIGHT", "OBJECT_NODE_WEIGHT", "PREDICATE_WEIGHT", "KP_WEIGHT"]
+
+    # currently not implemented due to missing database data
+    unscoredCaseIds = {"X00004"}
+
+    def __init__(self, problems: list, excluded_kps: set, weights: dict, similarity_threshold: float, node_similarities: dict = None,
+                 predicate_similarities: dict = None):
+        """
+        Constructor
+        :param problems: Every "xARA_ExplanationCaseProblems" row, in table order
+        :param excluded_kps: KPs whose results are always explained by X00014
+        :param weights: Dictionary of case id -> dictionary of weight column -> float or None
+        :param similarity_threshold: Global result threshold a case similarity must exceed
+        :param node_similarities: Dictionary of (node1, node2) -> similarity, see clsLocalSimilarityStore
+        :param predicate_similarities: Dictionary of (predicate1, predicate2) -> similarity, see clsLocalSimilarityStore
+        """
+        self.problems = problems
+        self.excluded_kps = frozenset(excluded_kps)
+        self.weights = weights
+        self.similarity_threshold = similarity_threshold
+
+        # the problems search() scores, in table order
+        self.scored_problems = []
+        for problem in problems:
+            case_id = problem["CASE_ID"]
+            problem_weights = weights.get(case_id, dict.fromkeys(self.weightKeys))
+            if case_id in self.unscoredCaseIds:
+                continue
+            # if there are no weights (not just a missing case ID, they can also be nulls in the DB) skip this explanation case
+            if all(problem_weights[key] is None for key in self.weightKeys):
+                continue
+            if any(problem_weights[key] is None for key in self.weightKeys):
+                logging.warning(f"Explanation case {case_id} has only some of its result weights, it is not scored")
+                continue
+            self.scored_problems.append(clsExplanationProblem(
+                case_id=case_id,
+                kp_name=problem["KP_NAME"],
+                subject_node=problem["SUBJECT_NODE"],
+                object_node=problem["OBJECT_NODE"],
+                predicate=problem["PREDICATE"],
+                weights=problem_weights
+            ))
+
+        # the categories and predicates of the scored problems encoded against dense local similarity matrices
+        self.problem_matrix = clsCaseProblemMatrix(
+            cases=pd.DataFrame({
+                "N00_NODE_CATEGORY": [problem.subject_node for problem in self.scored_problems],
+                "N01_NODE_CATEGORY": [problem.object_node for problem in self.scored_problems],
+                "E00_EDGE_PREDICATE": [problem.predicate for problem in self.scored_problems],
+                "CASE_ID": [problem.case_id for problem in self.scored_problems],
+                "ORIGIN": "EXPLANATION",
+            }, columns=["N00_NODE_CATEGORY", "N01_NODE_CATEGORY", "E00_EDGE_PREDICATE", "CASE_ID", "ORIGIN"]),
+            node_similarities=node_similarities or {},
+            predicate_similarities=predicate_similarities or {}
+        )
+        self.kp_codes = {kp_name: code for code, kp_name in enumerate(clsCaseProblemMatrix.vocabulary(problem.kp_name for problem in self.scored_problems))}
+        self.problem_kp_codes = clsCaseProblemMatrix.encode([problem.kp_name for problem in self.scored_problems], self.kp_codes)
+        self.kp_weights = np.array([problem.kp_weight for problem in self.scored_problems], dtype=np.float64)
+        self.node_weights = np.array([problem.node_weight for problem in self.scored_problems], dtype=np.float64)
+        self.predicate_weights = np.array([problem.predicate_weight for problem in self.scored_problems], dtype=np.float64)
+        self.weight_sums = np.array([problem.weight_sum for problem in self.scored_problems], dtype=np.float64)
+
+    def similarities(self, new_subject, new_object, new_predicate, kp_name) -> np.ndarray:
+        """
+        Explanation global edge definition similarity of every scored problem:
+            GXS = (KPS * KP weight + XNLS * node weight + XPS * predicate weight) / SUM(weights)
+        with KPS 1 for the same KP and 0 otherwise, XPS the predicate local similarity and XNLS the best average node local similarity of the
+        subject and object, compared straight or crossed
+        :param new_subject: New case subject category
+        :param new_object: New case object category
+        :param new_predicate: New case predicate
+        :param kp_name: Name of the KP that returned the results
+        :return: Float numpy array aligned with scored_problems
+        """
+        matrix = self.problem_matrix
+        kps = (self.problem_kp_codes == self.kp_codes.get(kp_name, -1)).astype(np.float64)
+        xps = matrix.predicate_similarity_row(new_predicate)[matrix.predicate_case_codes]
+
+        subject_similarity = matrix.node_similarity_row(new_subject)
+        object_similarity = matrix.node_similarity_row(new_object)
+        avg_node_similarity = (subject_similarity[matrix.subject_codes] + object_similarity[matrix.object_codes]) / 2
+        avg_x_node_similarity = (subject_similarity[matrix.object_codes] + object_similarity[matrix.subject_codes]) / 2
+        xnls = np.maximum(avg_node_similarity, avg_x_node_similarity)
+
+        return (kps * self.kp_weights + xnls * self.node_weights + xps * self.predicate_weights) / self.weight_sums
+
+    def find_best_problem(self, new_subject, new_object, new_predicate, kp_name):
+        """
+        Finds the scored problem with the highest similarity above the global result threshold, the first one in table order on ties
+        :param new_subject: New case subject category
+        :param new_object: New case object category
+        :param new_predicate: New case predicate
+        :param kp_name: Name of the KP that returned the results
+        :return: Tuple of the case id and its similarity, None if no similarity is above the threshold
+        """
+        if len(self.scored_problems) == 0:
+            return None
+        similarities = self.similarities(new_subject, new_object, new_predicate, kp_name)
+        best = int(np.argmax(similarities))
+        if similarities[best] > self.similarity_threshold:
+            return self.scored_problems[best].case_id, float(similarities[best])
+        return None
+
+    @classmethod
+    def load(cls, app, node_similarities: dict = None, predicate_similarities: dict = None):
+        """
+        Reads the four tables
+        :param app: Flask application context, used to send requests to the database.
+        :param node_similarities: See constructor
+        :param predicate_similarities: See constructor
+        :return: clsExplanationCatalog
+        """
+        with app.app_context():
+            problems = db.session.execute(cls.sqlRetrieveExplanationProblems).mappings().all()
+            excluded_kps = {row["KP"] for row in db.session.execute(cls.sqlRetrieveExplanationExcludedKPs).mappings().all()}
+            weight_rows = db.session.execute(cls.sqlRetrieveResultWeights).mappings().all()
+            similarity_threshold = float(db.session.execute(cls.sqlRetrieveGlobalResultThreshold).fetchall()[0][0])
+
+        # convert the weights from decimal to float
+        weights = {}
+        for row in weight_rows:
+            weights[row["XCASE_ID"]] = {key: (float(row[key]) if row[key] is not None else None) for key in cls.weightKeys}
+
+        return cls(problems=problems, excluded_kps=excluded_kps, weights=weights, similarity_threshold=similarity_threshold,
+                   node_similarities=node_similarities, predicate_similarities=predicate_similarities)
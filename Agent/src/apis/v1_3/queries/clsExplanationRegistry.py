@@ -0,0 +1,181 @@
+"""
+WHAT: Prebuilt handlers that create the explanation of each case, and an index of the explanation cases whose attribute criteria an edge of a knowledge
+      graph meets
+WHY: ExplanationSolutionFinder.retrieve_explanation_solution rebuilt a dictionary of lambdas, X00001 text tables included, for every result. When no case
+     was similar enough, search() created every explanation and ran its edgeAttributeValidate over the edges, scanning them once per case. The handlers
+     are now built once per process, and attribute_matches finds every applicable case in one pass over the attributes of the knowledge graph.
+ASSUMES: Explanations keep per-result state (kp_name, logs), so a handler still creates a new explanation for the case it is chosen for, with its
+         constant arguments shared. The attribute criteria of a case are those of clsExplanationBase.attribute_criteria.
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-04-01
+"""
+
+import threading
+from .clsExplanationX00001 import ExplanationX00001
+from .clsExplanationX00002 import ExplanationX00002
+from .clsExplanationX00003 import ExplanationX00003
+from .clsExplanationX00004 import ExplanationX00004
+from .clsExplanationX00005 import ExplanationX00005
+from .clsExplanationX00006 import ExplanationX00006
+from .clsExplanationX00007 import ExplanationX00007
+from .clsExplanationX00008 import ExplanationX00008
+from .clsExplanationX00009 import ExplanationX00009
+from .clsExplanationX00010 import ExplanationX00010
+from .clsExplanationX00011 import ExplanationX00011
+from .clsExplanationX00012 import ExplanationX00012
+from .clsExplanationX00013 import ExplanationX00013
+from .clsExplanationX00014 import ExplanationX00014
+from .clsExplanationX00015 import ExplanationX00015
+from .clsExplanationX00016 import ExplanationX00016
+
+
+class clsExplanationHandler:
+    """
+    Creates the explanation of one case
+    """
+
+    def __init__(self, case_id: str, explanation_class, create):
+        """
+        Constructor
+        :param case_id: Explanation case id
+        :param explanation_class: Class of the explanation
+        :param create: Function of the Flask application and the KP name that returns a new explanation
+        """
+        self.case_id = case_id
+        self.explanation_class = explanation_class
+        self.create = create
+        self.attribute_criteria = explanation_class.attribute_criteria
+
+
+class clsExplanationRegistry:
+    """
+    See header
+    """
+
+    x00001EdgeValues = frozenset({"MAGMA_GENE", "RC_GENES", "INTEGRATED_GENETICS"})
+
+    x00001ValueCombinations = {
+        frozenset(): (
+            "Disease-Gene association could not be determined.",
+            0.0
+        ),
+        frozenset(("MAGMA_GENE",)): (
+            "Disease-Gene association was identified via  MAGMA_GENE (a standard method for identifying gene-condition associations from variant-level associations using  proximity-based assignments from GWAS data), but was not confirmed by any of the two other methods used, namely, RC_GENES and INTEGRATED_GENETICS. These methods are still  experimental. Considering MAGMA_GENE is a standard method in the field, we still maintain acceptable confidence in these results.",
+            0.75
+        ),
+        frozenset(("RC_GENES",)): (
+            "Disease-Gene association was identified only by RC_GENES (an experimental method for identifying gene-condition associations using a novel  combination of established methods). Results were not confirmed using the  standard MAGMA_GENE method. RC_GENES is an experimental method, and false positives may be present. For more details see: https://www.biorxiv.org/content/10.1101/2020.06.28.171561v2 For this reason,  we consider these results to be the associations with lowest confidence.",
+            0.5
+        ),
+        frozenset(("INTEGRATED_GENETICS",)): (
+            "Disease-Gene association was identified only by INTEGRATED_GENETICS (an experimental method for identifying  gene-condition associations using a novel combination of established methods).  Results were not confirmed using the standard MAGMA_GENE method.  INTEGRATED_GENETICS is still in development and undergoing optimization; false-positives may be present. For this reason, we consider these results to be  the associations with lowest confidence.",
+            0.25
+        ),
+        frozenset(("MAGMA_GENE", "RC_GENES")): (
+            "Disease-Gene association was identified via MAGMA_GENE (a  standard method for identifying gene-condition associations from variant-level associations using proximity-based assignments from GWAS data) AND was also identified by RC_GENES (an experimental but highly principled method for identifying gene-condition associations using a novel combination of established methods). RC_GENES is still in development and  undergoing optimization; false-positives may be present. Confirmation of the  association with both available methods from this KP gives us high confidence  in these results.",
+            1.0
+        ),
+        frozenset(("MAGMA_GENE", "INTEGRATED_GENETICS")): (
+            "Disease-Gene association was identified via MAGMA_GENE (a standard method for identifying gene-condition associations from variant-level associations using proximity-based assignments from GWAS data) AND was also identified by INTEGRATED_GENETICS (an experimental  method for identifying gene-condition associations using a novel combination of established methods). INTEGRATED_GENETICS is still in development and undergoing optimization; false-positives may be present. Confirmation of the  association with both available methods from this KP gives us high confidence in these results.",
+            1.0
+        ),
+        frozenset(("RC_GENES", "INTEGRATED_GENETICS")): (
+            "Disease-Gene association was identified by RC_GENES and INTEGRATED_GENETICS (both are experimental methods for identifying  gene-condition associations using a novel combination of established methods). Results were not confirmed using the standard MAGMA_GENE method. INTEGRATED_GENETICS and RC_GENES are experimental method, and false positives may be present. For more details see: https://www.biorxiv.org/content/10.1101/2020.06.28.171561v2 For this reason,  we consider these results to be the associations with low confidence.",
+            0.6
+        ),
+        frozenset(("MAGMA_GENE", "RC_GENES", "INTEGRATED_GENETICS")): (
+            "Disease-Gene association was identified via MAGMA_GENE (a  standard method for identifying gene-condition associations from variant-level associations using proximity-based assignments from GWAS data) AND was also identified by RC_GENES (an experimental but highly principled method for identifying gene-condition associations using a novel combination of established methods) AND was also identified by INTEGRATED_GENETICS (an experimental  method for identifying gene-condition associations using a novel combination of established methods).  RC_GENES and INTEGRATED_GENETICS is still in development and  undergoing optimization; false-positives may be present. Confirmation of the  association with all available methods from this KP gives us high confidence in these results.",
+            1.0
+        ),
+    }
+
+    x00001Rationale = "The score was obtained based on level of maturity of methods that identify associations."
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.handlers = {}
+        for handler in [
+            clsExplanationHandler("X00001", ExplanationX00001, lambda app, kp_name: ExplanationX00001(
+                edge_values=self.x00001EdgeValues,
+                value_combinations=self.x00001ValueCombinations,
+                rationale=self.x00001Rationale
+            )),
+            clsExplanationHandler("X00002", ExplanationX00002, lambda app, kp_name: ExplanationX00002(app)),
+            clsExplanationHandler("X00003", ExplanationX00003, lambda app, kp_name: ExplanationX00003("CMAP:similarity_score", kp_name)),
+            clsExplanationHandler("X00004", ExplanationX00004, lambda app, kp_name: ExplanationX00004(kp_name)),
+            clsExplanationHandler("X00005", ExplanationX00005, lambda app, kp_name: ExplanationX00005("ln_ratio", kp_name)),
+            clsExplanationHandler("X00006", ExplanationX00006, lambda app, kp_name: ExplanationX00006("auc_roc", kp_name)),
+            clsExplanationHandler("X00007", ExplanationX00007, lambda app, kp_name: ExplanationX00007("biolink:Contribution", kp_name)),
+            clsExplanationHandler("X00008", ExplanationX00008, lambda app, kp_name: ExplanationX00008("biolink:p_value", kp_name)),
+            clsExplanationHandler("X00009", ExplanationX00009, lambda app, kp_name: ExplanationX00009(kp_name)),
+            clsExplanationHandler("X00010", ExplanationX00010, lambda app, kp_name: ExplanationX00010("enrichment_p", kp_name)),
+            clsExplanationHandler("X00011", ExplanationX00011, lambda app, kp_name: ExplanationX00011(kp_name)),
+            clsExplanationHandler("X00012", ExplanationX00012, lambda app, kp_name: ExplanationX00012(kp_name)),
+            clsExplanationHandler("X00013", ExplanationX00013, lambda app, kp_name: ExplanationX00013(kp_name)),
+            clsExplanationHandler("X00014", ExplanationX00014, lambda app, kp_name: ExplanationX00014(kp_name)),
+            clsExplanationHandler("X00015", ExplanationX00015, lambda app, kp_name: ExplanationX00015(kp_name)),
+            clsExplanationHandler("X00016", ExplanationX00016, lambda app, kp_name: ExplanationX00016(kp_name)),
+        ]:
+            self.handlers[handler.case_id] = handler
+
+        # case id -> its criteria, and attribute_type_id -> criteria of that type (None for the criteria of any type)
+        self.case_criteria = {}
+        self.criteria_by_type = {}
+        for handler in self.handlers.values():
+            if handler.attribute_criteria is None:
+                continue
+            self.case_criteria[handler.case_id] = frozenset(handler.attribute_criteria)
+            for criterion in handler.attribute_criteria:
+                self.criteria_by_type.setdefault(criterion.attribute_type_id, []).append(criterion)
+
+    @classmethod
+    def instance(cls):
+        """
+        Returns the process-wide registry, building it on first use
+        :return: clsExplanationRegistry
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def create(self, case_id: str, app, kp_name: str):
+        """
+        Creates the explanation of a case
+        :param case_id: Explanation case id
+        :param app: Flask application context, used by explanations that send requests to the database
+        :param kp_name: Name of the KP that returned the results
+        :return: Explanation, X00014 for an unknown case id
+        """
+        handler = self.handlers.get(case_id, self.handlers["X00014"])
+        return handler.create(app, kp_name)
+
+    def attribute_matches(self, knowledge_graph) -> set:
+        """
+        Finds the cases that have an edge whose attributes meet every attribute criterion of the case, same as edgeAttributeValidate, by testing each
+        attribute only against the criteria of its attribute_type_id
+        :param knowledge_graph: TRAPI knowledge graph
+        :return: Set of case ids
+        """
+        any_type_criteria = self.criteria_by_type.get(None, [])
+        matched_case_ids = set()
+        # the edges of a knowledge graph meet few distinct sets of criteria, so the cases of each set are only looked up once
+        cases_of_met_criteria = {}
+        for edge in knowledge_graph["edges"].values():
+            met_criteria = set()
+            for attribute in edge["attributes"]:
+                for criterion in self.criteria_by_type.get(attribute['attribute_type_id'], ()):
+                    if criterion.test(attribute):
+                        met_criteria.add(criterion)
+                for criterion in any_type_criteria:
+                    if criterion.test(attribute):
+                        met_criteria.add(criterion)
+            met_criteria = frozenset(met_criteria)
+            case_ids = cases_of_met_criteria.get(met_criteria)
+            if case_ids is None:
+                case_ids = cases_of_met_criteria[met_criteria] = {case_id for case_id, criteria in self.case_criteria.items() if criteria <= met_criteria}
+            matched_case_ids |= case_ids
+        return matched_case_ids
@@ -22,7 +22,7 @@ from modDatabase import db
 import time
 from .clsNodeNormalizerProvider import clsNodeNormalizerProvider
 from .clsNameResolutionProvider import clsNameResolutionProvider
-from utils.biobert.relationship_classification import relationship_classification
+from utils.biobert.relationship_classification import relationship_classification, get_relationship_predictor
 from utils.clsLog import clsLogEvent
 from modConfig import ZERO_RESULT_SCORE
 import re
@@ -61,7 +61,93 @@ class ExplanationX00002(clsExplanationBase):
         """
         return False
 
-    def find_references(self, synonyms, categories):
+    # largest sentence distance between a subject and an object reference for the model to classify their relationship
+    max_sentence_distance = 9
+
+    sqlFindEdgeReferences = \
+        """
+        with terms as (
+            select distinct t.edge_index, t.role, t.kind, t.token
+            from unnest(cast(:edge_indexes as integer[]), cast(:roles as text[]), cast(:kinds as text[]), cast(:tokens as text[])) as t(edge_index, role, kind, token)
+        ),
+        hits as (
+            select t.edge_index, t.role, t.kind, c."ID", c."Article_Number", c."Article_ID", c."SENT_ID", c."CHEM_TOKS" as "TOKS"
+            from terms t join public."CHEM_TOKENS_TEXT" c on c."CHEM_TOKS" = t.token
+            where t.kind = 'CHEM'
+            union all
+            select t.edge_index, t.role, t.kind, g."ID", g."Article_Number", g."Article_ID", g."SENT_ID", g."GENE_TOKS" as "TOKS"
+            from terms t join public."GENE_TOKENS_TEXT" g on g."GENE_TOKS" = t.token
+            where t.kind = 'GENE'
+        ),
+        articles as (
+            select
+                edge_index, "Article_ID",
+                min("TOKS") filter (where role = 'S') as subject_toks,
+                min("TOKS") filter (where role = 'O') as object_toks,
+                min(kind) filter (where role = 'O') as object_kind
+            from hits
+            group by edge_index, "Article_ID"
+        ),
+        -- the closest object sentence before and after every subject sentence of an article, as [SENT_ID, ID], found in one sort of the hits
+        -- instead of joining every subject hit with every object hit
+        nearest_objects as (
+            select
+                edge_index, "Article_ID", role, kind, "ID", "SENT_ID",
+                max(case when role = 'O' then array["SENT_ID", "ID"] end) over (
+                    partition by edge_index, "Article_ID" order by "SENT_ID", role rows between unbounded preceding and current row) as previous_object,
+                min(case when role = 'O' then array["SENT_ID", "ID"] end) over (
+                    partition by edge_index, "Article_ID" order by "SENT_ID", role rows between current row and unbounded following) as next_object
+            from hits
+        ),
+        candidate_pairs as (
+            select
+                edge_index, "Article_ID", kind as subject_kind, "ID" as subject_id, "SENT_ID",
+                case
+                    when next_object is null then previous_object
+                    when previous_object is null then next_object
+                    when "SENT_ID" - previous_object[1] <= next_object[1] - "SENT_ID" then previous_object
+                    else next_object end as closest_object
+            from nearest_objects
+            where role = 'S'
+        ),
+        closest_pairs as (
+            select distinct on (edge_index, "Article_ID")
+                edge_index, "Article_ID", abs("SENT_ID" - closest_object[1]) as distance, subject_kind, subject_id, closest_object[2] as object_id
+            from candidate_pairs
+            where closest_object is not null and abs("SENT_ID" - closest_object[1]) <= :max_distance
+            order by edge_index, "Article_ID", abs("SENT_ID" - closest_object[1]), "SENT_ID", subject_id
+        )
+        select
+            a.edge_index as "EDGE_INDEX", a."Article_ID", a.subject_toks as "SUBJECT_TOKS", a.object_toks as "OBJECT_TOKS",
+            p.distance as "DISTANCE",
+            coalesce(sc."CHEM_TOKS", sg."GENE_TOKS") as "CLOSEST_SUBJECT_TOKS", coalesce(oc."CHEM_TOKS", og."GENE_TOKS") as "CLOSEST_OBJECT_TOKS",
+            coalesce(sc."SENT_TEXT", sg."SENT_TEXT") as "SUBJECT_SENT_TEXT", coalesce(oc."SENT_TEXT", og."SENT_TEXT") as "OBJECT_SENT_TEXT"
+        from articles a
+        left join closest_pairs p on p.edge_index = a.edge_index and p."Article_ID" = a."Article_ID"
+        left join public."CHEM_TOKENS_TEXT" sc on p.subject_kind = 'CHEM' and sc."ID" = p.subject_id
+        left join public."GENE_TOKENS_TEXT" sg on p.subject_kind = 'GENE' and sg."ID" = p.subject_id
+        left join public."CHEM_TOKENS_TEXT" oc on a.object_kind = 'CHEM' and oc."ID" = p.object_id
+        left join public."GENE_TOKENS_TEXT" og on a.object_kind = 'GENE' and og."ID" = p.object_id
+        order by a.edge_index, a."Article_ID";
+        """
+
+    @staticmethod
+    def reference_kind(categories):
+        """
+        :param categories: Node categories
+        :return: "CHEM" or "GENE" for the token table the node is searched in, or None if no table represents the node
+        """
+        categories = [c.lower() for c in categories]
+
+        if "biolink:drug" in categories or "biolink:smallmolecule" in categories:
+            return "CHEM"
+        elif "biolink:gene" in categories or "biolink:protein" in categories or "biolink:geneproduct" in categories or "biolink:geneorgeneproduct" in categories:
+            return "GENE"
+        # elif "biolink:disease" in categories or "biolink:phenotypicfeature" in categories or "biolink:diseaseorphenotypicfeature" in categories:
+        #     return "DIS"
+        return None
+
+    def find_edge_references(self, edge_terms):
         """
         FOR every Subject Node Synonym in Subject Node Synonyms List:
             IF Subject Node Category=="biolink:Drug" or Subject Node Category=="biolink:SmallMolecule":
@@ -93,31 +179,49 @@ class ExplanationX00002(clsExplanationBase):
                        Records and extract the Sentence Record (ID, Article_Number, Article_ID, SENT_ID, SENT_TEXT, DIS_TOKS).
 
 
-        :param synonyms:
-        :param categories:
-        :return:
+        All edges are searched in one query: the synonyms of every edge are sent as one unnested array tagged with the edge and its side, subject
+        and object hits are joined on article in SQL and only the closest pair of sentences no further than max_sentence_distance apart is kept
+        per article, together with its sentence text.
+
+        :param edge_terms: List of (edge index, subject synonyms, subject categories, object synonyms, object categories)
+        :return: Dictionary of edge index -> list of article rows (see sqlFindEdgeReferences) ordered by article id, only for edges with any reference
         """
-        synonyms = [s.lower() for s in synonyms]
-        categories = [c.lower() for c in categories]
+        edge_indexes, roles, kinds, tokens = [], [], [], []
+        for edge_index, subject_synonyms, subject_categories, object_synonyms, object_categories in edge_terms:
+            for role, synonyms, categories in (("S", subject_synonyms, subject_categories), ("O", object_synonyms, object_categories)):
+                kind = self.reference_kind(categories)
+                if kind is None:
+                    continue
+                for synonym in synonyms:
+                    edge_indexes.append(edge_index)
+                    roles.append(role)
+                    kinds.append(kind)
+                    tokens.append(synonym.lower())
 
-        if "biolink:drug" in categories or "biolink:smallmolecule" in categories:
-            query = """SELECT "ID", "Article_Number", "Article_ID", "SENT_ID", "SENT_TEXT", "CHEM_TOKS" as "TOKS" FROM public."CHEM_TOKENS_TEXT" WHERE "CHEM_TOKS" = ANY(array[:synonyms]);"""
-        elif "biolink:gene" in categories or "biolink:protein" in categories or "biolink:geneproduct" in categories or "biolink:geneorgeneproduct" in categories:
-            query = """SELECT "ID", "Article_Number", "Article_ID", "SENT_ID", "SENT_TEXT", "GENE_TOKS" as "TOKS" FROM public."GENE_TOKENS_TEXT" WHERE "GENE_TOKS" = ANY(array[:synonyms]);"""
-        # elif "biolink:disease" in categories or "biolink:phenotypicfeature" in categories or "biolink:diseaseorphenotypicfeature" in categories:
-        #     query = ""
-        else:
-            return []
+        if len(tokens) == 0:
+            return {}
 
         with self.app.app_context():
-            results = db.session.execute(query, {"synonyms": synonyms}).mappings().all()
-
-
-        matches = []
+            results = db.session.execute(self.sqlFindEdgeReferences, {
+                "edge_indexes": edge_indexes,
+                "roles": roles,
+                "kinds": kinds,
+                "tokens": tokens,
+                "max_distance": self.max_sentence_distance
+            }).mappings().all()
+
+        return self.group_edge_references(results)
+
+    @staticmethod
+    def group_edge_references(results):
+        """
+        :param results: Rows of sqlFindEdgeReferences
+        :return: Dictionary of edge index -> list of article rows as dictionaries
+        """
+        edge_references = {}
         for result in results:
-            matches.append(dict(result))
-
-        return matches
+            edge_references.setdefault(result["EDGE_INDEX"], []).append(dict(result))
+        return edge_references
 
     no_found_references_attributes = [
         {
@@ -235,6 +339,33 @@ class ExplanationX00002(clsExplanationBase):
         name_resolution_provider = clsNameResolutionProvider(sorted(list(identifiers.values())))
         name_resolution_provider.get_synonyms()
 
+        # bulk search the publications of all edges whose subject and object categories have tables representing them
+        edge_terms = []
+        for index, (edgeId, edge) in enumerate(edges):
+            subject_categories = knowledge_graph['nodes'][edge["subject"]]['categories']
+            object_categories = knowledge_graph['nodes'][edge["object"]]['categories']
+            if self.reference_kind(subject_categories) is not None and self.reference_kind(object_categories) is not None:
+                edge_terms.append((
+                    index,
+                    name_resolution_provider.synonyms.get(identifiers.get(edge["subject"]), []), subject_categories,
+                    name_resolution_provider.synonyms.get(identifiers.get(edge["object"]), []), object_categories
+                ))
+        logging.debug("Getting article references")
+        self.logs.append(clsLogEvent(
+            identifier=self.case_id,
+            level="DEBUG",
+            code="",
+            message=f"Getting article references of {len(edge_terms)} edges."
+        ))
+        edge_references = self.find_edge_references(edge_terms)
+
+        close_article_ids = set()
+        for article_references in edge_references.values():
+            for reference in article_references:
+                if reference["DISTANCE"] is not None:
+                    close_article_ids.add(reference["Article_ID"])
+        article_information = self.get_article_information(sorted(close_article_ids)) if len(close_article_ids) > 0 else {}
+
         # collect all edges that have acceptable sentences to bulk predict later
         predictable_edges = []
 
@@ -301,89 +432,43 @@ class ExplanationX00002(clsExplanationBase):
                 results.append(result)
                 continue
 
-            subject_synonyms = name_resolution_provider.synonyms[identifiers[edge_subject]]
-
-            logging.debug(f"{self.case_id} edge {index+1} of {len(knowledge_graph['edges'])} getting subject article references")
+            article_references = edge_references.get(index, [])
+            subject_article_ids = [reference["Article_ID"] for reference in article_references if reference["SUBJECT_TOKS"] is not None]
+            object_article_ids = [reference["Article_ID"] for reference in article_references if reference["OBJECT_TOKS"] is not None]
             self.logs.append(clsLogEvent(
                 identifier=self.case_id,
                 level="DEBUG",
                 code="",
-                message=f"Edge {edgeId} getting subject article references."
+                message=f"Edge {edgeId} Subject references in {len(subject_article_ids)} articles, object references in {len(object_article_ids)} articles."
             ))
-            subject_references = self.find_references(subject_synonyms, subject_categories)
-            self.logs.append(clsLogEvent(
-                identifier=self.case_id,
-                level="DEBUG",
-                code="",
-                message=f"Edge {edgeId} Subject Synonyms: {subject_synonyms}, References: {len(subject_references)}."
-            ))
-
-            if len(subject_references) <= 0:
-                result['score'] = ZERO_RESULT_SCORE
-                result['attributes'] = ExplanationX00002.no_found_references_attributes
-                results.append(result)
-                continue
-
-            object_synonyms = name_resolution_provider.synonyms[identifiers[edge_object]]
-            logging.debug(f"{self.case_id} edge {index + 1} of {len(knowledge_graph['edges'])} getting object article references")
-            self.logs.append(clsLogEvent(
-                identifier=self.case_id,
-                level="DEBUG",
-                code="",
-                message=f"Edge {edgeId} getting object article references."
-            ))
-            object_references = self.find_references(object_synonyms, object_categories)
-
-            self.logs.append(clsLogEvent(
-                identifier=self.case_id,
-                level="DEBUG",
-                code="",
-                message=f"Edge {edgeId} Object Synonyms: {object_synonyms}, References: {len(object_references)}."
-            ))
-
-            # object_references = [
-            #     {'ID': 261595, 'Article_Number': '1336', 'Article_ID': '288e7bf5d16ac18731d2f1ee7db6d6ed2a720cc2', 'SENT_ID': 85,
-            #      'SENT_TEXT': 'On the other hand, AP2 and SP1 are known to activate epidermal growth factor receptor some chemical.',
-            #      'TOKS': 'some chemical'}
-            # ]
 
-            if len(object_references) <= 0:
+            if len(subject_article_ids) <= 0 or len(object_article_ids) <= 0:
                 self.logs.append(clsLogEvent(
                     identifier=self.case_id,
                     level="DEBUG",
                     code="",
-                    message=f"Edge {edgeId} No object references found, stopping."
+                    message=f"Edge {edgeId} No subject or object references found, stopping."
                 ))
                 result['score'] = ZERO_RESULT_SCORE
                 result['attributes'] = ExplanationX00002.no_found_references_attributes
                 results.append(result)
                 continue
 
-            # find matching article ids between the two lists of subject and object results
-            matching_reference_pairs_by_article = {}
-            for subject_reference in subject_references:
-                for object_reference in object_references:
-                    if subject_reference["Article_ID"] == object_reference["Article_ID"]:
-                        if subject_reference["Article_ID"] not in matching_reference_pairs_by_article:
-                            matching_reference_pairs_by_article[subject_reference["Article_ID"]] = []
-                        matching_reference_pairs_by_article[subject_reference["Article_ID"]].append((subject_reference, object_reference))
+            # articles with both subject and object references
+            matching_references = [reference for reference in article_references if reference["SUBJECT_TOKS"] is not None and reference["OBJECT_TOKS"] is not None]
 
             self.logs.append(clsLogEvent(
                 identifier=self.case_id,
                 level="DEBUG",
                 code="",
-                message=f"Edge {edgeId} Matched subject/object articles: {len(matching_reference_pairs_by_article)}."
+                message=f"Edge {edgeId} Matched subject/object articles: {len(matching_references)}."
             ))
 
-            if len(matching_reference_pairs_by_article) <= 0:
+            if len(matching_references) <= 0:
                 result['score'] = ZERO_RESULT_SCORE
                 attributes = copy.deepcopy(ExplanationX00002.no_matching_reference_pairs_attributes)
                 # get all unique PMIDs to return to the user
-                pmids = set()
-                for subject_reference in subject_references:
-                    pmids.add(subject_reference['Article_ID'])
-                for object_reference in object_references:
-                    pmids.add(object_reference['Article_ID'])
+                pmids = sorted(set(subject_article_ids) | set(object_article_ids))
 
                 attributes[1]["value"] += ", ".join(pmids)
                 result['attributes'] = attributes
@@ -396,13 +481,12 @@ class ExplanationX00002(clsExplanationBase):
                 ))
                 continue
 
-            article_information = self.get_article_information(list(matching_reference_pairs_by_article.keys()))
-
             result['attributes'] = []
             score = 0.5
 
             pairs_to_predict = []
-            for article_id, reference_pairs in matching_reference_pairs_by_article.items():
+            for reference in matching_references:
+                article_id = reference["Article_ID"]
                 if time.time() > start_time + 4.5 * 60:
                     self.logs.append(clsLogEvent(
                         identifier=self.case_id,
@@ -412,77 +496,32 @@ class ExplanationX00002(clsExplanationBase):
                     ))
                     raise TimeoutError("Explanation execution ran too long")
 
-                pair_distances = []
-                for reference_pair in reference_pairs:
-                    distance = abs(reference_pair[0]["SENT_ID"] - reference_pair[1]["SENT_ID"])
-                    pair_distances.append((reference_pair, distance, reference_pair[0]["Article_Number"]))
-
-                pair_distances.sort(key=lambda x: (x[1], x[2]))
-                closest_reference_pair_data = pair_distances[0]
-                closest_reference_pair = closest_reference_pair_data[0]
-
-                self.logs.append(clsLogEvent(
-                    identifier=self.case_id,
-                    level="DEBUG",
-                    code="",
-                    message=f"Edge {edgeId} Article {article_id} closest pair distance {closest_reference_pair_data[1]}."
-                ))
-
-                if closest_reference_pair_data[1] > 9:
+                # the query only pairs sentences within max_sentence_distance of each other
+                if reference["DISTANCE"] is None:
                     self.logs.append(clsLogEvent(
                         identifier=self.case_id,
                         level="DEBUG",
                         code="",
-                        message=f"Edge {edgeId} Sentence distance too great: {closest_reference_pair_data[1]}, stopping."
+                        message=f"Edge {edgeId} Article {article_id} sentence distance greater than {self.max_sentence_distance}, stopping."
                     ))
-                # if False:
                     attributes = copy.deepcopy(ExplanationX00002.reference_distance_too_large_attributes)
-                    attributes[1]["value"] = attributes[1]["value"].format(closest_reference_pair[0]["TOKS"], closest_reference_pair[1]["TOKS"], article_id)
+                    attributes[1]["value"] = attributes[1]["value"].format(reference["SUBJECT_TOKS"], reference["OBJECT_TOKS"], article_id)
                     result['attributes'] += attributes
                     result['score'] = score
-                    # result['attributes'] = attributes
-                    # results.append(result)
                     continue
 
-                pairs_to_predict.append((article_id, closest_reference_pair))
+                self.logs.append(clsLogEvent(
+                    identifier=self.case_id,
+                    level="DEBUG",
+                    code="",
+                    message=f"Edge {edgeId} Article {article_id} closest pair distance {reference['DISTANCE']}."
+                ))
 
-                # # combine two sentences and wrap the matched text in special characters
-                # subject_special_sentence = closest_reference_pair[0]['SENT_TEXT'].replace(closest_reference_pair[0]['TOKS'], f"<<{closest_reference_pair[0]['TOKS']}>>")
-                # object_special_sentence = closest_reference_pair[1]['SENT_TEXT'].replace(closest_reference_pair[1]['TOKS'], f"[[{closest_reference_pair[1]['TOKS']}]]")
-                # instance = f"{subject_special_sentence} {object_special_sentence}"
-                # # data_try = 'Agonistic activity of << ICI 182 780 >> on activation of GSK 3β/[[ AKT ]] pathway in the rat uterus during the estrous cycle.'
-                # self.logs.append(clsLogEvent(
-                #     identifier=self.case_id,
-                #     level="DEBUG",
-                #     code="",
-                #     message=f"Edge {edgeId} Beginning relationship classification..."
-                # ))
-                #
-                # relation_label = relationship_classification(instance)
-                # self.logs.append(clsLogEvent(
-                #     identifier=self.case_id,
-                #     level="DEBUG",
-                #     code="",
-                #     message=f"Edge {edgeId} Relationship classification finished {relation_label}"
-                # ))
-                # # import random
-                # # random.seed(1234)
-                # # relation_label = random.choice(["UPREGULATOR|ACTIVATOR|INDIRECT_UPREGULATOR", "DOWNREGULATOR|INHIBITOR|INDIRECT_DOWNREGULATOR", "AGONIST|AGONIST‐ACTIVATOR|AGONIST‐INHIBITOR", "ANTAGONIST", "SUBSTRATE|PRODUCT_OF|SUBSTRATE_PRODUCT_OF" "No RELATION"])
-                #
-                # if relation_label == "No RELATION":
-                #     attributes = copy.deepcopy(ExplanationX00002.reference_model_fail_attributes)
-                #     attributes[1]["value"] = attributes[1]["value"].format(closest_reference_pair[0]["TOKS"], closest_reference_pair[1]["TOKS"], article_id)
-                #     result['attributes'] += attributes
-                # else:
-                #     article = article_information.get(article_id, {"Title": "Article Not Found", "Author": "Article Not Found"})
-                #     attributes = copy.deepcopy(ExplanationX00002.reference_model_pass_attributes)
-                #     attributes[1]["value"] = attributes[1]["value"].format(subject_name=closest_reference_pair[0]["TOKS"],
-                #                                                            object_name=closest_reference_pair[1]["TOKS"],
-                #                                                            relation_label=relation_label, article_title=article["Title"], article_author=article["Author"])
-                #     result['attributes'] += attributes
-                #     score = 1.0
-                #
-                # result['score'] = score
+                closest_reference_pair = (
+                    {"TOKS": reference["CLOSEST_SUBJECT_TOKS"], "SENT_TEXT": reference["SUBJECT_SENT_TEXT"]},
+                    {"TOKS": reference["CLOSEST_OBJECT_TOKS"], "SENT_TEXT": reference["OBJECT_SENT_TEXT"]}
+                )
+                pairs_to_predict.append((article_id, closest_reference_pair))
 
             if len(pairs_to_predict) > 0:
                 self.logs.append(clsLogEvent(
@@ -515,6 +554,7 @@ class ExplanationX00002(clsExplanationBase):
             relation_labels = relationship_classification(prediction_sentences)
             t1 = time.time()
             logging.debug(f"Predicting {len(prediction_sentences)} sentences took {t1-t0} seconds.")
+            logging.debug(f"BioBERT batching metrics: {get_relationship_predictor().metrics()}")
             self.logs.append(clsLogEvent(
                 identifier=self.case_id,
                 level="DEBUG",
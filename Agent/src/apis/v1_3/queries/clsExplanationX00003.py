@@ -39,7 +39,7 @@ from utils.clsLog import clsLogEvent
 from modConfig import ZERO_RESULT_SCORE
 import logging
 
-from .clsExplanationBase import clsExplanationBase
+from .clsExplanationBase import clsAttributeCriterion, clsExplanationBase
 
 class ExplanationX00003(clsExplanationBase):
     def __init__(self, score_attribute: str, kp_name: str):
@@ -128,19 +128,12 @@ class ExplanationX00003(clsExplanationBase):
 
         return results
 
-    def edgeAttributeValidate(self, edge):
-        """
-        criteria 1: "attribute_type_id": "biolink:aggregator_knowledge_source" "value": "infores:molepro"
-        criteria 2: “attribute_type_id” = “CMAP:similarity_score” AND "value" = NOT EMPTY
-        """
-        criteria_1_met = False
-        criteria_2_met = False
-        for attribute in edge["attributes"]:
-            if attribute['attribute_type_id'] == 'biolink:aggregator_knowledge_source' and attribute['value'] ==  'infores:molepro':
-                criteria_1_met = True
-            elif attribute['attribute_type_id'] == 'CMAP:similarity_score' and self.value_not_empty(attribute):
-                criteria_2_met = True
-        return criteria_1_met and criteria_2_met
+    # criteria 1: "attribute_type_id": "biolink:aggregator_knowledge_source" "value": "infores:molepro"
+    # criteria 2: “attribute_type_id” = “CMAP:similarity_score” AND "value" = NOT EMPTY
+    attribute_criteria = (
+        clsAttributeCriterion('biolink:aggregator_knowledge_source', lambda attribute: attribute['value'] == 'infores:molepro'),
+        clsAttributeCriterion('CMAP:similarity_score', clsExplanationBase.value_not_empty),
+    )
 
 
 if __name__ == "__main__":
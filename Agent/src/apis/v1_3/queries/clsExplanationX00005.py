@@ -9,7 +9,7 @@ Call function Sol P 5: score_by_numeric_attribute () with 2 parameters:
 
 from collections import OrderedDict
 from modConfig import ZERO_RESULT_SCORE
-from .clsExplanationBase import clsExplanationBase
+from .clsExplanationBase import clsAttributeCriterion, clsExplanationBase
 
 
 class ExplanationX00005(clsExplanationBase):
@@ -67,23 +67,14 @@ class ExplanationX00005(clsExplanationBase):
 
         return results
 
-    def edgeAttributeValidate(self, edge):
-        """
-        criteria 1: "attribute_source": "infores:cohd" AND “attribute_type_id” = “has_evidence” AND "original_attribute_name" = "ln_ratio" AND "value" = NOT EMPTY
-        """
-        criteria_1_met = False
-        for attribute in edge["attributes"]:
-            if (
-                'attribute_source' in attribute and
-                'attribute_type_id' in attribute and
-                'original_attribute_name' in attribute and
-                attribute['attribute_source'] == "infores:cohd" and
-                attribute['attribute_type_id'] == "biolink:has_evidence" and
-                attribute['original_attribute_name'] == "ln_ratio" and
-                self.value_not_empty(attribute)
-            ):
-                criteria_1_met = True
-        return criteria_1_met
+    # criteria 1: "attribute_source": "infores:cohd" AND “attribute_type_id” = “has_evidence” AND "original_attribute_name" = "ln_ratio" AND "value" = NOT EMPTY
+    attribute_criteria = (
+        clsAttributeCriterion('biolink:has_evidence', lambda attribute: (
+            attribute.get('attribute_source') == 'infores:cohd' and
+            attribute.get('original_attribute_name') == 'ln_ratio' and
+            clsExplanationBase.value_not_empty(attribute)
+        )),
+    )
 
 
 if __name__ == "__main__":
@@ -7,7 +7,7 @@ Assign Explanation Score = [value given to slot "value" in the attribute where a
 
 from collections import OrderedDict
 from modConfig import ZERO_RESULT_SCORE
-from .clsExplanationBase import clsExplanationBase
+from .clsExplanationBase import clsAttributeCriterion, clsExplanationBase
 
 
 class ExplanationX00006(clsExplanationBase):
@@ -62,19 +62,13 @@ class ExplanationX00006(clsExplanationBase):
 
         return results
 
-    def edgeAttributeValidate(self, edge):
-        """
-        criteria 1: "attribute_type_id": "biolink:primary_knowledge_source" "value": “infores:biothings-multiomics-clinical-risk"
-        criteria 2: “attribute_type_id” = “biolink:auc_roc” AND "value" = NOT EMPTY
-        """
-        criteria_1_met = False
-        criteria_2_met = False
-        for attribute in edge["attributes"]:
-            if attribute['attribute_type_id'] == 'biolink:aggregator_knowledge_source' and self.attribute_has_value(attribute['value'], 'infores:biothings-multiomics-clinical-risk'):
-                criteria_1_met = True
-            elif attribute['attribute_type_id'] == 'auc_roc' and self.value_not_empty(attribute):
-                criteria_2_met = True
-        return criteria_1_met and criteria_2_met
+    # criteria 1: "attribute_type_id": "biolink:primary_knowledge_source" "value": “infores:biothings-multiomics-clinical-risk"
+    # criteria 2: “attribute_type_id” = “biolink:auc_roc” AND "value" = NOT EMPTY
+    attribute_criteria = (
+        clsAttributeCriterion('biolink:aggregator_knowledge_source',
+                              lambda attribute: clsExplanationBase.attribute_has_value(attribute['value'], 'infores:biothings-multiomics-clinical-risk')),
+        clsAttributeCriterion('auc_roc', clsExplanationBase.value_not_empty),
+    )
 
 
 if __name__ == "__main__":
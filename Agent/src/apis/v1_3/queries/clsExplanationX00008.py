@@ -9,7 +9,7 @@ Call function Sol P 5: score_by_numeric_attribute () with 2 parameters:
 
 from collections import OrderedDict
 from modConfig import ZERO_RESULT_SCORE
-from .clsExplanationBase import clsExplanationBase
+from .clsExplanationBase import clsAttributeCriterion, clsExplanationBase
 
 class ExplanationX00008(clsExplanationBase):
     def __init__(self, score_attribute: str, kp_name: str):
@@ -68,19 +68,12 @@ class ExplanationX00008(clsExplanationBase):
 
         return results
 
-    def edgeAttributeValidate(self, edge):
-        """
-        Criteria 1: "attribute_type_id": "biolink:aggregator_knowledge_source" "value": “infores:spoke"
-        Criteria 2: “attribute_type_id” = “biolink:p_value” AND "value" = NOT EMPTY
-        """
-        criteria_1_met = False
-        criteria_2_met = False
-        for attribute in edge["attributes"]:
-            if attribute['attribute_type_id'] == 'biolink:aggregator_knowledge_source' and attribute['value'] == 'infores:spoke':
-                criteria_1_met = True
-            elif attribute['attribute_type_id'] == 'biolink:p_value' and self.value_not_empty(attribute):
-                criteria_2_met = True
-        return criteria_1_met and criteria_2_met
+    # Criteria 1: "attribute_type_id": "biolink:aggregator_knowledge_source" "value": “infores:spoke"
+    # Criteria 2: “attribute_type_id” = “biolink:p_value” AND "value" = NOT EMPTY
+    attribute_criteria = (
+        clsAttributeCriterion('biolink:aggregator_knowledge_source', lambda attribute: attribute['value'] == 'infores:spoke'),
+        clsAttributeCriterion('biolink:p_value', clsExplanationBase.value_not_empty),
+    )
 
 
 if __name__ == "__main__":
@@ -13,7 +13,12 @@ Assign:
 
 from collections import OrderedDict
 from modConfig import ZERO_RESULT_SCORE
-from .clsExplanationBase import clsExplanationBase
+from .clsExplanationBase import clsAttributeCriterion, clsExplanationBase
+
+
+def is_ctd_source(attribute):
+    return attribute.get('original_attribute_name') == 'biolink:original_knowledge_source' and attribute['value'] == 'infores:ctd'
+
 
 class ExplanationX00009(clsExplanationBase):
     def __init__(self, kp_name: str):
@@ -63,19 +68,13 @@ class ExplanationX00009(clsExplanationBase):
 
         return results
 
-    def edgeAttributeValidate(self, edge):
-        """
-        Criteria 1: "original_attribute_name": "biolink:original_knowledge_source" "value": "infores:ctd"
-        Criteria 2: "attribute_type_id": "publications" AND "value" = NOT EMPTY
-        """
-        criteria_1_met = False
-        criteria_2_met = False
-        for attribute in edge["attributes"]:
-            if 'original_attribute_name' in attribute and attribute['original_attribute_name'] == 'biolink:original_knowledge_source' and attribute['value'] == 'infores:ctd':
-                criteria_1_met = True
-            elif attribute['attribute_type_id'] == 'biolink:publications' and self.value_not_empty(attribute):
-                criteria_2_met = True
-        return criteria_1_met and criteria_2_met
+    # Criteria 1: "original_attribute_name": "biolink:original_knowledge_source" "value": "infores:ctd"
+    # Criteria 2: "attribute_type_id": "publications" AND "value" = NOT EMPTY
+    attribute_criteria = (
+        clsAttributeCriterion(None, is_ctd_source),
+        # an attribute that meets criteria 1 does not count for criteria 2
+        clsAttributeCriterion('biolink:publications', lambda attribute: clsExplanationBase.value_not_empty(attribute) and not is_ctd_source(attribute)),
+    )
 
 
 if __name__ == "__main__":
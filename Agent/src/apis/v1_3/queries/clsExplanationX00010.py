@@ -9,7 +9,7 @@ b) attribute_type_id: "biolink:enrichment_p"
 
 from collections import OrderedDict
 from modConfig import ZERO_RESULT_SCORE
-from .clsExplanationBase import clsExplanationBase
+from .clsExplanationBase import clsAttributeCriterion, clsExplanationBase
 
 class ExplanationX00010(clsExplanationBase):
     def __init__(self, score_attribute: str, kp_name: str):
@@ -68,20 +68,10 @@ class ExplanationX00010(clsExplanationBase):
 
         return results
 
-    def edgeAttributeValidate(self, edge):
-        """
-        Criteria 1: "attribute_type_id": "biolink:Attribute" AND "original_attribute_name": "enrichment_p" AND "value" = NOT EMPTY
-        """
-        criteria_1_met = False
-        for attribute in edge["attributes"]:
-            if (
-                attribute['attribute_type_id'] == 'biolink:Attribute' and
-                'original_attribute_name' in attribute and
-                attribute['original_attribute_name'] == 'enrichment_p' and
-                self.value_not_empty(attribute)
-            ):
-                criteria_1_met = True
-        return criteria_1_met
+    # Criteria 1: "attribute_type_id": "biolink:Attribute" AND "original_attribute_name": "enrichment_p" AND "value" = NOT EMPTY
+    attribute_criteria = (
+        clsAttributeCriterion('biolink:Attribute', lambda attribute: attribute.get('original_attribute_name') == 'enrichment_p' and clsExplanationBase.value_not_empty(attribute)),
+    )
 
 
 if __name__ == "__main__":
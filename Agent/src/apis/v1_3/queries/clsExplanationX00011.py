@@ -13,7 +13,7 @@ Assign:
 
 from collections import OrderedDict
 from modConfig import ZERO_RESULT_SCORE
-from .clsExplanationBase import clsExplanationBase
+from .clsExplanationBase import clsAttributeCriterion, clsExplanationBase
 
 class ExplanationX00011(clsExplanationBase):
     def __init__(self, kp_name: str):
@@ -63,24 +63,12 @@ class ExplanationX00011(clsExplanationBase):
 
         return results
 
-    def edgeAttributeValidate(self, edge):
-        """
-        Criteria 1: "original_attribute_name": "biolink:primary_knowledge_source" "value": "infores:hetio"
-        Criteria 2: "attribute_type_id": "biolink:Attribute" AND "original_attribute_name": "hetio_source" AND "value" = NOT EMPTY
-        """
-        criteria_1_met = False
-        criteria_2_met = False
-        for attribute in edge["attributes"]:
-            if 'original_attribute_name' in attribute and attribute['original_attribute_name'] == 'biolink:primary_knowledge_source' and attribute['value'] == 'infores:hetio':
-                criteria_1_met = True
-            elif (
-                attribute['attribute_type_id'] == 'biolink:Attribute' and
-                'original_attribute_name' in attribute and
-                attribute['original_attribute_name'] == "hetio_source" and
-                self.value_not_empty(attribute)
-            ):
-                criteria_2_met = True
-        return criteria_1_met and criteria_2_met
+    # Criteria 1: "original_attribute_name": "biolink:primary_knowledge_source" "value": "infores:hetio"
+    # Criteria 2: "attribute_type_id": "biolink:Attribute" AND "original_attribute_name": "hetio_source" AND "value" = NOT EMPTY
+    attribute_criteria = (
+        clsAttributeCriterion(None, lambda attribute: attribute.get('original_attribute_name') == 'biolink:primary_knowledge_source' and attribute['value'] == 'infores:hetio'),
+        clsAttributeCriterion('biolink:Attribute', lambda attribute: attribute.get('original_attribute_name') == 'hetio_source' and clsExplanationBase.value_not_empty(attribute)),
+    )
 
 
 if __name__ == "__main__":
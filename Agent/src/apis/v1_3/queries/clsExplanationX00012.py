@@ -13,7 +13,7 @@ Assign:
 
 from collections import OrderedDict
 from modConfig import ZERO_RESULT_SCORE
-from .clsExplanationBase import clsExplanationBase
+from .clsExplanationBase import clsAttributeCriterion, clsExplanationBase
 
 
 class ExplanationX00012(clsExplanationBase):
@@ -64,20 +64,10 @@ class ExplanationX00012(clsExplanationBase):
 
         return results
 
-    def edgeAttributeValidate(self, edge):
-        """
-        Criteria 1: "attribute_source": "infores:hmdb" AND "attribute_type_id": "biolink:Publication" AND "value" = NOT EMPTY
-        """
-        criteria_1_met = False
-        for attribute in edge["attributes"]:
-            if (
-                'attribute_source' in attribute and
-                attribute['attribute_source'] == 'infores:hmdb' and
-                attribute['attribute_type_id'] == "biolink:Publication" and
-                self.value_not_empty(attribute)
-            ):
-                criteria_1_met = True
-        return criteria_1_met
+    # Criteria 1: "attribute_source": "infores:hmdb" AND "attribute_type_id": "biolink:Publication" AND "value" = NOT EMPTY
+    attribute_criteria = (
+        clsAttributeCriterion('biolink:Publication', lambda attribute: attribute.get('attribute_source') == 'infores:hmdb' and clsExplanationBase.value_not_empty(attribute)),
+    )
 
 
 if __name__ == "__main__":
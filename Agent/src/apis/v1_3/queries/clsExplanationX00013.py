@@ -14,7 +14,7 @@ Assign:
 
 from collections import OrderedDict
 from modConfig import ZERO_RESULT_SCORE
-from .clsExplanationBase import clsExplanationBase
+from .clsExplanationBase import clsAttributeCriterion, clsExplanationBase
 
 class ExplanationX00013(clsExplanationBase):
     def __init__(self, kp_name: str):
@@ -64,22 +64,14 @@ class ExplanationX00013(clsExplanationBase):
 
         return results
 
-    def edgeAttributeValidate(self, edge):
-        """
-        Criteria 1: "attribute_source": "infores:chembl" AND "attribute_type_id": "biolink:Publication" AND "original_attribute_name": "ClinicalTrials" AND "value" = NOT EMPTY
-        """
-        criteria_1_met = False
-        for attribute in edge["attributes"]:
-            if (
-                'attribute_source' in attribute and
-                attribute['attribute_source'] == 'infores:chembl' and
-                attribute['attribute_type_id'] == "biolink:Publication" and
-                'original_attribute_name' in attribute and
-                attribute['original_attribute_name'] == "ClinicalTrials" and
-                self.value_not_empty(attribute)
-            ):
-                criteria_1_met = True
-        return criteria_1_met
+    # Criteria 1: "attribute_source": "infores:chembl" AND "attribute_type_id": "biolink:Publication" AND "original_attribute_name": "ClinicalTrials" AND "value" = NOT EMPTY
+    attribute_criteria = (
+        clsAttributeCriterion('biolink:Publication', lambda attribute: (
+            attribute.get('attribute_source') == 'infores:chembl' and
+            attribute.get('original_attribute_name') == 'ClinicalTrials' and
+            clsExplanationBase.value_not_empty(attribute)
+        )),
+    )
 
 
 if __name__ == "__main__":
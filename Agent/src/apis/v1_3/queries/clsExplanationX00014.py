@@ -47,15 +47,7 @@ class ExplanationX00014(clsExplanationBase):
         :param object_synonyms:
         :return: Value of the first matched NGD, None if no values were found
         """
-        for subject_name, object_name in product(subject_synonyms, object_synonyms):
-
-            ngd_provider = clsMeshNormalizedGoogleDistanceProvider(subject_name, object_name)
-            ngd_provider.get_value()
-            logging.debug(f"Subject: {subject_name} Object: {object_name} Value: {ngd_provider.value}")
-            if ngd_provider.value:
-                return ngd_provider.value
-
-        return None
+        return clsMeshNormalizedGoogleDistanceProvider.get_first_values([list(product(subject_synonyms, object_synonyms))])[0]
 
     def create_results_and_explain(self, case_solution):
         knowledge_graph = case_solution.knowledge_graph
@@ -85,7 +77,18 @@ class ExplanationX00014(clsExplanationBase):
         name_resolution_provider.get_synonyms()
         synonyms = name_resolution_provider.synonyms
 
-        for index, (edgeId, edge) in list(self.enumerate_edges(knowledge_graph))[:10]:
+        # collect up to three synonyms for each subject and object, and test each combination of every edge at once
+        enumerated_edges = list(self.enumerate_edges(knowledge_graph))
+        edge_synonyms = []
+        for index, (edgeId, edge) in enumerated_edges:
+            subject_synonyms = synonyms.get(edge['subject'], [edge['subject']])[:self.synonym_try_count]
+            object_synonyms = synonyms.get(edge['object'], [edge['object']])[:self.synonym_try_count]
+            edge_synonyms.append((subject_synonyms, object_synonyms))
+        ngd_values = clsMeshNormalizedGoogleDistanceProvider.get_first_values([
+            list(product(subject_synonyms, object_synonyms)) for subject_synonyms, object_synonyms in edge_synonyms
+        ])
+
+        for (index, (edgeId, edge)), (subject_synonyms, object_synonyms), ngd_value in zip(enumerated_edges, edge_synonyms, ngd_values):
             result = OrderedDict({
                 'edge_bindings': {
                     e00_id: [{"id": edgeId}]
@@ -96,13 +99,6 @@ class ExplanationX00014(clsExplanationBase):
                 }
             })
 
-            # collect up to three synonyms for each subject and object
-            subject_synonyms = synonyms.get(edge['subject'], [edge['subject']])[:self.synonym_try_count]
-            object_synonyms = synonyms.get(edge['object'], [edge['object']])[:self.synonym_try_count]
-
-            # test each combination until we get a valid NGD result
-            ngd_value = self.get_ngd(subject_synonyms, object_synonyms)
-
             if ngd_value:
                 score = ngd_value
                 result['attributes'] = [
@@ -14,7 +14,7 @@ Assign:
 
 from collections import OrderedDict
 from modConfig import ZERO_RESULT_SCORE
-from .clsExplanationBase import clsExplanationBase
+from .clsExplanationBase import clsAttributeCriterion, clsExplanationBase
 
 
 class ExplanationX00015(clsExplanationBase):
@@ -22,24 +22,14 @@ class ExplanationX00015(clsExplanationBase):
         self.case_id = "X00015"
         self.kp_name = kp_name
 
-    def edgeAttributeValidate(self, edge):
-        """
-        "attribute_source": "infores:chembl" AND "attribute_type_id": "biolink:has_confidence_level" AND "original_attribute_name":"phase" AND "value" = NOT EMPTY
-        :param edge:
-        :return:
-        """
-        criteria_1_met = False
-        for attribute in edge["attributes"]:
-            if (
-                    'attribute_source' in attribute and
-                    attribute['attribute_source'] == 'infores:chembl' and
-                    attribute['attribute_type_id'] == "biolink:has_confidence_level" and
-                    'original_attribute_name' in attribute and
-                    attribute['original_attribute_name'] == "phase" and
-                    self.value_not_empty(attribute)
-            ):
-                criteria_1_met = True
-        return criteria_1_met
+    # "attribute_source": "infores:chembl" AND "attribute_type_id": "biolink:has_confidence_level" AND "original_attribute_name":"phase" AND "value" = NOT EMPTY
+    attribute_criteria = (
+        clsAttributeCriterion('biolink:has_confidence_level', lambda attribute: (
+            attribute.get('attribute_source') == 'infores:chembl' and
+            attribute.get('original_attribute_name') == 'phase' and
+            clsExplanationBase.value_not_empty(attribute)
+        )),
+    )
 
     def create_results_and_explain(self, case_solution):
         """
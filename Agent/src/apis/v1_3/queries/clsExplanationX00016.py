@@ -15,7 +15,7 @@ Assign:
 
 from collections import OrderedDict
 from modConfig import ZERO_RESULT_SCORE
-from .clsExplanationBase import clsExplanationBase
+from .clsExplanationBase import clsAttributeCriterion, clsExplanationBase
 
 class ExplanationX00016(clsExplanationBase):
     def __init__(self, kp_name: str):
@@ -65,19 +65,12 @@ class ExplanationX00016(clsExplanationBase):
 
         return results
 
-    def edgeAttributeValidate(self, edge):
-        """
-        Criteria 1: "attribute_type_id": "biolink:aggregator_knowledge_source" AND "value" = "infores:mydisease-info"
-        Criteria 2: "attribute_type_id": "biolink:publications" AND "value" : NOT EMPTY
-        """
-        criteria_1_met = False
-        criteria_2_met = False
-        for attribute in edge["attributes"]:
-            if attribute['attribute_type_id'] == 'biolink:aggregator_knowledge_source' and self.attribute_has_value(attribute['value'], 'infores:mydisease-info'):
-                criteria_1_met = True
-            elif attribute['attribute_type_id'] == 'biolink:publications' and self.value_not_empty(attribute):
-                criteria_2_met = True
-        return criteria_1_met and criteria_2_met
+    # Criteria 1: "attribute_type_id": "biolink:aggregator_knowledge_source" AND "value" = "infores:mydisease-info"
+    # Criteria 2: "attribute_type_id": "biolink:publications" AND "value" : NOT EMPTY
+    attribute_criteria = (
+        clsAttributeCriterion('biolink:aggregator_knowledge_source', lambda attribute: clsExplanationBase.attribute_has_value(attribute['value'], 'infores:mydisease-info')),
+        clsAttributeCriterion('biolink:publications', clsExplanationBase.value_not_empty),
+    )
 
 
 if __name__ == "__main__":
@@ -5,6 +5,7 @@ ASSUMES: None
 FUTURE IMPROVEMENTS: N/A
 WHO: SL 2021-04-25
 """
+import json
 import logging
 
 import requests
@@ -14,6 +15,9 @@ from jsonschema import ValidationError
 from datetime import datetime
 from utils.clsLog import clsLogEvent
 from ..modSettings import trapi_version
+from .clsTrapiResponseValidator import clsTrapiResponseValidator
+from utils.multithreading.clsCancellationToken import clsOperationCancelled
+import modConfig
 
 
 
@@ -35,6 +39,8 @@ class clsKnowledgeProvider:
         self.requestBody = None
         self.responseBody = None
         self.explanations = None
+        # token of the dispatched element sending this request, see clsCaseSolution.generateKnowledgeGraphForOnePath
+        self.cancellationToken = None
 
         self.logs = None
 
@@ -70,15 +76,38 @@ class clsKnowledgeProvider:
                 code="",
                 message=f"Sending request to Knowledge Provider {self.url}..."
             ))
-            response = request_with_global_timeout(
-                method="post",
-                url=self.url,
-                global_timeout=None,
-                # global_timeout=self.timeoutSeconds,
-                json=self.requestBody
-            )
+            if modConfig.kpFanoutEnabled:
+                # imported here so aiohttp is only needed when the fan out is enabled
+                from extensions.aiohttp_extension import kp_fanout
+                # the calling thread only waits, the request is sent from the event loop with this knowledge provider's concurrency limit
+                response = kp_fanout.request(
+                    method="post",
+                    url=self.url,
+                    key=self.name,
+                    cancellation_token=self.cancellationToken,
+                    json=self.requestBody
+                )
+            else:
+                # bounded by the dispatch deadline so an aborted query doesn't leave this thread blocked on the read timeout
+                global_timeout = None
+                if self.cancellationToken is not None:
+                    self.cancellationToken.raise_if_cancelled()
+                    remaining_seconds = self.cancellationToken.remaining_seconds()
+                    # a global timeout of 0 would mean none
+                    global_timeout = None if remaining_seconds is None else max(remaining_seconds, 0.001)
+                response = request_with_global_timeout(
+                    method="post",
+                    url=self.url,
+                    global_timeout=global_timeout,
+                    # global_timeout=self.timeoutSeconds,
+                    json=self.requestBody
+                )
             response.raise_for_status()
-        except requests.exceptions.Timeout:
+        except requests.exceptions.Timeout as e:
+            if self.cancellationToken is not None and self.cancellationToken.deadline is not None and \
+                    not isinstance(e, requests.exceptions.ConnectTimeout):
+                # the read was bounded by the dispatch deadline, the query was aborted rather than the knowledge provider being slow
+                raise clsOperationCancelled(f"Deadline reached while waiting for Knowledge Provider {self.url}") from e
             self.logs.append(clsLogEvent(
                 identifier=self.name,
                 level="ERROR",
@@ -100,31 +129,33 @@ class clsKnowledgeProvider:
             code="",
             message=f"KP 200 response in {response.elapsed}. Content size: {len(response.content)}."
         ))
-        self.responseBody = response.json()
-
-        # 2022-12-06 Automat is not returning valid TRAPI. So to fix their mistake and use their results the workflow section is being removed from their responses.
-        if "automat" in self.url:
-            if "workflow" in self.responseBody:
-                del self.responseBody["workflow"]
-        self.validateResponseBody()
+        self.validateResponseBody(response.content)
         self.checkForEmptyResponseBody()
 
-    def validateResponseBody(self):
+    def validateResponseBody(self, content: bytes):
         """
-        Verify its a valid TRAPI response
+        Parses the response into the responseBody property and verifies its a valid TRAPI response while it is parsed, see clsTrapiResponseValidator
+        :param content: Raw response body
         :return: None
         :raises: Will raise InvalidSchema if not valid
         """
         try:
-            import reasoner_validator
+            validator = clsTrapiResponseValidator(trapi_version, sample_size=modConfig.kpValidationSampleSize)
         except requests.HTTPError as e:
             logging.critical("Reasoner validator web request failing! Assuming all responses are good!")
             self.logs.append(clsLogEvent(identifier="", level="CRITICAL", code="", message=f"Reasoner validator github request is down! {e}").dict())
-            return
+            validator = None
 
         try:
-            # reasoner_validator.validate_Response(self.responseBody)
-            reasoner_validator.validate(self.responseBody, "Response", trapi_version)
+            self.responseBody = validator.parse(content) if validator is not None else json.loads(content)
+
+            # 2022-12-06 Automat is not returning valid TRAPI. So to fix their mistake and use their results the workflow section is being removed from their responses.
+            if "automat" in self.url:
+                if "workflow" in self.responseBody:
+                    del self.responseBody["workflow"]
+
+            if validator is not None:
+                validator.finish(self.responseBody)
         except ValidationError as e:
             self.logs.append(clsLogEvent(
                 identifier=self.name,
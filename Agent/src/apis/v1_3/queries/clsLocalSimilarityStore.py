@@ -0,0 +1,317 @@
+"""
+WHAT: A process-wide, read-mostly store of the "xARA_LocalSimNodes", "xARA_LocalSimPredicates" and "xARA_CaseProblems" tables, and of the
+      explanation case catalog
+WHY: Every request used to re-read these tables and rebuild the lookup dictionaries. Loading them once per process and sharing the result with every
+     query thread removes the full table scans from each request.
+ASSUMES: The tables change rarely, so a reload after a TTL is acceptable.
+FUTURE IMPROVEMENTS: Detect table changes from the database instead of relying on the TTL
+WHO: TZ 2023-03-06, local similarity fingerprint TZ 2023-04-02, TTL only reloads TZ 2023-04-03
+"""
+
+from modDatabase import db
+from .clsCaseProblemMatrix import clsCaseProblemMatrix
+from .clsCaseSolutionConflations import clsCaseSolutionConflations
+from .clsExplanationCatalog import clsExplanationCatalog
+import modConfig
+import threading
+import logging
+import hashlib
+import pandas as pd
+from time import time
+
+
+def local_similarity_fingerprint(node_rows: list, predicate_rows: list) -> str:
+    """
+    Hashes the rows of both local similarity tables independently of their order. The xARA-ETL clsPrecomputedGlobalSimilarityJob stores the same hash
+    with each version of the precomputed global similarity, so keep both implementations in step.
+    :param node_rows: "NEW_CASE_NODE", "CANDIDATE_CASE_NODE", "SIMILARITY_SCORE" rows
+    :param predicate_rows: "NEW_CASE_PREDICATE", "CANDIDATE_CASE_PREDICATE", "SIMILARITY_SCORE" rows
+    :return: Hex digest
+    """
+    def text(value) -> str:
+        if value is None or value != value:
+            return ""
+        return repr(float(value)) if not isinstance(value, str) else value
+
+    digest = hashlib.sha256()
+    for rows in (node_rows, predicate_rows):
+        for line in sorted("\t".join(text(value) for value in row) for row in rows):
+            digest.update(line.encode())
+            digest.update(b"\n")
+        # an empty line ends each table
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class clsLocalSimilaritySnapshot:
+    """
+    Immutable (by convention) set of similarity dictionaries loaded at the same time. Readers keep a reference to one snapshot for a whole request,
+    so a reload in another thread never mixes old and new values.
+    """
+
+    def __init__(self, node_similarities: dict, predicate_similarities: dict, version: int, loaded_at: float, local_similarity_fingerprint: str = None):
+        self.node_similarities = node_similarities
+        self.predicate_similarities = predicate_similarities
+        self.version = version
+        self.loaded_at = loaded_at
+        # see local_similarity_fingerprint(), tells if precomputed global similarities were computed from the same rows
+        self.local_similarity_fingerprint = local_similarity_fingerprint
+        # read on first use by clsBiolinkSimilarity.get_precomputed_global_similarity_version(), an empty tuple when there is no precomputed version
+        self.precomputed_global_similarity_version: tuple = None
+        # built on first use by clsLocalSimilarityStore.get_case_problem_matrix()
+        self.case_problem_matrix: clsCaseProblemMatrix = None
+        # built on first use by clsLocalSimilarityStore.get_case_solution_conflations()
+        self.case_solution_conflations: clsCaseSolutionConflations = None
+        # loaded on first use by clsLocalSimilarityStore.get_explanation_catalog()
+        self.explanation_catalog: clsExplanationCatalog = None
+
+
+class clsLocalSimilarityStore:
+    """
+    See header
+    """
+    sqlGetAllNodeSimilarityScore = \
+        """
+        select
+            x."NEW_CASE_NODE",
+            x."CANDIDATE_CASE_NODE",
+            x."SIMILARITY_SCORE"
+            from "xARA_LocalSimNodes" x
+        """
+
+    sqlGetAllPredicateSimilarityScore = \
+        """
+        select
+            x."NEW_CASE_PREDICATE",
+            x."CANDIDATE_CASE_PREDICATE",
+            x."SIMILARITY_SCORE"
+            from "xARA_LocalSimPredicates" x
+        """
+
+    sqlGetAllCaseProblems = \
+        """
+        select
+            x."N00_NODE_CATEGORY",
+            x."N01_NODE_CATEGORY",
+            x."E00_EDGE_PREDICATE",
+            x."CASE_ID",
+            x."ORIGIN"
+            from "xARA_CaseProblems" x
+        """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, app, ttl_seconds: float = None):
+        """
+        Constructor
+        :param app: Flask application context, used to send requests to the database.
+        :param ttl_seconds: Seconds a snapshot is served before it is reloaded. None or 0 disables the TTL.
+        """
+        self.app = app
+        self.ttl_seconds = ttl_seconds
+        self.snapshot: clsLocalSimilaritySnapshot = None
+        self.refresh_lock = threading.Lock()
+        self.case_problem_lock = threading.Lock()
+        self.explanation_catalog_lock = threading.Lock()
+
+    @classmethod
+    def initialize(cls, app, ttl_seconds: float = None):
+        """
+        Creates the process-wide store and loads it. Meant to be called once at application startup.
+        :param app: Flask application
+        :param ttl_seconds: See constructor. Defaults to modConfig.localSimilarityCacheTtlSeconds
+        :return: The shared store
+        """
+        if ttl_seconds is None:
+            ttl_seconds = modConfig.localSimilarityCacheTtlSeconds
+        with cls._instance_lock:
+            store = cls(app, ttl_seconds=ttl_seconds)
+            store.refresh()
+            cls._instance = store
+        return store
+
+    @classmethod
+    def instance(cls, app=None):
+        """
+        Returns the process-wide store, lazily creating it with the given app if initialize() was never called (e.g. unit tests).
+        :param app: Flask application, only used if the store does not exist yet
+        :return: The shared store
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    if app is None:
+                        raise AttributeError("Local similarity store is not initialized and no app was supplied")
+                    store = cls(app, ttl_seconds=modConfig.localSimilarityCacheTtlSeconds)
+                    store.refresh()
+                    cls._instance = store
+        return cls._instance
+
+    @classmethod
+    def reset(cls):
+        """
+        Drops the process-wide store so the next instance() call reloads from the database.
+        :return: None
+        """
+        with cls._instance_lock:
+            cls._instance = None
+
+    def fetch_rows(self, statement: str) -> list:
+        """
+        :param statement: One of the select statements of this class
+        :return: List of result rows
+        """
+        with self.app.app_context():
+            return db.session.execute(statement=statement).fetchall()
+
+    def load_node_similarity(self, sim_score_results: list = None) -> dict:
+        """
+        Generates a dictionary of node pairs as keys (node1, node2) and their similarity as the value. Node similarity is symmetric.
+        :param sim_score_results: Rows of sqlGetAllNodeSimilarityScore. Read from the database when None.
+        :return: dictionary
+        """
+        if sim_score_results is None:
+            sim_score_results = self.fetch_rows(self.sqlGetAllNodeSimilarityScore)
+
+        node_similarities = {}
+        for result in sim_score_results:
+            similarity = result[2]
+            node_similarities[(result[0], result[1])] = similarity
+            node_similarities[(result[1], result[0])] = similarity
+        return node_similarities
+
+    def load_predicate_similarity(self, sim_score_results: list = None) -> dict:
+        """
+        Generates a dictionary of predicate pairs as keys (predicate1, predicate2) and their similarity as the value.
+        :param sim_score_results: Rows of sqlGetAllPredicateSimilarityScore. Read from the database when None.
+        :return: dictionary
+        """
+        if sim_score_results is None:
+            sim_score_results = self.fetch_rows(self.sqlGetAllPredicateSimilarityScore)
+
+        predicate_similarities = {}
+        for result in sim_score_results:
+            predicate_similarities[(result[0], result[1])] = result[2]
+        return predicate_similarities
+
+    def load_case_problems(self) -> pd.DataFrame:
+        """
+        Reads the one hop columns of every case problem, for all origins.
+        :return: DataFrame
+        """
+        with self.app.app_context():
+            data = db.session.execute(statement=self.sqlGetAllCaseProblems).fetchall()
+        return pd.DataFrame(data=data, columns=["N00_NODE_CATEGORY", "N01_NODE_CATEGORY", "E00_EDGE_PREDICATE", "CASE_ID", "ORIGIN"])
+
+    def get_case_problem_matrix(self, snapshot: clsLocalSimilaritySnapshot = None) -> clsCaseProblemMatrix:
+        """
+        Returns the encoded case problems of a snapshot, building them on first use. Only one thread builds the matrix, the others wait for it.
+        :param snapshot: Snapshot the similarity matrices are taken from. Defaults to get_snapshot()
+        :return: clsCaseProblemMatrix
+        """
+        if snapshot is None:
+            snapshot = self.get_snapshot()
+        if snapshot.case_problem_matrix is None:
+            with self.case_problem_lock:
+                if snapshot.case_problem_matrix is None:
+                    start = time()
+                    snapshot.case_problem_matrix = clsCaseProblemMatrix(
+                        cases=self.load_case_problems(),
+                        node_similarities=snapshot.node_similarities,
+                        predicate_similarities=snapshot.predicate_similarities
+                    )
+                    logging.debug(f"Encoded {len(snapshot.case_problem_matrix)} case problems in {time() - start} seconds")
+        return snapshot.case_problem_matrix
+
+    def get_case_solution_conflations(self, snapshot: clsLocalSimilaritySnapshot = None) -> clsCaseSolutionConflations:
+        """
+        Returns the case solution conflations derived from the node similarities of a snapshot, building them on first use. Building is cheap and
+        idempotent, so concurrent first uses are not locked.
+        :param snapshot: Snapshot the node similarities are taken from. Defaults to get_snapshot()
+        :return: clsCaseSolutionConflations
+        """
+        if snapshot is None:
+            snapshot = self.get_snapshot()
+        if snapshot.case_solution_conflations is None:
+            snapshot.case_solution_conflations = clsCaseSolutionConflations.from_node_similarities(
+                node_similarities=snapshot.node_similarities,
+                threshold=modConfig.caseSolutionConflationThreshold
+            )
+        return snapshot.case_solution_conflations
+
+    def get_explanation_catalog(self, snapshot: clsLocalSimilaritySnapshot = None) -> clsExplanationCatalog:
+        """
+        Returns the explanation catalog of a snapshot, loading it on first use. Only one thread loads the catalog, the others wait for it.
+        :param snapshot: Snapshot the catalog belongs to. Defaults to get_snapshot()
+        :return: clsExplanationCatalog
+        """
+        if snapshot is None:
+            snapshot = self.get_snapshot()
+        if snapshot.explanation_catalog is None:
+            with self.explanation_catalog_lock:
+                if snapshot.explanation_catalog is None:
+                    start = time()
+                    snapshot.explanation_catalog = clsExplanationCatalog.load(
+                        app=self.app,
+                        node_similarities=snapshot.node_similarities,
+                        predicate_similarities=snapshot.predicate_similarities
+                    )
+                    logging.debug(f"Loaded {len(snapshot.explanation_catalog.problems)} explanation case problems in {time() - start} seconds")
+        return snapshot.explanation_catalog
+
+    def refresh(self) -> clsLocalSimilaritySnapshot:
+        """
+        Loads both tables into a new snapshot and swaps it in with a single reference assignment. Readers holding the previous snapshot are unaffected.
+        :return: The new snapshot
+        """
+        with self.refresh_lock:
+            # counts the loads, only used to tell snapshots apart in the logs
+            version = self.snapshot.version + 1 if self.snapshot is not None else 0
+            start = time()
+            node_rows = self.fetch_rows(self.sqlGetAllNodeSimilarityScore)
+            predicate_rows = self.fetch_rows(self.sqlGetAllPredicateSimilarityScore)
+            snapshot = clsLocalSimilaritySnapshot(
+                node_similarities=self.load_node_similarity(node_rows),
+                predicate_similarities=self.load_predicate_similarity(predicate_rows),
+                version=version,
+                loaded_at=time(),
+                local_similarity_fingerprint=local_similarity_fingerprint(node_rows, predicate_rows)
+            )
+            self.snapshot = snapshot
+        logging.debug(f"Loaded local similarity snapshot version {version} in {time() - start} seconds")
+        return snapshot
+
+    def is_stale(self, snapshot: clsLocalSimilaritySnapshot) -> bool:
+        """
+        Checks if a snapshot should be reloaded due to an expired TTL.
+        :param snapshot: The snapshot to check
+        :return: boolean
+        """
+        if snapshot is None:
+            return True
+        if self.ttl_seconds and time() - snapshot.loaded_at > self.ttl_seconds:
+            return True
+        return False
+
+    def get_snapshot(self) -> clsLocalSimilaritySnapshot:
+        """
+        Returns the current snapshot, reloading it first if it is stale. If another thread is already reloading, the current (stale) snapshot is returned
+        instead of blocking, unless there is no snapshot at all.
+        :return: The current snapshot
+        """
+        snapshot = self.snapshot
+        if not self.is_stale(snapshot):
+            return snapshot
+
+        if snapshot is None:
+            return self.refresh()
+
+        if self.refresh_lock.locked():
+            return snapshot
+
+        try:
+            return self.refresh()
+        except Exception as e:
+            logging.error(f"Failed to reload local similarity snapshot, serving version {snapshot.version}: {e}")
+            return snapshot
@@ -0,0 +1,162 @@
+"""
+WHAT: In-process Normalized Google Distance (NGD) between MeSH terms, computed from MeSH term frequencies and pairwise co-occurrence counts of PubMed
+WHY: Every ExplanationX00014 score depended on the remote PubmedMeshNgd service of ARAX. Pairs of terms in the local tables are now computed in
+     process, the remote service is only asked about terms the tables do not know, see clsMeshNormalizedGoogleDistanceProvider.get_first_values.
+ASSUMES: modConfig.ngdDataPath is a SQLite file built by the xARA-ETL clsMeshNgdJob with the tables of sqlCreateTables. Same formula as ARAX:
+         NGD = (max(log f(x), log f(y)) - log f(x, y)) / (log N - min(log f(x), log f(y))), with N the number of articles times the average number
+         of MeSH headings per article. Names are matched lower-cased against MeSH descriptor names and entry terms. The job replaces the file
+         atomically, instance() reopens it when its inode or modification time changes.
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-30, reopen on refresh TZ 2023-04-02
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+from typing import Optional, Tuple
+import modConfig
+
+
+class clsMeshNgdEngine:
+    """
+    See header
+    """
+
+    sqlCreateTables = \
+        """
+        create table meta (key text primary key, value real not null);
+        create table terms (term_id integer primary key, ui text not null unique, count integer not null);
+        create table names (name text primary key, term_id integer not null) without rowid;
+        create table cooccurrences (term_id_1 integer not null, term_id_2 integer not null, count integer not null,
+                                    primary key (term_id_1, term_id_2)) without rowid;
+        """
+
+    # no row when either name is unknown. term_id_1 is the smaller id of a pair, a term co-occurs with itself in every article it is in.
+    sqlFindCounts = \
+        """
+        select t1.count, t2.count, case when t1.term_id = t2.term_id then t1.count else c.count end
+        from names n1
+        join terms t1 on t1.term_id = n1.term_id
+        cross join names n2
+        join terms t2 on t2.term_id = n2.term_id
+        left join cooccurrences c on c.term_id_1 = min(t1.term_id, t2.term_id) and c.term_id_2 = max(t1.term_id, t2.term_id)
+        where n1.name = ? and n2.name = ?
+        """
+
+    # bytes of the file SQLite reads through a memory map instead of read() calls
+    mmapSize = 1 << 30
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, connection: Optional[sqlite3.Connection], path: str = None, file_state: tuple = None):
+        """
+        Constructor
+        :param connection: Connection to the NGD tables, None for an engine that knows no terms
+        :param path: File the connection was opened from, None if the engine never reopens
+        :param file_state: stat_file() of the path when it was opened
+        """
+        self.connection = connection
+        self.path = path
+        self.file_state = file_state
+        self.lock = threading.Lock()
+        self.log_n = None
+        if connection is not None:
+            self.log_n = math.log(connection.execute("select value from meta where key = 'N'").fetchone()[0])
+
+    @staticmethod
+    def stat_file(path: Optional[str]) -> Optional[tuple]:
+        """
+        :param path: SQLite file, may be missing or None
+        :return: Tuple of the inode and modification time of the file, None if it does not exist
+        """
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def is_stale(self) -> bool:
+        """
+        :return: Whether the file was replaced, created or removed since the engine was opened
+        """
+        return self.path is not None and self.stat_file(self.path) != self.file_state
+
+    def close(self):
+        """
+        Closes the connection once the queries in flight are done, the engine then knows no terms
+        :return: None
+        """
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    @classmethod
+    def from_file(cls, path: Optional[str]):
+        """
+        Opens the NGD tables read only
+        :param path: SQLite file built by clsMeshNgdJob, may be missing or None
+        :return: clsMeshNgdEngine
+        """
+        file_state = cls.stat_file(path)
+        if file_state is None:
+            logging.debug(f"No local MeSH NGD tables at '{path}', every NGD is requested remotely")
+            return cls(None, path=path or None)
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        connection.execute(f"pragma mmap_size = {cls.mmapSize}")
+        logging.debug(f"Loaded local MeSH NGD tables from '{path}'")
+        return cls(connection, path=path, file_state=file_state)
+
+    @classmethod
+    def instance(cls):
+        """
+        Returns the process-wide engine, opening modConfig.ngdDataPath on first use and again whenever clsMeshNgdJob replaced the file
+        :return: clsMeshNgdEngine
+        """
+        engine = cls._instance
+        if engine is None or engine.is_stale():
+            with cls._instance_lock:
+                engine = cls._instance
+                if engine is None:
+                    cls._instance = cls.from_file(modConfig.ngdDataPath)
+                elif engine.is_stale():
+                    cls._instance = cls.from_file(engine.path)
+                    engine.close()
+                engine = cls._instance
+        return engine
+
+    def ngd(self, subject_count: int, object_count: int, pair_count: int) -> Optional[float]:
+        """
+        :param subject_count: Number of articles with the subject term
+        :param object_count: Number of articles with the object term
+        :param pair_count: Number of articles with both terms
+        :return: NGD, None if the terms never occur together or the rarer term is in every article (NGD undefined)
+        """
+        if not pair_count:
+            return None
+        log_subject, log_object = math.log(subject_count), math.log(object_count)
+        denominator = self.log_n - min(log_subject, log_object)
+        if denominator == 0:
+            return None
+        return (max(log_subject, log_object) - math.log(pair_count)) / denominator
+
+    def get_ngd(self, subject_name: str, object_name: str) -> Tuple[bool, Optional[float]]:
+        """
+        Computes the NGD of a pair of names
+        :param subject_name: Name of the subject
+        :param object_name: Name of the object
+        :return: Tuple of whether both names are known MeSH terms and the NGD, None if they are unknown or never occur together
+        """
+        with self.lock:
+            # closed by instance() when the file was replaced, or no file at all
+            if self.connection is None:
+                return False, None
+            row = self.connection.execute(self.sqlFindCounts, (subject_name.lower(), object_name.lower())).fetchone()
+        if row is None:
+            return False, None
+        return True, self.ngd(*row)
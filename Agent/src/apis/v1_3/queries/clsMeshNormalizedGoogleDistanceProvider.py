@@ -1,13 +1,22 @@
 """
 WHAT: Requests and returns data from a synonyms lookup service.
 WHY: Synonyms are needed for explanations.
-ASSUMES: None
+ASSUMES: NGD is symmetric, so a pair of terms is cached once whatever its order. A response without a value (e.g. TermNotFound) is a definitive
+         answer and is cached, failed requests are not. Pairs of terms known to the local clsMeshNgdEngine are never requested.
 FUTURE IMPROVEMENTS:
-WHO: TZ 2021-09-25
+WHO: TZ 2021-09-25, persistent cache and parallel probing TZ 2023-03-29, local engine TZ 2023-03-30
 """
 
 from extensions.requests_extension import request_with_global_timeout
-from typing import Optional
+from utils.clsTtlCache import clsTtlCache
+from .clsMeshNgdEngine import clsMeshNgdEngine
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import monotonic
+from typing import List, Optional, Tuple
+import threading
+import logging
+import requests
+import modConfig
 
 
 class clsMeshNormalizedGoogleDistanceProvider:
@@ -18,6 +27,14 @@ class clsMeshNormalizedGoogleDistanceProvider:
 
     url = "https://arax.ncats.io/api/arax/v1.3/PubmedMeshNgd/"
 
+    # unordered pair of terms -> NGD value, or None when ARAX has no value for them, shared by every query
+    cache = clsTtlCache(name="mesh_ngd", ttl_seconds=modConfig.ngdCacheTtlSeconds, max_size=modConfig.ngdCacheMaxSize,
+                        sqlite_path=modConfig.ngdCacheSqlitePath)
+
+    # one bounded pool probing pairs for every query of the process, see get_executor()
+    _executor = None
+    _executor_lock = threading.Lock()
+
     def __init__(self, subject_name: str, object_name: str, raise_on_status=False):
         """
         Constructor
@@ -61,3 +78,131 @@ class clsMeshNormalizedGoogleDistanceProvider:
             self.value = self.responseBody["value"]
         else:
             self.error_message = self.responseBody["message"]
+
+    @staticmethod
+    def pair_key(subject_name: str, object_name: str) -> str:
+        """
+        :return: Cache key of the pair, the same for both orders
+        """
+        return "\t".join(sorted((subject_name, object_name)))
+
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        """
+        Returns the process-wide probe pool, created on first use from modConfig
+        :return: ThreadPoolExecutor
+        """
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(max_workers=modConfig.ngdProbeMaxWorkers, thread_name_prefix="mesh_ngd")
+        return cls._executor
+
+    @classmethod
+    def probe(cls, subject_name: str, object_name: str) -> Optional[float]:
+        """
+        Requests the NGD of one pair and caches definitive answers
+        :param subject_name: Name of the subject
+        :param object_name: Name of the object
+        :return: NGD value, None if there is none or the request failed
+        """
+        provider = cls(subject_name, object_name)
+        try:
+            provider.get_value()
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            logging.debug(f"NGD request failed for subject: {subject_name} object: {object_name} error: {e}")
+            return None
+
+        logging.debug(f"Subject: {subject_name} Object: {object_name} Value: {provider.value}")
+        if provider.response_code is not None:
+            cls.cache.set_many({cls.pair_key(subject_name, object_name): provider.value})
+        return provider.value
+
+    @classmethod
+    def get_first_values(cls, pair_lists: List[List[Tuple[str, str]]], timeout_seconds: float = None) -> List[Optional[float]]:
+        """
+        Gets the first NGD value of each list of pairs, in list order. Pairs of known MeSH terms are computed by the local engine and cached pairs
+        are not requested again. The other pairs of every list are probed in parallel on the shared pool, highest priority first, and a list's
+        remaining probes are cancelled once an earlier pair has a value.
+        :param pair_lists: One list of (subject name, object name) pairs per edge, in priority order
+        :param timeout_seconds: Seconds to wait for probes, lists still undecided then get their first value found so far.
+                                Defaults to modConfig.ngdProbeTimeoutSeconds
+        :return: First truthy value of each list, None if no pair has one
+        """
+        keyed_lists = [[(cls.pair_key(*pair), pair) for pair in pairs] for pairs in pair_lists]
+        pairs_by_key = {}
+        for keyed_pairs in keyed_lists:
+            for key, pair in keyed_pairs:
+                pairs_by_key.setdefault(key, pair)
+        # key -> value of every answered pair, failed probes count as no value for this call
+        values = {}
+        engine = clsMeshNgdEngine.instance()
+        for key, pair in pairs_by_key.items():
+            is_known, value = engine.get_ngd(*pair)
+            if is_known:
+                values[key] = value
+        cached, missing = cls.cache.get_many([key for key in pairs_by_key if key not in values])
+        values.update(cached)
+        if not modConfig.ngdRemoteEnabled:
+            values.update({key: None for key in missing})
+
+        def decide(keyed_pairs: list) -> Tuple[bool, Optional[float]]:
+            for key, _ in keyed_pairs:
+                if key not in values:
+                    return False, None
+                if values[key]:
+                    return True, values[key]
+            return True, None
+
+        def needed_keys(keyed_pairs: list) -> list:
+            keys = []
+            for key, _ in keyed_pairs:
+                if values.get(key):
+                    break
+                if key not in values:
+                    keys.append(key)
+            return keys
+
+        results = [None] * len(keyed_lists)
+        undecided = set()
+        for index, keyed_pairs in enumerate(keyed_lists):
+            decided, results[index] = decide(keyed_pairs)
+            if not decided:
+                undecided.add(index)
+        if not undecided:
+            return results
+
+        # round robin over the lists so every edge gets its highest priority pair probed first
+        submit_order = []
+        needed_lists = [needed_keys(keyed_lists[index]) for index in sorted(undecided)]
+        for rank in range(max(len(keys) for keys in needed_lists)):
+            submit_order.extend(keys[rank] for keys in needed_lists if rank < len(keys))
+        executor = cls.get_executor()
+        futures = {executor.submit(cls.probe, *pairs_by_key[key]): key for key in dict.fromkeys(submit_order)}
+
+        deadline = monotonic() + (modConfig.ngdProbeTimeoutSeconds if timeout_seconds is None else timeout_seconds)
+        while undecided and futures:
+            done, _ = wait(list(futures), timeout=max(0, deadline - monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                values[futures.pop(future)] = None if future.cancelled() else future.result()
+
+            for index in list(undecided):
+                decided, results[index] = decide(keyed_lists[index])
+                if decided:
+                    undecided.remove(index)
+
+            needed = set()
+            for index in undecided:
+                needed.update(needed_keys(keyed_lists[index]))
+            for future, key in list(futures.items()):
+                if key not in needed and future.cancel():
+                    del futures[future]
+
+        # timed out, the first value found so far is used
+        for index in undecided:
+            results[index] = next((values[key] for key, _ in keyed_lists[index] if values.get(key)), None)
+        for future in futures:
+            future.cancel()
+        return results
@@ -2,14 +2,19 @@
 A list of Case Solutions to be executed in order, which them merges the resulting knowledge graphs and creates results.
 """
 from utils.multithreading.clsNode import clsNode
-from copy import deepcopy
+from .modTrapiCopy import copy_query_graph, copy_record
 from utils.clsLog import clsLogEvent
-import networkx
-from itertools import product, chain
+from utils.multithreading.clsCancellationToken import clsOperationCancelled
+from itertools import product, count
 import traceback
+import heapq
+import modConfig
 
 
 class clsMultiHop(clsNode):
+    # largest number of merged results kept per multi hop, None keeps all
+    max_results = modConfig.multihopMaxResults
+
     def __init__(self, dispatchId: int, dispatchDescription: str, case_solutions):
         super().__init__(dispatchId=dispatchId, dispatchDescription=dispatchDescription, dispatchMode="parallel", dispatchList=[])
 
@@ -31,6 +36,10 @@ class clsMultiHop(clsNode):
 
     def execute_hops(self):
         for i, case_solution in enumerate(self.case_solutions):
+            # stop between hops once the query is cancelled, the hop's own knowledge provider request is guarded the same way
+            self.checkCancellation()
+            case_solution.dispatchCancellationToken = self.dispatchCancellationToken
+
             # if we are on a second+ hop, then try to populate its unknown node ids
             if i > 0:
                 previous_solution = self.case_solutions[i-1]
@@ -87,21 +96,70 @@ class clsMultiHop(clsNode):
         self.query_graph = {"nodes": {}, "edges": {}}
         for case_solution in self.case_solutions:
             if case_solution.query_graph:
-                self.query_graph['edges'].update(deepcopy(case_solution.query_graph['edges']))
-                self.query_graph['nodes'].update(deepcopy(case_solution.query_graph['nodes']))
+                case_query_graph = copy_query_graph(case_solution.query_graph)
+                self.query_graph['edges'].update(case_query_graph['edges'])
+                self.query_graph['nodes'].update(case_query_graph['nodes'])
 
     def merge_knowledge_graphs(self):
         self.knowledge_graph = {"nodes": {}, "edges": {}}
         for case_solution in self.case_solutions:
             if case_solution.knowledge_graph:
-                self.knowledge_graph['edges'].update(deepcopy(case_solution.knowledge_graph['edges']))
-                self.knowledge_graph['nodes'].update(deepcopy(case_solution.knowledge_graph['nodes']))
+                # the records are shared with the case solutions, clsQueryManager.mergeCaseSolutions copies them
+                self.knowledge_graph['edges'].update(case_solution.knowledge_graph['edges'])
+                self.knowledge_graph['nodes'].update(case_solution.knowledge_graph['nodes'])
                 # self.knowledge_graph.update(case_solution.knowledge_graph)
 
+    @staticmethod
+    def first_edge_bindings(result: dict) -> list:
+        return result["edge_bindings"][next(iter(result["edge_bindings"]))]
+
+    def order_hops(self, starting_node_qg_id: str):
+        """
+        Orders the case solutions into a chain of query graph nodes walking from the starting node. Complete results only exist when every hop
+        extends the chain by one new node, as a result can't branch or revisit a node.
+        :param starting_node_qg_id: Query graph node id the results start from
+        :return: List of (case solution, query graph edge id, from node qg id, to node qg id) in walk order, or None if the hops don't form a chain
+        """
+        remaining = list(self.case_solutions)
+        visited = {starting_node_qg_id}
+        current_qg_id = starting_node_qg_id
+        chain_hops = []
+        while remaining:
+            candidates = []
+            for case_solution in remaining:
+                for edge_qg_id, edge in case_solution.query_graph['edges'].items():
+                    if current_qg_id in (edge['subject'], edge['object']):
+                        next_qg_id = edge['object'] if edge['subject'] == current_qg_id else edge['subject']
+                        candidates.append((case_solution, edge_qg_id, current_qg_id, next_qg_id))
+            if len(candidates) != 1 or candidates[0][3] in visited:
+                return None
+            chain_hops.append(candidates[0])
+            remaining.remove(candidates[0][0])
+            current_qg_id = candidates[0][3]
+            visited.add(current_qg_id)
+        return chain_hops
+
+    @staticmethod
+    def index_hop(case_solution, edge_qg_id: str, from_qg_id: str, to_qg_id: str) -> dict:
+        """
+        Hash index of one hop's results by the node id they join on
+        :return: Dictionary of from node kg id -> {to node kg id: result}. The last result connecting a node pair wins.
+        """
+        index = {}
+        for result in case_solution.results:
+            if edge_qg_id not in result["edge_bindings"]:
+                continue
+            for from_binding, to_binding in product(result["node_bindings"][from_qg_id], result["node_bindings"][to_qg_id]):
+                index.setdefault(from_binding['id'], {})[to_binding['id']] = result
+        return index
+
     def merge_results(self):
         """
-        Combine results from each case solution into full results that address all nodes and edges in the query graph. This is accomplished by generating a
-        network graph of results then walking from a starting node to all linked nodes, building result objects as the graph is walked.
+        Combine results from each case solution into full results that address all nodes and edges in the query graph. The hops are ordered into a
+        chain from the starting node and joined on their shared node ids, hop by hop. A result's score is the average of its edge binding scores.
+        Only the best max_results results are kept, best first: partial results are extended depth first, a heap holds the best complete ones and a
+        partial result is dropped as soon as its best possible score can't beat the worst kept result. With max_results None every result is kept, in
+        the order they are found.
         :return:
         """
         self.results = []
@@ -112,78 +170,85 @@ class clsMultiHop(clsNode):
                 self.results += self.case_solutions[0].results
             return
 
-        nx_results = networkx.DiGraph()
-        start_nodes = set()
-
-        nx_results_node_format = "{}_{}"
-        for i, case_solution in enumerate(self.case_solutions):
-            # if any case doesn't have results then we can't complete the multihop query, so just abort.
+        # if any case doesn't have results then we can't complete the multihop query, so just abort.
+        for case_solution in self.case_solutions:
             if len(case_solution.results) <= 0:
                 return
 
-            if case_solution.results:
-                for result in case_solution.results:
-                    if i == 0:
-                        # n0 will ALWAYS be specified! If this changes a lot more will need to be done.
-                        starting_node_qg_id = sorted(list(result["node_bindings"].keys()))[0]
-                        for node_binding in result["node_bindings"][starting_node_qg_id]:
-                            start_nodes.add(nx_results_node_format.format(starting_node_qg_id, node_binding['id']))
-
-                    for edge_qg_id, edge_bindings in result["edge_bindings"].items():
-                        for edge_binding in edge_bindings:
-                            edge_kg_id = edge_binding["id"]
-
-                            # ALWAYS 2 nodes! The edge directionality isn't implied, so we must refer to the query graph to find the node ids.
-                            # node_binding_ids = sorted(list(result["node_bindings"]))
-                            node1_qg_id = case_solution.query_graph['edges'][edge_qg_id]['subject']
-                            node2_qg_id = case_solution.query_graph['edges'][edge_qg_id]['object']
-                            node_pairs = product(*[result["node_bindings"][node1_qg_id], result["node_bindings"][node2_qg_id]])
-                            for node1_binding, node2_binding in node_pairs:
-                                node1_id = nx_results_node_format.format(node1_qg_id, node1_binding['id'])
-                                node2_id = nx_results_node_format.format(node2_qg_id, node2_binding['id'])
-                                nx_results.add_node(node1_id, query_graph_id=node1_qg_id, knowledge_graph_id=node1_binding['id'])
-                                nx_results.add_node(node2_id, query_graph_id=node2_qg_id, knowledge_graph_id=node2_binding['id'])
-
-                                nx_results.add_edge(node1_id, node2_id, score=result['score'], attributes=result['attributes'], result=result)
-
-        # nx_results.remove_edges_from(networkx.selfloop_edges(nx_results))  # not needed anymore due to qg id disambiguation?
-
-        def add_to_result(new_result, source_node, excluded_qg_ids):
-            successors = nx_results.successors(source_node)
-            predecessors = nx_results.predecessors(source_node)
-            for neighbor in chain(successors, predecessors):
-                node = nx_results.nodes[neighbor]
-                if node['query_graph_id'] in excluded_qg_ids:
-                    continue
-
-                nx_edge = nx_results.get_edge_data(source_node, neighbor)
-                # since we are looking in both directions the source -> neighbor edge may not exist, so look in the other direction.
-                if nx_edge is None:
-                    nx_edge = nx_results.get_edge_data(neighbor, source_node)
-                edge_result = nx_edge["result"]
+        # n0 will ALWAYS be specified! If this changes a lot more will need to be done.
+        starting_node_qg_id = sorted(list(self.case_solutions[0].results[-1]["node_bindings"].keys()))[0]
+        start_nodes = {}
+        for result in self.case_solutions[0].results:
+            for node_binding in result["node_bindings"].get(starting_node_qg_id, []):
+                start_nodes[node_binding['id']] = None
 
-                # edge_result = nx_results.get_edge_data(source_node, successor)["result"]
-
-                neighbor_result = deepcopy(new_result)
-                neighbor_result["node_bindings"].update(edge_result["node_bindings"])
-                neighbor_result["edge_bindings"].update(edge_result["edge_bindings"])
-
-                # add the explanations from the result to the edge binding
-                edge_bindings = neighbor_result["edge_bindings"][list(edge_result["edge_bindings"].keys())[0]]
-                for edge_binding in edge_bindings:
-                    edge_binding["attributes"] = edge_result["attributes"]
-                    edge_binding["score"] = edge_result["score"]
-
-                path_excluded_qg_ids = deepcopy(excluded_qg_ids)
-                path_excluded_qg_ids.add(node['query_graph_id'])
-                add_to_result(neighbor_result, neighbor, path_excluded_qg_ids)
-                if len(neighbor_result["edge_bindings"]) == len(self.case_solutions):
-                    self.results.append(neighbor_result)
+        chain_hops = self.order_hops(starting_node_qg_id)
+        if chain_hops is None:
+            return
+        indexes = [self.index_hop(*chain_hop) for chain_hop in chain_hops]
+
+        # best (largest) score sum and fewest edge bindings of any completion from each node, nodes that can't be completed are left out
+        best_sums = [{} for _ in range(len(indexes) + 1)]
+        min_counts = [{} for _ in range(len(indexes) + 1)]
+        for i in range(len(indexes) - 1, -1, -1):
+            for from_kg_id, neighbors in indexes[i].items():
+                for to_kg_id, result in neighbors.items():
+                    if i + 1 < len(indexes) and to_kg_id not in best_sums[i + 1]:
+                        continue
+                    binding_count = len(self.first_edge_bindings(result))
+                    total = result['score'] * binding_count + best_sums[i + 1].get(to_kg_id, 0.0)
+                    best_sums[i][from_kg_id] = max(total, best_sums[i].get(from_kg_id, total))
+                    binding_count += min_counts[i + 1].get(to_kg_id, 0)
+                    min_counts[i][from_kg_id] = min(binding_count, min_counts[i].get(from_kg_id, binding_count))
+
+        # min heap of (score, -order, path) so the worst, then latest, complete result is dropped first
+        heap = []
+        order = count()
+
+        def extend(i, kg_id, path, score_sum, binding_count):
+            if i == len(indexes):
+                entry = (score_sum / binding_count, -next(order), path)
+                if self.max_results is None or len(heap) < self.max_results:
+                    heapq.heappush(heap, entry)
+                else:
+                    heapq.heappushpop(heap, entry)
+                return
+            if kg_id not in best_sums[i]:
+                return
+            for to_kg_id, result in indexes[i][kg_id].items():
+                if i + 1 < len(indexes) and to_kg_id not in best_sums[i + 1]:
+                    continue
+                result_binding_count = len(self.first_edge_bindings(result))
+                next_score_sum = score_sum + result['score'] * result_binding_count
+                next_binding_count = binding_count + result_binding_count
+                if self.max_results is not None and len(heap) >= self.max_results:
+                    best_total = next_score_sum + best_sums[i + 1].get(to_kg_id, 0.0)
+                    if best_total >= 0 and best_total / (next_binding_count + min_counts[i + 1].get(to_kg_id, 0)) <= heap[0][0]:
+                        continue
+                extend(i + 1, to_kg_id, path + (result,), next_score_sum, next_binding_count)
 
         for starting_node_kg_id in start_nodes:
+            extend(0, starting_node_kg_id, (), 0.0, 0)
+
+        if self.max_results is None:
+            # nothing was dropped, keep the order the results were found in
+            paths = [path for _, _, path in sorted(heap, key=lambda entry: -entry[1])]
+        else:
+            paths = [path for _, _, path in sorted(heap, reverse=True)]
+        for path in paths:
             new_result = {"node_bindings": {}, "edge_bindings": {}, "score": 0.0}
+            for result in path:
+                new_result["node_bindings"].update(result["node_bindings"])
+                new_result["edge_bindings"].update(result["edge_bindings"])
 
-            add_to_result(new_result, starting_node_kg_id, {starting_node_qg_id})
+                # add the explanations from the result to copies of the edge bindings, the case solutions' results are left as they were
+                edge_bindings = [copy_record(edge_binding) for edge_binding in self.first_edge_bindings(result)]
+                for edge_binding in edge_bindings:
+                    edge_binding["attributes"] = result["attributes"]
+                    edge_binding["score"] = result["score"]
+                new_result["edge_bindings"][next(iter(result["edge_bindings"]))] = edge_bindings
+            if len(new_result["edge_bindings"]) == len(self.case_solutions):
+                self.results.append(new_result)
 
         # compute the score for each result by averaging all edge binding scores
         for result in self.results:
@@ -202,6 +267,7 @@ class clsMultiHop(clsNode):
     def execute(self):
         try:
             self.execute_hops()
+            self.checkCancellation()
             self.generate_results()
             # self.merge_query_graphs()  # not used anymore since the QG must remain constant (except for derived queries)
             self.merge_knowledge_graphs()
@@ -215,6 +281,13 @@ class clsMultiHop(clsNode):
                 code="",
                 message=f"Aborting Multihop execution: {e}"
             ))
+        except clsOperationCancelled as e:
+            self.logs.append(clsLogEvent(
+                identifier=f"MH{self.dispatchId}",
+                level="WARNING",
+                code="Cancelled",
+                message=f"Multihop execution cancelled: {e}"
+            ))
         except Exception as e:
             print(traceback.format_exc())
             self.logs.append(clsLogEvent(
@@ -7,6 +7,8 @@ WHO: TZ 2021-09-25
 """
 
 from extensions.requests_extension import request_with_global_timeout
+from utils.clsTtlCache import clsTtlCache
+import modConfig
 
 
 class clsNameResolutionProvider:
@@ -17,6 +19,10 @@ class clsNameResolutionProvider:
 
     url = "https://name-resolution-sri.renci.org/reverse_lookup"
 
+    # curie -> synonyms, or None when the service has none, shared by every query
+    cache = clsTtlCache(name="name_resolution", ttl_seconds=modConfig.sriCacheTtlSeconds, max_size=modConfig.sriCacheMaxSize,
+                        sqlite_path=modConfig.sriCacheSqlitePath)
+
     def __init__(self, curie_ids: list):
         """
         Constructor
@@ -29,9 +35,15 @@ class clsNameResolutionProvider:
 
     def get_synonyms(self):
         """
-        Gets all synonyms for the curies
+        Gets all synonyms for the curies, only the curies missing from the cache are requested
         :return: None
         """
+        cached, missing_curie_ids = self.cache.get_many(self.curie_ids)
+        self.synonyms = {curie: synonyms for curie, synonyms in cached.items() if synonyms is not None}
+        if not missing_curie_ids:
+            return
+
+        self.requestBody = {"curies": missing_curie_ids}
         response = request_with_global_timeout(
             method="post",
             url=self.url,
@@ -43,6 +55,7 @@ class clsNameResolutionProvider:
         response.raise_for_status()
         self.responseBody = response.json()
 
-        self.synonyms = {}
         for curie, synonyms in self.responseBody.items():
             self.synonyms[curie] = synonyms
+        # curies the service did not return are cached too, so they are not requested again
+        self.cache.set_many({curie: self.responseBody.get(curie) for curie in missing_curie_ids})
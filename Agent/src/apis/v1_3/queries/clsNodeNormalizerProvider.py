@@ -7,7 +7,9 @@ WHO: TZ 2021-11-05
 """
 
 from extensions.requests_extension import request_with_global_timeout
+from utils.clsTtlCache import clsTtlCache
 import logging
+import modConfig
 
 
 class clsNodeNormalizerProvider:
@@ -18,6 +20,10 @@ class clsNodeNormalizerProvider:
 
     url = "https://nodenormalization-sri.renci.org/1.3/get_normalized_nodes"
 
+    # curie -> normalized identifier, shared by every query
+    cache = clsTtlCache(name="node_normalizer", ttl_seconds=modConfig.sriCacheTtlSeconds, max_size=modConfig.sriCacheMaxSize,
+                        sqlite_path=modConfig.sriCacheSqlitePath)
+
     def __init__(self, curie_ids: list):
         """
         Constructor
@@ -30,9 +36,14 @@ class clsNodeNormalizerProvider:
 
     def get_identifiers(self):
         """
-        Gets identifiers for the curies
+        Gets identifiers for the curies, only the curies missing from the cache are requested
         :return: None
         """
+        self.identifiers, missing_curie_ids = self.cache.get_many(self.curie_ids)
+        if not missing_curie_ids:
+            return
+
+        self.requestBody = {"curies": missing_curie_ids}
         response = request_with_global_timeout(
             method="post",
             url=self.url,
@@ -44,7 +55,7 @@ class clsNodeNormalizerProvider:
         response.raise_for_status()
         self.responseBody = response.json()
 
-        self.identifiers = {}
+        identifiers = {}
         for curie, normalized_data in self.responseBody.items():
             if normalized_data is None:
                 logging.info(f"CURIE '{curie}' did not return data.")
@@ -54,4 +65,6 @@ class clsNodeNormalizerProvider:
             if identifier == "":
                 logging.info(f"CURIE '{curie}' did not return an identifier.")
                 identifier = curie
-            self.identifiers[curie] = identifier
+            identifiers[curie] = identifier
+        self.cache.set_many(identifiers)
+        self.identifiers.update(identifiers)
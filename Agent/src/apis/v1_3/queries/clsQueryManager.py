@@ -14,13 +14,13 @@ from .clsCaseSolutionManager import clsCaseSolutionManager
 from .clsCategoriesProvider import clsCategoriesProvider
 from .clsCurieIdsProvider import clsCurieIdsProvider
 from utils.multithreading.clsNode import clsNode
-import copy
 import json
 from flask import current_app, request
 import time
-from copy import deepcopy
+from .modTrapiCopy import copy_record, copy_query_graph, copy_knowledge_graph, copy_attributed, copy_request_body
 from itertools import product
 from utils.multithreading.modDispatcher import query_dispatch
+from utils.multithreading.clsCancellationToken import clsCancellationToken
 from ..modSettings import trapi_version, reasoner_id
 from utils.clsLog import clsLogEvent
 from .clsBioLinkSimilarity import clsBiolinkSimilarity
@@ -28,6 +28,7 @@ from .clsExplanationSolutionFinder import ExplanationSolutionFinder
 from ..models.workflow.clsWorkflow import Workflow
 import requests
 from extensions.requests_extension import request_with_global_timeout
+from .clsAesScoringEngine import clsAesScoringEngine
 import logging
 from ..models.clsXaraQueryResults import tableName
 from modDatabase import db
@@ -279,31 +280,46 @@ class clsQueryManager(clsNode):
 
     def getCurieIds(self):
         """
-        A function to get the appropriate curie ids from the names for each node (if applicable)
+        A function to get the appropriate curie ids from the names for each node (if applicable).
+        The names of every node are resolved together, see clsCurieIdsProvider.resolve_names().
         :return: None
         """
+        node_names = {}
         for nodeId, node in self.userRequestBody['message']['query_graph']['nodes'].items():
-            if 'names' not in node and 'name' not in node: continue
             if 'names' in node:
-                curieIdsProvider = clsCurieIdsProvider(names=node['names'])
+                node_names[nodeId] = node['names']
             elif 'name' in node:
-                curieIdsProvider = clsCurieIdsProvider(names=[node['name']])
-            else:
-                continue
-            curieIdsProvider.getCurieIds()
-            node['ids'] = curieIdsProvider.curieIds
+                node_names[nodeId] = [node['name']]
+        if not node_names:
+            return
+
+        curie_ids = clsCurieIdsProvider.resolve_names([name for names in node_names.values() for name in names])
+        for nodeId, names in node_names.items():
+            node = self.userRequestBody['message']['query_graph']['nodes'][nodeId]
+            node['ids'] = sorted(set(curieId for name in names for curieId in curie_ids[name]))
+            if len(node['ids']) == 0:
+                raise AttributeError("No curie ids found for given names")
             # del node['names']  # delete this, otherwise knowledge provider will throw 500
 
     def getCategories(self):
         """
-        A function to get the appropriate categories from the curie ids for each node (if applicable)
+        A function to get the appropriate categories from the curie ids for each node (if applicable).
+        The curie ids of every node are resolved in one request, see clsCategoriesProvider.resolve_categories().
         :return: None
         """
+        node_curie_ids = {}
         for nodeId, node in self.userRequestBody['message']['query_graph']['nodes'].items():
             if 'categories' in node: continue
-            categoriesProvider = clsCategoriesProvider(curieIds=node['ids'])
-            categoriesProvider.getCategories()
-            node['categories'] = categoriesProvider.categories
+            node_curie_ids[nodeId] = node['ids']
+        if not node_curie_ids:
+            return
+
+        categories, _ = clsCategoriesProvider.resolve_categories(sorted(set(curieId for curieIds in node_curie_ids.values() for curieId in curieIds)))
+        for nodeId, curieIds in node_curie_ids.items():
+            node = self.userRequestBody['message']['query_graph']['nodes'][nodeId]
+            node['categories'] = sorted(set(categories[curieId] for curieId in curieIds if categories[curieId] is not None))
+            if len(node['categories']) == 0:
+                raise AttributeError("No categories found for given curie ids")
 
     def deriveQueryPaths(self):
         """
@@ -326,33 +342,33 @@ class clsQueryManager(clsNode):
         def node_generator(node_id, node_data):
             if "names" in node_data and len(node_data["names"]) > 1 and len(node_data["categories"]) > 1:
                 for category in node_data["categories"]:
-                    new_node = deepcopy(node_data)
+                    new_node = copy_record(node_data)
                     new_node["categories"] = [category]
                     yield node_id, new_node
             elif "ids" in node_data and len(node_data["ids"]) > 1 and len(node_data["categories"]) > 1:
                 for curie in node_data["ids"]:
-                    new_node = deepcopy(node_data)
+                    new_node = copy_record(node_data)
                     new_node["ids"] = [curie]
                     yield node_id, new_node
             elif "names" in node_data and len(node_data["names"]) > 1 and "ids" in node_data and len(
                     node_data["ids"]) > 1:
                 for curie in node_data["ids"]:
-                    new_node = deepcopy(node_data)
+                    new_node = copy_record(node_data)
                     new_node["ids"] = [curie]
                     yield node_id, new_node
             elif "names" in node_data and len(node_data["names"]) > 1:
                 for name in node_data["names"]:
-                    new_node = deepcopy(node_data)
+                    new_node = copy_record(node_data)
                     new_node["names"] = [name]
                     yield node_id, new_node
             elif "categories" in node_data and len(node_data["categories"]) > 1:
                 for category in node_data["categories"]:
-                    new_node = deepcopy(node_data)
+                    new_node = copy_record(node_data)
                     new_node["categories"] = [category]
                     yield node_id, new_node
             elif "ids" in node_data and len(node_data["ids"]) > 1:
                 for curie in node_data["ids"]:
-                    new_node = deepcopy(node_data)
+                    new_node = copy_record(node_data)
                     new_node["ids"] = [curie]
                     yield node_id, new_node
             else:
@@ -366,12 +382,12 @@ class clsQueryManager(clsNode):
                 edge_data["predicates"] = ["ANY"]
 
             for predicate in edge_data["predicates"]:
-                new_edge = deepcopy(edge_data)
+                new_edge = copy_record(edge_data)
                 new_edge["predicates"] = [predicate]
 
                 if "qualifier_constraints" in new_edge and len(new_edge["qualifier_constraints"]) > 0:
                     for qualifier_constraint in new_edge["qualifier_constraints"]:
-                        new_qc_edge = deepcopy(new_edge)
+                        new_qc_edge = copy_record(new_edge)
                         new_qc_edge["qualifier_constraints"] = [qualifier_constraint]
                         yield edge_id, new_qc_edge
                 else:
@@ -414,14 +430,15 @@ class clsQueryManager(clsNode):
         app = current_app._get_current_object() if self.app is None else self.app
         # use the same searcher class across all solution managers
         case_problem_searcher = clsBiolinkSimilarity(app)
+        # taken before the searcher is copied, so every manager uses the same local similarity snapshot
+        case_problem_searcher.get_similarity_snapshot()
         explanation_solution_finder = ExplanationSolutionFinder(app)
         # explanation_solution_finder = None
 
         for dispatchId, query_graph in enumerate(self.batch_query_graphs):
             # create a deep copy of the user request body
             # override with single edge predicates, 1 at a time
-            userRequestBodyCopy = deepcopy(self.userRequestBody)
-            userRequestBodyCopy['message']["query_graph"] = query_graph
+            userRequestBodyCopy = copy_request_body(self.userRequestBody, query_graph)
             # edgesCopy = userRequestBodyCopy['message']['query_graph']['edges']
             # edgeCopy = edgesCopy[list(edgesCopy.keys())[0]]
             # edgeCopy['predicates'] = [edgePredicate]
@@ -435,10 +452,10 @@ class clsQueryManager(clsNode):
                 workflow=self.workflow
             )
             caseSolutionManager.app = current_app._get_current_object() if self.app is None else self.app  # pass app by reference
-            caseSolutionManager.initialize_db_data()
             # create a shallow copy of the searchers, so the app reference stays the same.
             # We are only copying so it doesn't need to re-retrieve the initialization data.
             caseSolutionManager.case_problem_searcher = copy(case_problem_searcher)
+            caseSolutionManager.initialize_db_data()
             # caseSolutionManager.explanation_solution_finder = copy(explanation_solution_finder)
             caseSolutionManager.explanation_solution_finder = explanation_solution_finder
 
@@ -455,11 +472,17 @@ class clsQueryManager(clsNode):
                 message=f"Executing {len(self.dispatchList)} predicate searches."
             ))
 
+            # shared by both dispatches, everything still running at the processing timeout stops at its next checkpoint
+            if self.dispatchCancellationToken is None:
+                self.dispatchCancellationToken = clsCancellationToken(deadline=self.started_time + self.processing_timeout)
+
             query_dispatch(
                 objects=self.dispatchList,
                 method=self.dispatchMode,
                 parentId=self.dispatchId,
-                abort_time=int(self.started_time + self.processing_timeout)
+                abort_time=int(self.started_time + self.processing_timeout),
+                pool_size=modConfig.queryDispatchPoolSize,
+                cancellation_token=self.dispatchCancellationToken
             )
 
             # all solution managers have identified case solutions to use, now we aggregate and dispatch those
@@ -471,14 +494,22 @@ class clsQueryManager(clsNode):
                 if case_solution_manager.dispatchList:
                     self.caseMultiHops += case_solution_manager.dispatchList
 
-            query_dispatch(
+            unfinished = query_dispatch(
                 objects=self.caseMultiHops,
                 method=self.dispatchMode,
                 parentId=self.dispatchId,
                 abort_time=int(self.started_time + self.processing_timeout),
                 # abort_time=10,
-                pool_size=5
+                pool_size=modConfig.multihopDispatchPoolSize,
+                cancellation_token=self.dispatchCancellationToken
             )
+            if unfinished:
+                self.logs.append(clsLogEvent(
+                    identifier="",
+                    level="WARNING",
+                    code="Cancelled",
+                    message=f"Processing timeout of {self.processing_timeout} seconds reached, {len(unfinished)} Case Solutions were cancelled."
+                ))
 
             self.logs.append(clsLogEvent(
                 identifier="",
@@ -549,7 +580,7 @@ class clsQueryManager(clsNode):
         """
 
         # Query graph is the submitted QG unless derived case solutions were used. In that case the query graph is the one used by the derived cases.
-        self.query_graph = deepcopy(self.userRequestBody["message"]["query_graph"])
+        self.query_graph = copy_query_graph(self.userRequestBody["message"]["query_graph"])
         # No longer the case, the query graph must be static
         # This is especially true if multiple case solutions were used: How to select what is the query graph to use from multiples?
         # for multi_hop in self.caseMultiHops:
@@ -571,20 +602,22 @@ class clsQueryManager(clsNode):
                 if multi_hop.successful:
                     all_cases_unsuccessful = False
                     # if the properties weren't set yet, then copy the first one found
+                    # the multi hops are done, so their results are taken over as is. merge_overlapping_results copies the edge bindings.
                     if self.knowledge_graph is None and self.results is None:
-                        self.knowledge_graph = deepcopy(multi_hop.knowledge_graph)
-                        self.results = deepcopy(multi_hop.results)
+                        self.knowledge_graph = copy_knowledge_graph(multi_hop.knowledge_graph)
+                        self.results = list(multi_hop.results)
                         continue
 
-                    self.knowledge_graph['edges'].update(deepcopy(multi_hop.knowledge_graph['edges']))
-                    self.knowledge_graph['nodes'].update(deepcopy(multi_hop.knowledge_graph['nodes']))
-                    self.results.extend(deepcopy(multi_hop.results))
+                    multi_hop_knowledge_graph = copy_knowledge_graph(multi_hop.knowledge_graph)
+                    self.knowledge_graph['edges'].update(multi_hop_knowledge_graph['edges'])
+                    self.knowledge_graph['nodes'].update(multi_hop_knowledge_graph['nodes'])
+                    self.results.extend(multi_hop.results)
 
         # Merge all results with same subject and object IDs
         self.merge_overlapping_results()
 
         if all_cases_unsuccessful:
-            self.query_graph = deepcopy(self.userRequestBody["message"]["query_graph"])
+            self.query_graph = copy_query_graph(self.userRequestBody["message"]["query_graph"])
             self.knowledge_graph = {'nodes': {}, 'edges': {}}
             self.results = []
 
@@ -645,7 +678,7 @@ class clsQueryManager(clsNode):
                     if edge_binding_key not in merged_result["edge_bindings"]:
                         merged_result["edge_bindings"][edge_binding_key] = []
                     for edge_binding in edge_bindings:
-                        new_edge_binding = copy.deepcopy(edge_binding)
+                        new_edge_binding = copy_attributed(edge_binding)
 
                         # if "score" in new_edge_binding:
                         #     new_edge_binding["original_score"] = new_edge_binding["score"]
@@ -712,17 +745,19 @@ class clsQueryManager(clsNode):
 
                 # if the properties weren't set yet, then copy the first one found
                 if self.query_graph is None and self.knowledge_graph is None and self.results is None:
-                    self.query_graph = deepcopy(caseSolution.query_graph)
-                    self.knowledge_graph = deepcopy(caseSolution.knowledge_graph)
-                    self.results = deepcopy(caseSolution.results)
+                    self.query_graph = copy_query_graph(caseSolution.query_graph)
+                    self.knowledge_graph = copy_knowledge_graph(caseSolution.knowledge_graph)
+                    self.results = list(caseSolution.results)
                     continue
 
                 # update for the rest of them
-                self.query_graph['edges'].update(deepcopy(caseSolution.query_graph['edges']))
-                self.query_graph['nodes'].update(deepcopy(caseSolution.query_graph['nodes']))
-                self.knowledge_graph['edges'].update(deepcopy(caseSolution.knowledge_graph['edges']))
-                self.knowledge_graph['nodes'].update(deepcopy(caseSolution.knowledge_graph['nodes']))
-                self.results.extend(deepcopy(caseSolution.results))
+                case_query_graph = copy_query_graph(caseSolution.query_graph)
+                case_knowledge_graph = copy_knowledge_graph(caseSolution.knowledge_graph)
+                self.query_graph['edges'].update(case_query_graph['edges'])
+                self.query_graph['nodes'].update(case_query_graph['nodes'])
+                self.knowledge_graph['edges'].update(case_knowledge_graph['edges'])
+                self.knowledge_graph['nodes'].update(case_knowledge_graph['nodes'])
+                self.results.extend(caseSolution.results)
 
     # def appendProvenance(self):
     #     """
@@ -828,9 +863,26 @@ class clsQueryManager(clsNode):
 
     def send_to_aes(self):
         """
-        Sends the response to the AES web service for evidence scoring.
+        Scores the response with the local AES engine, or sends it to the AES web service when there is no local data for the query.
         :return:
         """
+        if clsAesScoringEngine.instance().score_response(self.query_graph, self.knowledge_graph, self.results):
+            self.logs.append(clsLogEvent(
+                identifier="",
+                level="DEBUG",
+                code="",
+                message="Successfully performed local AES results labeling."
+            ))
+            return
+        if not modConfig.aesRemoteEnabled:
+            self.logs.append(clsLogEvent(
+                identifier="",
+                level="WARNING",
+                code="",
+                message="No local AES data for this query and the remote AES service is disabled, skipping AES results labeling."
+            ))
+            return
+
         # aes_url = "http://172.16.32.17/AES/Analyze/"
         # aes_url = "http://localhost/AES/Analyze/"
         aes_url = "https://aes.decisionengineering.us/AES/Analyze/"
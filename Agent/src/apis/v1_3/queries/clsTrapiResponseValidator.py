@@ -0,0 +1,259 @@
+"""
+WHAT: Incremental TRAPI validation of knowledge provider responses, checking every knowledge graph node, knowledge graph edge and result as soon as it is parsed
+WHY: reasoner_validator.validate checks the Response schema itself on every call and then validates the whole parsed document in one pass. KP responses can
+     hold tens of thousands of edges, and all of them had to be parsed before the first error could be found. Here the response is parsed with ijson and
+     each record is checked as it completes, so a malformed record fails the parse early. In sampling mode only N random edges (reservoir sampled) are
+     validated against the full Edge schema and every other record gets a cheap structural check.
+ASSUMES: Schemas are those of reasoner_validator.util.load_schema, one self-contained JSON schema per TRAPI component.
+         Falls back to json.loads followed by the same per-record checks when ijson is not installed.
+FUTURE IMPROVEMENTS: Stream the response from the socket instead of parsing response.content
+WHO: TZ 2023-03-21
+"""
+
+import json
+import random
+import threading
+from io import BytesIO
+import jsonschema
+from jsonschema import ValidationError
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+class clsTrapiResponseValidator:
+    """
+    See header
+    """
+
+    # id of a component schema -> (schema, jsonschema validator). Building a validator checks the schema, so they are reused across responses.
+    _validators = {}
+    _validators_lock = threading.Lock()
+
+    def __init__(self, trapi_version: str, sample_size: int = None, seed: int = None, schemas: dict = None):
+        """
+        Constructor
+        :param trapi_version: TRAPI version to validate against
+        :param sample_size: Number of random edges validated against the full Edge schema, the other records are checked shallowly.
+                            None validates every node, edge and result fully.
+        :param seed: Random seed of the edge sample
+        :param schemas: Dictionary of component -> JSON schema, loaded with reasoner_validator when not given
+        """
+        if schemas is None:
+            from reasoner_validator.util import load_schema
+            schemas = load_schema(trapi_version)
+        self.trapi_version = trapi_version
+        self.sample_size = sample_size
+        self.schemas = schemas
+        self.random = random.Random(seed)
+
+        self.sampled_edges = []
+        self.edge_count = 0
+
+    def validator(self, component: str):
+        """
+        Returns the cached jsonschema validator of a component
+        :param component: TRAPI component, e.g. "Edge"
+        :return: jsonschema validator
+        """
+        schema = self.schemas[component]
+        cached = self._validators.get(id(schema))
+        if cached is None:
+            with self._validators_lock:
+                validator_class = jsonschema.validators.validator_for(schema)
+                validator_class.check_schema(schema)
+                # the schema is kept so its id is not reused
+                cached = self._validators[id(schema)] = (schema, validator_class(schema))
+        return cached[1]
+
+    def validate_component(self, instance, component: str, location: str):
+        """
+        Validates one record against its full component schema
+        :param instance: Record
+        :param component: TRAPI component
+        :param location: Where the record is in the response, added to the error message
+        :return: None
+        :raises: ValidationError
+        """
+        error = jsonschema.exceptions.best_match(self.validator(component).iter_errors(instance))
+        if error is not None:
+            raise ValidationError(f"{location}: {error.message}")
+
+    @staticmethod
+    def check_node(node_id: str, node):
+        """
+        Structural check of a knowledge graph node
+        :raises: ValidationError
+        """
+        if not isinstance(node, dict):
+            raise ValidationError(f"knowledge_graph.nodes.{node_id}: {node!r} is not of type 'object'")
+        categories = node.get("categories")
+        if categories is not None and (not isinstance(categories, list) or not all(isinstance(category, str) for category in categories)):
+            raise ValidationError(f"knowledge_graph.nodes.{node_id}.categories: {categories!r} is not a list of strings")
+        if node.get("name") is not None and not isinstance(node["name"], str):
+            raise ValidationError(f"knowledge_graph.nodes.{node_id}.name: {node['name']!r} is not of type 'string'")
+        clsTrapiResponseValidator.check_list(node, "attributes", f"knowledge_graph.nodes.{node_id}")
+
+    @staticmethod
+    def check_edge(edge_id: str, edge):
+        """
+        Structural check of a knowledge graph edge
+        :raises: ValidationError
+        """
+        if not isinstance(edge, dict):
+            raise ValidationError(f"knowledge_graph.edges.{edge_id}: {edge!r} is not of type 'object'")
+        for key in ("subject", "object"):
+            if not isinstance(edge.get(key), str):
+                raise ValidationError(f"knowledge_graph.edges.{edge_id}.{key}: {edge.get(key)!r} is not of type 'string'")
+        if edge.get("predicate") is not None and not isinstance(edge["predicate"], str):
+            raise ValidationError(f"knowledge_graph.edges.{edge_id}.predicate: {edge['predicate']!r} is not of type 'string'")
+        clsTrapiResponseValidator.check_list(edge, "attributes", f"knowledge_graph.edges.{edge_id}")
+        clsTrapiResponseValidator.check_list(edge, "qualifiers", f"knowledge_graph.edges.{edge_id}")
+
+    @staticmethod
+    def check_result(index: int, result):
+        """
+        Structural check of a result
+        :raises: ValidationError
+        """
+        if not isinstance(result, dict):
+            raise ValidationError(f"results.{index}: {result!r} is not of type 'object'")
+        for key in ("node_bindings", "edge_bindings"):
+            bindings = result.get(key)
+            if not isinstance(bindings, dict):
+                raise ValidationError(f"results.{index}.{key}: {bindings!r} is not of type 'object'")
+            for qg_id, binding_list in bindings.items():
+                if not isinstance(binding_list, list) or not all(isinstance(binding, dict) and isinstance(binding.get("id"), str) for binding in binding_list):
+                    raise ValidationError(f"results.{index}.{key}.{qg_id}: {binding_list!r} is not a list of bindings with an 'id'")
+
+    @staticmethod
+    def check_list(record: dict, key: str, location: str):
+        values = record.get(key)
+        if values is not None and (not isinstance(values, list) or not all(isinstance(value, dict) for value in values)):
+            raise ValidationError(f"{location}.{key}: {values!r} is not a list of objects")
+
+    def on_node(self, node_id: str, node):
+        if self.sample_size is None:
+            self.validate_component(node, "Node", f"knowledge_graph.nodes.{node_id}")
+        else:
+            self.check_node(node_id, node)
+
+    def on_edge(self, edge_id: str, edge):
+        if self.sample_size is None:
+            self.validate_component(edge, "Edge", f"knowledge_graph.edges.{edge_id}")
+            return
+        self.check_edge(edge_id, edge)
+        # reservoir sampling, every edge has the same chance to be fully validated in finish()
+        self.edge_count += 1
+        if len(self.sampled_edges) < self.sample_size:
+            self.sampled_edges.append((edge_id, edge))
+        else:
+            index = self.random.randrange(self.edge_count)
+            if index < self.sample_size:
+                self.sampled_edges[index] = (edge_id, edge)
+
+    def on_result(self, index: int, result):
+        if self.sample_size is None:
+            self.validate_component(result, "Result", f"results.{index}")
+        else:
+            self.check_result(index, result)
+
+    def parse(self, content: bytes):
+        """
+        Parses a response body, checking every knowledge graph node and edge and every result as soon as it is complete
+        :param content: Raw response body
+        :return: Parsed response body
+        :raises: ValidationError on the first invalid record, ValueError if the content is not JSON
+        """
+        if ijson is None:
+            body = json.loads(content)
+            self.check_records(body)
+            return body
+
+        root = None
+        # the container being built and the key its next value goes to (None for arrays), and the same pair for every enclosing container
+        container, key = None, None
+        stack = []
+        try:
+            for event, value in ijson.basic_parse(BytesIO(content), use_float=True):
+                if event == "map_key":
+                    key = value
+                elif event == "start_map" or event == "start_array":
+                    stack.append((container, key))
+                    container, key = ({} if event == "start_map" else []), None
+                elif event == "end_map" or event == "end_array":
+                    completed = container
+                    container, key = stack.pop()
+                    if container is None:
+                        root = completed
+                    elif key is None:
+                        container.append(completed)
+                    else:
+                        container[key] = completed
+                    # stack: (None, None), (response, "message"), (message, "knowledge_graph"), (knowledge_graph, "nodes" or "edges")
+                    if len(stack) == 4 and stack[1][1] == "message" and stack[2][1] == "knowledge_graph":
+                        if stack[3][1] == "edges":
+                            self.on_edge(key, completed)
+                        elif stack[3][1] == "nodes":
+                            self.on_node(key, completed)
+                    # stack: (None, None), (response, "message"), (message, "results")
+                    elif len(stack) == 3 and stack[1][1] == "message" and stack[2][1] == "results":
+                        self.on_result(len(container) - 1, completed)
+                elif container is None:
+                    root = value
+                elif key is None:
+                    container.append(value)
+                else:
+                    container[key] = value
+        except ijson.JSONError as e:
+            raise ValueError(f"Response is not valid JSON: {e}") from e
+        return root
+
+    def check_records(self, body):
+        """
+        Checks every knowledge graph node and edge and every result of an already parsed response body
+        :param body: Response body
+        :return: None
+        :raises: ValidationError
+        """
+        message = body.get("message") if isinstance(body, dict) else None
+        if not isinstance(message, dict):
+            return
+        knowledge_graph = message.get("knowledge_graph")
+        if isinstance(knowledge_graph, dict):
+            if isinstance(knowledge_graph.get("nodes"), dict):
+                for node_id, node in knowledge_graph["nodes"].items():
+                    self.on_node(node_id, node)
+            if isinstance(knowledge_graph.get("edges"), dict):
+                for edge_id, edge in knowledge_graph["edges"].items():
+                    self.on_edge(edge_id, edge)
+        if isinstance(message.get("results"), list):
+            for index, result in enumerate(message["results"]):
+                self.on_result(index, result)
+
+    def finish(self, body):
+        """
+        Validates the rest of the response against the Response schema, with the already checked records left out, then the sampled edges
+        :param body: Response body returned by parse()
+        :return: None
+        :raises: ValidationError
+        """
+        envelope = body
+        message = body.get("message") if isinstance(body, dict) else None
+        if isinstance(message, dict):
+            envelope = dict(body)
+            envelope["message"] = dict(message)
+            knowledge_graph = message.get("knowledge_graph")
+            if isinstance(knowledge_graph, dict):
+                envelope["message"]["knowledge_graph"] = dict(knowledge_graph)
+                for key in ("nodes", "edges"):
+                    if isinstance(knowledge_graph.get(key), dict):
+                        envelope["message"]["knowledge_graph"][key] = {}
+            if isinstance(message.get("results"), list):
+                envelope["message"]["results"] = []
+        self.validate_component(envelope, "Response", "response")
+
+        for edge_id, edge in self.sampled_edges:
+            self.validate_component(edge, "Edge", f"knowledge_graph.edges.{edge_id}")
@@ -0,0 +1,87 @@
+"""
+WHAT: Copy-on-write copies of TRAPI query graphs, knowledge graphs and results
+WHY: Case solutions, multi hops and the query manager used to deepcopy whole knowledge provider responses, sometimes once per result. Every node, edge
+     and attribute was duplicated even though almost nothing is changed afterwards. These copies only duplicate the containers that are written to
+     (the node and edge maps, the records, the attribute and binding lists) and share everything below them with the original.
+ASSUMES: Callers replace values instead of editing them in place, except for the containers copied here. For example, a copied query graph node may get
+         node["ids"] = [...] but not node["ids"].append(...), and a copied knowledge graph edge may get edge["attributes"].append(...).
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-20
+"""
+
+
+def copy_record(record: dict) -> dict:
+    """
+    Copies one query graph node or edge, its values are shared
+    :param record: Node or edge
+    :return: New dictionary
+    """
+    return dict(record)
+
+
+def copy_query_graph(query_graph: dict) -> dict:
+    """
+    Copies the node and edge maps and every node and edge record
+    :param query_graph: TRAPI query graph, or None
+    :return: New query graph, or None
+    """
+    if query_graph is None:
+        return None
+    copied = dict(query_graph)
+    for key in ("nodes", "edges"):
+        if query_graph.get(key) is not None:
+            copied[key] = {record_id: copy_record(record) for record_id, record in query_graph[key].items()}
+    return copied
+
+
+def copy_attributed(record: dict) -> dict:
+    """
+    Copies a knowledge graph node or edge, or an edge binding, and its attribute list. The attributes themselves are shared.
+    :param record: Record with an optional "attributes" list
+    :return: New dictionary
+    """
+    copied = dict(record)
+    if copied.get("attributes") is not None:
+        copied["attributes"] = list(copied["attributes"])
+    return copied
+
+
+def copy_knowledge_graph(knowledge_graph: dict) -> dict:
+    """
+    Copies the node and edge maps, every node and edge record and their attribute lists
+    :param knowledge_graph: TRAPI knowledge graph, or None
+    :return: New knowledge graph, or None
+    """
+    if knowledge_graph is None:
+        return None
+    copied = dict(knowledge_graph)
+    for key in ("nodes", "edges"):
+        if knowledge_graph.get(key) is not None:
+            copied[key] = {record_id: copy_attributed(record) for record_id, record in knowledge_graph[key].items()}
+    return copied
+
+
+def copy_result(result: dict) -> dict:
+    """
+    Copies a result and its binding maps, so bindings can be added or replaced per query graph id. The binding lists are shared.
+    :param result: TRAPI result
+    :return: New result
+    """
+    copied = dict(result)
+    for key in ("node_bindings", "edge_bindings"):
+        if result.get(key) is not None:
+            copied[key] = dict(result[key])
+    return copied
+
+
+def copy_request_body(request_body: dict, query_graph: dict) -> dict:
+    """
+    Copies a TRAPI request with a different query graph, the rest of the message is shared
+    :param request_body: TRAPI request body
+    :param query_graph: Query graph of the copy
+    :return: New request body
+    """
+    copied = dict(request_body)
+    copied["message"] = dict(request_body["message"])
+    copied["message"]["query_graph"] = query_graph
+    return copied
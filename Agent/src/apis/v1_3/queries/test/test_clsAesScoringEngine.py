@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from copy import deepcopy
+from timeit import default_timer as timer
+import numpy as np
+import modConfig
+from ..clsAesScoringEngine import clsAesScoringEngine, clsAesFeatureSet
+
+
+def reference_score(candidate: np.ndarray, references: np.ndarray) -> float:
+    """
+    Average cosine of one KP answer against every AES-derived answer, one pair at a time as described in AES/*.md
+    """
+    cosines = []
+    for reference in references:
+        norm = np.linalg.norm(candidate) * np.linalg.norm(reference)
+        cosines.append(float(candidate @ reference) / norm if norm > 0 else 0.0)
+    return float(np.mean(cosines))
+
+
+class test_clsAesScoringEngine(unittest.TestCase):
+
+    def setUp(self):
+        # 6 phenotypes x 10 diseases
+        self.row_ids = [f"HP:000000{i}" for i in range(6)]
+        self.matrix = np.array([
+            [1, 1, 0, 0, 0, 0, 0, 0, 0, 1],
+            [1, 0, 1, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 1, 1, 0, 0, 0, 0, 0],
+            [1, 1, 0, 0, 0, 0, 0, 0, 0, 1],
+            [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+        ], dtype=np.uint8)
+        self.answers = {"MONDO:0004975": ["HP:0000000", "HP:0000001"]}
+        self.feature_set = clsAesFeatureSet(name="disease_phenotype", row_ids=self.row_ids, packed_features=np.packbits(self.matrix, axis=1),
+                                            feature_count=self.matrix.shape[1], answers=self.answers)
+        self.engine = clsAesScoringEngine({"disease_phenotype": self.feature_set})
+
+        self.query_graph = {
+            "nodes": {
+                "n0": {"ids": ["MONDO:0004975"], "categories": ["biolink:Disease"]},
+                "n1": {"categories": ["biolink:PhenotypicFeature"]},
+            },
+            "edges": {"e01": {"subject": "n0", "object": "n1", "predicates": ["biolink:has_phenotype"]}},
+        }
+        self.knowledge_graph = {"nodes": {}, "edges": {}}
+        self.results = []
+        for i, phenotype in enumerate(self.row_ids + ["HP:9999999"]):
+            self.knowledge_graph["edges"][f"kg{i}"] = {"subject": "MONDO:0004975", "object": phenotype, "predicate": "biolink:has_phenotype", "attributes": None}
+            self.results.append({
+                "node_bindings": {"n0": [{"id": "MONDO:0004975"}], "n1": [{"id": phenotype}]},
+                "edge_bindings": {"e01": [{"id": f"kg{i}"}]},
+            })
+
+    def test_scores_match_pairwise_cosine(self):
+        references = self.matrix[[0, 1]].astype(float)
+        scores = self.feature_set.score(self.row_ids, ["HP:0000000", "HP:0000001"])
+        self.assertEqual(set(self.row_ids), set(scores))
+        for i, row_id in enumerate(self.row_ids):
+            self.assertAlmostEqual(reference_score(self.matrix[i].astype(float), references), scores[row_id], places=6)
+        # an all zero phenotype scores 0 instead of dividing by zero
+        self.assertEqual(0.0, scores["HP:0000004"])
+
+    def test_score_response_labels_results_and_knowledge_graph(self):
+        self.assertTrue(self.engine.score_response(self.query_graph, self.knowledge_graph, self.results))
+
+        for result in self.results[:-1]:
+            attributes = result["edge_bindings"]["e01"][0]["attributes"]
+            self.assertEqual(["biolink:aes_evidence_score"], [attribute["attribute_type_id"] for attribute in attributes])
+            kg_edge = self.knowledge_graph["edges"][result["edge_bindings"]["e01"][0]["id"]]
+            self.assertEqual(attributes, kg_edge["attributes"])
+
+        # a phenotype missing from the matrix is left unscored
+        self.assertNotIn("attributes", self.results[-1]["edge_bindings"]["e01"][0])
+        self.assertIsNone(self.knowledge_graph["edges"]["kg6"]["attributes"])
+
+        # identical feature vectors get the same score
+        score = lambda i: self.results[i]["edge_bindings"]["e01"][0]["attributes"][0]["value"]
+        self.assertEqual(score(0), score(3))
+        self.assertGreater(score(0), score(2))
+
+    def test_score_response_without_local_data(self):
+        unknown_disease = deepcopy(self.query_graph)
+        unknown_disease["nodes"]["n0"]["ids"] = ["MONDO:0000001"]
+        other_workflow = deepcopy(self.query_graph)
+        other_workflow["nodes"]["n1"]["categories"] = ["biolink:Gene"]
+        results = deepcopy(self.results)
+
+        for query_graph in (unknown_disease, other_workflow):
+            self.assertFalse(self.engine.score_response(query_graph, self.knowledge_graph, results))
+        self.assertEqual(self.results, results)
+
+    def test_from_folder(self):
+        with tempfile.TemporaryDirectory() as folder:
+            np.save(os.path.join(folder, "disease_phenotype.npy"), np.packbits(self.matrix, axis=1))
+            with open(os.path.join(folder, "disease_phenotype.json"), "w") as file:
+                json.dump({"feature_count": self.matrix.shape[1], "rows": self.row_ids, "answers": self.answers}, file)
+
+            engine = clsAesScoringEngine.from_folder(folder)
+            self.assertEqual(["disease_phenotype"], list(engine.feature_sets))
+            self.assertEqual(self.feature_set.score(self.row_ids, self.answers["MONDO:0004975"]),
+                             engine.feature_sets["disease_phenotype"].score(self.row_ids, self.answers["MONDO:0004975"]))
+            del engine
+
+        self.assertEqual({}, clsAesScoringEngine.from_folder(None).feature_sets)
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_batched_scoring(self):
+        """
+        Scores 2000 KP answers against 200 AES answers over 5217 bit fingerprints, pairwise loop against one matrix product
+        """
+        rng = np.random.RandomState(0)
+        matrix = (rng.rand(5000, 5217) < 0.05).astype(np.uint8)
+        row_ids = [f"CHEBI:{i}" for i in range(len(matrix))]
+        feature_set = clsAesFeatureSet(name="protein_chemical", row_ids=row_ids, packed_features=np.packbits(matrix, axis=1),
+                                       feature_count=matrix.shape[1], answers={})
+        candidate_ids = row_ids[:2000]
+        reference_ids = row_ids[-200:]
+        references = matrix[-200:].astype(float)
+
+        start = timer()
+        expected = {row_id: reference_score(matrix[i].astype(float), references) for i, row_id in enumerate(candidate_ids[:200])}
+        before_seconds = (timer() - start) * len(candidate_ids) / 200
+
+        start = timer()
+        scores = feature_set.score(candidate_ids, reference_ids)
+        after_seconds = timer() - start
+
+        logging.info(f"AES scoring of {len(candidate_ids)} answers: pairwise {before_seconds:.2f} s (extrapolated), batched {after_seconds:.3f} s")
+        for row_id, score in expected.items():
+            self.assertAlmostEqual(score, scores[row_id], places=5)
+        self.assertLess(after_seconds, before_seconds)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,304 @@
+import logging
+import os
+import random
+import unittest
+from timeit import default_timer as timer
+import numpy as np
+import pandas as pd
+import modConfig
+from apis.v1_3.queries.clsLocalSimilarityStore import clsLocalSimilarityStore
+from apis.v1_3.queries.clsCaseProblemMatrix import clsCaseProblemMatrix
+from apis.v1_3.queries.clsBioLinkSimilarity import clsBiolinkSimilarity
+from apis.v1_3.queries.clsKnowledgeType import clsKnowledgeType
+from .modTestDatabase import createSqliteApp, seedTable, seedLocalSimilarity, seedCaseProblems, syntheticLocalSimilarityRows, syntheticCaseProblemRows
+
+
+def referenceGlobalSimilarity(searcher: clsBiolinkSimilarity, cases: pd.DataFrame, new_subject, new_object, new_predicate, weights):
+    """
+    The per row pandas calculation clsBiolinkSimilarity.get_global_sim_triplets used before the case problems were encoded
+    """
+    cases = cases.copy()
+    subject_weight, object_weight, predicate_weight = weights
+    cases['subject_local_sim'] = cases['N00_NODE_CATEGORY'].map(lambda x: searcher.get_local_sim_score_nodes(new_subject, x))
+    cases['object_local_sim'] = cases['N01_NODE_CATEGORY'].map(lambda x: searcher.get_local_sim_score_nodes(new_object, x))
+    cases['pred_local_sim'] = cases['E00_EDGE_PREDICATE'].map(lambda x: searcher.get_local_sim_score_preds(new_predicate, x))
+    cases['global_sim'] = ((cases['subject_local_sim'] * float(subject_weight) + cases['object_local_sim']
+                            * float(object_weight) + cases['pred_local_sim'] * float(predicate_weight)) / float(sum(weights)))
+    return cases
+
+
+def referenceTopGlobalSimCases(global_similarity: pd.DataFrame, query_threshold, max_cases: int, knowledge_type: str, second_highest_max_reuse: int,
+                               max_similarity_lt: float = None):
+    """
+    The sort based clsBiolinkSimilarity.get_top_global_sim_cases used before np.argpartition
+    """
+    all_sorted_global_similarity = global_similarity.sort_values(['global_sim', 'CASE_ID'], ascending=[False, True])
+    sorted_global_similarity = all_sorted_global_similarity[all_sorted_global_similarity["global_sim"] >= query_threshold]
+    if max_similarity_lt:
+        sorted_global_similarity = sorted_global_similarity[sorted_global_similarity["global_sim"] < max_similarity_lt]
+
+    if len(sorted_global_similarity) <= 1:
+        selected_cases = sorted_global_similarity
+    elif knowledge_type == clsKnowledgeType.LOOKUP:
+        top_score = sorted_global_similarity['global_sim'].unique()[0]
+        selected_cases = sorted_global_similarity[sorted_global_similarity['global_sim'] == top_score]
+    else:
+        top_two_scores = sorted_global_similarity['global_sim'].unique()[:2]
+        top_score = top_two_scores[0]
+        runner_up_score = -1 if len(top_two_scores) == 1 else top_two_scores[1]
+        selected_cases = sorted_global_similarity[sorted_global_similarity['global_sim'] == top_score]
+        if runner_up_score > 0.9499:
+            runner_up_selected_cases = sorted_global_similarity[sorted_global_similarity['global_sim'] == runner_up_score].head(second_highest_max_reuse)
+            selected_cases = pd.concat((selected_cases, runner_up_selected_cases))
+
+    return list(selected_cases.iloc[:max_cases][['CASE_ID', 'global_sim']].to_records(index=False))
+
+
+class test_clsCaseProblemMatrix(unittest.TestCase):
+    nodeCount = 30
+    predicateCount = 20
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app, cls.databasePath = createSqliteApp()
+        node_rows, predicate_rows = syntheticLocalSimilarityRows(nodeCount=cls.nodeCount, predicateCount=cls.predicateCount)
+        # some sparse zero scores, which become -20 for nodes, and an "ANY" case predicate
+        node_rows += [("biolink:Category0", "biolink:Unmapped", 0)]
+        predicate_rows += [("biolink:predicate_0", "biolink:predicate_1", 0)]
+        seedLocalSimilarity(cls.app, nodeRows=node_rows, predicateRows=predicate_rows)
+
+        cls.case_rows = syntheticCaseProblemRows(caseCount=2000, nodeCount=cls.nodeCount + 2, predicateCount=cls.predicateCount + 2)
+        cls.case_rows += [("biolink:Category1", "biolink:Category1", "ANY", "Q900000", "fromKP"),
+                          ("biolink:Category1", None, "biolink:predicate_1", "Q900001", "fromKP"),
+                          ("biolink:Category2", "biolink:Category3", "biolink:predicate_2", "Q900002", None)]
+        seedCaseProblems(cls.app, cls.case_rows)
+        cls.cases = pd.DataFrame(data=cls.case_rows, columns=["N00_NODE_CATEGORY", "N01_NODE_CATEGORY", "E00_EDGE_PREDICATE", "CASE_ID", "ORIGIN"])
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.databasePath)
+
+    def setUp(self):
+        clsLocalSimilarityStore.reset()
+        clsLocalSimilarityStore.initialize(self.app, ttl_seconds=0)
+        self.searcher = clsBiolinkSimilarity(self.app)
+        self.matrix = self.searcher.get_case_problem_matrix()
+
+    def tearDown(self):
+        clsLocalSimilarityStore.reset()
+
+    def test_matrix_is_shared(self):
+        self.assertEqual(len(self.case_rows), len(self.matrix))
+        self.assertIs(self.matrix, clsBiolinkSimilarity(self.app).get_case_problem_matrix())
+
+    def test_filter_rows_matches_query(self):
+        for origins in (["fromKP"], ["derived"], ["fromKP", "derived"]):
+            for exclude_matching_n0_n1 in (False, True):
+                expected = self.cases["ORIGIN"].isin(origins)
+                if exclude_matching_n0_n1:
+                    expected &= self.cases["N00_NODE_CATEGORY"].notna() & self.cases["N01_NODE_CATEGORY"].notna()
+                    expected &= self.cases["N00_NODE_CATEGORY"] != self.cases["N01_NODE_CATEGORY"]
+                rows = self.matrix.filter_rows(origins, exclude_matching_n0_n1=exclude_matching_n0_n1)
+                self.assertListEqual(list(np.flatnonzero(expected.to_numpy())), list(rows))
+
+    def test_nan_is_encoded_like_none(self):
+        nan_cases = self.cases.astype(object).where(self.cases.notna(), float("nan"))
+        self.assertTrue(pd.isna(nan_cases.loc[len(nan_cases) - 2, "N01_NODE_CATEGORY"]))
+        self.assertIsNot(None, nan_cases.loc[len(nan_cases) - 2, "N01_NODE_CATEGORY"])
+        matrix = clsCaseProblemMatrix(nan_cases, self.matrix.node_similarities, self.matrix.predicate_similarities)
+
+        self.assertEqual(self.matrix.node_categories, matrix.node_categories)
+        self.assertEqual(self.matrix.origins, matrix.origins)
+        self.assertIsNotNone(matrix.null_node_code)
+        for origins in (["fromKP"], ["derived"], ["fromKP", "derived"]):
+            for exclude_matching_n0_n1 in (False, True):
+                self.assertListEqual(list(self.matrix.filter_rows(origins, exclude_matching_n0_n1)), list(matrix.filter_rows(origins, exclude_matching_n0_n1)))
+                expected_rows, expected_sim = self.matrix.candidate_rows(origins, exclude_matching_n0_n1, "biolink:Category1", "biolink:Category2",
+                                                                         "biolink:predicate_1", 1.0, 1.0, 1.0, 3.0, 0.0)
+                rows, sim = matrix.candidate_rows(origins, exclude_matching_n0_n1, "biolink:Category1", "biolink:Category2", "biolink:predicate_1",
+                                                  1.0, 1.0, 1.0, 3.0, 0.0)
+                self.assertListEqual(list(expected_rows), list(rows))
+                self.assertTrue(np.array_equal(expected_sim, sim))
+
+    def test_global_similarity_matches_reference(self):
+        randomizer = random.Random(1)
+        categories = [f"biolink:Category{i}" for i in range(self.nodeCount + 2)] + ["biolink:Unmapped", "biolink:NeverSeen"]
+        predicates = [f"biolink:predicate_{i}" for i in range(self.predicateCount + 2)] + ["ANY", "biolink:never_seen"]
+        weights = (3, 2, 1.5)
+        rows = np.arange(len(self.case_rows))
+        for _ in range(50):
+            new_subject, new_object, new_predicate = randomizer.choice(categories), randomizer.choice(categories), randomizer.choice(predicates)
+            expected = referenceGlobalSimilarity(self.searcher, self.cases, new_subject, new_object, new_predicate, weights)['global_sim'].to_numpy()
+            actual = self.matrix.global_similarity(rows, new_subject, new_object, new_predicate, *[float(weight) for weight in weights], float(sum(weights)))
+            self.assertTrue(np.array_equal(expected, actual), f"Global similarity differs for {(new_subject, new_object, new_predicate)}")
+
+    def test_top_global_sim_cases_matches_reference(self):
+        randomizer = random.Random(2)
+        # few distinct scores so there are many ties on the top and runner up scores
+        scores = [1.0, 0.99, 0.96, 0.95, 0.9, 0.5, -3.0]
+        for _ in range(300):
+            count = randomizer.randrange(0, 40)
+            case_ids = [f"Q{i:03d}" for i in randomizer.sample(range(500), count)]
+            global_similarity = pd.DataFrame({'CASE_ID': case_ids, 'global_sim': [randomizer.choice(scores) for _ in range(count)]})
+            query_threshold = randomizer.choice([0.0, 0.9, 0.95])
+            max_cases = randomizer.randrange(1, 10)
+            knowledge_type = randomizer.choice([clsKnowledgeType.LOOKUP, clsKnowledgeType.CREATIVE_MODE])
+            max_similarity_lt = randomizer.choice([None, 1.0])
+            self.searcher.second_highest_max_reuse = randomizer.randrange(1, 5)
+
+            expected = referenceTopGlobalSimCases(global_similarity, query_threshold, max_cases, knowledge_type, self.searcher.second_highest_max_reuse,
+                                                  max_similarity_lt=max_similarity_lt)
+            actual = self.searcher.get_top_global_sim_cases(global_similarity, query_threshold, None, max_cases, knowledge_type, max_similarity_lt=max_similarity_lt)
+            self.assertListEqual([x[0] for x in expected], actual)
+            self.assertListEqual([tuple(x) for x in expected], [tuple(x) for x in self.searcher.selected_case_ids_and_similarities])
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_global_similarity(self):
+        """
+        Compares scoring every case problem with the per row pandas lambdas (previous behavior) against the encoded matrix
+        """
+        weights = (1, 1, 1)
+        rows = self.matrix.filter_rows(["fromKP", "derived"], exclude_matching_n0_n1=False)
+        repeat = 5
+
+        start = timer()
+        for _ in range(repeat):
+            referenceGlobalSimilarity(self.searcher, self.cases, "biolink:Category1", "biolink:Category2", "biolink:predicate_3", weights)
+        before_seconds = (timer() - start) / repeat
+
+        start = timer()
+        for _ in range(repeat):
+            self.matrix.global_similarity(rows, "biolink:Category1", "biolink:Category2", "biolink:predicate_3", 1.0, 1.0, 1.0, 3.0)
+        after_seconds = (timer() - start) / repeat
+
+        logging.info(f"Global similarity of {len(rows)} case problems: before {before_seconds * 1000:.2f} ms, after {after_seconds * 1000:.2f} ms")
+        self.assertLess(after_seconds, before_seconds)
+
+    def test_candidate_rows_match_full_scoring(self):
+        randomizer = random.Random(3)
+        categories = [f"biolink:Category{i}" for i in range(self.nodeCount + 2)] + ["biolink:Unmapped", "biolink:NeverSeen"]
+        predicates = [f"biolink:predicate_{i}" for i in range(self.predicateCount + 2)] + ["ANY", "biolink:never_seen"]
+        for _ in range(200):
+            new_subject, new_object, new_predicate = randomizer.choice(categories), randomizer.choice(categories), randomizer.choice(predicates)
+            weights = randomizer.choice([(1.0, 1.0, 1.0), (3.0, 2.0, 1.5), (1.0, 0.0, 2.0), (1.0, -1.0, 1.0)])
+            threshold = randomizer.choice([None, -5.0, 0.0, 0.3, 0.5, 0.75, 0.9, 1.0, 1.2])
+            origins = randomizer.choice([["fromKP"], ["derived"], ["fromKP", "derived"]])
+            exclude_matching_n0_n1 = randomizer.choice([False, True])
+
+            rows = self.matrix.filter_rows(origins, exclude_matching_n0_n1=exclude_matching_n0_n1)
+            global_sim = self.matrix.global_similarity(rows, new_subject, new_object, new_predicate, *weights, sum(weights))
+            if threshold is not None:
+                rows, global_sim = rows[global_sim >= threshold], global_sim[global_sim >= threshold]
+
+            candidate_rows, candidate_sim = self.matrix.candidate_rows(origins, exclude_matching_n0_n1, new_subject, new_object, new_predicate, *weights,
+                                                                       sum(weights), threshold)
+            message = f"Candidates differ for {(new_subject, new_object, new_predicate, weights, threshold, origins, exclude_matching_n0_n1)}"
+            self.assertListEqual(list(rows), list(candidate_rows), message)
+            self.assertTrue(np.array_equal(global_sim, candidate_sim), message)
+
+    def test_precomputed_global_similarity_lookup(self):
+        """
+        The precomputed table is filled like the xARA-ETL clsPrecomputedGlobalSimilarityJob does, from every case problem at or above the lowest threshold
+        """
+        weights = (3.0, 2.0, 1.5)
+        min_threshold = 0.5
+        # the last triplet has no case problem at or above the threshold
+        precomputed = [("biolink:Category1", "biolink:predicate_2", "biolink:Category3"), ("biolink:Category4", "ANY", "biolink:Category4"),
+                       ("biolink:Nothing", "biolink:predicate_2", "biolink:Nothing")]
+        rows = []
+        for subject, predicate, object in precomputed:
+            case_rows, global_sim = self.matrix.candidate_rows(["fromKP", "derived"], False, subject, object, predicate, *weights, sum(weights), min_threshold)
+            rows += [(subject, predicate, object, case_id, similarity, 1) for case_id, similarity in zip(self.matrix.case_ids[case_rows], global_sim)]
+        seedTable(self.app, "xARA_GlobalSimilarity", ["SUBJECT", "PREDICATE", "OBJECT", "CASE_ID", "GLOBAL_SIM", "VERSION"], rows)
+        seedTable(self.app, "xARA_GlobalSimilarityTriplets", ["SUBJECT", "PREDICATE", "OBJECT", "FINGERPRINT", "VERSION"],
+                  [triplet + ("fingerprint", 1) for triplet in precomputed])
+        version_columns = ["VERSION", "MIN_THRESHOLD", "SUBJECT_NODE_WEIGHT", "OBJECT_NODE_WEIGHT", "PREDICATE_WEIGHT", "LOCAL_SIM_FINGERPRINT"]
+        fingerprint = self.searcher.get_similarity_snapshot().local_similarity_fingerprint
+        seedTable(self.app, "xARA_GlobalSimilarityVersion", version_columns, [(1, min_threshold) + weights + (fingerprint,)])
+        clsBiolinkSimilarity.precomputed_tables_available = True
+        self.addCleanup(seedTable, self.app, "xARA_GlobalSimilarityVersion", ["VERSION"], [])
+
+        for subject, predicate, object in precomputed:
+            for origins in (["fromKP"], ["derived"]):
+                for threshold in (0.5, 0.8):
+                    for exclude_matching_n0_n1 in (False, True):
+                        expected = self.matrix.candidate_rows(origins, exclude_matching_n0_n1, subject, object, predicate, *weights, sum(weights), threshold)
+                        actual = self.searcher.lookup_global_sim_triplets(subject, object, predicate, origins, exclude_matching_n0_n1, weights, threshold)
+                        self.assertListEqual(list(expected[0]), list(actual[0]))
+                        self.assertTrue(np.array_equal(expected[1], actual[1]))
+
+        # falls back to the live computation
+        subject, predicate, object = precomputed[0]
+        self.assertIsNone(self.searcher.lookup_global_sim_triplets("biolink:Category2", object, predicate, ["fromKP"], True, weights, 0.8), "unseen triplet")
+        self.assertIsNone(self.searcher.lookup_global_sim_triplets(subject, object, predicate, ["fromKP"], True, weights, 0.4), "threshold below the table's")
+        self.assertIsNone(self.searcher.lookup_global_sim_triplets(subject, object, predicate, ["fromKP"], True, (1.0, 1.0, 1.0), 0.8), "other weights")
+
+        # the version is read once per snapshot, a triplet recomputed by a later version isn't used until the next snapshot
+        seedTable(self.app, "xARA_GlobalSimilarityTriplets", ["SUBJECT", "PREDICATE", "OBJECT", "FINGERPRINT", "VERSION"], [precomputed[0] + ("fingerprint", 2)])
+        self.assertIsNone(self.searcher.lookup_global_sim_triplets(subject, object, predicate, ["fromKP"], True, weights, 0.8), "triplet of a later version")
+        seedTable(self.app, "xARA_GlobalSimilarityVersion", version_columns, [(2, min_threshold) + weights + (fingerprint,)], clearTable=False)
+        clsLocalSimilarityStore.instance().refresh()
+        self.assertIsNotNone(clsBiolinkSimilarity(self.app).lookup_global_sim_triplets(subject, object, predicate, ["fromKP"], True, weights, 0.8))
+
+        seedTable(self.app, "xARA_GlobalSimilarityVersion", version_columns, [(3, min_threshold) + weights + ("other local similarities",)], clearTable=False)
+        clsLocalSimilarityStore.instance().refresh()
+        self.assertIsNone(clsBiolinkSimilarity(self.app).lookup_global_sim_triplets(subject, object, predicate, ["fromKP"], True, weights, 0.8),
+                          "computed from other local similarities")
+
+    @staticmethod
+    def syntheticMatrix100k() -> clsCaseProblemMatrix:
+        """
+        100k synthetic case problems over 60 categories and 40 predicates
+        """
+        node_rows, predicate_rows = syntheticLocalSimilarityRows(nodeCount=60, predicateCount=40)
+        node_similarities = {}
+        for node1, node2, similarity in node_rows:
+            node_similarities[(node1, node2)] = node_similarities[(node2, node1)] = similarity
+        cases = pd.DataFrame(data=syntheticCaseProblemRows(caseCount=100000, nodeCount=60, predicateCount=40),
+                             columns=["N00_NODE_CATEGORY", "N01_NODE_CATEGORY", "E00_EDGE_PREDICATE", "CASE_ID", "ORIGIN"])
+        return clsCaseProblemMatrix(cases, node_similarities, {(row[0], row[1]): row[2] for row in predicate_rows})
+
+    def full_scoring(self, matrix: clsCaseProblemMatrix, origins, query, weights, threshold):
+        """
+        Scores all case problems then applies the threshold (previous behavior)
+        """
+        rows = matrix.filter_rows(origins, exclude_matching_n0_n1=True)
+        global_sim = matrix.global_similarity(rows, *query, *weights, sum(weights))
+        return rows[global_sim >= threshold], global_sim[global_sim >= threshold]
+
+    def test_candidate_rows_match_full_scoring_100k(self):
+        matrix = self.syntheticMatrix100k()
+        query = ("biolink:Category10", "biolink:Category20", "biolink:predicate_5")
+        rows, global_sim = self.full_scoring(matrix, ["fromKP", "derived"], query, (1.0, 1.0, 1.0), 0.75)
+        candidate_rows, candidate_sim = matrix.candidate_rows(["fromKP", "derived"], True, *query, 1.0, 1.0, 1.0, 3.0, 0.75)
+        self.assertListEqual(list(rows), list(candidate_rows))
+        self.assertTrue(np.array_equal(global_sim, candidate_sim))
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_candidate_rows_100k(self):
+        """
+        Compares scoring all 100k case problems then applying the threshold (previous behavior) against the pruned inverted triplet index
+        """
+        matrix = self.syntheticMatrix100k()
+        query = ("biolink:Category10", "biolink:Category20", "biolink:predicate_5")
+        weights = (1.0, 1.0, 1.0)
+        origins = ["fromKP", "derived"]
+        threshold = 0.75
+        repeat = 20
+
+        start = timer()
+        for _ in range(repeat):
+            self.full_scoring(matrix, origins, query, weights, threshold)
+        before_seconds = (timer() - start) / repeat
+
+        start = timer()
+        for _ in range(repeat):
+            candidate_rows, candidate_sim = matrix.candidate_rows(origins, True, *query, *weights, 3.0, threshold)
+        after_seconds = (timer() - start) / repeat
+
+        logging.info(f"Case problems at or above {threshold} out of {len(matrix)}: {len(candidate_rows)} from {len(matrix.triplets)} triplets, "
+                     f"before {before_seconds * 1000:.2f} ms, after {after_seconds * 1000:.2f} ms")
+        self.assertLess(after_seconds, before_seconds)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import logging
+import random
+import unittest
+from timeit import default_timer as timer
+import modConfig
+from apis.v1_3.queries.clsCaseSolutionConflations import clsCaseSolutionConflations
+
+
+def solution(solution_id: int, kp: str, subject: str, object: str, second_kp: str = None) -> dict:
+    return {
+        "SOLUTION_ID": solution_id, "CASE_ID": f"Q{solution_id:06d}",
+        "KP_PATH1": kp, "NODE1_PATH1_CATEGORY": subject, "NODE2_PATH1_CATEGORY": object, "EDGE1_PATH1_PREDICATE": "biolink:related_to",
+        "KP_PATH2": second_kp, "NODE1_PATH2_CATEGORY": None, "NODE2_PATH2_CATEGORY": None, "EDGE1_PATH2_PREDICATE": None
+    }
+
+
+def pairwise_filter(solutions: list, conflations: clsCaseSolutionConflations) -> list:
+    """
+    Reference: every one hop solution is compared with every other one
+    """
+    excluded = set()
+    for solution_a in solutions:
+        key_a = conflations.key(solution_a)
+        for solution_b in solutions:
+            if key_a is not None and solution_a is not solution_b and key_a == conflations.key(solution_b) \
+                    and conflations.rank(solution_b) < conflations.rank(solution_a):
+                excluded.add(solution_a["SOLUTION_ID"])
+    return [solution for solution in solutions if solution["SOLUTION_ID"] not in excluded]
+
+
+class test_clsCaseSolutionConflations(unittest.TestCase):
+
+    def test_keeps_most_specific_of_same_kp(self):
+        solutions = [
+            solution(1, "KP A", "biolink:ChemicalEntity", "biolink:Gene"),
+            solution(2, "KP A", "biolink:SmallMolecule", "biolink:Gene"),
+            solution(3, "KP A", "biolink:SmallMolecule", "biolink:Protein"),
+            solution(4, "KP B", "biolink:ChemicalEntity", "biolink:Gene"),
+            solution(5, "KP A", "biolink:SmallMolecule", "biolink:Disease"),
+            solution(6, "KP A", "biolink:ChemicalEntity", "biolink:Gene", second_kp="KP B"),
+            solution(7, "KP A", "biolink:Disease", "biolink:PhenotypicFeature"),
+            solution(8, "KP A", "biolink:Disease", "biolink:PhenotypicFeature"),
+        ]
+        results = clsCaseSolutionConflations().filter(solutions)
+        # 1 and 2 are conflations of 3, which is the most specific. Other KPs, other categories, two hops and unconflated duplicates are kept.
+        self.assertEqual([3, 4, 5, 6, 7, 8], [result["SOLUTION_ID"] for result in results])
+
+    def test_conflations_from_node_similarities(self):
+        conflations = clsCaseSolutionConflations.from_node_similarities({
+            ("biolink:Disease", "biolink:DiseaseOrPhenotypicFeature"): 0.95,
+            ("biolink:DiseaseOrPhenotypicFeature", "biolink:Disease"): 0.95,
+            ("biolink:Disease", "biolink:Disease"): 1.0,
+            ("biolink:Disease", "biolink:PhenotypicFeature"): 0.5,
+        }, threshold=0.9)
+        solutions = [
+            solution(1, "KP A", "biolink:Gene", "biolink:DiseaseOrPhenotypicFeature"),
+            solution(2, "KP A", "biolink:Protein", "biolink:Disease"),
+            solution(3, "KP A", "biolink:Gene", "biolink:PhenotypicFeature"),
+        ]
+        self.assertEqual([2, 3], [result["SOLUTION_ID"] for result in conflations.filter(solutions)])
+        self.assertEqual(conflations.canonical["biolink:Disease"], conflations.canonical["biolink:DiseaseOrPhenotypicFeature"])
+        self.assertNotIn("biolink:PhenotypicFeature", conflations.canonical)
+
+    def test_conflation_is_not_transitive(self):
+        conflations = clsCaseSolutionConflations([
+            ("biolink:Disease", "biolink:DiseaseOrPhenotypicFeature"),
+            ("biolink:DiseaseOrPhenotypicFeature", "biolink:PhenotypicFeature"),
+            ("biolink:Cell", "biolink:CellLine"), ("biolink:CellLine", "biolink:CellType"), ("biolink:Cell", "biolink:CellType"),
+        ])
+        # the disease categories form a chain, only the first pair in sorted order is conflated
+        self.assertEqual(conflations.canonical["biolink:Disease"], conflations.canonical["biolink:DiseaseOrPhenotypicFeature"])
+        self.assertNotIn("biolink:PhenotypicFeature", conflations.canonical)
+        # the cell categories are all conflated with each other
+        self.assertEqual({"biolink:Cell"}, {conflations.canonical[category] for category in ("biolink:Cell", "biolink:CellLine", "biolink:CellType")})
+
+        solutions = [
+            solution(1, "KP A", "biolink:Gene", "biolink:Disease"),
+            solution(2, "KP A", "biolink:Gene", "biolink:PhenotypicFeature"),
+        ]
+        self.assertEqual([1, 2], [result["SOLUTION_ID"] for result in conflations.filter(solutions)])
+
+    @staticmethod
+    def synthetic_solutions(count: int) -> list:
+        randomizer = random.Random(0)
+        categories = ["biolink:Gene", "biolink:Protein", "biolink:SmallMolecule", "biolink:ChemicalEntity", "biolink:Disease", "biolink:Pathway"]
+        kps = [f"KP {i}" for i in range(20)]
+        return [
+            solution(i, randomizer.choice(kps), randomizer.choice(categories), randomizer.choice(categories),
+                     second_kp=randomizer.choice(kps) if randomizer.random() < 0.3 else None)
+            for i in range(count)
+        ]
+
+    def test_filter_matches_pairwise(self):
+        conflations = clsCaseSolutionConflations()
+        sample = self.synthetic_solutions(1000)
+        self.assertEqual(pairwise_filter(sample, conflations), conflations.filter(sample))
+
+        results = conflations.filter(self.synthetic_solutions(10000))
+        self.assertEqual(len({conflations.key(result) for result in results if conflations.key(result) is not None}),
+                         len([result for result in results if conflations.key(result) is not None]),
+                         "Expected one solution per conflation group")
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_10k_solutions(self):
+        """
+        Compares the single pass filter with a pairwise comparison of the same rule on 10,000 synthetic case solutions
+        """
+        solutions = self.synthetic_solutions(10000)
+        conflations = clsCaseSolutionConflations()
+
+        start = timer()
+        conflations.filter(solutions)
+        single_pass_seconds = timer() - start
+
+        sample = solutions[:1000]
+        start = timer()
+        pairwise_filter(sample, conflations)
+        pairwise_seconds = (timer() - start) * (len(solutions) / len(sample)) ** 2
+        logging.info(f"10k case solutions: single pass {single_pass_seconds * 1000:.1f} ms, pairwise ~{pairwise_seconds * 1000:.0f} ms "
+                     f"(extrapolated from 1k)")
+        self.assertLess(single_pass_seconds, pairwise_seconds)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import threading
+import unittest
+from unittest.mock import patch
+from modDatabase import db
+from apis.v1_3.queries.clsCaseSolutionLoader import clsCaseSolutionLoader
+from .modTestDatabase import createSqliteApp, seedTable
+
+solutionColumns = [
+    "SOLUTION_ID", "CASE_ID",
+    "SOLUTION_FIRST_KP_NAME", "NODE1_PATH1_CATEGORY", "NODE2_PATH1_CATEGORY", "EDGE1_PATH1_PREDICATE",
+    "SOLUTION_SECOND_KP_NAME", "NODE1_PATH2_CATEGORY", "NODE2_PATH2_CATEGORY", "EDGE1_PATH2_PREDICATE"
+]
+kpInfoColumns = ["KP_Name", "DEV_URL", "STAGING_URL", "TESTING_URL", "PROD_URL", "Priority"]
+
+
+class test_clsCaseSolutionLoader(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app, cls.databasePath = createSqliteApp()
+        seedTable(cls.app, "xARA_CaseSolutions", solutionColumns, [
+            (1, "Q000001", "KP A", "biolink:Gene", "biolink:Disease", "biolink:related_to", None, None, None, None),
+            (2, "Q000001", "KP B", "biolink:Gene", "biolink:Disease", "biolink:related_to", "KP A", "biolink:Disease", "biolink:Gene", "biolink:related_to"),
+            (3, "Q000002", "KP C", "biolink:Drug", "biolink:Disease", "biolink:treats", None, None, None, None),
+            (4, "Q000003", "KP A", "biolink:Drug", "biolink:Gene", "biolink:affects", None, None, None, None),
+        ])
+        seedTable(cls.app, "xARA_KP_Info", kpInfoColumns, [
+            ("KP A", "", "", "", "https://a.example/query", 2),
+            ("KP B", "", "", "", "https://b.example/query", None),
+        ])
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.databasePath)
+
+    def setUp(self):
+        clsCaseSolutionLoader.reset()
+        self.loader = clsCaseSolutionLoader(self.app, max_wait_seconds=0.2)
+        self.queried_case_ids = []
+        patcher = patch.object(self.loader, "query_rows", side_effect=self.query_rows)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.loader.scheduler.close()
+        clsCaseSolutionLoader.reset()
+
+    def query_rows(self, case_ids: list) -> list:
+        """
+        Runs the loader's query on SQLite, which has no "= ANY(array)"
+        """
+        self.queried_case_ids.append(sorted(case_ids))
+        parameters = {f"caseId{i}": case_id for i, case_id in enumerate(case_ids)}
+        sql = self.loader.sql.replace("= ANY(:caseIds)", f"in ({', '.join(':' + name for name in parameters)})")
+        with self.app.app_context():
+            return db.session.execute(statement=sql, params=parameters).fetchall()
+
+    def test_rows_include_kp_urls_and_priority(self):
+        solutions = self.loader.load(["Q000001", "Q000002", "Q999999"])
+
+        self.assertEqual({"Q000001", "Q000002", "Q999999"}, set(solutions))
+        self.assertEqual((), solutions["Q999999"])
+        first, second = sorted(solutions["Q000001"], key=lambda row: row["SOLUTION_ID"])
+        self.assertEqual(("KP A", "https://a.example/query", None, 2), (first["KP_PATH1"], first["KP_PATH1_URL"], first["KP_PATH2_URL"], first["Priority"]))
+        self.assertEqual(("https://b.example/query", "https://a.example/query", 0),
+                         (second["KP_PATH1_URL"], second["KP_PATH2_URL"], second["Priority"]))
+        self.assertIsNone(solutions["Q000002"][0]["KP_PATH1_URL"], "Expected a KP missing from xARA_KP_Info to have no URL")
+        # the sorting and conflation filter of clsCaseSolutionManager rely on Priority being the last column and on hashable rows
+        self.assertEqual("Priority", list(first.keys())[-1])
+        self.assertEqual(2, len({first, second, first}))
+
+    def test_concurrent_managers_share_one_query(self):
+        manager_case_ids = [["Q000001", "Q000002"], ["Q000002", "Q000003"], ["Q000003"], ["Q000001", "Q999999"]]
+        results = [None] * len(manager_case_ids)
+        barrier = threading.Barrier(len(manager_case_ids))
+
+        def run_manager(index):
+            barrier.wait()
+            results[index] = self.loader.load(manager_case_ids[index])
+
+        threads = [threading.Thread(target=run_manager, args=(i,)) for i in range(len(manager_case_ids))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([["Q000001", "Q000002", "Q000003", "Q999999"]], self.queried_case_ids)
+        for case_ids, solutions in zip(manager_case_ids, results):
+            self.assertEqual(set(case_ids), set(solutions))
+        self.assertIs(results[0]["Q000002"], results[1]["Q000002"])
+
+    def test_cached_case_ids_are_not_queried_again(self):
+        self.loader.load(["Q000001", "Q999999"])
+        solutions = self.loader.load(["Q000001", "Q999999", "Q000003"])
+
+        self.assertEqual([["Q000001", "Q999999"], ["Q000003"]], self.queried_case_ids)
+        self.assertEqual(2, len(solutions["Q000001"]))
+        self.assertEqual((), solutions["Q999999"], "Expected case ids without solutions to be cached too")
+        self.assertEqual(2, self.loader.query_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
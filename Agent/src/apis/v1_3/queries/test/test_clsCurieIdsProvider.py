@@ -0,0 +1,82 @@
+import threading
+import unittest
+from unittest.mock import patch
+import requests_mock
+from extensions.requests_extension import request_with_global_timeout
+from .. import clsCurieIdsProvider as modCurieIdsProvider
+from ..clsCurieIdsProvider import clsCurieIdsProvider
+from ..clsCategoriesProvider import clsCategoriesProvider
+
+
+class test_clsCurieIdsProvider(unittest.TestCase):
+    """
+    Batched, cached name and category resolution for the query graph nodes
+    """
+
+    def setUp(self):
+        clsCurieIdsProvider.cache.clear()
+        clsCategoriesProvider.cache.clear()
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.overlap = threading.Barrier(2, timeout=5)
+
+    def overlapping_request(self, *args, **kwargs):
+        """
+        The first two lookups only get through together, so they fail with BrokenBarrierError if they are sent one after the other
+        """
+        with self.lock:
+            self.request_count += 1
+            request_number = self.request_count
+        if request_number <= 2:
+            self.overlap.wait()
+        return request_with_global_timeout(*args, **kwargs)
+
+    @staticmethod
+    def lookup_response(request, context):
+        name = request.qs["string"][0]
+        return {f"CURIE:{name}": [name]}
+
+    def test_names_are_looked_up_in_parallel_once(self):
+        names = ["aspirin", "ibuprofen", "acetaminophen", "naproxen", "Aspirin ", "caffeine"]
+        with requests_mock.Mocker() as mocker, patch.object(modCurieIdsProvider, "request_with_global_timeout", new=self.overlapping_request):
+            mocker.post(clsCurieIdsProvider.url, json=self.lookup_response)
+
+            curie_ids = clsCurieIdsProvider.resolve_names(names)
+
+            self.assertEqual(5, mocker.call_count)
+            self.assertEqual(["CURIE:aspirin"], curie_ids["Aspirin "])
+            self.assertEqual(["CURIE:caffeine"], curie_ids["caffeine"])
+
+            provider = clsCurieIdsProvider(names=["ASPIRIN", "caffeine"])
+            provider.getCurieIds()
+            self.assertEqual(["CURIE:aspirin", "CURIE:caffeine"], provider.curieIds)
+            self.assertEqual(5, mocker.call_count)
+
+    def test_no_curie_ids_raises(self):
+        with requests_mock.Mocker() as mocker:
+            mocker.post(clsCurieIdsProvider.url, json={})
+            with self.assertRaises(AttributeError):
+                clsCurieIdsProvider(names=["unknown"]).getCurieIds()
+
+    def test_categories_are_requested_in_one_batch(self):
+        with requests_mock.Mocker() as mocker:
+            mocker.post(clsCategoriesProvider.url, json={
+                "CHEBI:1": {"type": ["biolink:SmallMolecule", "biolink:ChemicalEntity"]},
+                "NCBIGene:1": {"type": ["biolink:Gene"]},
+                "MONDO:1": None,
+            })
+            categories, _ = clsCategoriesProvider.resolve_categories(["CHEBI:1", "NCBIGene:1", "MONDO:1"])
+            self.assertEqual({"CHEBI:1": "biolink:SmallMolecule", "NCBIGene:1": "biolink:Gene", "MONDO:1": None}, categories)
+            self.assertEqual(1, mocker.call_count)
+
+            provider = clsCategoriesProvider(curieIds=["NCBIGene:1", "MONDO:1"])
+            provider.getCategories()
+            self.assertEqual(["biolink:Gene"], provider.categories)
+            self.assertEqual(1, mocker.call_count)
+
+            with self.assertRaises(AttributeError):
+                clsCategoriesProvider(curieIds=["MONDO:1"]).getCategories()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+import logging
+import os
+import random
+import unittest
+from unittest.mock import patch
+from timeit import default_timer as timer
+import modConfig
+from apis.v1_3.queries.clsLocalSimilarityStore import clsLocalSimilarityStore
+from apis.v1_3.queries.clsBioLinkSimilarity import clsBiolinkSimilarity
+from apis.v1_3.queries.clsExplanationCatalog import clsExplanationCatalog
+from apis.v1_3.queries.clsExplanationSolutionFinder import ExplanationSolutionFinder
+from apis.v1_3.queries.clsExplanationX00003 import ExplanationX00003
+from apis.v1_3.queries.clsExplanationX00014 import ExplanationX00014
+from .modTestDatabase import createSqliteApp, seedLocalSimilarity, seedExplanationCatalog
+
+
+def loopSimilarities(finder, new_subject, new_object, new_predicate, kp_name):
+    """
+    Explanation similarities as scored one problem at a time before the problems were encoded as arrays, used as the reference
+    """
+    explanation_similarities = []
+    for explanation_problem in finder.explanation_catalog.scored_problems:
+        kps = finder.string_similarity(kp_name, explanation_problem.kp_name)
+        xps = finder.get_local_sim_score_preds(new_predicate, explanation_problem.predicate)
+
+        subject_similarity = finder.get_local_sim_score_nodes(new_subject, explanation_problem.subject_node)
+        object_similarity = finder.get_local_sim_score_nodes(new_object, explanation_problem.object_node)
+        avg_node_similiarity = (subject_similarity + object_similarity) / 2
+        subject_x_object_similarity = finder.get_local_sim_score_nodes(new_subject, explanation_problem.object_node)
+        object_x_subject_similarity = finder.get_local_sim_score_nodes(new_object, explanation_problem.subject_node)
+        avg_x_node_similiarity = (subject_x_object_similarity + object_x_subject_similarity) / 2
+        xnls = max(avg_node_similiarity, avg_x_node_similiarity)
+
+        case_similarity = ((float(kps) * explanation_problem.kp_weight +
+                            float(xnls) * explanation_problem.node_weight +
+                            float(xps) * explanation_problem.predicate_weight) /
+                           explanation_problem.weight_sum)
+        explanation_similarities.append((explanation_problem.case_id, case_similarity))
+    return explanation_similarities
+
+
+def loopBestProblem(finder, new_subject, new_object, new_predicate, kp_name):
+    top_explanation = sorted(loopSimilarities(finder, new_subject, new_object, new_predicate, kp_name), key=lambda x: x[1], reverse=True)[0]
+    return top_explanation if top_explanation[1] > finder.explanation_similarity_threshold else None
+
+
+class test_clsExplanationCatalog(unittest.TestCase):
+
+    problemRows = [
+        ("X00003", "KP A", "biolink:Gene", "biolink:Protein", "biolink:related_to"),
+        ("X00004", "KP A", "biolink:Gene", "biolink:Protein", "biolink:related_to"),
+        ("X00005", "KP A", "biolink:Gene", "biolink:Protein", "biolink:related_to"),
+        ("X00006", "KP A", "biolink:Gene", "biolink:Protein", "biolink:related_to"),
+        ("X00007", "KP B", "biolink:Disease", "biolink:Gene", "biolink:treats"),
+    ]
+    weightRows = [
+        ("X00003", 1.0, 1.0, 1.0, 1.0),
+        ("X00004", 1.0, 1.0, 1.0, 1.0),
+        ("X00005", None, None, None, None),
+        ("X00006", 1.0, None, 1.0, 1.0),
+        ("X00007", 2.0, 1.0, 1.0, 0.5),
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app, cls.databasePath = createSqliteApp()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.databasePath)
+
+    def setUp(self):
+        seedLocalSimilarity(self.app, nodeRows=[("biolink:Gene", "biolink:Protein", 0.9)], predicateRows=[("biolink:treats", "biolink:related_to", 0.5)])
+        seedExplanationCatalog(self.app, problemRows=self.problemRows, excludedKps=["KP X"], weightRows=self.weightRows, globalResultThreshold=0.5)
+        clsLocalSimilarityStore.reset()
+        clsLocalSimilarityStore.initialize(self.app, ttl_seconds=0)
+
+    def tearDown(self):
+        clsLocalSimilarityStore.reset()
+
+    def seedSyntheticCatalog(self, problemCount: int, seed: int = 0):
+        """
+        Seeds random local similarities and explanation case problems over a few categories, predicates and KPs
+        """
+        generator = random.Random(seed)
+        categories = [f"biolink:Category{i}" for i in range(30)]
+        predicates = [f"biolink:predicate_{i}" for i in range(20)] + ["biolink:related_to"]
+        kps = [f"KP {i}" for i in range(10)]
+        node_rows = [(categories[i], categories[j], round(generator.random(), 2)) for i in range(len(categories)) for j in range(i + 1, len(categories))
+                     if generator.random() < 0.3]
+        predicate_rows = [(predicate_1, predicate_2, round(generator.random(), 2)) for predicate_1 in predicates for predicate_2 in predicates
+                          if predicate_1 != predicate_2 and generator.random() < 0.2]
+        problem_rows = [(f"X{i:05d}", generator.choice(kps), generator.choice(categories), generator.choice(categories), generator.choice(predicates))
+                        for i in range(problemCount)]
+        weight_rows = [(case_id, generator.choice([0.5, 1.0, 2.0]), generator.choice([0.5, 1.0]), generator.choice([0.5, 1.0, 1.5]),
+                        generator.choice([0.0, 0.5, 1.0])) for case_id, *_ in problem_rows]
+        seedLocalSimilarity(self.app, nodeRows=node_rows, predicateRows=predicate_rows)
+        seedExplanationCatalog(self.app, problemRows=problem_rows, excludedKps=[], weightRows=weight_rows, globalResultThreshold=0.5)
+        clsLocalSimilarityStore.instance().refresh()
+        requests = [(generator.choice(categories + ["biolink:Unseen"]), generator.choice(categories), generator.choice(predicates + ["biolink:unseen"]),
+                     generator.choice(kps + ["KP Unseen"])) for _ in range(50)]
+        return requests
+
+    def test_catalog_contents(self):
+        catalog = clsExplanationCatalog.load(self.app)
+        self.assertEqual(5, len(catalog.problems))
+        # X00004 is not implemented, X00005 has no weights and X00006 only some of them
+        self.assertEqual(["X00003", "X00007"], [problem.case_id for problem in catalog.scored_problems])
+        self.assertEqual(frozenset({"KP X"}), catalog.excluded_kps)
+        self.assertEqual(0.5, catalog.similarity_threshold)
+
+        problem = catalog.scored_problems[1]
+        self.assertEqual((0.5, 1.5, 1.0, 3.0), (problem.kp_weight, problem.node_weight, problem.predicate_weight, problem.weight_sum))
+
+    def test_finders_share_one_load(self):
+        with patch.object(clsExplanationCatalog, "load", wraps=clsExplanationCatalog.load) as load:
+            finder_1 = ExplanationSolutionFinder(self.app)
+            finder_2 = ExplanationSolutionFinder(self.app)
+        load.assert_called_once()
+        self.assertIs(finder_1.explanation_catalog, finder_2.explanation_catalog)
+
+    def test_refresh_swaps_catalog(self):
+        store = clsLocalSimilarityStore.instance()
+        finder_before = ExplanationSolutionFinder(self.app)
+
+        seedExplanationCatalog(self.app, problemRows=self.problemRows, excludedKps=[], weightRows=self.weightRows, globalResultThreshold=0.8)
+        store.refresh()
+        finder_after = ExplanationSolutionFinder(self.app)
+
+        # an in-flight request keeps its catalog, new requests see the new data
+        self.assertEqual((0.5, {"KP X"}), (finder_before.explanation_similarity_threshold, set(finder_before.explanation_excluded_kps)))
+        self.assertEqual((0.8, set()), (finder_after.explanation_similarity_threshold, set(finder_after.explanation_excluded_kps)))
+
+    def test_search(self):
+        knowledge_graph = {"edges": {"e0": {"subject": "n0", "object": "n1", "attributes": []}}}
+        finder = ExplanationSolutionFinder(self.app)
+        self.assertIsInstance(finder.search(["biolink:Gene"], ["biolink:Protein"], ["biolink:related_to"], knowledge_graph, "KP A"), ExplanationX00003)
+        self.assertIsInstance(finder.search(["biolink:Gene"], ["biolink:Protein"], ["biolink:related_to"], knowledge_graph, "KP X"), ExplanationX00014)
+
+    def test_vectorized_matches_loop(self):
+        for new_subject, new_object, new_predicate, kp_name in [("biolink:Gene", "biolink:Protein", "biolink:related_to", "KP A"),
+                                                                 ("biolink:Protein", "biolink:Gene", "biolink:treats", "KP B"),
+                                                                 ("biolink:Disease", "biolink:Gene", "biolink:treats", "KP Unseen")]:
+            finder = ExplanationSolutionFinder(self.app)
+            expected = loopSimilarities(finder, new_subject, new_object, new_predicate, kp_name)
+            actual = finder.explanation_catalog.similarities(new_subject, new_object, new_predicate, kp_name)
+            self.assertEqual([similarity for _, similarity in expected], actual.tolist())
+            self.assertEqual(loopBestProblem(finder, new_subject, new_object, new_predicate, kp_name),
+                             finder.explanation_catalog.find_best_problem(new_subject, new_object, new_predicate, kp_name))
+
+        requests = self.seedSyntheticCatalog(problemCount=500)
+        finder = ExplanationSolutionFinder(self.app)
+        for new_subject, new_object, new_predicate, kp_name in requests:
+            expected = loopSimilarities(finder, new_subject, new_object, new_predicate, kp_name)
+            actual = finder.explanation_catalog.similarities(new_subject, new_object, new_predicate, kp_name)
+            self.assertEqual([similarity for _, similarity in expected], actual.tolist())
+            # ties go to the first problem in table order, same as the stable sort
+            self.assertEqual(loopBestProblem(finder, new_subject, new_object, new_predicate, kp_name),
+                             finder.explanation_catalog.find_best_problem(new_subject, new_object, new_predicate, kp_name))
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_vectorized_search(self):
+        """
+        Compares scoring 10k explanation case problems one at a time (previous behavior) against scoring them as arrays.
+        """
+        requests = self.seedSyntheticCatalog(problemCount=10000)
+        finder = ExplanationSolutionFinder(self.app)
+        catalog = finder.explanation_catalog
+        request_count = 10
+
+        start = timer()
+        for new_subject, new_object, new_predicate, kp_name in requests[:request_count]:
+            loopBestProblem(finder, new_subject, new_object, new_predicate, kp_name)
+        before_seconds = (timer() - start) / request_count
+
+        start = timer()
+        for new_subject, new_object, new_predicate, kp_name in requests[:request_count]:
+            catalog.find_best_problem(new_subject, new_object, new_predicate, kp_name)
+        after_seconds = (timer() - start) / request_count
+
+        logging.info(f"Explanation similarity search: before {before_seconds * 1000:.2f} ms, after {after_seconds * 1000:.2f} ms "
+                     f"({len(catalog.scored_problems)} explanation case problems)")
+        self.assertLess(after_seconds, before_seconds)
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_per_request_setup(self):
+        """
+        Compares per-request setup time of reading the four catalog tables (previous behavior) against reading the shared catalog.
+        """
+        problem_rows = [(f"X{i:05d}", f"KP {i % 20}", "biolink:Gene", "biolink:Protein", "biolink:related_to") for i in range(1000)]
+        weight_rows = [(case_id, 1.0, 1.0, 1.0, 1.0) for case_id, *_ in problem_rows]
+        seedExplanationCatalog(self.app, problemRows=problem_rows, excludedKps=[f"KP {i}" for i in range(100, 200)], weightRows=weight_rows,
+                               globalResultThreshold=0.5)
+        clsLocalSimilarityStore.instance().refresh()
+        ExplanationSolutionFinder(self.app)
+        request_count = 10
+
+        start = timer()
+        for _ in range(request_count):
+            clsBiolinkSimilarity(self.app)
+            clsExplanationCatalog.load(self.app)
+        before_seconds = (timer() - start) / request_count
+
+        start = timer()
+        for _ in range(request_count):
+            ExplanationSolutionFinder(self.app)
+        after_seconds = (timer() - start) / request_count
+
+        logging.info(f"Per-request explanation finder setup: before {before_seconds * 1000:.2f} ms, after {after_seconds * 1000:.2f} ms "
+                     f"({len(problem_rows)} explanation case problems)")
+        self.assertLess(after_seconds, before_seconds)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import random
+import unittest
+from timeit import default_timer as timer
+import modConfig
+from apis.v1_3.queries.clsLocalSimilarityStore import clsLocalSimilarityStore
+from apis.v1_3.queries.clsExplanationRegistry import clsExplanationRegistry
+from apis.v1_3.queries.clsExplanationSolutionFinder import ExplanationSolutionFinder
+from apis.v1_3.queries.clsExplanationX00001 import ExplanationX00001
+from apis.v1_3.queries.clsExplanationX00012 import ExplanationX00012
+from apis.v1_3.queries.clsExplanationX00014 import ExplanationX00014
+from apis.v1_3.queries.clsExplanationX00016 import ExplanationX00016
+from .modTestDatabase import createSqliteApp, seedLocalSimilarity, seedExplanationCatalog
+
+
+queryViewFixtureFolder = os.path.join(os.path.dirname(__file__), "..", "..", "views", "test", "test_clsQueryView")
+
+
+def loadKnowledgeGraph(filePath: str):
+    with open(filePath, "r") as file:
+        return json.load(file)["message"]["knowledge_graph"]
+
+
+def loopAttributeSolution(registry, explanation_problems, knowledge_graph, kp_name):
+    """
+    Attribute fallback of ExplanationSolutionFinder.search before the registry, creating every explanation and validating edges case by case, used as
+    the reference
+    """
+    for explanation_problem in explanation_problems:
+        solution_class = registry.create(explanation_problem['CASE_ID'], None, kp_name)
+        for edge in knowledge_graph["edges"].values():
+            if solution_class.edgeAttributeValidate(edge) is True:
+                return solution_class
+    return ExplanationX00014(kp_name)
+
+
+def randomKnowledgeGraph(generator: random.Random, edgeCount: int):
+    """
+    Knowledge graph with attributes drawn from the values the explanation criteria test
+    """
+    types = ["biolink:aggregator_knowledge_source", "CMAP:similarity_score", "biolink:has_evidence", "auc_roc", "biolink:p_value", "biolink:publications",
+             "biolink:Attribute", "biolink:Publication", "biolink:has_confidence_level", "Contribution", "biolink:primary_knowledge_source", "other"]
+    values = ["infores:molepro", "infores:spoke", "infores:ctd", "infores:hetio", "infores:mydisease-info", ["infores:mydisease-info"],
+              "infores:biothings-multiomics-clinical-risk", "", None, 0.5, "PMID:1"]
+    sources = [None, "infores:cohd", "infores:hmdb", "infores:chembl", "infores:connections-hypothesis"]
+    names = [None, "ln_ratio", "enrichment_p", "hetio_source", "ClinicalTrials", "phase", "biolink:original_knowledge_source",
+             "biolink:primary_knowledge_source"]
+
+    def attribute():
+        result = {"attribute_type_id": generator.choice(types), "value": generator.choice(values)}
+        source, name = generator.choice(sources), generator.choice(names)
+        if source is not None:
+            result["attribute_source"] = source
+        if name is not None:
+            result["original_attribute_name"] = name
+        return result
+
+    return {"edges": {f"e{i}": {"subject": "n0", "object": "n1", "attributes": [attribute() for _ in range(generator.randint(0, 5))]}
+                      for i in range(edgeCount)}}
+
+
+class test_clsExplanationRegistry(unittest.TestCase):
+
+    caseIds = [f"X{i:05d}" for i in range(1, 17)]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app, cls.databasePath = createSqliteApp()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.databasePath)
+
+    def setUp(self):
+        # no explanation case is similar enough, so search() always falls back to the attributes
+        problem_rows = [(case_id, "KP A", "biolink:Gene", "biolink:Protein", "biolink:related_to") for case_id in ["X00016"] + self.caseIds]
+        seedLocalSimilarity(self.app, nodeRows=[], predicateRows=[])
+        seedExplanationCatalog(self.app, problemRows=problem_rows, excludedKps=[], weightRows=[], globalResultThreshold=1.5)
+        clsLocalSimilarityStore.reset()
+        clsLocalSimilarityStore.initialize(self.app, ttl_seconds=0)
+
+    def tearDown(self):
+        clsLocalSimilarityStore.reset()
+
+    def test_create(self):
+        registry = clsExplanationRegistry.instance()
+        self.assertIs(registry, clsExplanationRegistry.instance())
+
+        explanation_1 = registry.create("X00001", self.app, "KP A")
+        explanation_2 = registry.create("X00001", self.app, "KP B")
+        self.assertIsInstance(explanation_1, ExplanationX00001)
+        # explanations keep per-result logs, their constant tables are shared
+        self.assertIsNot(explanation_1, explanation_2)
+        self.assertIs(explanation_1.value_combinations, explanation_2.value_combinations)
+
+        self.assertEqual("KP B", registry.create("X00012", self.app, "KP B").kp_name)
+        self.assertIsInstance(registry.create("X99999", self.app, "KP A"), ExplanationX00014)
+
+    def test_attribute_matches_agree_with_validate(self):
+        registry = clsExplanationRegistry.instance()
+        generator = random.Random(0)
+        knowledge_graphs = [randomKnowledgeGraph(generator, edgeCount=generator.randint(1, 4)) for _ in range(2000)]
+        knowledge_graphs.append(loadKnowledgeGraph(os.path.join(os.path.dirname(__file__), "trapi_disease2phenotype.json")))
+        for knowledge_graph in knowledge_graphs:
+            expected = {case_id for case_id in self.caseIds
+                        if any(registry.create(case_id, None, "KP A").edgeAttributeValidate(edge) for edge in knowledge_graph["edges"].values())}
+            self.assertEqual(expected, registry.attribute_matches(knowledge_graph))
+
+    def test_search_attribute_fallback(self):
+        finder = ExplanationSolutionFinder(self.app)
+        hmdb_attribute = {"attribute_source": "infores:hmdb", "attribute_type_id": "biolink:Publication", "value": "PMID:21059682"}
+        mydisease_attributes = [{"attribute_type_id": "biolink:aggregator_knowledge_source", "value": "infores:mydisease-info"},
+                                {"attribute_type_id": "biolink:publications", "value": ["PMID:1"]}]
+
+        def search(*edges_attributes):
+            knowledge_graph = {"edges": {f"e{i}": {"subject": "n0", "object": "n1", "attributes": attributes} for i, attributes in enumerate(edges_attributes)}}
+            return finder.search(["biolink:Gene"], ["biolink:Disease"], ["biolink:treats"], knowledge_graph, "KP B")
+
+        self.assertIsInstance(search([hmdb_attribute]), ExplanationX00012)
+        # the first case in table order wins
+        self.assertIsInstance(search([hmdb_attribute], mydisease_attributes), ExplanationX00016)
+        # criteria are met by attributes of the same edge
+        self.assertIsInstance(search(mydisease_attributes[:1], mydisease_attributes[1:]), ExplanationX00014)
+        self.assertEqual("KP B", search([hmdb_attribute]).kp_name)
+
+    def test_search_attribute_fallback_matches_loop(self):
+        finder = ExplanationSolutionFinder(self.app)
+        registry = clsExplanationRegistry.instance()
+        for fileName in ["path1/test_knowledge_provider_response_body_path_1.json", "path2/test_knowledge_provider_response_body_path_2.json"]:
+            knowledge_graph = loadKnowledgeGraph(os.path.join(queryViewFixtureFolder, fileName))
+            expected = loopAttributeSolution(registry, finder.explanation_problems, knowledge_graph, "KP A")
+            actual = finder.search(["biolink:Gene"], ["biolink:Disease"], ["biolink:treats"], knowledge_graph, "KP A")
+            self.assertEqual(expected.case_id, actual.case_id)
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_attribute_fallback(self):
+        """
+        Compares the attribute fallback of search() on the knowledge graphs of the query view fixtures, validating edges case by case (previous behavior)
+        against one pass over the attributes.
+        """
+        finder = ExplanationSolutionFinder(self.app)
+        registry = clsExplanationRegistry.instance()
+        for fileName in ["path1/test_knowledge_provider_response_body_path_1.json", "path2/test_knowledge_provider_response_body_path_2.json"]:
+            knowledge_graph = loadKnowledgeGraph(os.path.join(queryViewFixtureFolder, fileName))
+            request_count = 5
+
+            start = timer()
+            for _ in range(request_count):
+                expected = loopAttributeSolution(registry, finder.explanation_problems, knowledge_graph, "KP A")
+            before_seconds = (timer() - start) / request_count
+
+            start = timer()
+            for _ in range(request_count):
+                actual = finder.search(["biolink:Gene"], ["biolink:Disease"], ["biolink:treats"], knowledge_graph, "KP A")
+            after_seconds = (timer() - start) / request_count
+
+            logging.info(f"Explanation attribute fallback for {fileName}: before {before_seconds * 1000:.2f} ms, after {after_seconds * 1000:.2f} ms "
+                         f"({len(knowledge_graph['edges'])} edges)")
+            self.assertEqual(expected.case_id, actual.case_id)
+            self.assertLess(after_seconds, before_seconds)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
 import unittest
 from unittest.mock import patch
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 import time_machine
 from ...clsKnowledgeProvider import clsKnowledgeProvider
 import requests_mock
@@ -7,9 +11,35 @@ from jsonschema import ValidationError
 from requests.exceptions import InvalidSchema, HTTPError
 from datetime import datetime
 from utils.clsLog import clsLogEvent
+from utils.multithreading.clsCancellationToken import clsCancellationToken, clsOperationCancelled
 import json
 
 
+class _BlockingKnowledgeProvider(ThreadingMixIn, HTTPServer):
+    """
+    Knowledge provider that reads the request and never answers until released
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _BlockingHandler)
+        self.release = threading.Event()
+
+    def handle_error(self, request, client_address):
+        # the client hangs up at its deadline
+        pass
+
+
+class _BlockingHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.release.wait()
+
+
 class test_clsKnowledgeProvider(unittest.TestCase):
 
     @classmethod
@@ -196,6 +226,40 @@ class test_clsKnowledgeProvider(unittest.TestCase):
         self.assertEqual(knowledgeProvider.logs[0], expectedLogs[0])
         # skipping log [1], due to the message including a timing string that varies
 
+    @patch.object(clsKnowledgeProvider, "validateRequestBody")
+    def test_blocked_request_is_released_at_the_dispatch_deadline(self, _):
+        server = _BlockingKnowledgeProvider()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            knowledgeProvider = clsKnowledgeProvider(name=self.name, url=f"http://127.0.0.1:{server.server_address[1]}/query")
+            knowledgeProvider.logs = []
+            knowledgeProvider.requestBody = {"message": {"query_graph": {"edges": {}, "nodes": {}}}}
+            knowledgeProvider.cancellationToken = clsCancellationToken(deadline=time.time() + 0.3)
+            errors = []
+
+            def worker():
+                try:
+                    knowledgeProvider.execute()
+                except Exception as e:
+                    errors.append(e)
+
+            thread = threading.Thread(target=worker, daemon=True)
+            thread.start()
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive(), "Expected the worker thread to stop waiting for the knowledge provider at the deadline")
+            self.assertEqual(1, len(errors))
+            self.assertIsInstance(errors[0], clsOperationCancelled)
+
+            # once cancelled no request is sent
+            with requests_mock.Mocker() as mocker:
+                with self.assertRaises(clsOperationCancelled):
+                    knowledgeProvider.execute()
+                self.assertEqual(0, mocker.call_count)
+        finally:
+            server.release.set()
+            server.shutdown()
+            server.server_close()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,118 @@
+import logging
+import os
+import unittest
+from unittest.mock import patch
+from timeit import default_timer as timer
+import modConfig
+from apis.v1_3.queries.clsLocalSimilarityStore import clsLocalSimilarityStore
+from apis.v1_3.queries.clsBioLinkSimilarity import clsBiolinkSimilarity
+from .modTestDatabase import createSqliteApp, seedLocalSimilarity, syntheticLocalSimilarityRows
+
+
+class test_clsLocalSimilarityStore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app, cls.databasePath = createSqliteApp()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.databasePath)
+
+    def setUp(self):
+        seedLocalSimilarity(
+            self.app,
+            nodeRows=[("biolink:Gene", "biolink:Protein", 0.9)],
+            predicateRows=[("biolink:treats", "biolink:related_to", 0.5)]
+        )
+        clsLocalSimilarityStore.reset()
+
+    def tearDown(self):
+        clsLocalSimilarityStore.reset()
+
+    def test_similarities_are_loaded(self):
+        store = clsLocalSimilarityStore.initialize(self.app, ttl_seconds=0)
+        snapshot = store.get_snapshot()
+        self.assertEqual(0.9, snapshot.node_similarities[("biolink:Gene", "biolink:Protein")])
+        self.assertEqual(0.9, snapshot.node_similarities[("biolink:Protein", "biolink:Gene")], "Expected node similarity to be symmetric")
+        self.assertEqual(0.5, snapshot.predicate_similarities[("biolink:treats", "biolink:related_to")])
+        self.assertNotIn(("biolink:related_to", "biolink:treats"), snapshot.predicate_similarities, "Expected predicate similarity to be directional")
+
+    def test_searchers_share_one_load(self):
+        clsLocalSimilarityStore.initialize(self.app, ttl_seconds=0)
+        with patch.object(clsLocalSimilarityStore, "load_node_similarity") as load_nodes:
+            searcher_1 = clsBiolinkSimilarity(self.app)
+            searcher_2 = clsBiolinkSimilarity(self.app)
+        load_nodes.assert_not_called()
+        self.assertIs(searcher_1.node_similarities, searcher_2.node_similarities)
+        self.assertEqual(-20, searcher_1.get_local_sim_score_nodes("biolink:Gene", "biolink:Disease"))
+        self.assertEqual(0.9, searcher_1.get_local_sim_score_nodes("biolink:Protein", "biolink:Gene"))
+
+    def test_refresh_swaps_snapshot(self):
+        store = clsLocalSimilarityStore.initialize(self.app, ttl_seconds=0)
+        searcher_before = clsBiolinkSimilarity(self.app)
+
+        seedLocalSimilarity(self.app, nodeRows=[("biolink:Gene", "biolink:Protein", 0.7)], predicateRows=[])
+        store.refresh()
+        searcher_after = clsBiolinkSimilarity(self.app)
+
+        # an in-flight request keeps its snapshot, new requests see the new data
+        self.assertEqual(0.9, searcher_before.get_local_sim_score_nodes("biolink:Gene", "biolink:Protein"))
+        self.assertEqual(0.7, searcher_after.get_local_sim_score_nodes("biolink:Gene", "biolink:Protein"))
+        self.assertEqual(0, searcher_after.get_local_sim_score_preds("biolink:treats", "biolink:related_to"))
+
+    def test_ttl_expiry_reloads(self):
+        store = clsLocalSimilarityStore.initialize(self.app, ttl_seconds=60)
+        snapshot = store.get_snapshot()
+        self.assertIs(snapshot, store.get_snapshot(), "Expected the snapshot to be reused inside the TTL")
+
+        snapshot.loaded_at -= 61
+        self.assertIsNot(snapshot, store.get_snapshot(), "Expected the snapshot to be reloaded after the TTL")
+
+    def test_failed_reload_keeps_serving(self):
+        store = clsLocalSimilarityStore.initialize(self.app, ttl_seconds=60)
+        snapshot = store.get_snapshot()
+        snapshot.loaded_at -= 61
+        with patch.object(clsLocalSimilarityStore, "load_node_similarity", side_effect=RuntimeError("database is down")):
+            self.assertIs(snapshot, store.get_snapshot())
+
+    def test_case_solution_conflations_follow_snapshot(self):
+        seedLocalSimilarity(self.app, nodeRows=[("biolink:Disease", "biolink:DiseaseOrPhenotypicFeature", 0.95)], predicateRows=[])
+        store = clsLocalSimilarityStore.initialize(self.app, ttl_seconds=0)
+        conflations = store.get_case_solution_conflations()
+        self.assertIs(conflations, store.get_case_solution_conflations(), "Expected the conflations to be built once per snapshot")
+        self.assertEqual(conflations.canonical["biolink:Disease"], conflations.canonical["biolink:DiseaseOrPhenotypicFeature"])
+        self.assertEqual(conflations.canonical["biolink:Gene"], conflations.canonical["biolink:Protein"])
+
+        seedLocalSimilarity(self.app, nodeRows=[], predicateRows=[])
+        store.refresh()
+        self.assertNotIn("biolink:Disease", store.get_case_solution_conflations().canonical)
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_per_request_setup(self):
+        """
+        Compares per-request setup time of reloading both tables (previous behavior) against reading the shared snapshot.
+        """
+        node_rows, predicate_rows = syntheticLocalSimilarityRows(nodeCount=120, predicateCount=120)
+        seedLocalSimilarity(self.app, nodeRows=node_rows, predicateRows=predicate_rows)
+        store = clsLocalSimilarityStore.initialize(self.app, ttl_seconds=0)
+        request_count = 10
+
+        start = timer()
+        for _ in range(request_count):
+            store.load_node_similarity()
+            store.load_predicate_similarity()
+        before_seconds = (timer() - start) / request_count
+
+        start = timer()
+        for _ in range(request_count):
+            clsBiolinkSimilarity(self.app)
+        after_seconds = (timer() - start) / request_count
+
+        logging.info(f"Per-request similarity setup: before {before_seconds * 1000:.2f} ms, after {after_seconds * 1000:.2f} ms "
+                     f"({len(node_rows)} node rows, {len(predicate_rows)} predicate rows)")
+        self.assertLess(after_seconds, before_seconds)
+
+
+if __name__ == '__main__':
+    unittest.main()
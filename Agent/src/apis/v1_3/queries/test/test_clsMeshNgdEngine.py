@@ -0,0 +1,153 @@
+import logging
+import math
+import os
+import random
+import unittest
+from unittest.mock import patch
+from timeit import default_timer as timer
+from apis.v1_3.queries.clsMeshNgdEngine import clsMeshNgdEngine
+import modConfig
+from .modTestDatabase import createMeshNgdFile
+
+
+def reference_ngd(articles: list, subject_name: str, object_name: str):
+    """
+    Reference: the NGD formula of ARAX, counting articles of the corpus one at a time
+    """
+    headings = [{name.lower() for name in article} for article in articles]
+    n = sum(len(article) for article in headings)
+    subject_count = sum(1 for article in headings if subject_name.lower() in article)
+    object_count = sum(1 for article in headings if object_name.lower() in article)
+    pair_count = sum(1 for article in headings if subject_name.lower() in article and object_name.lower() in article)
+    if pair_count == 0:
+        return None
+    return (max(math.log(subject_count), math.log(object_count)) - math.log(pair_count)) / \
+           (math.log(n) - min(math.log(subject_count), math.log(object_count)))
+
+
+class test_clsMeshNgdEngine(unittest.TestCase):
+
+    articles = [
+        ["Acetaminophen", "Pain", "Fever"],
+        ["Acetaminophen", "Pain"],
+        ["Acetaminophen", "Liver"],
+        ["Aspirin", "Pain"],
+        ["Aspirin", "Fever", "Pain"],
+        ["Aspirin", "Stroke"],
+        ["Fever"],
+        ["Liver", "Stroke"],
+        ["Ibuprofen"],
+    ]
+    entryTerms = {"Paracetamol": "Acetaminophen", "Pyrexia": "Fever"}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path = createMeshNgdFile(cls.articles, cls.entryTerms)
+        cls.engine = clsMeshNgdEngine.from_file(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.connection.close()
+        os.remove(cls.path)
+
+    def test_ngd_matches_formula(self):
+        names = sorted({name for article in self.articles for name in article})
+        for subject_name in names:
+            for object_name in names:
+                is_known, value = self.engine.get_ngd(subject_name, object_name)
+                self.assertTrue(is_known)
+                expected = reference_ngd(self.articles, subject_name, object_name)
+                if expected is None:
+                    self.assertIsNone(value, f"{subject_name} {object_name}")
+                else:
+                    self.assertAlmostEqual(expected, value, msg=f"{subject_name} {object_name}")
+
+    def test_entry_terms_and_case(self):
+        self.assertEqual(self.engine.get_ngd("Acetaminophen", "Fever"), self.engine.get_ngd("paracetamol", "PYREXIA"))
+        self.assertEqual(self.engine.get_ngd("Acetaminophen", "Fever"), self.engine.get_ngd("Fever", "Acetaminophen"))
+
+    def test_unknown_terms(self):
+        self.assertEqual((False, None), self.engine.get_ngd("Acetaminophen", "PTGS2"))
+        self.assertEqual((False, None), clsMeshNgdEngine.from_file(None).get_ngd("Acetaminophen", "Pain"))
+        self.assertEqual((False, None), clsMeshNgdEngine.from_file(self.path + ".missing").get_ngd("Acetaminophen", "Pain"))
+
+    def test_undefined_ngd(self):
+        engine = clsMeshNgdEngine(None)
+        engine.log_n = math.log(10)
+        # the rarer term is in every article
+        self.assertIsNone(engine.ngd(10, 20, 5))
+        self.assertIsNone(engine.ngd(3, 4, 0))
+
+    def test_instance_reopens_replaced_file(self):
+        path = createMeshNgdFile(self.articles)
+        self.addCleanup(os.remove, path)
+        with patch.object(modConfig, "ngdDataPath", path), patch.object(clsMeshNgdEngine, "_instance", None):
+            engine = clsMeshNgdEngine.instance()
+            self.assertIs(engine, clsMeshNgdEngine.instance())
+            self.assertEqual(self.engine.get_ngd("Aspirin", "Pain"), engine.get_ngd("Aspirin", "Pain"))
+
+            # replaced the way clsMeshNgdJob does
+            os.replace(createMeshNgdFile(self.articles + [["Aspirin", "Pain"]]), path)
+            reopened = clsMeshNgdEngine.instance()
+            self.assertIsNot(engine, reopened)
+            self.assertAlmostEqual(reference_ngd(self.articles + [["Aspirin", "Pain"]], "Aspirin", "Pain"), reopened.get_ngd("Aspirin", "Pain")[1])
+            self.assertEqual((False, None), engine.get_ngd("Aspirin", "Pain"), "Expected the replaced file to be closed")
+            reopened.close()
+
+    @staticmethod
+    def synthetic_corpus(term_count: int, article_count: int, pair_count: int):
+        """
+        :return: Tuple of random articles of up to 15 of term_count terms and pair_count random pairs of those terms
+        """
+        randomizer = random.Random(0)
+        terms = [f"Term {i}" for i in range(term_count)]
+        articles = [randomizer.sample(terms, randomizer.randint(1, 15)) for _ in range(article_count)]
+        pairs = [tuple(randomizer.sample(terms, 2)) for _ in range(pair_count)]
+        return articles, pairs
+
+    def assert_matches_formula(self, articles: list, pairs: list, values: list):
+        for pair, (is_known, value) in zip(pairs, values):
+            self.assertTrue(is_known)
+            expected = reference_ngd(articles, *pair)
+            if expected is None:
+                self.assertIsNone(value)
+            else:
+                self.assertAlmostEqual(expected, value)
+
+    def test_synthetic_corpus_matches_formula(self):
+        articles, pairs = self.synthetic_corpus(term_count=200, article_count=2000, pair_count=50)
+        path = createMeshNgdFile(articles)
+        try:
+            engine = clsMeshNgdEngine.from_file(path)
+            values = [engine.get_ngd(*pair) for pair in pairs]
+            engine.close()
+        finally:
+            os.remove(path)
+        self.assert_matches_formula(articles, pairs, values)
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_lookup(self):
+        """
+        Time of one NGD on 2,000 terms and 20,000 synthetic articles, against counting the articles of the corpus (reference_ngd)
+        """
+        articles, pairs = self.synthetic_corpus(term_count=2000, article_count=20000, pair_count=5000)
+        path = createMeshNgdFile(articles)
+        try:
+            engine = clsMeshNgdEngine.from_file(path)
+            start = timer()
+            values = [engine.get_ngd(*pair) for pair in pairs]
+            lookup_seconds = (timer() - start) / len(pairs)
+            engine.close()
+        finally:
+            os.remove(path)
+
+        start = timer()
+        self.assert_matches_formula(articles, pairs[:50], values[:50])
+        reference_seconds = (timer() - start) / 50
+
+        logging.info(f"Local NGD: {lookup_seconds * 1e6:.1f} us per pair, counting articles {reference_seconds * 1e3:.1f} ms per pair "
+                     f"({len(set(term for article in articles for term in article))} terms, {len(articles)} articles)")
+        self.assertLess(lookup_seconds, reference_seconds)
+
+if __name__ == '__main__':
+    unittest.main()
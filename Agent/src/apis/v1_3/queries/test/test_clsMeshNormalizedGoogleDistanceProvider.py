@@ -1,8 +1,58 @@
+import json
+import logging
+import os
+import threading
+import time
 import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from timeit import default_timer as timer
+from unittest.mock import patch
+from urllib.parse import unquote
+import modConfig
 from apis.v1_3.queries.clsMeshNormalizedGoogleDistanceProvider import clsMeshNormalizedGoogleDistanceProvider
+from apis.v1_3.queries.clsMeshNgdEngine import clsMeshNgdEngine
+from .modTestDatabase import createMeshNgdFile
 import requests_mock
 
 
+class _StubArax(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StubAraxHandler)
+        # "subject/object" -> (delay seconds, value), pairs not listed are not found in MeSH
+        self.values = {}
+        self.failing = set()
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+
+class _StubAraxHandler(BaseHTTPRequestHandler):
+    """
+    Local PubmedMeshNgd stand in
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        pair = unquote(self.path.split("/PubmedMeshNgd/", 1)[1])
+        with self.server.lock:
+            self.server.requests[pair] += 1
+        delay, value = self.server.values.get(pair, (0.1, None))
+        time.sleep(delay)
+        status = 500 if pair in self.server.failing else 200
+        body = json.dumps({"response_code": "OK", "value": value} if value is not None else {"response_code": "TermNotFound", "message": "Not found in MeSH"})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+
 class test_clsMeshNormalizedGoogleDistanceProvider(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -13,7 +63,7 @@ class test_clsMeshNormalizedGoogleDistanceProvider(unittest.TestCase):
         pass
 
     def setUp(self):
-        pass
+        clsMeshNormalizedGoogleDistanceProvider.cache.clear()
 
     def tearDown(self):
         pass
@@ -73,3 +123,130 @@ class test_clsMeshNormalizedGoogleDistanceProvider(unittest.TestCase):
         self.assertEqual(None, provider.response_code)
         self.assertEqual(None, provider.error_message)
         self.assertEqual(False, provider.response.ok)
+
+
+class test_clsMeshNormalizedGoogleDistanceProviderProbing(unittest.TestCase):
+    """
+    Probes a local stub of the PubmedMeshNgd API
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _StubArax()
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.url_patch = patch.object(clsMeshNormalizedGoogleDistanceProvider, "url", f"http://127.0.0.1:{cls.server.server_address[1]}/PubmedMeshNgd/")
+        cls.url_patch.start()
+        # no local MeSH tables unless a test sets them
+        cls.engine_patch = patch.object(clsMeshNgdEngine, "_instance", clsMeshNgdEngine(None))
+        cls.engine_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.url_patch.stop()
+        cls.engine_patch.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        clsMeshNormalizedGoogleDistanceProvider.cache.clear()
+        self.server.values = {}
+        self.server.failing = set()
+        self.server.requests.clear()
+
+    def test_first_success_in_priority_order(self):
+        # the second pair answers first, but the first pair has priority
+        self.server.values = {"A1/B1": (0.4, 1.5), "A1/B2": (0.0, 2.5), "A2/B1": (0.0, 3.5)}
+        values = clsMeshNormalizedGoogleDistanceProvider.get_first_values([[("A1", "B1"), ("A1", "B2"), ("A2", "B1")]])
+        self.assertEqual([1.5], values)
+
+        self.server.values = {"A1/B2": (0.0, 2.5), "A2/B1": (0.0, 3.5)}
+        clsMeshNormalizedGoogleDistanceProvider.cache.clear()
+        values = clsMeshNormalizedGoogleDistanceProvider.get_first_values([[("A1", "B1"), ("A1", "B2"), ("A2", "B1")]])
+        self.assertEqual([2.5], values)
+
+    def test_unordered_pairs_and_negatives_are_cached(self):
+        self.server.values = {"A/B": (0.0, 0.75)}
+        self.assertEqual([0.75, None], clsMeshNormalizedGoogleDistanceProvider.get_first_values([[("A", "B")], [("C", "D")]]))
+        # the same pairs in the other order are served from the cache, including the one without a value
+        self.assertEqual([0.75, None], clsMeshNormalizedGoogleDistanceProvider.get_first_values([[("B", "A")], [("D", "C")]]))
+        self.assertEqual(Counter({"A/B": 1, "C/D": 1}), self.server.requests)
+
+    def test_failures_are_not_cached(self):
+        self.server.values = {"A/B": (0.0, 0.75)}
+        self.server.failing = {"A/B"}
+        self.assertEqual([None], clsMeshNormalizedGoogleDistanceProvider.get_first_values([[("A", "B")]]))
+        self.server.failing = set()
+        self.assertEqual([0.75], clsMeshNormalizedGoogleDistanceProvider.get_first_values([[("A", "B")]]))
+        self.assertEqual(2, self.server.requests["A/B"])
+
+    def test_timeout_returns_values_found_so_far(self):
+        self.server.values = {"A/B": (1.0, 0.75), "A/C": (0.0, 0.5)}
+        start = timer()
+        values = clsMeshNormalizedGoogleDistanceProvider.get_first_values([[("A", "B"), ("A", "C")]], timeout_seconds=0.3)
+        self.assertLess(timer() - start, 0.9)
+        self.assertEqual([0.5], values)
+
+    def test_local_engine_pairs_are_not_requested(self):
+        path = createMeshNgdFile([["Acetaminophen", "Pain"], ["Acetaminophen"], ["Pain", "Fever"]])
+        engine = clsMeshNgdEngine.from_file(path)
+        try:
+            local_value = engine.get_ngd("Acetaminophen", "Pain")[1]
+            self.server.values = {"PTGS2/Pain": (0.0, 0.9)}
+            with patch.object(clsMeshNgdEngine, "_instance", engine):
+                values = clsMeshNormalizedGoogleDistanceProvider.get_first_values([[("Acetaminophen", "Pain")], [("PTGS2", "Pain")]])
+                with patch("modConfig.ngdRemoteEnabled", False):
+                    offline_values = clsMeshNormalizedGoogleDistanceProvider.get_first_values([[("Acetaminophen", "Pain")], [("PTGS3", "Pain")]])
+        finally:
+            engine.connection.close()
+            os.remove(path)
+
+        self.assertEqual([local_value, 0.9], values)
+        self.assertEqual([local_value, None], offline_values)
+        self.assertEqual(Counter({"PTGS2/Pain": 1}), self.server.requests)
+
+    def slow_synonym_pairs(self, edge_count: int) -> list:
+        """
+        Edges of 9 synonym pairs each, every request takes 0.1 seconds and only the last pair of each edge has a value
+        """
+        pair_lists = []
+        for edge in range(edge_count):
+            pair_lists.append([(f"S{edge}_{i}", f"O{edge}_{j}") for i in range(3) for j in range(3)])
+            self.server.values[f"S{edge}_2/O{edge}_2"] = (0.1, edge + 1.0)
+        return pair_lists
+
+    def test_parallel_probing(self):
+        pair_lists = self.slow_synonym_pairs(30)
+        values = clsMeshNormalizedGoogleDistanceProvider.get_first_values(pair_lists)
+        self.assertEqual([edge + 1.0 for edge in range(30)], values)
+        self.assertEqual(values, clsMeshNormalizedGoogleDistanceProvider.get_first_values(pair_lists))
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_parallel_probing(self):
+        """
+        Compares the sequential probing (previous behavior) of 2 edges with the parallel probing of all 30, see slow_synonym_pairs
+        """
+        edge_count = 30
+        pair_lists = self.slow_synonym_pairs(edge_count)
+
+        start = timer()
+        for pairs in pair_lists[:2]:
+            for subject_name, object_name in pairs:
+                provider = clsMeshNormalizedGoogleDistanceProvider(subject_name, object_name)
+                provider.get_value()
+                if provider.value:
+                    break
+        sequential_seconds = (timer() - start) / 2 * edge_count
+        clsMeshNormalizedGoogleDistanceProvider.cache.clear()
+
+        start = timer()
+        clsMeshNormalizedGoogleDistanceProvider.get_first_values(pair_lists)
+        parallel_seconds = timer() - start
+
+        start = timer()
+        clsMeshNormalizedGoogleDistanceProvider.get_first_values(pair_lists)
+        cached_seconds = timer() - start
+
+        logging.info(f"NGD of {edge_count} edges: sequential ~{sequential_seconds:.1f} s (extrapolated from 2 edges), parallel {parallel_seconds:.2f} s, "
+                     f"cached {cached_seconds * 1000:.1f} ms")
+        self.assertLess(parallel_seconds, sequential_seconds / 4)
\ No newline at end of file
@@ -1,9 +1,96 @@
+import logging
+import random
+import tracemalloc
 import unittest
+from copy import deepcopy
+from itertools import product, chain
+from timeit import default_timer as timer
+from types import SimpleNamespace
+from unittest.mock import patch
+import networkx
+import modConfig
 from apis.v1_3.queries.clsMultiHop import clsMultiHop
 from apis.v1_3.queries.clsCaseSolution import clsCaseSolution
+from utils.multithreading.clsCancellationToken import clsCancellationToken, clsOperationCancelled
 from collections import OrderedDict
 
 
+def reference_merge_results(case_solutions):
+    """
+    The previous merge: a networkx graph of all hop results walked depth first, copying the partial result at every step
+    """
+    results = []
+    nx_results = networkx.DiGraph()
+    start_nodes = set()
+    for i, case_solution in enumerate(case_solutions):
+        for result in case_solution.results:
+            if i == 0:
+                starting_node_qg_id = sorted(list(result["node_bindings"].keys()))[0]
+                for node_binding in result["node_bindings"][starting_node_qg_id]:
+                    start_nodes.add(f"{starting_node_qg_id}_{node_binding['id']}")
+            for edge_qg_id, edge_bindings in result["edge_bindings"].items():
+                for edge_binding in edge_bindings:
+                    node1_qg_id = case_solution.query_graph['edges'][edge_qg_id]['subject']
+                    node2_qg_id = case_solution.query_graph['edges'][edge_qg_id]['object']
+                    for node1_binding, node2_binding in product(result["node_bindings"][node1_qg_id], result["node_bindings"][node2_qg_id]):
+                        node1_id = f"{node1_qg_id}_{node1_binding['id']}"
+                        node2_id = f"{node2_qg_id}_{node2_binding['id']}"
+                        nx_results.add_node(node1_id, query_graph_id=node1_qg_id)
+                        nx_results.add_node(node2_id, query_graph_id=node2_qg_id)
+                        nx_results.add_edge(node1_id, node2_id, result=result)
+
+    def add_to_result(new_result, source_node, excluded_qg_ids):
+        for neighbor in chain(nx_results.successors(source_node), nx_results.predecessors(source_node)):
+            node = nx_results.nodes[neighbor]
+            if node['query_graph_id'] in excluded_qg_ids:
+                continue
+            nx_edge = nx_results.get_edge_data(source_node, neighbor) or nx_results.get_edge_data(neighbor, source_node)
+            edge_result = nx_edge["result"]
+            neighbor_result = deepcopy(new_result)
+            neighbor_result["node_bindings"].update(edge_result["node_bindings"])
+            neighbor_result["edge_bindings"].update(edge_result["edge_bindings"])
+            for edge_binding in neighbor_result["edge_bindings"][list(edge_result["edge_bindings"].keys())[0]]:
+                edge_binding["attributes"] = edge_result["attributes"]
+                edge_binding["score"] = edge_result["score"]
+            add_to_result(neighbor_result, neighbor, excluded_qg_ids | {node['query_graph_id']})
+            if len(neighbor_result["edge_bindings"]) == len(case_solutions):
+                results.append(neighbor_result)
+
+    for starting_node_kg_id in start_nodes:
+        add_to_result({"node_bindings": {}, "edge_bindings": {}, "score": 0.0}, starting_node_kg_id, {starting_node_qg_id})
+
+    for result in results:
+        edge_scores = [edge_binding["score"] for edge_bindings in result["edge_bindings"].values() for edge_binding in edge_bindings]
+        result["score"] = sum(edge_scores) / len(edge_scores)
+    return results
+
+
+def synthetic_hops(node_counts: list, fanout: int, seed: int = 0, reverse_second_hop: bool = False) -> list:
+    """
+    Case solution stand-ins for a chain n00 - n01 - ... where every node links to `fanout` random nodes of the next hop
+    """
+    rng = random.Random(seed)
+    case_solutions = []
+    for hop in range(len(node_counts) - 1):
+        subject, object = f"n0{hop}", f"n0{hop + 1}"
+        edge = {"subject": object, "object": subject} if reverse_second_hop and hop == 1 else {"subject": subject, "object": object}
+        results = []
+        for i in range(node_counts[hop]):
+            for j in rng.sample(range(node_counts[hop + 1]), fanout):
+                results.append({
+                    "edge_bindings": {f"e0{hop}": [{"id": f"e{hop}-{i}-{j}"}]},
+                    "node_bindings": {subject: [{"id": f"{subject}:{i}"}], object: [{"id": f"{object}:{j}"}]},
+                    "score": round(rng.random(), 3),
+                    "attributes": [{"attribute_type_id": "biolink:description", "value": f"{hop}-{i}-{j}"}],
+                })
+        case_solutions.append(SimpleNamespace(query_graph={"nodes": {}, "edges": {f"e0{hop}": edge}}, results=results))
+    return case_solutions
+
+
+def result_key(result: dict):
+    return tuple(sorted(binding["id"] for bindings in result["edge_bindings"].values() for binding in bindings)), result["score"]
+
+
 class test_clsMultiHop(unittest.TestCase):
 
     @classmethod
@@ -177,3 +264,128 @@ class test_clsMultiHop(unittest.TestCase):
         reasoner_validator.validate(expected_results[0], "Result", "1.3.0")
 
         self.assertEqual(multihop.results, expected_results)
+
+    @patch.object(clsMultiHop, "max_results", new=None)
+    def test_merge_results_matches_graph_walk(self):
+        for seed, reverse_second_hop in ((0, False), (1, True)):
+            case_solutions = synthetic_hops([3, 8, 8, 5], fanout=3, seed=seed, reverse_second_hop=reverse_second_hop)
+            expected = reference_merge_results(deepcopy(case_solutions))
+
+            multihop = clsMultiHop(0, "multihop", case_solutions)
+            multihop.merge_results()
+
+            self.assertGreater(len(expected), 0)
+            self.assertEqual(sorted(map(result_key, expected)), sorted(map(result_key, multihop.results)))
+            self.assertEqual(sorted(expected, key=result_key), sorted(multihop.results, key=result_key))
+
+    def test_merge_results_keeps_the_best_results(self):
+        case_solutions = synthetic_hops([4, 10, 10], fanout=5)
+        expected = sorted(map(result_key, reference_merge_results(deepcopy(case_solutions))), key=lambda key: key[1], reverse=True)
+
+        with patch.object(clsMultiHop, "max_results", new=7):
+            multihop = clsMultiHop(0, "multihop", case_solutions)
+            multihop.merge_results()
+
+        self.assertEqual(7, len(multihop.results))
+        self.assertEqual([key[1] for key in expected[:7]], [result["score"] for result in multihop.results])
+
+    def test_merge_results_default_limit(self):
+        # the cross product of the hops is never kept whole by default
+        self.assertEqual(1000, clsMultiHop.max_results)
+        case_solutions = synthetic_hops([1, 40, 40], fanout=40)
+        merged_before = deepcopy([case_solution.results for case_solution in case_solutions])
+
+        multihop = clsMultiHop(0, "multihop", case_solutions)
+        multihop.merge_results()
+
+        self.assertEqual(1000, len(multihop.results))
+        scores = [result["score"] for result in multihop.results]
+        self.assertEqual(sorted(scores, reverse=True), scores)
+        # the explanations are added to copies of the edge bindings
+        self.assertEqual(merged_before, [case_solution.results for case_solution in case_solutions])
+
+    def test_merge_results_without_a_chain(self):
+        # both hops leave n00, so no single result can cover them
+        case_solutions = synthetic_hops([3, 3, 3], fanout=2)
+        case_solutions[1].query_graph["edges"]["e01"] = {"subject": "n00", "object": "n02"}
+        for result in case_solutions[1].results:
+            result["node_bindings"]["n00"] = result["node_bindings"].pop("n01")
+
+        multihop = clsMultiHop(0, "multihop", case_solutions)
+        multihop.merge_results()
+        self.assertEqual(sorted(map(result_key, reference_merge_results(case_solutions))), sorted(map(result_key, multihop.results)))
+        self.assertEqual([], multihop.results)
+
+    def test_cancelled_multihop_stops_before_knowledge_provider_requests(self):
+        token = clsCancellationToken()
+        requests = []
+
+        def case_solution(i):
+            knowledge_provider = SimpleNamespace(name=f"KP {i}", url=f"https://kp{i}", requestBody=None, responseBody=None, logs=[])
+
+            def execute():
+                requests.append(i)
+                # the query is cancelled while the first hop is waiting for its knowledge provider
+                token.cancel("processing timeout")
+                knowledge_provider.responseBody = {"message": {
+                    "knowledge_graph": {"nodes": {}, "edges": {}},
+                    "results": [{"node_bindings": {"n00": [{"id": "A"}], "n01": [{"id": "B"}]}, "edge_bindings": {}}]
+                }}
+            knowledge_provider.execute = execute
+
+            solution = clsCaseSolution(dispatchId=i, dispatchDescription=f"hop {i}")
+            solution.id = i
+            solution.logs = []
+            solution.paths = [SimpleNamespace(knowledgeProvider=knowledge_provider, logs=[], subject="biolink:Gene", object="biolink:Gene",
+                                              predicate="biolink:related_to")]
+            solution.subject_query_graph_node_id = f"n0{i}"
+            solution.object_query_graph_node_id = f"n0{i + 1}"
+            solution.predicate_query_graph_edge_id = f"e0{i}"
+            return solution
+
+        multihop = clsMultiHop(0, "multihop", [case_solution(0), case_solution(1)])
+        multihop.dispatchCancellationToken = token
+        multihop.execute()
+
+        self.assertEqual([0], requests, "Expected the second hop to never send its knowledge provider request")
+        self.assertTrue(multihop.finished)
+        self.assertFalse(multihop.successful)
+        self.assertIn("Cancelled", [log.code for log in multihop.logs])
+
+        # a case solution checks the token right before its knowledge provider request
+        solution = case_solution(1)
+        solution.dispatchCancellationToken = token
+        solution.generateQueryGraphForOnePath()
+        with self.assertRaises(clsOperationCancelled):
+            solution.generateKnowledgeGraphForOnePath()
+        self.assertEqual([0], requests)
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    @patch.object(clsMultiHop, "max_results", new=1000)
+    def test_benchmark_high_fanout(self):
+        """
+        500 x 500 fanout: 500 first hop results, each joining 500 second hop results, 250000 candidate paths, against the graph walk (previous
+        behavior) of 40 x 40 paths
+        """
+        case_solutions = synthetic_hops([1, 500, 500], fanout=500)
+
+        small = synthetic_hops([1, 40, 40], fanout=40)
+        start = timer()
+        reference_merge_results(deepcopy(small))
+        reference_seconds = timer() - start
+
+        tracemalloc.start()
+        start = timer()
+        multihop = clsMultiHop(0, "multihop", case_solutions)
+        multihop.merge_results()
+        merge_seconds = timer() - start
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        logging.info(f"Graph walk of 40 x 40 paths: {reference_seconds:.2f} s. "
+                     f"Join of 500 x 500 paths keeping {clsMultiHop.max_results}: {merge_seconds:.2f} s, {peak_bytes / 2 ** 20:.1f} MiB peak")
+        self.assertEqual(clsMultiHop.max_results, len(multihop.results))
+        scores = [result["score"] for result in multihop.results]
+        self.assertEqual(sorted(scores, reverse=True), scores)
+        # per candidate path
+        self.assertLess(merge_seconds / 500 ** 2, reference_seconds / 40 ** 2)
@@ -0,0 +1,55 @@
+import unittest
+import requests_mock
+from ..clsNodeNormalizerProvider import clsNodeNormalizerProvider
+from ..clsNameResolutionProvider import clsNameResolutionProvider
+
+
+class test_clsNodeNormalizerProvider(unittest.TestCase):
+    """
+    Node normalization and name resolution share the same read-through cache behavior
+    """
+
+    def setUp(self):
+        clsNodeNormalizerProvider.cache.clear()
+        clsNameResolutionProvider.cache.clear()
+
+    def test_repeated_identifiers_are_not_requested_again(self):
+        with requests_mock.Mocker() as mocker:
+            mocker.post(clsNodeNormalizerProvider.url, json={
+                "MESH:D000001": {"id": {"identifier": "CHEBI:1"}},
+                "NCBIGene:0": None,
+            })
+            provider = clsNodeNormalizerProvider(["NCBIGene:0", "MESH:D000001"])
+            provider.get_identifiers()
+            self.assertEqual({"MESH:D000001": "CHEBI:1", "NCBIGene:0": "NCBIGene:0"}, provider.identifiers)
+
+            mocker.post(clsNodeNormalizerProvider.url, json={"MESH:D000002": {"id": {"identifier": "CHEBI:2"}}})
+            provider = clsNodeNormalizerProvider(["NCBIGene:0", "MESH:D000001", "MESH:D000002"])
+            provider.get_identifiers()
+            self.assertEqual({"MESH:D000001": "CHEBI:1", "MESH:D000002": "CHEBI:2", "NCBIGene:0": "NCBIGene:0"}, provider.identifiers)
+
+            # only the new curie was sent upstream
+            self.assertEqual(2, mocker.call_count)
+            self.assertEqual({"curies": ["MESH:D000002"]}, mocker.last_request.json())
+
+            provider = clsNodeNormalizerProvider(["NCBIGene:0", "MESH:D000002"])
+            provider.get_identifiers()
+            self.assertEqual(2, mocker.call_count)
+            self.assertEqual({"MESH:D000002": "CHEBI:2", "NCBIGene:0": "NCBIGene:0"}, provider.identifiers)
+
+        metrics = clsNodeNormalizerProvider.cache.metrics()
+        self.assertEqual((4, 3), (metrics["hits"], metrics["misses"]))
+
+    def test_repeated_synonyms_are_not_requested_again(self):
+        with requests_mock.Mocker() as mocker:
+            # the service leaves out curies it has no synonyms for
+            mocker.post(clsNameResolutionProvider.url, json={"CHEBI:1": ["water", "H2O"]})
+            for _ in range(3):
+                provider = clsNameResolutionProvider(["CHEBI:1", "CHEBI:404"])
+                provider.get_synonyms()
+                self.assertEqual({"CHEBI:1": ["water", "H2O"]}, provider.synonyms)
+            self.assertEqual(1, mocker.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+import json
+import logging
+import time
+import tracemalloc
+import unittest
+from copy import deepcopy
+import jsonschema
+from jsonschema import ValidationError
+import modConfig
+from ..clsTrapiResponseValidator import clsTrapiResponseValidator
+
+
+def trapi_schemas() -> dict:
+    """
+    A cut down TRAPI 1.3 schema, one self-contained schema per component like reasoner_validator.util.load_schema returns
+    """
+    components = {
+        "Response": {"type": "object", "properties": {"message": {"$ref": "#/components/schemas/Message"}}, "required": ["message"]},
+        "Message": {
+            "type": "object",
+            "properties": {
+                "query_graph": {"oneOf": [{"type": "object"}, {"type": "null"}]},
+                "knowledge_graph": {"oneOf": [{"$ref": "#/components/schemas/KnowledgeGraph"}, {"type": "null"}]},
+                "results": {"oneOf": [{"type": "array", "items": {"$ref": "#/components/schemas/Result"}}, {"type": "null"}]},
+            },
+        },
+        "KnowledgeGraph": {
+            "type": "object",
+            "properties": {
+                "nodes": {"type": "object", "additionalProperties": {"$ref": "#/components/schemas/Node"}},
+                "edges": {"type": "object", "additionalProperties": {"$ref": "#/components/schemas/Edge"}},
+            },
+            "required": ["nodes", "edges"],
+        },
+        "Node": {
+            "type": "object",
+            "properties": {
+                "name": {"oneOf": [{"type": "string"}, {"type": "null"}]},
+                "categories": {"oneOf": [{"type": "array", "items": {"type": "string", "pattern": "^biolink:[A-Z][a-zA-Z]*$"}}, {"type": "null"}]},
+                "attributes": {"oneOf": [{"type": "array", "items": {"$ref": "#/components/schemas/Attribute"}}, {"type": "null"}]},
+            },
+        },
+        "Edge": {
+            "type": "object",
+            "properties": {
+                "subject": {"type": "string"},
+                "object": {"type": "string"},
+                "predicate": {"oneOf": [{"type": "string", "pattern": "^biolink:[a-z][a-z_]*$"}, {"type": "null"}]},
+                "attributes": {"oneOf": [{"type": "array", "items": {"$ref": "#/components/schemas/Attribute"}}, {"type": "null"}]},
+            },
+            "required": ["subject", "object"],
+        },
+        "Attribute": {
+            "type": "object",
+            "properties": {"attribute_type_id": {"type": "string", "pattern": "^[a-zA-Z_]+:.+$"}, "value": {}},
+            "required": ["attribute_type_id", "value"],
+        },
+        "Result": {
+            "type": "object",
+            "properties": {
+                "node_bindings": {"type": "object", "additionalProperties": {"type": "array", "items": {"type": "object", "required": ["id"]}}},
+                "edge_bindings": {"type": "object", "additionalProperties": {"type": "array", "items": {"type": "object", "required": ["id"]}}},
+                "score": {"oneOf": [{"type": "number"}, {"type": "null"}]},
+            },
+            "required": ["node_bindings", "edge_bindings"],
+        },
+    }
+    schemas = {}
+    for component in components:
+        subcomponents = deepcopy(components)
+        schema = subcomponents.pop(component)
+        schema["components"] = {"schemas": subcomponents}
+        schemas[component] = schema
+    return schemas
+
+
+def generate_response(edge_count: int) -> dict:
+    """
+    A KP response with edge_count drug -> gene edges, one result per edge
+    """
+    node_count = max(edge_count // 5, 2)
+    nodes = {f"CHEBI:{i}": {"name": f"drug {i}", "categories": ["biolink:SmallMolecule"], "attributes": []} for i in range(node_count // 2)}
+    nodes.update({f"NCBIGene:{i}": {"name": f"gene {i}", "categories": ["biolink:Gene"], "attributes": []} for i in range(node_count // 2)})
+    edges = {}
+    results = []
+    for i in range(edge_count):
+        subject, object = f"CHEBI:{i % (node_count // 2)}", f"NCBIGene:{(i * 7) % (node_count // 2)}"
+        edges[f"infores:kp.{i}"] = {
+            "subject": subject, "object": object, "predicate": "biolink:affects",
+            "attributes": [
+                {"attribute_type_id": "biolink:primary_knowledge_source", "value": "infores:kp"},
+                {"attribute_type_id": "biolink:publications", "value": [f"PMID:{i}", f"PMID:{i + 1}"]},
+            ],
+        }
+        results.append({"node_bindings": {"n0": [{"id": subject}], "n1": [{"id": object}]}, "edge_bindings": {"e0": [{"id": f"infores:kp.{i}"}]}, "score": 0.5})
+    return {"message": {"query_graph": {"nodes": {}, "edges": {}}, "knowledge_graph": {"nodes": nodes, "edges": edges}, "results": results}}
+
+
+def measure(function, *args):
+    """
+    CPU time and peak traced allocation of one call
+    """
+    tracemalloc.start()
+    start = time.process_time()
+    result = function(*args)
+    cpu_seconds = time.process_time() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, cpu_seconds, peak_bytes
+
+
+class test_clsTrapiResponseValidator(unittest.TestCase):
+
+    def setUp(self):
+        self.schemas = trapi_schemas()
+        self.body = generate_response(20)
+
+    def validate(self, body, sample_size=None) -> dict:
+        validator = clsTrapiResponseValidator("1.3", sample_size=sample_size, seed=0, schemas=self.schemas)
+        parsed = validator.parse(json.dumps(body).encode())
+        validator.finish(parsed)
+        return parsed
+
+    def test_valid_response_is_parsed(self):
+        for sample_size in (None, 5):
+            self.assertEqual(self.body, self.validate(self.body, sample_size))
+        # the fallback without ijson walks the parsed records
+        validator = clsTrapiResponseValidator("1.3", schemas=self.schemas)
+        validator.check_records(self.body)
+        validator.finish(self.body)
+
+    def test_null_knowledge_graph_and_results(self):
+        body = {"message": {"query_graph": None, "knowledge_graph": None, "results": None}}
+        self.assertEqual(body, self.validate(body))
+
+    def test_malformed_edge_raises(self):
+        del self.body["message"]["knowledge_graph"]["edges"]["infores:kp.3"]["subject"]
+        for sample_size in (None, 5):
+            with self.assertRaisesRegex(ValidationError, "infores:kp.3"):
+                self.validate(self.body, sample_size)
+
+    def test_malformed_attribute_raises_when_sampled(self):
+        self.body["message"]["knowledge_graph"]["edges"]["infores:kp.3"]["attributes"][0]["attribute_type_id"] = "no prefix"
+        with self.assertRaisesRegex(ValidationError, "infores:kp.3"):
+            self.validate(self.body)
+        with self.assertRaisesRegex(ValidationError, "infores:kp.3"):
+            self.validate(self.body, sample_size=20)
+        # shallow checks don't look inside attributes, only the sampled edge is validated fully
+        validator = clsTrapiResponseValidator("1.3", sample_size=1, seed=0, schemas=self.schemas)
+        parsed = validator.parse(json.dumps(self.body).encode())
+        if validator.sampled_edges[0][0] == "infores:kp.3":
+            self.assertRaises(ValidationError, validator.finish, parsed)
+        else:
+            validator.finish(parsed)
+
+    def test_malformed_node_and_result_raise(self):
+        body = deepcopy(self.body)
+        body["message"]["knowledge_graph"]["nodes"]["CHEBI:1"]["categories"] = "biolink:SmallMolecule"
+        for sample_size in (None, 5):
+            with self.assertRaisesRegex(ValidationError, "CHEBI:1"):
+                self.validate(body, sample_size)
+
+        body = deepcopy(self.body)
+        del body["message"]["results"][4]["edge_bindings"]
+        for sample_size in (None, 5):
+            with self.assertRaisesRegex(ValidationError, "results.4"):
+                self.validate(body, sample_size)
+
+    def test_malformed_envelope_raises(self):
+        for body in ({}, {"message": {"knowledge_graph": {"nodes": {}}}}):
+            with self.assertRaises(ValidationError):
+                self.validate(body)
+
+    def test_invalid_json_raises_value_error(self):
+        validator = clsTrapiResponseValidator("1.3", schemas=self.schemas)
+        with self.assertRaises(ValueError):
+            validator.parse(b'{"message": {"knowledge_graph": ')
+
+    def test_sample_is_uniform_and_bounded(self):
+        body = generate_response(200)
+        validator = clsTrapiResponseValidator("1.3", sample_size=10, seed=1, schemas=self.schemas)
+        validator.finish(validator.parse(json.dumps(body).encode()))
+        self.assertEqual(200, validator.edge_count)
+        self.assertEqual(10, len(validator.sampled_edges))
+        sampled_ids = [int(edge_id.split(".")[-1]) for edge_id, _ in validator.sampled_edges]
+        self.assertGreater(max(sampled_ids), 10)
+
+    def whole_document(self, content: bytes):
+        """
+        Validates the way reasoner_validator.validate does (previous behavior)
+        """
+        parsed = json.loads(content)
+        jsonschema.validate(parsed, self.schemas["Response"])
+        return parsed
+
+    def streaming(self, content: bytes, sample_size: int):
+        validator = clsTrapiResponseValidator("1.3", sample_size=sample_size, seed=0, schemas=self.schemas)
+        parsed = validator.parse(content)
+        validator.finish(parsed)
+        return parsed
+
+    def test_generated_response_matches_whole_document(self):
+        content = json.dumps(generate_response(2000)).encode()
+        self.assertEqual(self.whole_document(content), self.streaming(content, 100))
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_50k_edges(self):
+        """
+        Validates a generated 50k edge response the way reasoner_validator.validate does (previous behavior) and streaming with 100 sampled edges
+        """
+        content = json.dumps(generate_response(50000)).encode()
+
+        _, before_seconds, before_bytes = measure(self.whole_document, content)
+        _, sampled_seconds, sampled_bytes = measure(self.streaming, content, 100)
+
+        logging.info(f"Validating {len(content) / 2 ** 20:.1f} MiB, 50000 edges: "
+                     f"whole document {before_seconds:.2f} s CPU, {before_bytes / 2 ** 20:.1f} MiB peak; "
+                     f"streaming with 100 sampled edges {sampled_seconds:.2f} s CPU, {sampled_bytes / 2 ** 20:.1f} MiB peak")
+        self.assertLess(sampled_seconds, before_seconds)
+
+if __name__ == '__main__':
+    unittest.main()
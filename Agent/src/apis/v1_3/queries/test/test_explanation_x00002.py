@@ -0,0 +1,116 @@
+import random
+import unittest
+from modDatabase import db
+from apis.v1_3.queries.clsExplanationX00002 import ExplanationX00002
+from .modTestDatabase import createPostgresApp, dropPostgresTables
+
+
+def reference_articles(subject_references: list, object_references: list, max_distance: int) -> dict:
+    """
+    Reference: the per edge matching of every subject reference with every object reference
+    :return: Dictionary of article id -> closest sentence distance, or None if it is greater than max_distance
+    """
+    distances = {}
+    for subject_reference in subject_references:
+        for object_reference in object_references:
+            if subject_reference["Article_ID"] == object_reference["Article_ID"]:
+                distance = abs(subject_reference["SENT_ID"] - object_reference["SENT_ID"])
+                distances[subject_reference["Article_ID"]] = min(distance, distances.get(subject_reference["Article_ID"], distance))
+    return {article_id: (distance if distance <= max_distance else None) for article_id, distance in distances.items()}
+
+
+class TestExplanationX00002(unittest.TestCase):
+
+    def test_reference_kind(self):
+        self.assertEqual("CHEM", ExplanationX00002.reference_kind(["biolink:SmallMolecule", "biolink:Gene"]))
+        self.assertEqual("GENE", ExplanationX00002.reference_kind(["biolink:GeneOrGeneProduct"]))
+        self.assertIsNone(ExplanationX00002.reference_kind(["biolink:Disease"]))
+
+    def test_group_edge_references(self):
+        rows = [
+            {"EDGE_INDEX": 0, "Article_ID": "a1", "SUBJECT_TOKS": "x", "OBJECT_TOKS": None, "DISTANCE": None},
+            {"EDGE_INDEX": 2, "Article_ID": "a1", "SUBJECT_TOKS": "x", "OBJECT_TOKS": "y", "DISTANCE": 3},
+            {"EDGE_INDEX": 0, "Article_ID": "a2", "SUBJECT_TOKS": None, "OBJECT_TOKS": "y", "DISTANCE": None},
+        ]
+        edge_references = ExplanationX00002.group_edge_references(rows)
+        self.assertEqual([0, 2], sorted(edge_references))
+        self.assertEqual(["a1", "a2"], [reference["Article_ID"] for reference in edge_references[0]])
+
+
+@unittest.skipUnless(createPostgresApp() is not None, "TEST_DATABASE_URI is not set, no local Postgres to run the evidence query against")
+class TestExplanationX00002Postgres(unittest.TestCase):
+    """
+    Runs the bulk evidence query against seeded CHEM_TOKENS_TEXT and GENE_TOKENS_TEXT tables in the local Postgres test database
+    """
+    # the schema the ExplanationX00002 queries name
+    schema = "public"
+    tableNames = ["RAW_TEXT", "CHEM_TOKENS_TEXT", "GENE_TOKENS_TEXT"]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = createPostgresApp(schema=cls.schema)
+        randomizer = random.Random(0)
+        cls.chemicals = [f"chemical {i}" for i in range(20)]
+        cls.genes = [f"gene {i}" for i in range(20)]
+        cls.rows = {"CHEM": [], "GENE": []}
+        for kind, tokens in (("CHEM", cls.chemicals), ("GENE", cls.genes)):
+            for i in range(3000):
+                article = randomizer.randrange(200)
+                sentence = randomizer.randrange(60)
+                token = randomizer.choice(tokens)
+                cls.rows[kind].append({
+                    "ID": i, "Article_Number": str(article), "Article_ID": f"article{article:04d}", "SENT_ID": sentence,
+                    "SENT_TEXT": f"Sentence {sentence} of article {article} mentions {token}.", "TOKS": token
+                })
+
+        # plain create table, so existing tables are never replaced
+        with cls.app.app_context():
+            db.session.execute('create table "RAW_TEXT" ("Article_ID" text, "Article_Title" text, "Article_Author" text)')
+            for kind in ("CHEM", "GENE"):
+                db.session.execute(f'''create table "{kind}_TOKENS_TEXT" ("ID" integer, "Article_Number" text, "Article_ID" text,
+                                       "SENT_ID" integer, "SENT_TEXT" text, "{kind}_TOKS" text)''')
+                db.session.execute(
+                    f'''insert into "{kind}_TOKENS_TEXT" values (:ID, :Article_Number, :Article_ID, :SENT_ID, :SENT_TEXT, :TOKS)''',
+                    cls.rows[kind]
+                )
+            db.session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        dropPostgresTables(cls.app, cls.tableNames)
+
+    def test_bulk_references_match_per_edge_matching(self):
+        randomizer = random.Random(1)
+        edge_terms = []
+        for edge_index in range(50):
+            subject_synonyms = [s.upper() for s in randomizer.sample(self.chemicals, 2)]
+            object_categories = randomizer.choice([["biolink:Gene"], ["biolink:SmallMolecule"]])
+            object_tokens = self.genes if object_categories == ["biolink:Gene"] else self.chemicals
+            edge_terms.append((edge_index, subject_synonyms, ["biolink:SmallMolecule"], randomizer.sample(object_tokens, 2), object_categories))
+
+        explanation = ExplanationX00002(self.app)
+        edge_references = explanation.find_edge_references(edge_terms)
+
+        for edge_index, subject_synonyms, subject_categories, object_synonyms, object_categories in edge_terms:
+            subject_kind, object_kind = explanation.reference_kind(subject_categories), explanation.reference_kind(object_categories)
+            subject_references = [row for row in self.rows[subject_kind] if row["TOKS"] in [s.lower() for s in subject_synonyms]]
+            object_references = [row for row in self.rows[object_kind] if row["TOKS"] in [s.lower() for s in object_synonyms]]
+            expected = reference_articles(subject_references, object_references, explanation.max_sentence_distance)
+
+            article_references = edge_references.get(edge_index, [])
+            self.assertEqual(sorted({row["Article_ID"] for row in subject_references}),
+                             [reference["Article_ID"] for reference in article_references if reference["SUBJECT_TOKS"] is not None])
+            self.assertEqual(sorted({row["Article_ID"] for row in object_references}),
+                             [reference["Article_ID"] for reference in article_references if reference["OBJECT_TOKS"] is not None])
+
+            matching = {reference["Article_ID"]: reference for reference in article_references
+                        if reference["SUBJECT_TOKS"] is not None and reference["OBJECT_TOKS"] is not None}
+            self.assertEqual(expected, {article_id: reference["DISTANCE"] for article_id, reference in matching.items()})
+            for reference in matching.values():
+                if reference["DISTANCE"] is not None:
+                    self.assertIn(reference["CLOSEST_SUBJECT_TOKS"], reference["SUBJECT_SENT_TEXT"])
+                    self.assertIn(reference["CLOSEST_OBJECT_TOKS"], reference["OBJECT_SENT_TEXT"])
+
+
+if __name__ == '__main__':
+    unittest.main()
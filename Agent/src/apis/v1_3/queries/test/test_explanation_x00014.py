@@ -1,5 +1,7 @@
 import unittest
 from apis.v1_3.queries.clsExplanationX00014 import ExplanationX00014
+from apis.v1_3.queries.clsNameResolutionProvider import clsNameResolutionProvider
+from apis.v1_3.queries.clsMeshNormalizedGoogleDistanceProvider import clsMeshNormalizedGoogleDistanceProvider
 from modConfig import ZERO_RESULT_SCORE
 from collections import namedtuple, OrderedDict
 import requests_mock
@@ -16,7 +18,9 @@ class TestExplanationX00013(unittest.TestCase):
         pass
 
     def setUp(self):
-        pass
+        # every test mocks its own synonyms for the same curies
+        clsNameResolutionProvider.cache.clear()
+        clsMeshNormalizedGoogleDistanceProvider.cache.clear()
 
     def tearDown(self):
         pass
@@ -206,6 +210,33 @@ class TestExplanationX00013(unittest.TestCase):
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0], expected)
 
+    def test_all_edges_explained(self):
+        """
+        Tests that every edge is scored, not only the first 10
+        """
+        query_graph = {
+            "edges": {"e01": {"subject": "n0", "object": "n1"}},
+            "nodes": {"n0": {"categories": ["biolink:Gene"]}, "n1": {"categories": ["biolink:Gene"]}}
+        }
+        knowledge_graph = {
+            "nodes": {f"CURIE:{i:06d}": {} for i in range(26)},
+            "edges": {f"knowledge_graph_edge{i:02d}": {"subject": "CURIE:000000", "object": f"CURIE:{i:06d}", "attributes": []} for i in range(1, 26)},
+        }
+        CaseSolutionMock = namedtuple('CaseSolutionMock', ['query_graph', 'knowledge_graph'])
+        case_solution = CaseSolutionMock(query_graph, knowledge_graph)
+
+        x = ExplanationX00014("test_kp")
+
+        with requests_mock.Mocker() as mocker:
+            mock_name_resolution_response = {f"CURIE:{i:06d}": [f"Term {i}"] for i in range(26)}
+            mocker.register_uri('POST', re.compile('name-resolution-sri.renci.org/'), json=mock_name_resolution_response)
+            mocker.register_uri('GET', re.compile('arax.ncats.io/api/arax/v1.3/PubmedMeshNgd/'), json={"response_code": "OK", "value": 0.55})
+
+            results = x.create_results_and_explain(case_solution)
+
+        self.assertEqual(25, len(results))
+        self.assertEqual([0.55] * 25, [result["score"] for result in results])
+
     def test_get_ngd_nominal(self):
         """
         Tests that a list of subject and object synonyms will be iterated through to find a valid NGD service response.
@@ -0,0 +1,101 @@
+import logging
+import random
+import re
+import unittest
+import modConfig
+from modDatabase import db
+from apis.v1_3.queries.clsExplanationX00002 import ExplanationX00002
+from .modTestDatabase import createPostgresApp, dropPostgresTables, createLiteratureIndexes
+
+
+@unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+@unittest.skipUnless(createPostgresApp() is not None, "TEST_DATABASE_URI is not set, no local Postgres to benchmark the literature indexes on")
+class TestLiteratureTokenIndexes(unittest.TestCase):
+    """
+    Benchmark: EXPLAIN ANALYZE of the ExplanationX00002 queries on seeded literature tables, before and after the indexes of the xARA-ETL
+    clsLiteratureIndexesJob
+    """
+    # the schema the ExplanationX00002 queries name
+    schema = "public"
+    tableNames = ["CHEM_TOKENS_TEXT", "GENE_TOKENS_TEXT", "RAW_TEXT"]
+    sentenceCount = 300000
+    tokenCount = 20000
+    articleCount = 30000
+    # RAW_TEXT holds every article of the corpus, not only those with token matches
+    rawTextCount = 300000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = createPostgresApp(schema=cls.schema)
+        # plain create table, so existing tables are never replaced
+        with cls.app.app_context():
+            for kind in ("CHEM", "GENE"):
+                db.session.execute(f'''
+                    create table "{kind}_TOKENS_TEXT" as
+                    select
+                        i as "ID",
+                        (i % :articles)::text as "Article_Number",
+                        'article' || (i % :articles) as "Article_ID",
+                        (i / :articles) as "SENT_ID",
+                        'Sentence ' || i || ' mentions {kind.lower()} token ' || ((i::bigint * 7919) % :tokens) as "SENT_TEXT",
+                        '{kind.lower()} token ' || ((i::bigint * 7919) % :tokens) as "{kind}_TOKS"
+                    from generate_series(0, :sentences - 1) i
+                ''', {"articles": cls.articleCount, "tokens": cls.tokenCount, "sentences": cls.sentenceCount})
+            db.session.execute('''
+                create table "RAW_TEXT" as
+                select 'article' || i as "Article_ID", 'Title ' || i as "Article_Title", 'Author ' || i as "Article_Author"
+                from generate_series(0, :articles - 1) i
+            ''', {"articles": cls.rawTextCount})
+            db.session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        dropPostgresTables(cls.app, cls.tableNames)
+
+    def explain_analyze(self, sql: str, params: dict):
+        """
+        :return: Tuple of the execution time in milliseconds and the plan text
+        """
+        with self.app.app_context():
+            db.session.execute("analyze")
+            plan = "\n".join(row[0] for row in db.session.execute("explain analyze " + sql.strip().rstrip(";"), params))
+            db.session.rollback()
+        return float(re.search(r"Execution Time: ([\d.]+) ms", plan).group(1)), plan
+
+    def test_benchmark_indexes(self):
+        randomizer = random.Random(0)
+        explanation = ExplanationX00002(self.app)
+
+        edge_indexes, roles, kinds, tokens = [], [], [], []
+        for edge_index in range(200):
+            for role, kind in (("S", "CHEM"), ("O", "GENE")):
+                for _ in range(5):
+                    edge_indexes.append(edge_index)
+                    roles.append(role)
+                    kinds.append(kind)
+                    tokens.append(f"{kind} token {randomizer.randrange(self.tokenCount)}".lower())
+        evidence_params = {"edge_indexes": edge_indexes, "roles": roles, "kinds": kinds, "tokens": tokens, "max_distance": explanation.max_sentence_distance}
+        article_sql = """SELECT "Article_ID", "Article_Title", "Article_Author" FROM public."RAW_TEXT" WHERE "Article_ID" = ANY(array[:article_ids]);"""
+        article_params = {"article_ids": [f"article{randomizer.randrange(self.articleCount)}" for _ in range(100)]}
+
+        evidence_before, _ = self.explain_analyze(explanation.sqlFindEdgeReferences, evidence_params)
+        articles_before, _ = self.explain_analyze(article_sql, article_params)
+
+        createLiteratureIndexes(self.app, self.schema)
+
+        evidence_after, evidence_plan = self.explain_analyze(explanation.sqlFindEdgeReferences, evidence_params)
+        articles_after, articles_plan = self.explain_analyze(article_sql, article_params)
+
+        logging.info(f"Evidence query for {len(set(edge_indexes))} edges, {self.sentenceCount} sentences per token table: "
+                     f"before {evidence_before:.1f} ms, after {evidence_after:.1f} ms")
+        logging.info(f"RAW_TEXT lookup of {len(article_params['article_ids'])} articles: before {articles_before:.1f} ms, after {articles_after:.1f} ms")
+
+        self.assertIn("ix_CHEM_TOKENS_TEXT_CHEM_TOKS", evidence_plan)
+        self.assertIn("ix_GENE_TOKENS_TEXT_GENE_TOKS", evidence_plan)
+        self.assertIn("ix_RAW_TEXT_Article_ID", articles_plan)
+        self.assertLess(evidence_after, evidence_before)
+        self.assertLess(articles_after, articles_before)
+
+
+if __name__ == '__main__':
+    unittest.main()
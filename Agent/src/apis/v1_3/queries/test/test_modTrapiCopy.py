@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import time
+import tracemalloc
+import unittest
+from copy import deepcopy
+import modConfig
+from ..modTrapiCopy import copy_query_graph, copy_knowledge_graph, copy_result, copy_attributed, copy_request_body
+
+fixtures_folder = os.path.join(os.path.dirname(__file__), "..", "..", "views", "test", "test_clsQueryView")
+
+
+def measure(function, *args):
+    """
+    CPU time and peak traced allocation of one call
+    """
+    tracemalloc.start()
+    start = time.process_time()
+    result = function(*args)
+    cpu_seconds = time.process_time() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, cpu_seconds, peak_bytes
+
+
+class test_modTrapiCopy(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(os.path.join(fixtures_folder, "path2", "test_knowledge_provider_response_body_path_2.json")) as file:
+            cls.response_body = json.load(file)
+
+    def test_query_graph_records_are_copied(self):
+        query_graph = {"nodes": {"n0": {"ids": ["CHEBI:1"], "categories": ["biolink:SmallMolecule"]}}, "edges": {"e0": {"subject": "n0", "object": "n0"}}}
+        copied = copy_query_graph(query_graph)
+        copied["nodes"]["n0"]["ids"] = ["CHEBI:2"]
+        del copied["edges"]["e0"]["object"]
+        copied["nodes"]["n1"] = {}
+        self.assertEqual({"n0": {"ids": ["CHEBI:1"], "categories": ["biolink:SmallMolecule"]}}, query_graph["nodes"])
+        self.assertEqual({"subject": "n0", "object": "n0"}, query_graph["edges"]["e0"])
+
+    def test_knowledge_graph_attribute_lists_are_copied(self):
+        knowledge_graph = self.response_body["message"]["knowledge_graph"]
+        edge_id = next(iter(knowledge_graph["edges"]))
+        attribute_count = len(knowledge_graph["edges"][edge_id]["attributes"])
+
+        copied = copy_knowledge_graph(knowledge_graph)
+        self.assertEqual(knowledge_graph, copied)
+        copied["edges"][edge_id]["attributes"].append({"attribute_type_id": "biolink:aggregator_knowledge_source"})
+        copied["edges"][edge_id]["predicate"] = "biolink:related_to"
+        copied["edges"]["new"] = {}
+
+        self.assertEqual(attribute_count, len(knowledge_graph["edges"][edge_id]["attributes"]))
+        self.assertNotEqual("biolink:related_to", knowledge_graph["edges"][edge_id]["predicate"])
+        self.assertNotIn("new", knowledge_graph["edges"])
+
+    def test_result_binding_maps_are_copied(self):
+        result = {"node_bindings": {"n0": [{"id": "A"}]}, "edge_bindings": {"e0": [{"id": "x"}]}, "score": 0.5}
+        copied = copy_result(result)
+        copied["node_bindings"]["n1"] = [{"id": "B"}]
+        copied["edge_bindings"]["e0"] = [{"id": "y"}]
+        copied["score"] = 1.0
+        self.assertEqual({"node_bindings": {"n0": [{"id": "A"}]}, "edge_bindings": {"e0": [{"id": "x"}]}, "score": 0.5}, result)
+
+        binding = {"id": "x", "attributes": [{"value": 1}]}
+        copied = copy_attributed(binding)
+        copied["attributes"].append({"value": 2})
+        self.assertEqual([{"value": 1}], binding["attributes"])
+
+    def test_request_body_shares_everything_but_the_query_graph(self):
+        request_body = {"message": {"query_graph": {"nodes": {}, "edges": {}}, "knowledge_graph": None}, "submitter": "test"}
+        query_graph = {"nodes": {"n0": {}}, "edges": {}}
+        copied = copy_request_body(request_body, query_graph)
+        self.assertIs(query_graph, copied["message"]["query_graph"])
+        self.assertEqual({"nodes": {}, "edges": {}}, request_body["message"]["query_graph"])
+
+    @staticmethod
+    def deep(message):
+        return deepcopy(message["knowledge_graph"]), deepcopy(message["results"])
+
+    @staticmethod
+    def copy_on_write(message):
+        return copy_knowledge_graph(message["knowledge_graph"]), [copy_result(result) for result in message["results"]]
+
+    def test_knowledge_graph_and_results_equal_deepcopy(self):
+        message = self.response_body["message"]
+        self.assertEqual(self.deep(message), self.copy_on_write(message))
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_knowledge_graph_and_results(self):
+        """
+        Copies the views/test path 2 knowledge provider response the way a merge does, with deepcopy (previous behavior) and copy-on-write
+        """
+        message = self.response_body["message"]
+
+        _, before_seconds, before_bytes = measure(self.deep, message)
+        _, after_seconds, after_bytes = measure(self.copy_on_write, message)
+
+        logging.info(f"Copying {len(message['knowledge_graph']['edges'])} edges and {len(message['results'])} results: "
+                     f"deepcopy {before_seconds * 1000:.1f} ms CPU, {before_bytes / 2 ** 20:.1f} MiB peak; "
+                     f"copy-on-write {after_seconds * 1000:.1f} ms CPU, {after_bytes / 2 ** 20:.1f} MiB peak")
+        self.assertLess(after_bytes, before_bytes)
+        self.assertLess(after_seconds, before_seconds)
+
+if __name__ == '__main__':
+    unittest.main()
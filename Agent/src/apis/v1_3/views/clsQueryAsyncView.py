@@ -5,11 +5,12 @@ ASSUMES: 'Agent' is short for 'Explanatory Autonomous Relay Agent'
 FUTURE IMPROVEMENTS: N/A
 WHO: SL 2022-04-07
 """
-import multiprocessing
+import concurrent.futures
+import threading
 from flask_restx import Resource, Namespace
 from ..queries.modQuerySync import querySync
 from .clsQueryView import body as post_body
-from multiprocessing.dummy import Pool as ThreadPool
+from utils.multithreading.clsBoundedExecutor import clsBoundedExecutor
 from flask import current_app
 from flask import request
 from modDatabase import db
@@ -33,6 +34,26 @@ class clsQueryAsyncView(Resource):
     """
     See header
     """
+    # one bounded pool for every async query of the process, see get_executor()
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls) -> clsBoundedExecutor:
+        """
+        Returns the process-wide async query pool, created on first use from modConfig
+        :return: clsBoundedExecutor
+        """
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    cls._executor = clsBoundedExecutor(
+                        name="query_async",
+                        max_workers=modConfig.asyncQueryMaxWorkers,
+                        max_queue_size=modConfig.asyncQueryMaxQueueSize,
+                        min_retry_after_seconds=modConfig.asyncQueryRetryAfterSeconds
+                    )
+        return cls._executor
 
     @namespace.doc(body=post_body)
     def post(self):
@@ -46,27 +67,39 @@ class clsQueryAsyncView(Resource):
         * Checks knowledge provider response body is valid
         * Generates results
         * Returns entire query view model back to client
+        * Returns 503 with a Retry-After header when the async query queue is full
         :return: Query view model
         """
 
-        uuid = str(uuid_module.uuid4())
+        # a place in the queue is reserved before the query is validated and its uuid is stored
+        executor = self.get_executor()
+        if not executor.admit():
+            retry_after_seconds = executor.retry_after_seconds()
+            return {"message": f"Too many queries in progress, retry after {retry_after_seconds} seconds"}, 503, {"Retry-After": str(retry_after_seconds)}
+
+        asyncResult = None
+        try:
+            uuid = str(uuid_module.uuid4())
+
+            queryManager = clsQueryManager(app=current_app._get_current_object(), uuid=uuid)
+            queryManager.processing_timeout = 1 * 60 * 60  # 1 hour
 
-        queryManager = clsQueryManager(app=current_app._get_current_object(), uuid=uuid)
-        queryManager.processing_timeout = 1 * 60 * 60  # 1 hour
+            preStepResults = querySyncPreSteps(queryManager=queryManager)
+            if not isinstance(preStepResults, clsQueryManager):
+                return preStepResults
 
-        preStepResults = querySyncPreSteps(queryManager=queryManager)
-        if not isinstance(preStepResults, clsQueryManager):
-            return preStepResults
+            queryManager = preStepResults
 
-        queryManager = preStepResults
+            queryManager.insertUuidIntoDatabaseIfApplicable()
 
-        queryManager.insertUuidIntoDatabaseIfApplicable()
+            asyncResult = executor.submit(querySync, queryManager=queryManager)
+        finally:
+            if asyncResult is None:
+                executor.release()
 
-        pool = ThreadPool(processes=1)
-        asyncResult = pool.apply_async(func=querySync, kwds={"queryManager": queryManager})
         try:
-            result = asyncResult.get(timeout=queryManager.async_timeout)
-        except multiprocessing.TimeoutError:
+            result = asyncResult.result(timeout=queryManager.async_timeout)
+        except concurrent.futures.TimeoutError:
             return queryManager.userResponseBodyPendingAsync, 201
 
         return result
@@ -0,0 +1,167 @@
+import logging
+import unittest
+from unittest.mock import patch
+import threading
+import time
+import tracemalloc
+import modConfig
+from modApp import appFactory
+from ... import version
+from ...queries.clsQueryManager import clsQueryManager
+from ..clsQueryAsyncView import clsQueryAsyncView
+from utils.multithreading.clsBoundedExecutor import clsBoundedExecutor
+
+
+class test_clsQueryAsyncView(unittest.TestCase):
+    """
+    The query pipeline is mocked, only the async scheduling of the view is exercised
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = appFactory()
+
+    def setUp(self):
+        self.should_wait = False
+        self.pipeline_seconds = 0.0
+        self.pipeline_gate = None
+
+        def pre_steps(queryManager):
+            queryManager.userRequestBody = {"message": {"query_graph": {"nodes": {}, "edges": {}}}}
+            queryManager.async_timeout = 5 if self.should_wait else 0
+            return queryManager
+
+        def pipeline(queryManager):
+            if self.pipeline_gate is not None:
+                self.pipeline_gate.wait()
+            time.sleep(self.pipeline_seconds)
+            return {"status": "Success", "results_url": queryManager.resultsUrl}, 200
+
+        # plain functions rather than mocks, which would keep every query manager alive in their call history
+        self.patches = [
+            patch("apis.v1_3.views.clsQueryAsyncView.querySyncPreSteps", new=pre_steps),
+            patch("apis.v1_3.views.clsQueryAsyncView.querySync", new=pipeline),
+            patch.object(clsQueryManager, "insertUuidIntoDatabaseIfApplicable", new=lambda queryManager: None),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patches:
+            patcher.stop()
+        if self.pipeline_gate is not None:
+            self.pipeline_gate.set()
+        if clsQueryAsyncView._executor is not None:
+            clsQueryAsyncView._executor.shutdown()
+            clsQueryAsyncView._executor = None
+
+    def post(self, client=None):
+        client = client or self.app.test_client()
+        return client.post(f"/{version}/query_async/", json={"message": {}}, follow_redirects=True)
+
+    def test_should_wait_returns_the_result(self):
+        clsQueryAsyncView._executor = clsBoundedExecutor("query_async", max_workers=2, max_queue_size=2)
+        self.should_wait = True
+        response = self.post()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("Success", response.json["status"])
+
+    def test_full_queue_returns_503_with_retry_after(self):
+        executor = clsQueryAsyncView._executor = clsBoundedExecutor("query_async", max_workers=1, max_queue_size=1, min_retry_after_seconds=7)
+        self.pipeline_gate = threading.Event()
+
+        self.assertEqual(201, self.post().status_code)
+        self.assertEqual(201, self.post().status_code)
+        response = self.post()
+        self.assertEqual(503, response.status_code)
+        self.assertEqual("7", response.headers["Retry-After"])
+
+        self.pipeline_gate.set()
+        executor.shutdown()
+        metrics = executor.metrics()
+        self.assertEqual(2, metrics["completed"])
+        self.assertEqual(1, metrics["rejected"])
+        self.assertEqual(0, metrics["queued"])
+        # the second query waited for the first one to be released
+        self.assertGreater(metrics["max_wait_seconds"], 0)
+
+    def test_invalid_query_gives_back_its_admission(self):
+        executor = clsQueryAsyncView._executor = clsBoundedExecutor("query_async", max_workers=1, max_queue_size=0)
+        with patch("apis.v1_3.views.clsQueryAsyncView.querySyncPreSteps", return_value=({"message": "bad request"}, 400)):
+            for _ in range(3):
+                self.assertEqual(400, self.post().status_code)
+        self.assertEqual(0, executor.metrics()["rejected"])
+        self.assertIn(self.post().status_code, (200, 201))
+
+    def load_async_posts(self, client_count: int, posts_per_client: int) -> dict:
+        """
+        Async POSTs from client_count clients on a pool of 4 workers and a queue of 64
+        :return: Dictionary of the status codes, thread counts, traced memory and executor metrics of the load
+        """
+        executor = clsQueryAsyncView._executor = clsBoundedExecutor("query_async", max_workers=4, max_queue_size=64)
+        self.pipeline_seconds = 0.002
+        status_codes = []
+        thread_counts = []
+        memory_after_warm_up = []
+        lock = threading.Lock()
+
+        def client_worker(client_index):
+            client = self.app.test_client()
+            for i in range(posts_per_client):
+                status_code = self.post(client).status_code
+                with lock:
+                    status_codes.append(status_code)
+                    thread_counts.append(threading.active_count())
+                    if len(status_codes) == client_count * posts_per_client // 5:
+                        memory_after_warm_up.append(tracemalloc.get_traced_memory()[0])
+
+        threads_before = threading.active_count()
+        tracemalloc.start()
+        clients = [threading.Thread(target=client_worker, args=(i,)) for i in range(client_count)]
+        start = time.time()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        executor.shutdown()
+        seconds = time.time() - start
+        memory_at_end = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        return {"status_codes": status_codes, "threads_before": threads_before, "thread_counts": thread_counts, "seconds": seconds,
+                "memory_after_warm_up": memory_after_warm_up[0], "memory_at_end": memory_at_end, "max_workers": executor.max_workers,
+                "metrics": executor.metrics()}
+
+    def assert_bounded(self, load: dict, client_count: int, posts_per_client: int):
+        status_codes, metrics = load["status_codes"], load["metrics"]
+        self.assertEqual(client_count * posts_per_client, len(status_codes))
+        # 200 when the query finished before the (zero) async timeout
+        self.assertEqual(set(), set(status_codes) - {200, 201, 503})
+        self.assertEqual(len(status_codes) - status_codes.count(503), metrics["completed"])
+        self.assertEqual(status_codes.count(503), metrics["rejected"])
+        self.assertLessEqual(max(load["thread_counts"]), load["threads_before"] + client_count + load["max_workers"])
+
+    def test_async_posts_threads_are_bounded(self):
+        """
+        The number of threads stays bounded by the pool size. Previously every POST left a ThreadPool (a worker and 3 handler threads) behind.
+        """
+        load = self.load_async_posts(client_count=4, posts_per_client=25)
+        self.assert_bounded(load, client_count=4, posts_per_client=25)
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_load_1000_async_posts(self):
+        """
+        1000 async POSTs from 8 clients: the number of threads stays bounded by the pool size and memory doesn't grow with the number of requests.
+        """
+        load = self.load_async_posts(client_count=8, posts_per_client=125)
+        status_codes, metrics = load["status_codes"], load["metrics"]
+        logging.info(f"1000 async POSTs in {load['seconds']:.1f} s: {len(status_codes) - status_codes.count(503)} accepted, "
+                     f"{status_codes.count(503)} rejected, threads {load['threads_before']} before / {max(load['thread_counts'])} max, "
+                     f"traced memory {load['memory_after_warm_up'] / 2 ** 20:.1f} MiB after 200 POSTs / {load['memory_at_end'] / 2 ** 20:.1f} MiB "
+                     f"after 1000, queue wait average {metrics['average_wait_seconds'] * 1000:.1f} ms, max {metrics['max_wait_seconds'] * 1000:.1f} ms")
+
+        self.assert_bounded(load, client_count=8, posts_per_client=125)
+        self.assertLess(load["memory_at_end"] - load["memory_after_warm_up"], 2 ** 20 / 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -29,6 +29,9 @@ class test_clsQueryView(unittest.TestCase):
     def setUp(self):
         unstub()
         when(db).create_scoped_session().thenReturn(MagicMock())  # mocked session
+        # the lookups are cached across queries, every test mocks its own
+        clsCurieIdsProvider.cache.clear()
+        clsCategoriesProvider.cache.clear()
 
     def tearDown(self):
         unstub()
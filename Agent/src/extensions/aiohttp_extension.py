@@ -0,0 +1,192 @@
+"""
+WHAT: An asyncio/aiohttp fan-out engine for knowledge provider requests. One event loop thread sends every KP request of the process, with a
+      concurrency limit per knowledge provider and deadlines shared with the query's cancellation token.
+WHY: A KP request sent with requests occupies an OS thread for as long as the KP takes to answer, so the number of KP requests in flight was capped
+     by the size of the dispatch thread pools. On the event loop a request waiting on the network costs a coroutine instead of a thread, callers
+     that have many requests submit() them all at once, and the thread-based clsNode tree uses the request() sync bridge.
+ASSUMES: aiohttp is installed. Responses mimic requests.Response (status_code, content, json(), raise_for_status(), elapsed) and errors are raised as
+         requests exceptions, so clsKnowledgeProvider handles both transports the same way.
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-24
+"""
+
+from concurrent.futures import wait, FIRST_COMPLETED
+from datetime import timedelta
+from time import monotonic
+import asyncio
+import json
+import threading
+import time
+import aiohttp
+import requests
+import modConfig
+from utils.multithreading.clsCancellationToken import clsCancellationToken, clsOperationCancelled
+
+# seconds a request may take when it has no deadline, same as requests_extension.defaultReadTimeoutSeconds
+defaultTimeoutSeconds = 5 * 60
+
+
+class clsAsyncHttpResponse:
+    """
+    The parts of requests.Response used by the knowledge provider classes
+    """
+
+    def __init__(self, url: str, status_code: int, reason: str, headers: dict, content: bytes, elapsed: timedelta):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.elapsed = elapsed
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error: {self.reason} for url: {self.url}", response=self)
+
+
+class clsKpFanout:
+    """
+    See header
+    """
+
+    def __init__(self, max_per_key: int = None, max_connections: int = None, connect_timeout_seconds: float = None):
+        """
+        Constructor, the event loop thread is started on first use
+        :param max_per_key: Requests in flight per knowledge provider. Defaults to modConfig.kpFanoutMaxPerKp
+        :param max_connections: Open connections across all knowledge providers. Defaults to modConfig.kpFanoutMaxConnections
+        :param connect_timeout_seconds: Defaults to modConfig.httpConnectTimeoutSeconds
+        """
+        self.max_per_key = max_per_key or modConfig.kpFanoutMaxPerKp
+        self.max_connections = max_connections or modConfig.kpFanoutMaxConnections
+        self.connect_timeout_seconds = connect_timeout_seconds or modConfig.httpConnectTimeoutSeconds
+
+        self.loop = None
+        self.thread = None
+        self.session = None
+        self.lock = threading.Lock()
+        # key -> asyncio.Semaphore, only used on the loop thread
+        self.semaphores = {}
+
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def start(self):
+        """
+        Starts the event loop thread and its aiohttp session if they aren't running
+        :return: None
+        """
+        with self.lock:
+            if self.loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                started.set()
+                loop.run_forever()
+
+            self.thread = threading.Thread(target=run, name="kp_fanout", daemon=True)
+            self.thread.start()
+            started.wait()
+            self.session = asyncio.run_coroutine_threadsafe(self._create_session(), loop).result()
+            self.loop = loop
+
+    async def _create_session(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=0)
+        return aiohttp.ClientSession(connector=connector)
+
+    async def _send(self, method: str, url: str, semaphore: asyncio.Semaphore, kwargs: dict) -> clsAsyncHttpResponse:
+        async with semaphore:
+            started = monotonic()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout_seconds)
+                async with self.session.request(method, url, timeout=timeout, **kwargs) as response:
+                    content = await response.read()
+                    return clsAsyncHttpResponse(
+                        url=url,
+                        status_code=response.status,
+                        reason=response.reason,
+                        headers=dict(response.headers),
+                        content=content,
+                        elapsed=timedelta(seconds=monotonic() - started)
+                    )
+            finally:
+                self.in_flight -= 1
+
+    async def _request(self, method: str, url: str, key: str, deadline: float, kwargs: dict) -> clsAsyncHttpResponse:
+        semaphore = self.semaphores.get(key)
+        if semaphore is None:
+            semaphore = self.semaphores[key] = asyncio.Semaphore(self.max_per_key)
+
+        timeout_seconds = defaultTimeoutSeconds if deadline is None else deadline - time.time()
+        if timeout_seconds <= 0:
+            raise requests.exceptions.Timeout(f"Deadline passed before the request to {url} was sent")
+
+        try:
+            # the deadline covers the wait for a free slot of this knowledge provider as well as the request
+            return await asyncio.wait_for(self._send(method, url, semaphore, kwargs), timeout=timeout_seconds)
+        except asyncio.TimeoutError as e:
+            raise requests.exceptions.Timeout(f"Request to {url} did not complete within {timeout_seconds:.1f} seconds") from e
+        except aiohttp.ClientConnectionError as e:
+            raise requests.exceptions.ConnectionError(f"Request to {url} failed: {e}") from e
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.RequestException(f"Request to {url} failed: {e}") from e
+
+    def submit(self, method: str, url: str, key: str = None, deadline: float = None, **kwargs):
+        """
+        Schedules a request on the event loop without blocking
+        :param method: HTTP method
+        :param url: Url to request
+        :param key: Concurrency key, e.g. the knowledge provider name. Defaults to the url.
+        :param deadline: Optional time in epoch seconds by which the response body must be read
+        :param kwargs: Any other aiohttp request argument, e.g. json
+        :return: concurrent.futures.Future of a clsAsyncHttpResponse
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._request(method, url, key or url, deadline, kwargs), self.loop)
+
+    def request(self, method: str, url: str, key: str = None, cancellation_token: clsCancellationToken = None, **kwargs) -> clsAsyncHttpResponse:
+        """
+        Sync bridge: sends a request on the event loop and blocks the calling thread until it is answered, fails, or the token is cancelled.
+        The token's deadline is the request's deadline.
+        :param method: HTTP method
+        :param url: Url to request
+        :param key: Concurrency key, e.g. the knowledge provider name. Defaults to the url.
+        :param cancellation_token: Optional token of the calling element
+        :param kwargs: Any other aiohttp request argument, e.g. json
+        :return: clsAsyncHttpResponse
+        :raises: requests exceptions, clsOperationCancelled
+        """
+        deadline = cancellation_token.deadline if cancellation_token is not None else None
+        future = self.submit(method, url, key=key, deadline=deadline, **kwargs)
+        if cancellation_token is not None:
+            wait([future, cancellation_token.future], return_when=FIRST_COMPLETED)
+            if not future.done() and cancellation_token.cancelled:
+                future.cancel()
+                raise clsOperationCancelled(cancellation_token.reason)
+        return future.result()
+
+    def close(self):
+        """
+        Closes the session and stops the event loop thread
+        :return: None
+        """
+        with self.lock:
+            if self.loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = None
+            self.session = None
+            self.semaphores = {}
+
+
+kp_fanout = clsKpFanout()
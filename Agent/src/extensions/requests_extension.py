@@ -1,32 +1,169 @@
+"""
+WHAT: Pooled HTTP sessions, one per host, and a request function with an overall deadline
+WHY: Every knowledge provider request used to open a new TCP/TLS connection, and requests with a global timeout forked a process to enforce it.
+     Reusing one pooled session per host keeps connections alive between requests, and the deadline is now enforced in the calling thread
+     with connect/read timeouts, and by a watchdog timer that closes the connection if the body is still being read at the deadline.
+ASSUMES: requests.Session is shared between threads for plain requests only (no per-thread cookies or auth changes)
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-10, body watchdog TZ 2023-04-02
+"""
+
 import requests
-from multiprocessing import Process, Manager
-import logging
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from time import monotonic
+import threading
+import socket
 import modConfig
 
+# read timeout used when the caller has no global timeout
+defaultReadTimeoutSeconds = 5 * 60
+
+# body chunk size, a chunk can take any time to fill so the deadline is enforced by the watchdog, not between chunks
+streamChunkSize = 64 * 1024
+
+
+class clsHttpSessionPool:
+    """
+    Keeps one requests.Session per scheme and host, each with its own connection pool
+    """
+
+    def __init__(self, pool_connections: int = None, pool_maxsize: int = None):
+        """
+        Constructor
+        :param pool_connections: Number of connection pools to cache per session. Defaults to modConfig.httpPoolConnections
+        :param pool_maxsize: Maximum number of connections kept alive per host. Defaults to modConfig.httpPoolMaxSize
+        """
+        self.pool_connections = pool_connections or modConfig.httpPoolConnections
+        self.pool_maxsize = pool_maxsize or modConfig.httpPoolMaxSize
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create_session(self) -> requests.Session:
+        """
+        Creates a session with a pooled adapter for both protocols
+        :return: requests.Session
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get_session(self, url: str) -> requests.Session:
+        """
+        Returns the session of the url's host, creating it on first use
+        :param url: Any url on the host
+        :return: requests.Session
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme.lower(), parts.netloc.lower())
+        session = self.sessions.get(key)
+        if session is None:
+            with self.lock:
+                session = self.sessions.get(key)
+                if session is None:
+                    session = self.create_session()
+                    self.sessions[key] = session
+        return session
+
+    def close(self):
+        """
+        Closes every session and its pooled connections
+        :return: None
+        """
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+
+session_pool = clsHttpSessionPool()
+
 
-def _request_runner(method, url, response_proxy, **kwargs):
-    logging.basicConfig(level=modConfig.defaultLoggingLevel)
-    response_proxy['response'] = requests.request(method, url, **kwargs)
+def _close_connection(response: requests.Response, closed: threading.Event):
+    """
+    Closes the connection of a response from another thread. Shutting the socket down first wakes a read blocked on it, which closing the response
+    alone does not do.
+    :param response: Response requested with stream=True
+    :param closed: Set before closing, so the reading thread can tell a closed connection from a complete body
+    :return: None
+    """
+    closed.set()
+    connection = getattr(response.raw, "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # already closed by the server or by the reading thread
+            pass
+    response.close()
+
+
+def _read_before_deadline(response: requests.Response, deadline: float, global_timeout: float):
+    """
+    Streams the response body, giving up once the deadline passes. A watchdog timer closes the connection at the deadline, so a slow server trickling
+    data, which never trips the read timeout, cannot hold the request open past the global timeout.
+    :param response: Response requested with stream=True
+    :param deadline: monotonic() time the body must be read by
+    :param global_timeout: Original global timeout, for the error message
+    :return: None, the body is stored on the response like a non streamed request
+    :raises: requests.exceptions.Timeout
+    """
+    closed = threading.Event()
+    watchdog = threading.Timer(max(deadline - monotonic(), 0), _close_connection, args=(response, closed))
+    watchdog.daemon = True
+    watchdog.start()
+    chunks = []
+    try:
+        for chunk in response.iter_content(chunk_size=streamChunkSize):
+            chunks.append(chunk)
+    except requests.exceptions.RequestException as e:
+        response.close()
+        # a read timeout, or the watchdog closing the connection, is reported as a connection or chunked encoding error by requests
+        if closed.is_set() or monotonic() >= deadline:
+            raise requests.exceptions.Timeout(f"Response body of {response.url} was not read within {global_timeout} seconds", response=response) from e
+        raise
+    finally:
+        watchdog.cancel()
+
+    if closed.is_set():
+        # without a length check the closed connection can also end the body early instead of failing the read
+        raise requests.exceptions.Timeout(f"Response body of {response.url} was not read within {global_timeout} seconds", response=response)
+
+    # reading the body to the end already released the connection back to the pool
+    response._content = b"".join(chunks)
+    response._content_consumed = True
 
 
 def request_with_global_timeout(method, url, global_timeout, **kwargs):
+    """
+    Sends a request through the pooled session of the url's host
+    :param method: HTTP method
+    :param url: Url to request
+    :param global_timeout: Seconds the whole request may take. Connecting and each read of the headers are bounded by it, and the body must be read
+                           before it passes. None or 0 only applies the default read timeout.
+    :param kwargs: Any other requests.request() argument
+    :return: requests.Response with its body already read
+    :raises: requests.exceptions.Timeout
+    """
+    session = session_pool.get_session(url)
+    connect_timeout = modConfig.httpConnectTimeoutSeconds
+
     if global_timeout is None or global_timeout == 0:
-        return requests.request(method, url, timeout=5*60, **kwargs)
-        # return requests.request(method, url, timeout=3, **kwargs)
-    manager = Manager()
-    response_proxy = manager.dict()
-    process = Process(
-        target=_request_runner,
-        args=(method, url, response_proxy),
-        kwargs=kwargs
-    )
-    process.start()
-    process.join(global_timeout)
-    if process.is_alive():
-        process.terminate()
-        process.join()
-        raise requests.exceptions.Timeout
-    return response_proxy['response']
+        return session.request(method, url, timeout=(connect_timeout, defaultReadTimeoutSeconds), **kwargs)
+
+    deadline = monotonic() + global_timeout
+    response = session.request(method, url, timeout=(min(connect_timeout, global_timeout), global_timeout), stream=True, **kwargs)
+
+    remaining = deadline - monotonic()
+    if remaining <= 0:
+        response.close()
+        raise requests.exceptions.Timeout(f"Request to {url} did not respond within {global_timeout} seconds", response=response)
+
+    _read_before_deadline(response, deadline, global_timeout)
+    return response
 
 
 if __name__ == '__main__':
@@ -37,5 +174,3 @@ if __name__ == '__main__':
         global_timeout=5,
         params={"string": "Aspirin", "offset": 0, "limit": 1}
     )
-
-
@@ -0,0 +1,163 @@
+import unittest
+import asyncio
+import logging
+import socket
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+from aiohttp import web
+import requests
+import modConfig
+from ..aiohttp_extension import clsKpFanout
+from utils.multithreading.clsCancellationToken import clsCancellationToken, clsOperationCancelled
+
+
+class _StubKnowledgeProvider:
+    """
+    aiohttp server on a random local port, on its own event loop thread. Every handler sleeps before answering and the server records how many
+    requests of each knowledge provider were handled concurrently.
+    """
+
+    def __init__(self, delay_seconds: float):
+        self.delay_seconds = delay_seconds
+        self.concurrent = defaultdict(int)
+        self.max_concurrent = defaultdict(int)
+        self.handled = 0
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.runner = asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post("/{kp}/query", self.query)
+        app.router.add_get("/error", self.error)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", self.port, backlog=1024).start()
+        return runner
+
+    async def query(self, request):
+        kp = request.match_info["kp"]
+        self.concurrent[kp] += 1
+        self.max_concurrent[kp] = max(self.max_concurrent[kp], self.concurrent[kp])
+        try:
+            body = await request.json()
+            await asyncio.sleep(self.delay_seconds)
+            self.handled += 1
+            return web.json_response({"message": body["message"], "kp": kp})
+        finally:
+            self.concurrent[kp] -= 1
+
+    async def error(self, request):
+        return web.Response(status=503, text="unavailable")
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class test_aiohttp_extension(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _StubKnowledgeProvider(delay_seconds=0.5)
+        self.fanout = clsKpFanout(max_per_key=100, max_connections=1000)
+
+    def tearDown(self):
+        self.fanout.close()
+        self.server.close()
+
+    def test_response_mimics_requests(self):
+        response = self.fanout.request("post", self.server.url("/kp0/query"), json={"message": {"id": 1}})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({"message": {"id": 1}, "kp": "kp0"}, response.json())
+        self.assertGreaterEqual(response.elapsed.total_seconds(), 0.5)
+
+        response = self.fanout.request("get", self.server.url("/error"))
+        with self.assertRaises(requests.exceptions.HTTPError):
+            response.raise_for_status()
+
+    def test_300_concurrent_requests_on_one_thread(self):
+        """
+        300 requests to 3 knowledge providers answering in 0.5 seconds each. On threads this took 300 threads or 300 / pool size rounds,
+        on the event loop they are all in flight at once from one extra thread.
+        """
+        threads_before = threading.active_count()
+        futures = [self.fanout.submit("post", self.server.url(f"/kp{i % 3}/query"), key=f"kp{i % 3}", json={"message": {"id": i}})
+                   for i in range(300)]
+        thread_count = threading.active_count()
+        responses = [future.result() for future in futures]
+
+        self.assertEqual(list(range(300)), [response.json()["message"]["id"] for response in responses])
+        self.assertEqual(300, self.fanout.max_in_flight)
+        self.assertLessEqual(thread_count - threads_before, 1)
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_fanout(self):
+        """
+        Compares sending the requests with requests from the query dispatch pool (previous behavior) against the event loop
+        """
+        request_count = 60
+
+        def post(i):
+            return requests.post(self.server.url(f"/kp{i % 3}/query"), json={"message": {"id": i}})
+
+        start = timer()
+        with ThreadPoolExecutor(max_workers=modConfig.queryDispatchPoolSize) as executor:
+            list(executor.map(post, range(request_count)))
+        before_seconds = timer() - start
+
+        start = timer()
+        futures = [self.fanout.submit("post", self.server.url(f"/kp{i % 3}/query"), key=f"kp{i % 3}", json={"message": {"id": i}})
+                   for i in range(request_count)]
+        for future in futures:
+            future.result()
+        after_seconds = timer() - start
+
+        logging.info(f"{request_count} KP requests: before {before_seconds:.2f} s ({modConfig.queryDispatchPoolSize} threads), "
+                     f"after {after_seconds:.2f} s ({self.fanout.max_in_flight} in flight)")
+        self.assertLess(after_seconds, before_seconds)
+
+    def test_per_kp_limit(self):
+        self.fanout = clsKpFanout(max_per_key=4, max_connections=1000)
+        futures = [self.fanout.submit("post", self.server.url(f"/{kp}/query"), key=kp, json={"message": {}})
+                   for kp in ("slow_kp", "other_kp") for _ in range(12)]
+        for future in futures:
+            future.result()
+        # the limit of one knowledge provider doesn't hold back the others
+        self.assertEqual({"slow_kp": 4, "other_kp": 4}, dict(self.server.max_concurrent))
+
+    def test_deadline_raises_timeout(self):
+        token = clsCancellationToken(deadline=time.time() + 0.2)
+        start = time.time()
+        with self.assertRaises((requests.exceptions.Timeout, clsOperationCancelled)):
+            self.fanout.request("post", self.server.url("/kp0/query"), cancellation_token=token, json={"message": {}})
+        self.assertLess(time.time() - start, 0.45)
+
+        future = self.fanout.submit("post", self.server.url("/kp0/query"), deadline=time.time() + 0.2, json={"message": {}})
+        with self.assertRaises(requests.exceptions.Timeout):
+            future.result()
+
+    def test_cancellation_releases_the_waiting_thread(self):
+        token = clsCancellationToken()
+        threading.Timer(0.1, token.cancel, kwargs={"reason": "user abort"}).start()
+        start = time.time()
+        with self.assertRaises(clsOperationCancelled):
+            self.fanout.request("post", self.server.url("/kp0/query"), cancellation_token=token, json={"message": {}})
+        self.assertLess(time.time() - start, 0.45)
+
+
+if __name__ == '__main__':
+    unittest.main()
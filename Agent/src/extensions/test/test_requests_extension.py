@@ -1,26 +1,120 @@
+import json
+import logging
+import threading
+import time
+from time import monotonic
 import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from timeit import default_timer as timer
 import requests_mock
 import requests
-from ..requests_extension import request_with_global_timeout
+import modConfig
+from ..requests_extension import request_with_global_timeout, clsHttpSessionPool
+from .. import requests_extension
+
+
+class _StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        # every client (host, port) that opened a connection
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # clients hanging up on /slow and /drip are expected
+        pass
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """
+    Local knowledge provider stand in. /fast answers at once, /slow waits before the headers, /drip trickles the body and /trickle trickles a body larger
+    than the stream chunk size.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections.add(self.client_address)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_body(self, body: bytes, delay_between_chunks: float = 0):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not delay_between_chunks:
+            self.wfile.write(body)
+            return
+        for i in range(0, len(body), 4):
+            time.sleep(delay_between_chunks)
+            self.wfile.write(body[i:i + 4])
+            self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.do_GET()
+
+    def do_GET(self):
+        body = json.dumps({"message": {"path": self.path}}).encode()
+        if self.path.startswith("/trickle"):
+            body = json.dumps({"message": {"path": self.path, "padding": "x" * 4 * requests_extension.streamChunkSize}}).encode()
+        if self.path.startswith("/slow"):
+            time.sleep(1)
+        if self.path.startswith("/drip"):
+            self._send_body(body, delay_between_chunks=0.1)
+        elif self.path.startswith("/trickle"):
+            self._send_body(body, delay_between_chunks=0.01)
+        else:
+            self._send_body(body)
 
 
 class test_requests_extension(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _StubServer()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        requests_extension.session_pool.close()
+        with self.server.lock:
+            self.server.connections.clear()
+
     def test_request_with_global_timeout_raises_timeout(self):
+        with self.assertRaises(requests.exceptions.Timeout):
+            request_with_global_timeout("POST", f"{self.url}/slow", global_timeout=0.2, json={})
 
-        with requests_mock.Mocker() as mocker:
-            mocker.register_uri('POST', "http://www.fakewebsite.com/some_endpoint", status_code=418)  # some crash
-            with self.assertRaises(requests.exceptions.Timeout):
-                response = request_with_global_timeout("POST", "http://www.fakewebsite.com/some_endpoint", global_timeout=0.001)
-
-    # todo, how to register Mocker() for inside multiprocessing.Process()
-    # def test_request_with_global_timeout_does_not_raise_timeout(self):
-    #
-    #     with requests_mock.Mocker() as mocker:
-    #         mocker.register_uri('POST', "http://www.fakewebsite.com/some_endpoint", status_code=418)  # some crash
-    #         response = request_with_global_timeout("POST", "http://www.fakewebsite.com/some_endpoint", global_timeout=10)
-    #         with self.assertRaises(requests.exceptions.HTTPError):
-    #             response.raise_for_status()
+    def test_request_with_global_timeout_raises_timeout_on_slow_body(self):
+        # every read returns within the read timeout, only the overall deadline catches the trickle
+        with self.assertRaises(requests.exceptions.Timeout):
+            request_with_global_timeout("GET", f"{self.url}/drip", global_timeout=0.5)
+
+    def test_request_with_global_timeout_raises_timeout_within_a_chunk(self):
+        # no stream chunk fills before the deadline, the watchdog has to end the read
+        start = monotonic()
+        with self.assertRaises(requests.exceptions.Timeout):
+            request_with_global_timeout("GET", f"{self.url}/trickle", global_timeout=0.5)
+        self.assertLess(monotonic() - start, 2)
+
+    def test_request_with_global_timeout_does_not_raise_timeout(self):
+        response = request_with_global_timeout("POST", f"{self.url}/drip", global_timeout=10, json={})
+        response.raise_for_status()
+        self.assertEqual({"message": {"path": "/drip"}}, response.json())
 
     def test_request_with_global_timeout_does_not_raise_timeout_with_no_global_timeout(self):
 
@@ -30,6 +124,43 @@ class test_requests_extension(unittest.TestCase):
             with self.assertRaises(requests.exceptions.HTTPError):
                 response.raise_for_status()
 
+    def test_sessions_are_per_host(self):
+        pool = clsHttpSessionPool(pool_connections=1, pool_maxsize=2)
+        self.assertIs(pool.get_session("https://a.org/query"), pool.get_session("https://A.org/other"))
+        self.assertIsNot(pool.get_session("https://a.org/query"), pool.get_session("https://b.org/query"))
+        pool.close()
+
+    def test_connections_are_reused(self):
+        for global_timeout in (None, 5):
+            for _ in range(10):
+                request_with_global_timeout("POST", f"{self.url}/fast", global_timeout=global_timeout, json={}).raise_for_status()
+        self.assertEqual(1, len(self.server.connections), "Expected every request to reuse the pooled connection")
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_pooled_latency(self):
+        """
+        Compares the latency of a new connection per request (previous behavior) against the pooled session
+        """
+        request_count = 50
+
+        start = timer()
+        for _ in range(request_count):
+            requests.request("POST", f"{self.url}/fast", json={}).raise_for_status()
+        before_seconds = (timer() - start) / request_count
+        unpooled_connections = len(self.server.connections)
+
+        with self.server.lock:
+            self.server.connections.clear()
+        start = timer()
+        for _ in range(request_count):
+            request_with_global_timeout("POST", f"{self.url}/fast", global_timeout=5, json={}).raise_for_status()
+        after_seconds = (timer() - start) / request_count
+
+        logging.info(f"Stub KP latency: before {before_seconds * 1000:.2f} ms ({unpooled_connections} connections), "
+                     f"after {after_seconds * 1000:.2f} ms ({len(self.server.connections)} connections)")
+        self.assertEqual(request_count, unpooled_connections)
+        self.assertEqual(1, len(self.server.connections))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -14,6 +14,8 @@ from flask_compress import Compress
 from modDatabase import db
 from werkzeug.middleware.proxy_fix import ProxyFix
 from apis.v1_3 import blueprint as blueprint_v1_3
+from apis.v1_3.queries.clsLocalSimilarityStore import clsLocalSimilarityStore
+from apis.v1_3.queries.clsExplanationRegistry import clsExplanationRegistry
 import traceback
 
 
@@ -87,6 +89,12 @@ if __name__ == '__main__':
     rootLogger.setLevel(modConfig.defaultLoggingLevel)
     multiprocessing_logging.install_mp_handler()
 
+    # load the local similarity tables, the encoded case problems, the explanation catalog and the explanation handlers once, shared by every query thread
+    localSimilarityStore = clsLocalSimilarityStore.initialize(app)
+    localSimilarityStore.get_case_problem_matrix()
+    localSimilarityStore.get_explanation_catalog()
+    clsExplanationRegistry.instance()
+
     # https://docs.pylonsproject.org/projects/waitress/en/stable/arguments.html
     # waitress is lightweight and cross platform
     # performance is not as fast as uwsgi or gunicorn, but still "very acceptable"
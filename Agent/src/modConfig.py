@@ -58,14 +58,86 @@ externalApiProtocol = resolveDefaultValue(value=os.getenv("EXTERNAL_API_PROTOCOL
 
 bert_checkpoints_folder = "/media/storage/biobert/re_outputs" if isDocker else "/media/engineer1/Data/virtualbox_share/Work_In_Progress/xARA/Transfer_In/biobert/biobert/re_outputs/"
 
+# sentences from concurrent queries are micro-batched into one BioBERT forward pass, see utils/biobert/relationship_classification.py
+biobertMaxBatchSize = int(resolveDefaultValue(value=os.getenv("BIOBERT_MAX_BATCH_SIZE"), default=32))
+biobertMaxBatchWaitSeconds = float(resolveDefaultValue(value=os.getenv("BIOBERT_MAX_BATCH_WAIT_SECONDS"), default=0.01))
+
+# bit-packed AES feature matrices scored in process, see apis/v1_3/queries/clsAesScoringEngine.py. The folder is empty until the AES data is exported
+aesDataFolder = resolveDefaultValue(value=os.getenv("AES_DATA_FOLDER"), default="/media/storage/aes" if isDocker else "../../AES/data")
+# queries without local AES data are sent to the remote AES service unless this is FALSE
+aesRemoteEnabled = resolveDefaultValue(value=os.getenv("AES_REMOTE_ENABLED"), default="TRUE").upper() == "TRUE"
+
+# SRI node normalization and name resolution lookups are cached per CURIE, see utils/clsTtlCache.py. The SQLite file is optional.
+sriCacheTtlSeconds = int(resolveDefaultValue(value=os.getenv("SRI_CACHE_TTL_SECONDS"), default=24 * 60 * 60))
+sriCacheMaxSize = int(resolveDefaultValue(value=os.getenv("SRI_CACHE_MAX_SIZE"), default=100000))
+sriCacheSqlitePath = resolveDefaultValue(value=os.getenv("SRI_CACHE_SQLITE_PATH"), default=None)
+# names are looked up one request each, this many at a time
+sriLookupMaxWorkers = int(resolveDefaultValue(value=os.getenv("SRI_LOOKUP_MAX_WORKERS"), default=8))
+
+# NGD values are cached per unordered pair of MeSH terms, including pairs ARAX has no value for, see clsMeshNormalizedGoogleDistanceProvider
+ngdCacheTtlSeconds = int(resolveDefaultValue(value=os.getenv("NGD_CACHE_TTL_SECONDS"), default=7 * 24 * 60 * 60))
+ngdCacheMaxSize = int(resolveDefaultValue(value=os.getenv("NGD_CACHE_MAX_SIZE"), default=100000))
+ngdCacheSqlitePath = resolveDefaultValue(value=os.getenv("NGD_CACHE_SQLITE_PATH"), default=sriCacheSqlitePath)
+# synonym pairs missing from the cache are probed this many at a time per process, for at most this many seconds per query
+ngdProbeMaxWorkers = int(resolveDefaultValue(value=os.getenv("NGD_PROBE_MAX_WORKERS"), default=8))
+ngdProbeTimeoutSeconds = float(resolveDefaultValue(value=os.getenv("NGD_PROBE_TIMEOUT_SECONDS"), default=60))
+# MeSH term frequency and co-occurrence tables built by the xARA-ETL clsMeshNgdJob, NGD of known terms is computed in process, see clsMeshNgdEngine
+ngdDataPath = resolveDefaultValue(value=os.getenv("NGD_DATA_PATH"), default="/media/storage/mesh_ngd/MeshNgd.sqlite" if isDocker else "../../xARA-ETL/mnt/v1_1/MeshNgd.sqlite")
+# pairs with terms missing from the local tables are requested from ARAX unless this is FALSE
+ngdRemoteEnabled = resolveDefaultValue(value=os.getenv("NGD_REMOTE_ENABLED"), default="TRUE").upper() == "TRUE"
+
+# best scoring merged results kept per multi hop query, best first, see clsMultiHop.merge_results. 0 keeps all of them in the order they are found.
+multihopMaxResults = int(resolveDefaultValue(value=os.getenv("MULTIHOP_MAX_RESULTS"), default=1000)) or None
+
+# knowledge provider edges validated against the full TRAPI Edge schema per response, the others are checked shallowly, see clsTrapiResponseValidator. 0 validates everything.
+kpValidationSampleSize = int(resolveDefaultValue(value=os.getenv("KP_VALIDATION_SAMPLE_SIZE"), default=0)) or None
+
 maxThreadCount = 4
 
+# async queries run on one bounded pool per process, see clsQueryAsyncView.get_executor. Once the queue is full new queries get a 503.
+asyncQueryMaxWorkers = int(resolveDefaultValue(value=os.getenv("ASYNC_QUERY_MAX_WORKERS"), default=8))
+asyncQueryMaxQueueSize = int(resolveDefaultValue(value=os.getenv("ASYNC_QUERY_MAX_QUEUE_SIZE"), default=64))
+asyncQueryRetryAfterSeconds = int(resolveDefaultValue(value=os.getenv("ASYNC_QUERY_RETRY_AFTER_SECONDS"), default=30))
+
+# timing benchmarks of the unit tests are skipped unless this is TRUE, they log their numbers at INFO level
+runBenchmarks = resolveDefaultValue(value=os.getenv("RUN_BENCHMARKS"), default="FALSE").upper() == "TRUE"
+
+# pooled HTTP sessions used for knowledge provider and SRI requests, see extensions/requests_extension.py
+httpPoolConnections = int(resolveDefaultValue(value=os.getenv("HTTP_POOL_CONNECTIONS"), default=10))
+httpPoolMaxSize = int(resolveDefaultValue(value=os.getenv("HTTP_POOL_MAXSIZE"), default=20))
+httpConnectTimeoutSeconds = float(resolveDefaultValue(value=os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS"), default=10))
+
+# knowledge provider requests are sent from one asyncio event loop when TRUE, see extensions/aiohttp_extension.py
+kpFanoutEnabled = resolveDefaultValue(value=os.getenv("KP_FANOUT_ENABLED"), default="FALSE").upper() == "TRUE"
+kpFanoutMaxPerKp = int(resolveDefaultValue(value=os.getenv("KP_FANOUT_MAX_PER_KP"), default=32))
+kpFanoutMaxConnections = int(resolveDefaultValue(value=os.getenv("KP_FANOUT_MAX_CONNECTIONS"), default=512))
+
+# threads per query dispatching case solution managers and multi hops, see clsQueryManager.dispatch. With the KP fan-out enabled these threads
+# only wait on the event loop, so they can be raised to keep hundreds of knowledge provider requests in flight.
+queryDispatchPoolSize = int(resolveDefaultValue(value=os.getenv("QUERY_DISPATCH_POOL_SIZE"), default=7))
+multihopDispatchPoolSize = int(resolveDefaultValue(value=os.getenv("MULTIHOP_DISPATCH_POOL_SIZE"), default=5))
+
+# seconds the process-wide local similarity tables are cached before being reloaded, see clsLocalSimilarityStore
+localSimilarityCacheTtlSeconds = int(resolveDefaultValue(value=os.getenv("LOCAL_SIMILARITY_CACHE_TTL_SECONDS"), default=60 * 60))
+
+# read global similarity from the table precomputed by the xARA-ETL clsPrecomputedGlobalSimilarityJob when it covers the triplet, see clsBiolinkSimilarity
+globalSimilarityTableEnabled = resolveDefaultValue(value=os.getenv("GLOBAL_SIMILARITY_TABLE_ENABLED"), default="TRUE").upper() == "TRUE"
+
+# case solution rows are cached per case id and the case ids of managers running at the same time are loaded in one query, see clsCaseSolutionLoader
+caseSolutionCacheTtlSeconds = int(resolveDefaultValue(value=os.getenv("CASE_SOLUTION_CACHE_TTL_SECONDS"), default=60 * 60))
+caseSolutionCacheMaxSize = int(resolveDefaultValue(value=os.getenv("CASE_SOLUTION_CACHE_MAX_SIZE"), default=100000))
+caseSolutionMaxBatchSize = int(resolveDefaultValue(value=os.getenv("CASE_SOLUTION_MAX_BATCH_SIZE"), default=5000))
+caseSolutionMaxBatchWaitSeconds = float(resolveDefaultValue(value=os.getenv("CASE_SOLUTION_MAX_BATCH_WAIT_SECONDS"), default=0.005))
+
+# one hop case solutions of the same KP whose node categories have a local similarity above this are conflated, see clsCaseSolutionConflations
+caseSolutionConflationThreshold = float(resolveDefaultValue(value=os.getenv("CASE_SOLUTION_CONFLATION_THRESHOLD"), default=0.9))
+
 # Request on 2021-12-05 RE: xARA Update to set result score to very small value instead of zero.
 ZERO_RESULT_SCORE = 0.0001
 
 defaultLoggingLevel = logging.DEBUG
 
-# see clsCaseSolutionManager.retrieve_kp_urls() for explanation
+# see clsCaseSolutionLoader.kp_url_expression() for explanation
 environmentMode = os.getenv("ENVIRONMENT_MODE")
 environmentModeKPURLColumn = OrderedDict([
     ("DEVELOPMENT", "DEV_URL"),
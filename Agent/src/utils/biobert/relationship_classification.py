@@ -15,8 +15,10 @@ import pandas
 import os
 import collections
 import csv
+import threading
 import numpy as np
-from modConfig import bert_checkpoints_folder
+from modConfig import bert_checkpoints_folder, biobertMaxBatchSize, biobertMaxBatchWaitSeconds
+from utils.multithreading.clsBatchScheduler import clsBatchScheduler
 
 
 # In[2]:
@@ -317,105 +319,121 @@ def file_based_input_fn_builder(input_file, seq_length, is_training, drop_remain
 
 # In[6]:
 
-def relationship_classification(sentences):
-    if __name__ == "__main__":
-        biobert_re_finetuned_vocab = os.path.join(os.path.join(os.getcwd(), "re_outputs"), "vocab.txt")
-        biobert_re_finetuned_config = os.path.join(os.path.join(os.getcwd(), "re_outputs"), "bert_config.json")
-        biobert_re_finetuned_ckpt = os.path.join(bert_checkpoints_folder, "model.ckpt-389")
-    else:
-        biobert_re_finetuned_vocab = os.path.join(os.path.join(os.getcwd(), "utils/biobert/re_outputs"), "vocab.txt")
-        biobert_re_finetuned_config = os.path.join(os.path.join(os.getcwd(), "utils/biobert/re_outputs"), "bert_config.json")
-        biobert_re_finetuned_ckpt = os.path.join(bert_checkpoints_folder, "model.ckpt-389")
-
-    output_directory = os.path.join(os.getcwd(),"RE_try")
-    import tempfile
-    tempdir = tempfile.TemporaryDirectory(prefix="biobert_")
-    output_directory = tempdir.name
-
-    # re_dir = os.path.join(os.path.join(os.path.join(os.path.join(os.getcwd(),"datasets"),"RE"),"chemprot"),"scibert_preprocess")
-    tokenization.validate_case_matches_checkpoint(False, biobert_re_finetuned_ckpt)
-
-    ###### Extract BERT Configuration file --- LINE 969 of run_re.py 
-    bert_config = modeling.BertConfig.from_json_file(biobert_re_finetuned_config)
-    
-    processor = BioBERTChemprotProcessor()
-
-    ###### Note list of labels --- LINE 986 of run_re.py
-    label_list = processor.get_labels()
+# readable label of every chemprot label
+LABEL_NAMES = {
+    "cpr:3": "UPREGULATOR|ACTIVATOR|INDIRECT_UPREGULATOR",
+    "cpr:4": "DOWNREGULATOR|INHIBITOR|INDIRECT_DOWNREGULATOR",
+    "cpr:5": "AGONIST|AGONIST‐ACTIVATOR|AGONIST‐INHIBITOR",
+    "cpr:6": "ANTAGONIST",
+    "cpr:9": "SUBSTRATE|PRODUCT_OF|SUBSTRATE_PRODUCT_OF",
+}
+NO_RELATION = "No RELATION"
+
+
+class RelationshipPredictor(object):
+    """Keeps the fine-tuned relation classifier loaded in one long-lived tf.Session.
+
+    The graph and checkpoint are loaded once in the constructor. Sentences are converted to features in
+    memory (no TFRecord files) and fed straight into placeholders. Only the scheduler's worker thread
+    touches the session; callers submit their sentences and wait on a future, so the predictor can be
+    shared by every query thread. Sentences from concurrent callers are micro-batched: the worker collects
+    up to max_batch_size sentences, or whatever arrived within max_wait_seconds, and runs one forward pass.
+    """
 
-    ###### Get Tokenizer --- LINE 988 of run_re.py
-    tokenizer = tokenization.FullTokenizer(vocab_file=biobert_re_finetuned_vocab, do_lower_case=False)
-    
-    is_per_host = tf.contrib.tpu.InputPipelineConfig.PER_HOST_V2
-    run_config = tf.contrib.tpu.RunConfig(cluster= None,
-                                      master = None,
-                                      model_dir=output_directory,
-                                      save_checkpoints_steps=1000,
-                                      tpu_config=tf.contrib.tpu.TPUConfig(
-                                          iterations_per_loop=1000,
-                                          num_shards=8,
-                                          per_host_input_for_training=is_per_host))
-    model_fn = model_fn_builder(bert_config=bert_config, 
-                            num_labels=len(label_list), 
-                            init_checkpoint=biobert_re_finetuned_ckpt,
-                            learning_rate=5e-5,
-                            num_train_steps=None,
-                            num_warmup_steps=None,
-                            use_tpu=False,
-                            use_one_hot_embeddings=False)
-
-    estimator = tf.contrib.tpu.TPUEstimator(use_tpu=False, model_fn=model_fn, config=run_config, predict_batch_size=8)
-    predict_example = processor.get_test_example(sentences)
-    #  predict_examples = processor.get_test_examples(re_dir)
-    num_actual_predict_examples = len(predict_example)
-    predict_file = os.path.join(output_directory, "predict.tf_record")
-    file_based_convert_examples_to_features(predict_example, 
-                                        label_list,
-                                        128, 
-                                        tokenizer,
-                                        predict_file)
-    predict_input_fn = file_based_input_fn_builder(input_file=predict_file,
-                                               seq_length=128,
-                                               is_training=False,
-                                               drop_remainder=False)
-
-    # prediction time testing
-    # import time
-    # times = [time.time()]
-    # for i in range(5):
-    #     result = estimator.predict(input_fn=predict_input_fn)
-    #     for (i, prediction) in enumerate(result):
-    #         probabilities = prediction["probabilities"]
-    #         x = label_list[np.argmax(probabilities)]
-    #     times.append(time.time())
-    # for i in range(len(times)-1):
-    #     print(times[i+1] - times[i])
-
-    result = estimator.predict(input_fn=predict_input_fn)
-    predictions = []
-    for (i, prediction) in enumerate(result):
-        probabilities = prediction["probabilities"]
-        x = label_list[np.argmax(probabilities)]
-        if x=="cpr:3":
-            label_name = "UPREGULATOR|ACTIVATOR|INDIRECT_UPREGULATOR"
-        elif x=="cpr:4":
-            label_name = "DOWNREGULATOR|INHIBITOR|INDIRECT_DOWNREGULATOR"
-        elif x=="cpr:5":
-            label_name = "AGONIST|AGONIST‐ACTIVATOR|AGONIST‐INHIBITOR"
-        elif x=="cpr:6":
-            label_name = "ANTAGONIST"
-        elif x=="cpr:9":
-            label_name = "SUBSTRATE|PRODUCT_OF|SUBSTRATE_PRODUCT_OF"
-        else:
-            label_name = "No RELATION"
+    def __init__(self, bert_config, vocab_file, init_checkpoint=None, max_seq_length=128, max_batch_size=32, max_wait_seconds=0.01):
+        self.processor = BioBERTChemprotProcessor()
+        self.label_list = self.processor.get_labels()
+        self.tokenizer = tokenization.FullTokenizer(vocab_file=vocab_file, do_lower_case=False)
+        self.max_seq_length = max_seq_length
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.input_ids = tf.placeholder(tf.int32, [None, max_seq_length], name="input_ids")
+            self.input_mask = tf.placeholder(tf.int32, [None, max_seq_length], name="input_mask")
+            self.segment_ids = tf.placeholder(tf.int32, [None, max_seq_length], name="segment_ids")
+            label_ids = tf.zeros(tf.shape(self.input_ids)[:1], dtype=tf.int32)
+            (_, _, _, self.probabilities) = create_model(bert_config, False, self.input_ids, self.input_mask, self.segment_ids, label_ids,
+                                                         len(self.label_list), False)
+            if init_checkpoint:
+                (assignment_map, _) = modeling.get_assignment_map_from_checkpoint(tf.trainable_variables(), init_checkpoint)
+                tf.train.init_from_checkpoint(init_checkpoint, assignment_map)
+            initializer = tf.global_variables_initializer()
+        self.graph.finalize()
+
+        self.session = tf.Session(graph=self.graph)
+        self.session.run(initializer)
+
+        self.scheduler = clsBatchScheduler(run_batch=self.run, max_batch_size=max_batch_size, max_wait_seconds=max_wait_seconds,
+                                           name="RelationshipPredictor")
+
+    def featurize(self, sentences):
+        """Tokenizes sentences into one InputFeatures per sentence. Runs in the caller's thread."""
+        return [convert_single_example(i, example, self.label_list, self.max_seq_length, self.tokenizer)
+                for i, example in enumerate(self.processor.get_test_example(sentences))]
+
+    def run(self, features):
+        """Runs one forward pass over a batch of InputFeatures. Only called from the scheduler's worker thread."""
+        return list(self.session.run(self.probabilities, feed_dict={
+            self.input_ids: np.array([feature.input_ids for feature in features], dtype=np.int32),
+            self.input_mask: np.array([feature.input_mask for feature in features], dtype=np.int32),
+            self.segment_ids: np.array([feature.segment_ids for feature in features], dtype=np.int32),
+        }))
+
+    def submit(self, sentences):
+        """Queues sentences for prediction and returns a concurrent.futures.Future of their probabilities."""
+        return self.scheduler.submit(self.featurize(sentences))
+
+    def predict_probabilities(self, sentences):
+        """Class probabilities of every sentence, in self.label_list order."""
+        return np.array(self.submit(sentences).result(), dtype=np.float32).reshape(-1, len(self.label_list))
+
+    def metrics(self):
+        """Queue depth, batch size histogram and wait times of the micro-batching scheduler."""
+        return self.scheduler.metrics()
+
+    def predict(self, sentences):
+        """Readable relation label of every sentence, see LABEL_NAMES."""
+        return [LABEL_NAMES.get(self.label_list[np.argmax(probabilities)], NO_RELATION) for probabilities in self.predict_probabilities(sentences)]
+
+    def close(self):
+        """Stops the worker thread and releases the session."""
+        self.scheduler.close()
+        self.session.close()
+
+
+_predictor = None
+_predictor_lock = threading.Lock()
+
+
+def get_relationship_predictor():
+    """Returns the process-wide predictor of the fine-tuned checkpoint, loading it on first use."""
+    global _predictor
+    if _predictor is None:
+        with _predictor_lock:
+            if _predictor is None:
+                if __name__ == "__main__":
+                    biobert_re_finetuned_vocab = os.path.join(os.path.join(os.getcwd(), "re_outputs"), "vocab.txt")
+                    biobert_re_finetuned_config = os.path.join(os.path.join(os.getcwd(), "re_outputs"), "bert_config.json")
+                else:
+                    biobert_re_finetuned_vocab = os.path.join(os.path.join(os.getcwd(), "utils/biobert/re_outputs"), "vocab.txt")
+                    biobert_re_finetuned_config = os.path.join(os.path.join(os.getcwd(), "utils/biobert/re_outputs"), "bert_config.json")
+                biobert_re_finetuned_ckpt = os.path.join(bert_checkpoints_folder, "model.ckpt-389")
+
+                tokenization.validate_case_matches_checkpoint(False, biobert_re_finetuned_ckpt)
+                _predictor = RelationshipPredictor(bert_config=modeling.BertConfig.from_json_file(biobert_re_finetuned_config),
+                                                   vocab_file=biobert_re_finetuned_vocab,
+                                                   init_checkpoint=biobert_re_finetuned_ckpt,
+                                                   max_seq_length=128,
+                                                   max_batch_size=biobertMaxBatchSize,
+                                                   max_wait_seconds=biobertMaxBatchWaitSeconds)
+    return _predictor
 
-        predictions.append(label_name)
 
-    tempdir.cleanup()
-    return predictions
+def relationship_classification(sentences):
+    return get_relationship_predictor().predict(sentences)
 
 
 if __name__ == "__main__":
     data_try = 'Agonistic activity of << ICI 182 780 >> on activation of GSK 3β/[[ AKT ]] pathway in the rat uterus during the estrous cycle.'
-    label_try = relationship_classification(data_try)
+    label_try = relationship_classification([data_try])
     print(label_try)
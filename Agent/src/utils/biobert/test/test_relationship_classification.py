@@ -0,0 +1,148 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+import numpy as np
+import tensorflow as tf
+import modConfig
+from utils.biobert import modeling
+from utils.biobert.relationship_classification import RelationshipPredictor, create_model, LABEL_NAMES, NO_RELATION
+
+
+class test_relationship_classification(unittest.TestCase):
+    """
+    Runs the predictor on CPU with a tiny, randomly initialized BERT so the real checkpoint is not needed
+    """
+    sentences = [
+        "Agonistic activity of << ICI 182 780 >> on activation of GSK 3β/[[ AKT ]] pathway in the rat uterus.",
+        "<< Aspirin >> inhibits [[ COX ]] activity.",
+        "The [[ gene ]] is expressed in the liver.",
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp(prefix="biobert_test_")
+        words = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "<", ">", "[", "]", "/", ".", "activity", "of", "on", "the", "in", "is", "gene", "liver",
+                 "aspirin", "inhibits", "cox", "akt", "pathway", "rat", "uterus", "activation", "expressed", "agonistic", "ici", "182", "780", "gsk", "3"]
+        cls.vocab_file = os.path.join(cls.directory, "vocab.txt")
+        with open(cls.vocab_file, "w") as vocab:
+            vocab.write("\n".join(words) + "\n")
+        cls.bert_config = modeling.BertConfig(vocab_size=len(words), hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64,
+                                              max_position_embeddings=64)
+        cls.checkpoint = cls.save_random_checkpoint()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    @classmethod
+    def save_random_checkpoint(cls):
+        graph = tf.Graph()
+        with graph.as_default():
+            input_ids = tf.zeros([1, 16], dtype=tf.int32)
+            create_model(cls.bert_config, False, input_ids, input_ids, input_ids, tf.zeros([1], dtype=tf.int32), 6, False)
+            saver = tf.train.Saver()
+            with tf.Session(graph=graph) as session:
+                session.run(tf.global_variables_initializer())
+                return saver.save(session, os.path.join(cls.directory, "model.ckpt"))
+
+    def create_predictor(self, max_batch_size=4, max_wait_seconds=0.005):
+        return RelationshipPredictor(bert_config=self.bert_config, vocab_file=self.vocab_file, init_checkpoint=self.checkpoint, max_seq_length=32,
+                                     max_batch_size=max_batch_size, max_wait_seconds=max_wait_seconds)
+
+    def test_predict_labels(self):
+        predictor = self.create_predictor()
+        try:
+            probabilities = predictor.predict_probabilities(self.sentences)
+            self.assertEqual((len(self.sentences), len(predictor.label_list)), probabilities.shape)
+            np.testing.assert_allclose(np.ones(len(self.sentences)), probabilities.sum(axis=1), rtol=1e-5)
+
+            labels = predictor.predict(self.sentences)
+            self.assertEqual(len(self.sentences), len(labels))
+            self.assertTrue(set(labels) <= set(LABEL_NAMES.values()) | {NO_RELATION})
+            self.assertEqual(0, len(predictor.predict([])))
+        finally:
+            predictor.close()
+
+    def test_checkpoint_is_loaded(self):
+        first, second = self.create_predictor(), self.create_predictor()
+        try:
+            np.testing.assert_allclose(first.predict_probabilities(self.sentences), second.predict_probabilities(self.sentences), rtol=1e-5)
+        finally:
+            first.close()
+            second.close()
+
+    def test_concurrent_callers(self):
+        predictor = self.create_predictor()
+        try:
+            expected = predictor.predict_probabilities(self.sentences)
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(lambda _: predictor.predict_probabilities(self.sentences), range(32)))
+            for result in results:
+                np.testing.assert_allclose(expected, result, rtol=1e-5)
+
+            metrics = predictor.metrics()
+            self.assertEqual(len(self.sentences) * 33, metrics["item_count"])
+            self.assertLessEqual(max(metrics["batch_size_histogram"]), 4)
+            self.assertEqual(0, metrics["queue_depth"])
+        finally:
+            predictor.close()
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_warm_predictor(self):
+        """
+        Compares loading the model for every call (previous behavior) against a warm predictor
+        """
+        call_count = 5
+
+        start = timer()
+        for _ in range(call_count):
+            predictor = self.create_predictor()
+            predictor.predict(self.sentences)
+            predictor.close()
+        before_seconds = (timer() - start) / call_count
+
+        predictor = self.create_predictor()
+        try:
+            start = timer()
+            for _ in range(call_count):
+                predictor.predict(self.sentences)
+            after_seconds = (timer() - start) / call_count
+        finally:
+            predictor.close()
+
+        logging.info(f"BioBERT relation classification of {len(self.sentences)} sentences: before {before_seconds * 1000:.2f} ms, "
+                     f"after {after_seconds * 1000:.2f} ms")
+        self.assertLess(after_seconds, before_seconds)
+
+    @unittest.skipUnless(modConfig.runBenchmarks, "Benchmark, set RUN_BENCHMARKS=TRUE to run it")
+    def test_benchmark_micro_batching(self):
+        """
+        Compares concurrent queries running their own forward passes (one sentence per batch) against micro-batching across queries
+        """
+        query_count = 32
+
+        def run_queries(predictor):
+            start = timer()
+            with ThreadPoolExecutor(max_workers=query_count) as executor:
+                list(executor.map(lambda _: predictor.predict(self.sentences[:1]), range(query_count)))
+            seconds = (timer() - start) / query_count
+            metrics = predictor.metrics()
+            predictor.close()
+            return seconds, metrics
+
+        before_seconds, before_metrics = run_queries(self.create_predictor(max_batch_size=1, max_wait_seconds=0))
+        after_seconds, after_metrics = run_queries(self.create_predictor(max_batch_size=32, max_wait_seconds=0.01))
+
+        logging.info(f"Per query cost of {query_count} concurrent queries: before {before_seconds * 1000:.2f} ms ({before_metrics['batch_count']} batches), "
+                     f"after {after_seconds * 1000:.2f} ms ({after_metrics['batch_count']} batches, histogram {after_metrics['batch_size_histogram']}, "
+                     f"average wait {after_metrics['average_wait_seconds'] * 1000:.2f} ms)")
+        self.assertEqual(query_count, before_metrics["batch_count"])
+        self.assertLess(after_metrics["batch_count"], before_metrics["batch_count"])
+
+
+if __name__ == '__main__':
+    unittest.main()
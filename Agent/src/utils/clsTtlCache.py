@@ -0,0 +1,141 @@
+"""
+WHAT: A thread-safe read-through cache with an in-memory LRU tier and an optional on-disk SQLite tier, both expiring entries after a TTL
+WHY: The same CURIEs are looked up in the SRI services again and again across queries. Callers ask for many keys at once so only the misses
+     have to be requested upstream, in one batch.
+ASSUMES: Values are JSON serializable. None is a valid cached value (e.g. "this CURIE has no data"), misses are reported separately.
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-18
+"""
+
+from collections import OrderedDict
+import threading
+import sqlite3
+import json
+import time
+
+
+class clsTtlCache:
+    """
+    See header
+    """
+
+    def __init__(self, name: str, ttl_seconds: float, max_size: int, sqlite_path: str = None):
+        """
+        Constructor
+        :param name: Cache name, also the namespace of its rows in the SQLite store so several caches can share one file
+        :param ttl_seconds: Seconds an entry is served before it must be fetched again
+        :param max_size: Largest number of entries kept in memory, the least recently used are evicted first
+        :param sqlite_path: Optional SQLite file backing the in-memory tier, shared between processes and restarts
+        """
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.sqlite_path = sqlite_path
+
+        # key -> (expires_at, value)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.connection = None
+        if sqlite_path:
+            self.connection = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self.connection.execute(
+                "create table if not exists cache (name text not null, key text not null, value text, expires_at real not null, primary key (name, key))"
+            )
+            self.connection.commit()
+
+    def get_many(self, keys: list):
+        """
+        Looks up keys in memory, then on disk
+        :param keys: Keys to look up
+        :return: Tuple of a dictionary of key -> cached value and a list of the missing keys, in key order
+        """
+        now = time.time()
+        found = {}
+        missing = []
+        with self.lock:
+            for key in dict.fromkeys(keys):
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self.entries.move_to_end(key)
+                    found[key] = entry[1]
+                else:
+                    missing.append(key)
+
+            hit_count = len(found)
+            if missing and self.connection is not None:
+                for key, (expires_at, value) in self._read_disk(missing, now).items():
+                    found[key] = value
+                    self._store(key, expires_at, value)
+                missing = [key for key in missing if key not in found]
+
+            self.hits += hit_count
+            self.disk_hits += len(found) - hit_count
+            self.misses += len(missing)
+        return found, missing
+
+    def set_many(self, values: dict):
+        """
+        Caches values in memory and on disk
+        :param values: Dictionary of key -> value
+        :return: None
+        """
+        expires_at = time.time() + self.ttl_seconds
+        with self.lock:
+            for key, value in values.items():
+                self._store(key, expires_at, value)
+            if self.connection is not None and values:
+                self.connection.executemany(
+                    "insert or replace into cache (name, key, value, expires_at) values (?, ?, ?, ?)",
+                    [(self.name, key, json.dumps(value), expires_at) for key, value in values.items()]
+                )
+                self.connection.commit()
+
+    def _store(self, key: str, expires_at: float, value):
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _read_disk(self, keys: list, now: float) -> dict:
+        rows = {}
+        # stays well below SQLite's limit on the number of query parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            cursor = self.connection.execute(
+                f"select key, value, expires_at from cache where name = ? and expires_at > ? and key in ({', '.join('?' * len(chunk))})",
+                [self.name, now] + chunk
+            )
+            for key, value, expires_at in cursor:
+                rows[key] = (expires_at, json.loads(value))
+        return rows
+
+    def metrics(self) -> dict:
+        """
+        Hit and miss counters
+        :return: Dictionary
+        """
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        """
+        Removes every entry of this cache from memory and disk and resets the counters
+        :return: None
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+            if self.connection is not None:
+                self.connection.execute("delete from cache where name = ?", [self.name])
+                self.connection.commit()
@@ -0,0 +1,162 @@
+"""
+WHAT: An in-process micro-batching scheduler. Items submitted by many threads are collected into batches and processed by one worker thread.
+WHY: Model inference is much cheaper per item in one large batch than in many small ones. Concurrent queries each submitting a few items would
+     otherwise run their own small forward passes.
+ASSUMES: run_batch returns exactly one result per item, in the same order
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-14
+"""
+
+from concurrent.futures import Future
+from collections import Counter
+from time import monotonic
+import threading
+import logging
+import queue
+
+
+class clsBatchRequest:
+    """
+    The items of one submit() call and the future their results are sent to
+    """
+
+    def __init__(self, items: list):
+        self.items = items
+        self.results = [None] * len(items)
+        self.remaining = len(items)
+        self.future = Future()
+        self.submitted_at = monotonic()
+
+
+class clsBatchScheduler:
+    """
+    See header
+    """
+
+    def __init__(self, run_batch, max_batch_size: int, max_wait_seconds: float, name: str = "clsBatchScheduler"):
+        """
+        Constructor
+        :param run_batch: Function taking a list of items and returning a list of results. Only ever called from the worker thread.
+        :param max_batch_size: Largest number of items processed at once
+        :param max_wait_seconds: Longest time the first item of a batch waits for more items to arrive
+        :param name: Worker thread name
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+
+        # one entry per item: (request, item index), or None to stop the worker
+        self.queue = queue.Queue()
+
+        self.metrics_lock = threading.Lock()
+        self.batch_size_histogram = Counter()
+        self.max_queue_depth = 0
+        self.item_count = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds_seen = 0.0
+
+        self.worker = threading.Thread(target=self.serve, name=name, daemon=True)
+        self.worker.start()
+
+    def submit(self, items: list) -> Future:
+        """
+        Queues items for processing
+        :param items: List of items
+        :return: Future of the list of results, in item order
+        """
+        request = clsBatchRequest(items)
+        if len(items) == 0:
+            request.future.set_result([])
+            return request.future
+
+        for index in range(len(items)):
+            self.queue.put((request, index))
+        with self.metrics_lock:
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return request.future
+
+    def collect_batch(self):
+        """
+        Blocks for the first item, then keeps collecting until the batch is full or the first item has waited max_wait_seconds
+        :return: List of (request, item index), and whether the scheduler was stopped
+        """
+        entry = self.queue.get()
+        if entry is None:
+            return [], True
+
+        batch = [entry]
+        deadline = monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - monotonic()
+            try:
+                entry = self.queue.get(block=remaining > 0, timeout=remaining if remaining > 0 else None)
+            except queue.Empty:
+                break
+            if entry is None:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def serve(self):
+        stopped = False
+        while not stopped:
+            batch, stopped = self.collect_batch()
+            # requests cancelled while waiting are skipped
+            batch = [(request, index) for request, index in batch if not request.future.cancelled()]
+            if not batch:
+                continue
+
+            started_at = monotonic()
+            self.record_batch(batch, started_at)
+            try:
+                results = self.run_batch([request.items[index] for request, index in batch])
+            except Exception as e:
+                logging.error(f"Batch of {len(batch)} items failed: {e}")
+                for request, _ in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            for (request, index), result in zip(batch, results):
+                request.results[index] = result
+                request.remaining -= 1
+                if request.remaining == 0 and not request.future.done():
+                    request.future.set_result(request.results)
+
+    def record_batch(self, batch: list, started_at: float):
+        """
+        Updates the batch size histogram and the wait time of every item in the batch
+        :param batch: List of (request, item index)
+        :param started_at: monotonic() time the batch started running
+        :return: None
+        """
+        wait_seconds = [started_at - request.submitted_at for request, _ in batch]
+        with self.metrics_lock:
+            self.batch_size_histogram[len(batch)] += 1
+            self.item_count += len(batch)
+            self.total_wait_seconds += sum(wait_seconds)
+            self.max_wait_seconds_seen = max([self.max_wait_seconds_seen] + wait_seconds)
+
+    def metrics(self) -> dict:
+        """
+        Current queue depth, batch size histogram and item wait times
+        :return: Dictionary
+        """
+        with self.metrics_lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "batch_count": sum(self.batch_size_histogram.values()),
+                "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
+                "item_count": self.item_count,
+                "average_wait_seconds": self.total_wait_seconds / self.item_count if self.item_count else 0.0,
+                "max_wait_seconds": self.max_wait_seconds_seen,
+            }
+
+    def close(self):
+        """
+        Stops the worker thread once the items queued before this call are processed
+        :return: None
+        """
+        self.queue.put(None)
+        self.worker.join()
@@ -0,0 +1,125 @@
+"""
+WHAT: A process-wide thread pool with a bounded number of workers and a bounded admission queue, which rejects work instead of growing
+WHY: The async query endpoint created a new thread pool for every request and never closed it, so threads piled up under sustained load.
+     Rejected callers are told how long to wait before retrying, and the time admitted work spends queued is measured.
+ASSUMES: Callers admit() work before doing anything they can't undo, then either submit() it or release() the admission
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-23
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+import threading
+import logging
+import math
+
+
+class clsBoundedExecutor:
+    """
+    See header
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue_size: int, min_retry_after_seconds: int = 1):
+        """
+        Constructor
+        :param name: Thread name prefix, also used in logs
+        :param max_workers: Number of worker threads
+        :param max_queue_size: Number of admitted items that may wait for a free worker
+        :param min_retry_after_seconds: Smallest Retry-After returned to rejected callers
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.min_retry_after_seconds = min_retry_after_seconds
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # running + queued items never exceed max_workers + max_queue_size
+        self.admissions = threading.BoundedSemaphore(max_workers + max_queue_size)
+
+        self.metrics_lock = threading.Lock()
+        self.admitted = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def admit(self) -> bool:
+        """
+        Reserves a place for one item, without blocking
+        :return: True if admitted, False if the queue is full
+        """
+        admitted = self.admissions.acquire(blocking=False)
+        with self.metrics_lock:
+            if admitted:
+                self.admitted += 1
+            else:
+                self.rejected += 1
+        return admitted
+
+    def release(self):
+        """
+        Gives back an admission that won't be submitted
+        :return: None
+        """
+        with self.metrics_lock:
+            self.admitted -= 1
+        self.admissions.release()
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Queues an admitted item
+        :param function: Function to run on a worker thread
+        :return: concurrent.futures.Future of the function's return value
+        """
+        return self.executor.submit(self._run, monotonic(), function, args, kwargs)
+
+    def _run(self, submitted_at: float, function, args: tuple, kwargs: dict):
+        started_at = monotonic()
+        wait_seconds = started_at - submitted_at
+        with self.metrics_lock:
+            self.admitted -= 1
+            self.running += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        logging.debug(f"{self.name} item waited {wait_seconds:.3f} seconds in the queue")
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with self.metrics_lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_run_seconds += monotonic() - started_at
+            self.admissions.release()
+
+    def retry_after_seconds(self) -> int:
+        """
+        Estimates when a place frees up: the queued items plus one, run at the average run time across the workers
+        :return: Seconds
+        """
+        with self.metrics_lock:
+            average_run_seconds = self.total_run_seconds / self.completed if self.completed else 0.0
+            queued = self.admitted
+        return max(self.min_retry_after_seconds, math.ceil(average_run_seconds * (queued + 1) / self.max_workers))
+
+    def metrics(self) -> dict:
+        """
+        Queue and wait time counters
+        :return: Dictionary
+        """
+        with self.metrics_lock:
+            started = self.running + self.completed
+            return {
+                "max_workers": self.max_workers,
+                "max_queue_size": self.max_queue_size,
+                "queued": self.admitted,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "average_wait_seconds": self.total_wait_seconds / started if started else 0.0,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
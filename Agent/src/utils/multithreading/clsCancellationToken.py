@@ -0,0 +1,84 @@
+"""
+WHAT: A cooperative cancellation token shared by a dispatcher and the elements it runs, with an optional deadline
+WHY: Threads can't be killed. When a query reaches its abort time, the elements that are still running have to notice and stop by themselves,
+     between hops and before sending more knowledge provider requests, so their threads are released.
+ASSUMES: Elements check the token at the points where stopping is safe, see clsElement.checkCancellation
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-22
+"""
+
+from concurrent.futures import Future, wait
+import threading
+import time
+
+
+class clsOperationCancelled(Exception):
+    """
+    Raised by an element that noticed its cancellation token was cancelled
+    """
+    pass
+
+
+class clsCancellationToken:
+    """
+    See header
+    """
+
+    def __init__(self, deadline: float = None):
+        """
+        Constructor
+        :param deadline: Optional time in epoch seconds after which the token counts as cancelled
+        """
+        self.deadline = deadline
+        self.reason = None
+        # completed when cancelled, so dispatchers can wait on it together with the futures of their work
+        self.future = Future()
+        self.lock = threading.Lock()
+
+    def cancel(self, reason: str = "Cancelled"):
+        """
+        Cancels the token, waking up everything waiting on it
+        :param reason: Why, added to clsOperationCancelled messages
+        :return: None
+        """
+        with self.lock:
+            if not self.future.done():
+                self.reason = reason
+                self.future.set_result(reason)
+
+    @property
+    def cancelled(self) -> bool:
+        if self.future.done():
+            return True
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.cancel(f"Deadline of {self.deadline} reached")
+            return True
+        return False
+
+    def remaining_seconds(self) -> float:
+        """
+        :return: Seconds left until the deadline, at least 0, or None without a deadline
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def raise_if_cancelled(self):
+        """
+        :return: None
+        :raises: clsOperationCancelled if the token is cancelled
+        """
+        if self.cancelled:
+            raise clsOperationCancelled(self.reason)
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Blocks until the token is cancelled, its deadline is reached or the timeout expires
+        :param timeout: Seconds to wait at most, None waits until cancelled or the deadline
+        :return: True if the token is cancelled
+        """
+        remaining = self.remaining_seconds()
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        wait([self.future], timeout=timeout)
+        return self.cancelled
@@ -7,7 +7,20 @@ class clsElement(ABC):
         self.dispatchId = dispatchId
         self.dispatchDescription = dispatchDescription
         self.dispatchRunTimeSeconds = None
+        # "Completed", "Failed" or "Cancelled" once the dispatcher's runner has returned
+        self.dispatchStatus = None
         self.dispatchThreadLock = None
+        # clsCancellationToken set by the dispatcher, checked with checkCancellation()
+        self.dispatchCancellationToken = None
+
+    def checkCancellation(self):
+        """
+        Stops this element if its dispatch was cancelled. Called between steps and before outbound requests.
+        :return: None
+        :raises: clsOperationCancelled
+        """
+        if self.dispatchCancellationToken is not None:
+            self.dispatchCancellationToken.raise_if_cancelled()
 
     @abstractmethod
     def execute(self):
@@ -24,6 +24,12 @@ class clsNode(clsElement):
             for object in self.dispatchList:
                 object.dispatchThreadLock = self.dispatchThreadLock
 
+    def applyCancellationTokenToChildren(self):
+
+        if self.dispatchList is not None:
+            for object in self.dispatchList:
+                object.dispatchCancellationToken = self.dispatchCancellationToken
+
     # to be overridden if desired, but not abstract
     def preExecute(self):
         pass
@@ -34,9 +40,11 @@ class clsNode(clsElement):
                 objects=self.dispatchList,
                 method=self.dispatchMode,
                 parentId=self.dispatchId,
+                cancellation_token=self.dispatchCancellationToken,
             )
 
     def execute(self):
         self.applyThreadLockToChildren()
+        self.applyCancellationTokenToChildren()
         self.preExecute()
         self.dispatch()
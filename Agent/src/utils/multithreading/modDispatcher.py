@@ -1,6 +1,6 @@
-from multiprocessing.dummy import Pool as ThreadPool
-import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from .clsDelayedException import clsDelayedException
+from .clsCancellationToken import clsCancellationToken, clsOperationCancelled
 from ..modMiscUtils import findObjectType
 import time
 import logging
@@ -21,9 +21,21 @@ def runner(object):
 
     try:
         logging.debug(printer(object=object, status=status))
+        # a queued object can be picked up by a free thread before the dispatcher gets to drop it, it mustn't start after the cancellation
+        if object.dispatchCancellationToken is not None:
+            object.dispatchCancellationToken.raise_if_cancelled()
         object.execute()
         status = "Completed"
 
+    except clsOperationCancelled as e:
+        status = "Cancelled"
+        object.logs.append(clsLogEvent(
+            identifier=str(object.dispatchId),
+            level="WARNING",
+            code="Cancelled",
+            message=f"Object with dispatchId {object.dispatchId} was cancelled: {e}"
+        ))
+
     except Exception as tb:
         status = "Failed"
         print(traceback.format_exc())
@@ -39,21 +51,66 @@ def runner(object):
     finally:
         endTime = time.time()
         object.dispatchRunTimeSeconds = endTime - startTime
+        object.dispatchStatus = status
         message = printer(object=object, status=status)
         if status == "Completed":
             logging.debug(message)
         elif status == "Failed":
             logging.error(message)
+        elif status == "Cancelled":
+            logging.warning(message)
         logging.debug(f"{findObjectType(object)} with dispatchId {object.dispatchId} took {object.dispatchRunTimeSeconds} seconds")
 
         return object
-        
 
-def dispatch(objects: list, method: str, parentId: int):
-    # print("{} sleepin 5".format(parentId))
-    # time.sleep(5)
-    # print("{} done sleepin 5".format(parentId))
-    # return parentId
+
+def unfinished_objects(objects: list) -> list:
+    """
+    :param objects: Dispatched objects
+    :return: The objects that were cancelled, never started or are still running. Failed objects did run to the end.
+    """
+    return [object for object in objects if object.dispatchStatus not in ("Completed", "Failed")]
+
+
+def dispatch_parallel(objects: list, parentId: int, pool_size: int, cancellation_token: clsCancellationToken, grace_seconds: float = 10):
+    """
+    Runs every object on a thread pool and blocks until they are all done or the token is cancelled (or reaches its deadline), without polling.
+    Once cancelled, objects that haven't started are dropped and the running ones get grace_seconds to notice the token and stop at their next
+    checkpoint. Threads that still haven't stopped after that are left behind, the pool isn't waited for.
+    :param objects: clsElement objects, they are given the cancellation token
+    :param parentId: dispatchId of the parent, used in logs and thread names
+    :param pool_size: Number of threads
+    :param cancellation_token: Token shared with the objects
+    :param grace_seconds: Seconds running objects are given to stop once cancelled
+    :return: List of the objects that weren't run to the end, see unfinished_objects
+    """
+    for object in objects:
+        object.dispatchCancellationToken = cancellation_token
+        object.dispatchStatus = None
+
+    executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix=f"dispatch-{parentId}")
+    futures = {executor.submit(runner, object): object for object in objects}
+    try:
+        pending = set(futures)
+        while pending and not cancellation_token.cancelled:
+            timeout = cancellation_token.remaining_seconds()
+            # wakes up when an object finishes, the token is cancelled or its deadline is reached
+            _, pending = wait(pending | {cancellation_token.future}, timeout=timeout, return_when=FIRST_COMPLETED)
+            pending.discard(cancellation_token.future)
+
+        if pending:
+            for future in pending:
+                future.cancel()
+            running = [future for future in pending if not future.cancelled()]
+            logging.warning(f"Dispatch of parent with id {parentId} cancelled ({cancellation_token.reason}): "
+                            f"{len(pending) - len(running)} objects not started, {len(running)} stopping")
+            wait(running, timeout=grace_seconds)
+        return unfinished_objects(objects)
+    finally:
+        executor.shutdown(wait=False)
+
+
+def dispatch(objects: list, method: str, parentId: int, cancellation_token: clsCancellationToken = None):
 
     if method.lower() == "serial":
 
@@ -64,104 +121,52 @@ def dispatch(objects: list, method: str, parentId: int):
                 tb.re_raise()
 
     elif method.lower() == "parallel":
-        # pool = ThreadPool(processes=len(objects))
-        pool = ThreadPool(processes=5)
-        try:
-            # imap_unordered returns the result as soon as they're available
-            list(pool.imap_unordered(runner, objects))
-        except clsDelayedException as tb:
-            logging.error(f"Terminating thread pool of parent with id {parentId}")
-            pool.close()
-            pool.terminate()
-            tb.re_raise()
-        else:
-            pool.close()
-            pool.join()
-            # pool.wait(timeout=10)
+        dispatch_parallel(
+            objects=objects,
+            parentId=parentId,
+            pool_size=5,
+            cancellation_token=cancellation_token if cancellation_token is not None else clsCancellationToken(),
+        )
 
     else:
         raise AttributeError("Only 'serial' or 'parallel' supported for dispatch method")
 
 
-def test_runner(sleeptime):
-    print("sleepin {}".format(sleeptime))
-    import time
-    time.sleep(sleeptime)
-    print("done sleepin {}".format(sleeptime))
-    return sleeptime
-
-
-def test_runner_objectmanip(thing):
-    print("sleepin {}".format(thing.sleeptime))
-    import time
-    time.sleep(thing.sleeptime)
-    print("done sleepin {}".format(thing.sleeptime))
-    thing.done = "yes"
-    return thing
-
-
-class thingClass:
-    def __init__(self, sleeptime, done):
-        self.sleeptime = sleeptime
-        self.done = done
-
-
-def query_dispatch(objects: list, method: str, parentId: int, abort_time: int, pool_size: int = 7):
+def query_dispatch(objects: list, method: str, parentId: int, abort_time: float, pool_size: int = 7, cancellation_token: clsCancellationToken = None,
+                   grace_seconds: float = 10):
     """
-    Dispatches a worker for each Query Manager with a global timeout. Once the timeout is reached all working threads are stopped and any results are returned.
-    :param objects:
-    :param method:
-    :param parentId:
-    :param abort_time: time in epoch seconds when the threads should be aborted
-    :param pool_size:
-    :return:
+    Dispatches a worker for each Query Manager with a global timeout. Once the timeout is reached the working objects are cancelled, they stop at
+    their next checkpoint (see clsElement.checkCancellation), and any results are returned.
+    :param objects: clsElement objects
+    :param method: "serial" or "parallel"
+    :param parentId: dispatchId of the parent
+    :param abort_time: time in epoch seconds when the objects should be aborted, used when no cancellation token is given
+    :param pool_size: Number of threads
+    :param cancellation_token: Optional token shared with the caller, e.g. to abort the dispatch early
+    :param grace_seconds: Seconds running objects are given to stop once cancelled
+    :return: List of the objects that weren't run to the end, see unfinished_objects
     """
+    if cancellation_token is None:
+        cancellation_token = clsCancellationToken(deadline=abort_time)
 
     if method.lower() == "serial":
-
         for object in objects:
-            try:
-                runner(object)
-            except clsDelayedException as tb:
-                tb.re_raise()
-
-    elif method.lower() == "parallel":
-        # pool = multiprocessing.Pool(processes=5)
-        pool = ThreadPool(processes=pool_size)
-        print("running pool")
-        # list(pool.imap_unordered(runner, objects))
-        imap_results = pool.imap_unordered(runner, objects)
-        # imap_results = pool.imap_unordered(test_runner, [3, 2, 1, 12, 15, 16, 17, 18, 19, 20, 21])
-        # imap_results = pool.imap_unordered(test_runner, [3, 2, 1])
-        # imap_results = pool.imap_unordered(test_runner_objectmanip, [
-        #     thingClass(1, "no"),
-        #     thingClass(2, "no"),
-        #     thingClass(3, "no"),
-        #     thingClass(12, "nope"),
-        # ])
-        results = []
-        pool.close()
-        # pool.join()
-        print("pool waiting")
-        # start_time = time.time()
-        # timeout_time = start_time + 10
-        current_time = time.time()
-        while current_time < abort_time:
-            try:
-                result = imap_results.next(timeout=1)
-                results.append(result)
-                print("Got result {}".format(result,))
-            except StopIteration:
-                print("StopIteration")
+            object.dispatchStatus = None
+        for object in objects:
+            if cancellation_token.cancelled:
                 break
-            except multiprocessing.TimeoutError:
-                print("TimeoutError: time left {}".format(abort_time - current_time))
-            current_time = time.time()
+            object.dispatchCancellationToken = cancellation_token
+            runner(object)
+        return unfinished_objects(objects)
 
-        print("pool done {}".format(results,))
-        pool.terminate()
+    elif method.lower() == "parallel":
+        return dispatch_parallel(
+            objects=objects,
+            parentId=parentId,
+            pool_size=pool_size,
+            cancellation_token=cancellation_token,
+            grace_seconds=grace_seconds,
+        )
 
     else:
         raise AttributeError("Only 'serial' or 'parallel' supported for dispatch method")
-
-    return
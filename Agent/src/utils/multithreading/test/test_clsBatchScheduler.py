@@ -0,0 +1,67 @@
+import threading
+import unittest
+from ..clsBatchScheduler import clsBatchScheduler
+
+
+class test_clsBatchScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = []
+        # holds the worker inside the first batch so the next submits queue up behind it
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def run_batch(self, items):
+        self.batches.append(list(items))
+        self.started.set()
+        self.release.wait(timeout=5)
+        return [item * 10 for item in items]
+
+    def test_results_are_returned_in_order(self):
+        self.release.set()
+        scheduler = clsBatchScheduler(run_batch=self.run_batch, max_batch_size=4, max_wait_seconds=0)
+        try:
+            self.assertEqual([10, 20, 30], scheduler.submit([1, 2, 3]).result(timeout=5))
+            self.assertEqual([], scheduler.submit([]).result(timeout=5))
+        finally:
+            scheduler.close()
+
+    def test_items_of_concurrent_requests_share_batches(self):
+        scheduler = clsBatchScheduler(run_batch=self.run_batch, max_batch_size=4, max_wait_seconds=0)
+        try:
+            first = scheduler.submit([0])
+            self.started.wait(timeout=5)
+            futures = [scheduler.submit([i, i + 1]) for i in (1, 3, 5)]
+            self.release.set()
+
+            self.assertEqual([0], first.result(timeout=5))
+            self.assertListEqual([[10, 20], [30, 40], [50, 60]], [future.result(timeout=5) for future in futures])
+            # the 6 queued items are split into a full batch and the rest
+            self.assertListEqual([[0], [1, 2, 3, 4], [5, 6]], self.batches)
+
+            metrics = scheduler.metrics()
+            self.assertEqual({1: 1, 2: 1, 4: 1}, metrics["batch_size_histogram"])
+            self.assertEqual(7, metrics["item_count"])
+            self.assertEqual(6, metrics["max_queue_depth"])
+            self.assertEqual(0, metrics["queue_depth"])
+            self.assertGreater(metrics["max_wait_seconds"], 0)
+        finally:
+            self.release.set()
+            scheduler.close()
+
+    def test_failed_batch_raises_in_every_caller(self):
+        def run_batch(items):
+            raise ValueError("model crashed")
+
+        scheduler = clsBatchScheduler(run_batch=run_batch, max_batch_size=4, max_wait_seconds=0.05)
+        try:
+            futures = [scheduler.submit([1]), scheduler.submit([2])]
+            for future in futures:
+                with self.assertRaises(ValueError):
+                    future.result(timeout=5)
+        finally:
+            scheduler.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
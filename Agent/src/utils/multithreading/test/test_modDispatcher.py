@@ -0,0 +1,122 @@
+import unittest
+import threading
+import time
+from timeit import default_timer as timer
+from ..clsElement import clsElement
+from ..clsCancellationToken import clsCancellationToken
+from ..modDispatcher import query_dispatch, runner
+
+
+class clsSteppingElement(clsElement):
+    """
+    Works in small steps and checks its cancellation token between them, like a multi hop between hops
+    """
+
+    def __init__(self, dispatchId: int, steps: int, step_seconds: float = 0.05, started_barrier: threading.Barrier = None):
+        super().__init__(dispatchId=dispatchId, dispatchDescription=None)
+        self.steps = steps
+        self.step_seconds = step_seconds
+        # optional, passed once started so a test can cancel while this element is running
+        self.started_barrier = started_barrier
+        self.completed_steps = 0
+        self.started = False
+        self.finished = False
+        self.logs = []
+
+    def execute(self):
+        self.started = True
+        if self.started_barrier is not None:
+            self.started_barrier.wait()
+        for _ in range(self.steps):
+            self.checkCancellation()
+            time.sleep(self.step_seconds)
+            self.completed_steps += 1
+        self.finished = True
+
+
+def dispatch_threads(parentId: int) -> list:
+    return [thread for thread in threading.enumerate() if thread.name.startswith(f"dispatch-{parentId}_")]
+
+
+class test_modDispatcher(unittest.TestCase):
+
+    def wait_for_threads_to_exit(self, parentId: int, timeout: float) -> float:
+        start = timer()
+        while dispatch_threads(parentId) and timer() - start < timeout:
+            time.sleep(0.01)
+        return timer() - start
+
+    def test_returns_when_everything_is_done(self):
+        objects = [clsSteppingElement(dispatchId=i, steps=2) for i in range(4)]
+        start = timer()
+        unfinished = query_dispatch(objects=objects, method="parallel", parentId=1, abort_time=time.time() + 60, pool_size=4)
+        seconds = timer() - start
+
+        self.assertEqual([], unfinished)
+        self.assertTrue(all(object.finished for object in objects))
+        # woken up by completion rather than a once a second poll
+        self.assertLess(seconds, 0.5)
+
+    def test_abort_time_releases_threads(self):
+        objects = [clsSteppingElement(dispatchId=i, steps=1000) for i in range(3)]
+        start = timer()
+        unfinished = query_dispatch(objects=objects, method="parallel", parentId=2, abort_time=time.time() + 0.3, pool_size=3, grace_seconds=2)
+        seconds = timer() - start
+
+        self.assertEqual(objects, unfinished)
+        self.assertLess(seconds, 1.5, "Expected the dispatch to return shortly after the abort time")
+        self.assertLess(self.wait_for_threads_to_exit(2, timeout=5), 1, "Expected running threads to stop at their next step")
+        for object in objects:
+            self.assertFalse(object.finished)
+            self.assertLess(object.completed_steps, 100)
+            self.assertEqual("Cancelled", object.logs[-1].code)
+
+    def test_external_cancellation_drops_objects_not_started(self):
+        started = threading.Barrier(2, timeout=5)
+        objects = [clsSteppingElement(dispatchId=0, steps=1000, started_barrier=started)] + \
+                  [clsSteppingElement(dispatchId=i, steps=1000) for i in range(1, 4)]
+        token = clsCancellationToken()
+
+        def cancel_once_started():
+            started.wait()
+            token.cancel(reason="user abort")
+        threading.Thread(target=cancel_once_started).start()
+
+        unfinished = query_dispatch(objects=objects, method="parallel", parentId=3, abort_time=None, pool_size=1, cancellation_token=token)
+
+        self.assertEqual(objects, unfinished)
+        self.assertTrue(objects[0].started)
+        # the only thread is free again once the first object stops, the next queued object may be picked up before the dispatcher drops it
+        self.assertFalse(any(object.started for object in objects[1:]), "Expected queued objects to never start")
+        self.assertLess(self.wait_for_threads_to_exit(3, timeout=5), 1)
+        self.assertEqual("user abort", token.reason)
+
+    def test_object_picked_up_after_cancellation_does_not_start(self):
+        token = clsCancellationToken()
+        token.cancel(reason="user abort")
+        objects = [clsSteppingElement(dispatchId=i, steps=1) for i in range(3)]
+        for object in objects:
+            object.dispatchCancellationToken = token
+            runner(object)
+            self.assertFalse(object.started)
+            self.assertEqual("Cancelled", object.dispatchStatus)
+
+    def test_serial_skips_objects_after_abort_time(self):
+        objects = [clsSteppingElement(dispatchId=0, steps=1), clsSteppingElement(dispatchId=1, steps=1000), clsSteppingElement(dispatchId=2, steps=1)]
+        unfinished = query_dispatch(objects=objects, method="serial", parentId=4, abort_time=time.time() + 0.3)
+        self.assertTrue(objects[0].finished)
+        self.assertEqual("Cancelled", objects[1].dispatchStatus)
+        self.assertFalse(objects[2].started)
+        self.assertEqual(objects[1:], unfinished)
+
+    def test_token_deadline(self):
+        token = clsCancellationToken(deadline=time.time() + 0.1)
+        self.assertFalse(token.cancelled)
+        start = timer()
+        self.assertTrue(token.wait())
+        self.assertLess(timer() - start, 1)
+        self.assertTrue(token.cancelled)
+
+
+if __name__ == '__main__':
+    unittest.main()
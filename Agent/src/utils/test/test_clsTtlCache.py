@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from ..clsTtlCache import clsTtlCache
+
+
+class test_clsTtlCache(unittest.TestCase):
+
+    def test_misses_then_hits(self):
+        cache = clsTtlCache(name="test", ttl_seconds=60, max_size=10)
+        self.assertEqual(({}, ["a", "b"]), cache.get_many(["a", "b", "a"]))
+        cache.set_many({"a": 1, "b": None})
+        self.assertEqual(({"a": 1, "b": None}, ["c"]), cache.get_many(["a", "b", "c"]))
+        metrics = cache.metrics()
+        self.assertEqual((2, 3), (metrics["hits"], metrics["misses"]))
+        self.assertAlmostEqual(0.4, metrics["hit_rate"])
+
+    def test_least_recently_used_is_evicted(self):
+        cache = clsTtlCache(name="test", ttl_seconds=60, max_size=2)
+        cache.set_many({"a": 1, "b": 2})
+        cache.get_many(["a"])
+        cache.set_many({"c": 3})
+        self.assertEqual(({"a": 1, "c": 3}, ["b"]), cache.get_many(["a", "b", "c"]))
+
+    def test_entries_expire(self):
+        cache = clsTtlCache(name="test", ttl_seconds=60, max_size=10)
+        with mock.patch("utils.clsTtlCache.time.time", return_value=1000.0):
+            cache.set_many({"a": 1})
+        with mock.patch("utils.clsTtlCache.time.time", return_value=1059.0):
+            self.assertEqual(({"a": 1}, []), cache.get_many(["a"]))
+        with mock.patch("utils.clsTtlCache.time.time", return_value=1061.0):
+            self.assertEqual(({}, ["a"]), cache.get_many(["a"]))
+
+    def test_sqlite_tier_survives_a_new_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "cache.sqlite")
+            clsTtlCache(name="test", ttl_seconds=60, max_size=10, sqlite_path=path).set_many({"a": ["x", "y"], "b": None})
+
+            cache = clsTtlCache(name="test", ttl_seconds=60, max_size=10, sqlite_path=path)
+            self.assertEqual(({"a": ["x", "y"], "b": None}, ["c"]), cache.get_many(["a", "b", "c"]))
+            self.assertEqual(2, cache.metrics()["disk_hits"])
+            # promoted to memory
+            cache.get_many(["a"])
+            self.assertEqual(1, cache.metrics()["hits"])
+
+            # caches sharing the file are kept apart by name
+            self.assertEqual(({}, ["a"]), clsTtlCache(name="other", ttl_seconds=60, max_size=10, sqlite_path=path).get_many(["a"]))
+            cache.clear()
+            self.assertEqual(({}, ["a"]), clsTtlCache(name="test", ttl_seconds=60, max_size=10, sqlite_path=path).get_many(["a"]))
+            cache.connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -97,10 +97,11 @@ class clsDatabase:
         cursor.close()
         self.connection.commit()
 
-    def uploadTableViaStringIO(self, df, tableName, clearTable=False):
+    def uploadTableViaStringIO(self, df, tableName, clearTable=False, commit=True):
         """
         Here we are going save the dataframe in memory
         and use copy_from() to copy it to the table
+        :param commit: Boolean whether to commit, False leaves the upload in the caller's transaction
         """
         # columns must be in the same order
         sqlTableColumns = \
@@ -123,7 +124,8 @@ class clsDatabase:
             cursor.execute('delete from "%s"' % tableName)
         cursor.copy_from(buffer, '"' + tableName + '"', sep="\t", null='')
         cursor.close()
-        self.connection.commit()
+        if commit:
+            self.connection.commit()
 
 
 if __name__ == '__main__':
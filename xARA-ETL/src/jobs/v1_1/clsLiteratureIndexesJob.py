@@ -0,0 +1,90 @@
+"""
+WHAT: Creates the indexes of the literature tables (CHEM_TOKENS_TEXT, GENE_TOKENS_TEXT and RAW_TEXT) searched by the agent's ExplanationX00002
+WHY: The tables had no indexes, so every synonym lookup scanned the token tables. They live in the xARA ETL database, which the agent's migrations skip
+     (see migrations/env.py in the agent), so the indexes are created here.
+ASSUMES: The literature tables are loaded outside of this ETL, the job is skipped until they all exist. The statements are in sql/LiteratureIndexes.sql
+         and are idempotent, so the job can run on every ETL run. ExplanationX00002 lower-cases the synonyms and compares them with the stored tokens
+         as they are, so the job reports tokens that are not lower-case.
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-28, lower-case token check TZ 2023-04-03
+"""
+
+import os
+from clsDatabase import clsDatabase
+from utils.modMiscUtils import printAndLog
+
+
+class clsLiteratureIndexesJob:
+
+    sqlFilePath = os.path.join(os.path.dirname(__file__), "sql", "LiteratureIndexes.sql")
+
+    literatureTables = ["CHEM_TOKENS_TEXT", "GENE_TOKENS_TEXT", "RAW_TEXT"]
+
+    # token table -> token column
+    tokenColumns = {
+        "CHEM_TOKENS_TEXT": "CHEM_TOKS",
+        "GENE_TOKENS_TEXT": "GENE_TOKS",
+    }
+
+    sqlFindTables = \
+        """
+        select table_name from information_schema.tables where table_schema = '%s' and table_name in (%s);
+        """
+
+    sqlCountMixedCaseTokens = \
+        """
+        select count(*) as "MIXED_CASE_TOKENS" from %s."%s" where "%s" <> lower("%s");
+        """
+
+    def __init__(self, schema: str = "public"):
+        """
+        Constructor
+        :param schema: Schema of the literature tables
+        """
+        self.schema = schema
+
+    def execute(self):
+
+        printAndLog("Starting literature indexes job")
+
+        db = clsDatabase()
+        db.connect()
+        try:
+            tableNames = ",".join(f"'{tableName}'" for tableName in self.literatureTables)
+            foundTables = set(db.execute(sql=self.sqlFindTables % (self.schema, tableNames), expectingReturn=True)["table_name"])
+            missingTables = [tableName for tableName in self.literatureTables if tableName not in foundTables]
+            if missingTables:
+                printAndLog(f"Literature tables {missingTables} do not exist in schema {self.schema}, skipping")
+                return
+
+            self.checkLowerCaseTokens(db)
+
+            with open(self.sqlFilePath, "r") as file:
+                db.execute(sql=file.read().format(schema=self.schema))
+            db.connection.commit()
+            printAndLog("Created missing literature indexes")
+        finally:
+            db.disconnect()
+
+        printAndLog("Done!")
+
+    def checkLowerCaseTokens(self, db):
+        """
+        Reports token rows that are not lower-case, ExplanationX00002 never finds them
+        :param db: Connected clsDatabase
+        :return: Dictionary of token table -> number of rows that are not lower-case, only for tables with any
+        """
+        mixedCaseTokens = {}
+        for tableName, tokenColumn in self.tokenColumns.items():
+            sql = self.sqlCountMixedCaseTokens % (self.schema, tableName, tokenColumn, tokenColumn)
+            count = int(db.execute(sql=sql, expectingReturn=True)["MIXED_CASE_TOKENS"][0])
+            if count > 0:
+                mixedCaseTokens[tableName] = count
+                printAndLog(f"{count} rows of {self.schema}.{tableName} have a {tokenColumn} that is not lower-case, the agent's literature "
+                            f"search won't find them. Lower-case the tokens when loading the table")
+        return mixedCaseTokens
+
+
+if __name__ == '__main__':
+    job = clsLiteratureIndexesJob()
+    job.execute()
@@ -0,0 +1,159 @@
+"""
+WHAT: Builds the MeSH term frequency and pairwise co-occurrence tables the agent's clsMeshNgdEngine computes Normalized Google Distances from, out of a
+      PubMed baseline dump (pubmed*.xml.gz) and optionally the MeSH descriptor file (desc*.xml or desc*.xml.gz) for entry term names
+WHY: ExplanationX00014 asked the remote PubmedMeshNgd service of ARAX for every NGD. With these tables the agent computes them in process.
+ASSUMES: The dump is in <mountPath>/v1_1/pubmed and holds each PMID once (baseline files, not update files). The output is one SQLite file with the
+         schema of the agent's clsMeshNgdEngine.sqlCreateTables, written next to the dump as MeshNgd.sqlite and swapped in atomically.
+         N is the total number of MeSH headings, i.e. the number of articles times the average number of headings per article, as in ARAX.
+FUTURE IMPROVEMENTS: Apply the PubMed update files, they revise and delete citations of the baseline
+WHO: TZ 2023-03-30
+"""
+
+import glob
+import gzip
+import os
+import sqlite3
+import xml.etree.ElementTree as ElementTree
+from collections import Counter
+from itertools import combinations
+import modConfig
+from utils.modMiscUtils import printAndLog
+
+
+class clsMeshNgdJob:
+
+    sqlCreateTables = \
+        """
+        create table meta (key text primary key, value real not null);
+        create table terms (term_id integer primary key, ui text not null unique, count integer not null);
+        create table names (name text primary key, term_id integer not null) without rowid;
+        create table cooccurrences (term_id_1 integer not null, term_id_2 integer not null, count integer not null,
+                                    primary key (term_id_1, term_id_2)) without rowid;
+        """
+
+    sqlUpsertCooccurrences = \
+        """
+        insert into cooccurrences (term_id_1, term_id_2, count) values (?, ?, ?)
+        on conflict (term_id_1, term_id_2) do update set count = count + excluded.count;
+        """
+
+    def __init__(self, dumpFolder: str = None, outputPath: str = None, flushArticleCount: int = 200000):
+        """
+        Constructor
+        :param dumpFolder: Folder of the PubMed and MeSH descriptor files. Defaults to <mountPath>/v1_1/pubmed
+        :param outputPath: SQLite file to build. Defaults to <mountPath>/v1_1/MeshNgd.sqlite
+        :param flushArticleCount: Articles whose co-occurrences are counted in memory before being added to the SQLite file
+        """
+        self.dumpFolder = dumpFolder or os.path.join(modConfig.mountPath, "v1_1", "pubmed")
+        self.outputPath = outputPath or os.path.join(modConfig.mountPath, "v1_1", "MeshNgd.sqlite")
+        self.flushArticleCount = flushArticleCount
+
+        # MeSH descriptor UI -> term id, name of each UI as seen in the dump
+        self.termIds = {}
+        self.termNames = {}
+        self.termCounts = Counter()
+        self.articleCount = 0
+        self.headingCount = 0
+
+    @staticmethod
+    def openXml(filePath: str):
+        return gzip.open(filePath, "rb") if filePath.endswith(".gz") else open(filePath, "rb")
+
+    def termId(self, ui: str) -> int:
+        termId = self.termIds.get(ui)
+        if termId is None:
+            termId = self.termIds[ui] = len(self.termIds) + 1
+        return termId
+
+    def readArticles(self, filePath: str):
+        """
+        Streams the MeSH headings of every article of a PubMed XML file
+        :param filePath: pubmed*.xml or pubmed*.xml.gz file
+        :return: Generator of the sorted distinct term ids of each article with MeSH headings
+        """
+        with self.openXml(filePath) as file:
+            for _, element in ElementTree.iterparse(file, events=("end",)):
+                if element.tag != "PubmedArticle":
+                    continue
+                termIds = set()
+                for descriptor in element.iterfind("MedlineCitation/MeshHeadingList/MeshHeading/DescriptorName"):
+                    ui = descriptor.get("UI")
+                    termIds.add(self.termId(ui))
+                    self.termNames.setdefault(ui, (descriptor.text or "").strip())
+                element.clear()
+                if termIds:
+                    yield sorted(termIds)
+
+    def readDescriptorNames(self, filePath: str):
+        """
+        Streams the descriptor name and entry terms of every MeSH descriptor
+        :param filePath: desc*.xml or desc*.xml.gz file
+        :return: Generator of (descriptor UI, list of names, descriptor name first)
+        """
+        with self.openXml(filePath) as file:
+            for _, element in ElementTree.iterparse(file, events=("end",)):
+                if element.tag != "DescriptorRecord":
+                    continue
+                names = [element.findtext("DescriptorName/String")]
+                names.extend(term.text for term in element.iterfind("ConceptList/Concept/TermList/Term/String"))
+                yield element.findtext("DescriptorUI"), [name.strip() for name in names if name]
+                element.clear()
+
+    def flush(self, connection: sqlite3.Connection, cooccurrenceCounts: Counter):
+        connection.executemany(self.sqlUpsertCooccurrences, ((termId1, termId2, count) for (termId1, termId2), count in cooccurrenceCounts.items()))
+        connection.commit()
+        cooccurrenceCounts.clear()
+
+    def execute(self):
+
+        printAndLog("Starting MeSH NGD job")
+
+        articleFiles = sorted(glob.glob(os.path.join(self.dumpFolder, "pubmed*.xml*")))
+        descriptorFiles = sorted(glob.glob(os.path.join(self.dumpFolder, "desc*.xml*")))
+        if not articleFiles:
+            printAndLog(f"No PubMed files in {self.dumpFolder}, skipping")
+            return
+
+        temporaryPath = self.outputPath + ".tmp"
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+        connection = sqlite3.connect(temporaryPath)
+        connection.executescript(self.sqlCreateTables)
+
+        cooccurrenceCounts = Counter()
+        for filePath in articleFiles:
+            printAndLog(f"Counting MeSH headings of {os.path.basename(filePath)}")
+            for termIds in self.readArticles(filePath):
+                self.articleCount += 1
+                self.headingCount += len(termIds)
+                self.termCounts.update(termIds)
+                cooccurrenceCounts.update(combinations(termIds, 2))
+                if self.articleCount % self.flushArticleCount == 0:
+                    self.flush(connection, cooccurrenceCounts)
+        self.flush(connection, cooccurrenceCounts)
+        printAndLog(f"{self.articleCount} articles with {self.headingCount} MeSH headings of {len(self.termCounts)} terms")
+
+        connection.executemany("insert into terms (term_id, ui, count) values (?, ?, ?)",
+                               ((termId, ui, self.termCounts[termId]) for ui, termId in self.termIds.items()))
+        connection.execute("insert into meta (key, value) values ('N', ?)", (self.headingCount,))
+
+        # descriptor names come first, so an entry term never replaces the name of another descriptor
+        names = [(ui, [name]) for ui, name in self.termNames.items() if name]
+        for filePath in descriptorFiles:
+            printAndLog(f"Reading MeSH entry terms of {os.path.basename(filePath)}")
+            names.extend((ui, descriptorNames) for ui, descriptorNames in self.readDescriptorNames(filePath) if ui in self.termIds)
+        connection.executemany("insert or ignore into names (name, term_id) values (?, ?)",
+                               ((name.lower(), self.termIds[ui]) for ui, descriptorNames in names for name in descriptorNames))
+        connection.commit()
+        connection.execute("vacuum")
+        connection.close()
+
+        os.replace(temporaryPath, self.outputPath)
+        printAndLog(f"Wrote {self.outputPath}")
+
+        printAndLog("Done!")
+
+
+if __name__ == '__main__':
+    job = clsMeshNgdJob()
+    job.execute()
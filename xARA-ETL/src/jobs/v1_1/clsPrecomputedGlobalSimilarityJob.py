@@ -0,0 +1,337 @@
+"""
+WHAT: Precomputes the global similarity of every distinct one hop triplet seen in "xARA_CaseProblems" against all case problems, with the weights of
+      "xARA_QueryWeights", into the indexed "xARA_GlobalSimilarity" table. Each run is stamped in "xARA_GlobalSimilarityVersion".
+WHY: The agent scored every case problem for every query triplet. Queries for a known triplet can now read their cases with an indexed lookup, see
+     clsBiolinkSimilarity.lookup_global_sim_triplets in the agent.
+ASSUMES: Same local similarity rules as the agent's clsCaseProblemMatrix: node similarity is symmetric and a node score of 0 becomes -20, missing pairs
+         only match themselves, and the "ANY" predicate matches everything. Only cases at or above the lowest query threshold of "xARA_Config" are stored.
+FUTURE IMPROVEMENTS: N/A
+WHO: TZ 2023-03-25, local similarity fingerprint TZ 2023-04-02
+
+A refresh is incremental when the case problems, weights and threshold are unchanged: each triplet keeps a fingerprint of the local similarity rows
+it was computed from, and only triplets whose fingerprint changed (i.e. with a changed "xARA_LocalSimNodes" or "xARA_LocalSimPredicates" entry) are
+recomputed. Anything else rebuilds the whole table. Each version also stores a fingerprint of all local similarity rows, the agent only reads the table
+when it matches the local similarities it has loaded.
+"""
+
+import hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+import modConfig
+from clsDatabase import clsDatabase
+from utils.modMiscUtils import printAndLog
+
+
+class clsPrecomputedGlobalSimilarityJob:
+
+    ANY_PREDICATE = "ANY"
+    ZERO_NODE_SCORE = -20
+
+    tableGlobalSimilarity = "xARA_GlobalSimilarity"
+    tableTriplets = "xARA_GlobalSimilarityTriplets"
+    tableVersion = "xARA_GlobalSimilarityVersion"
+
+    sqlCreateTables = \
+        """
+        create table if not exists "xARA_GlobalSimilarity" (
+            "SUBJECT" varchar(255) not null,
+            "PREDICATE" varchar(255) not null,
+            "OBJECT" varchar(255) not null,
+            "CASE_ID" varchar(255) not null,
+            "GLOBAL_SIM" double precision not null,
+            "VERSION" integer not null,
+            primary key ("SUBJECT", "PREDICATE", "OBJECT", "CASE_ID")
+        );
+        create index if not exists "ix_xARA_GlobalSimilarity_SUBJECT_PREDICATE_OBJECT_GLOBAL_SIM"
+            on "xARA_GlobalSimilarity" ("SUBJECT", "PREDICATE", "OBJECT", "GLOBAL_SIM");
+
+        create table if not exists "xARA_GlobalSimilarityTriplets" (
+            "SUBJECT" varchar(255) not null,
+            "PREDICATE" varchar(255) not null,
+            "OBJECT" varchar(255) not null,
+            "FINGERPRINT" varchar(64) not null,
+            "VERSION" integer not null,
+            primary key ("SUBJECT", "PREDICATE", "OBJECT")
+        );
+
+        create table if not exists "xARA_GlobalSimilarityVersion" (
+            "VERSION" integer primary key,
+            "CREATED_AT" timestamp not null,
+            "IS_INCREMENTAL" boolean not null,
+            "MIN_THRESHOLD" double precision not null,
+            "SUBJECT_NODE_WEIGHT" double precision not null,
+            "OBJECT_NODE_WEIGHT" double precision not null,
+            "PREDICATE_WEIGHT" double precision not null,
+            "CASE_PROBLEMS_FINGERPRINT" varchar(64) not null,
+            "TRIPLETS_RECOMPUTED" integer not null,
+            "LOCAL_SIM_FINGERPRINT" varchar(64)
+        );
+        alter table "xARA_GlobalSimilarityVersion" add column if not exists "LOCAL_SIM_FINGERPRINT" varchar(64);
+        """
+
+    sqlCreateStaleTripletsTable = \
+        """
+        create temporary table "tmpGlobalSimilarityTriplets" ("SUBJECT" varchar(255), "PREDICATE" varchar(255), "OBJECT" varchar(255)) on commit drop;
+        """
+
+    def __init__(self, fullRefresh: bool = False):
+        """
+        Constructor
+        :param fullRefresh: Boolean whether to recompute every triplet even if an incremental refresh is possible
+        """
+        self.fullRefresh = fullRefresh
+
+        self.weights = None
+        self.weightSum = None
+        self.minThreshold = None
+
+        self.cases = None
+        self.nodeCategories = None
+        self.predicates = None
+        self.subjectCodes = None
+        self.objectCodes = None
+        self.predicateCodes = None
+        self.nodeSimilarityMatrix = None
+        self.predicateSimilarityMatrix = None
+
+    def loadWeightsAndThreshold(self, db: clsDatabase):
+        """
+        Reads the query weights, summed like the agent does, and the lowest of the query thresholds
+        :param db: Connected database
+        :return: None
+        """
+        dfWeights = db.execute(sql='select "SUBJECT_NODE_WEIGHT", "OBJECT_NODE_WEIGHT", "PREDICATE_WEIGHT" from "xARA_QueryWeights";', expectingReturn=True)
+        rawWeights = list(dfWeights.iloc[0])
+        self.weights = tuple(float(weight) for weight in rawWeights)
+        self.weightSum = float(sum(rawWeights))
+
+        dfConfig = db.execute(sql='select "REGULAR_GLOBAL_QUERY_THRESHOLD", "CREATIVE_GLOBAL_QUERY_THRESHOLD" from public."xARA_Config";', expectingReturn=True)
+        self.minThreshold = float(min(dfConfig.iloc[0]))
+
+    def encode(self, dfCases: pd.DataFrame, dfNodes: pd.DataFrame, dfPredicates: pd.DataFrame):
+        """
+        Encodes the case problems and builds the dense local similarity matrices over the (sorted) categories and predicates of the case problems
+        :param dfCases: "N00_NODE_CATEGORY", "N01_NODE_CATEGORY", "E00_EDGE_PREDICATE", "CASE_ID" columns of every case problem
+        :param dfNodes: "NEW_CASE_NODE", "CANDIDATE_CASE_NODE", "SIMILARITY_SCORE" rows
+        :param dfPredicates: "NEW_CASE_PREDICATE", "CANDIDATE_CASE_PREDICATE", "SIMILARITY_SCORE" rows
+        :return: None
+        """
+        self.cases = dfCases.reset_index(drop=True)
+
+        # a null category or predicate gets a code too, such case problems can still match e.g. the "ANY" predicate
+        self.nodeCategories = sorted(set(self.cases["N00_NODE_CATEGORY"]) | set(self.cases["N01_NODE_CATEGORY"]), key=lambda value: (value is None, str(value)))
+        nodeCodes = {category: code for code, category in enumerate(self.nodeCategories)}
+        self.predicates = sorted(set(self.cases["E00_EDGE_PREDICATE"]), key=lambda value: (value is None, str(value)))
+        predicateCodes = {predicate: code for code, predicate in enumerate(self.predicates)}
+
+        self.subjectCodes = np.array([nodeCodes[value] for value in self.cases["N00_NODE_CATEGORY"]], dtype=np.int64)
+        self.objectCodes = np.array([nodeCodes[value] for value in self.cases["N01_NODE_CATEGORY"]], dtype=np.int64)
+        self.predicateCodes = np.array([predicateCodes[value] for value in self.cases["E00_EDGE_PREDICATE"]], dtype=np.int64)
+
+        self.nodeSimilarityMatrix = np.identity(len(self.nodeCategories), dtype=np.float64)
+        for node1, node2, similarity in dfNodes.itertuples(index=False):
+            if node1 in nodeCodes and node2 in nodeCodes:
+                self.nodeSimilarityMatrix[nodeCodes[node1], nodeCodes[node2]] = similarity
+                self.nodeSimilarityMatrix[nodeCodes[node2], nodeCodes[node1]] = similarity
+        self.nodeSimilarityMatrix[self.nodeSimilarityMatrix == 0] = self.ZERO_NODE_SCORE
+
+        self.predicateSimilarityMatrix = np.identity(len(self.predicates), dtype=np.float64)
+        for predicate1, predicate2, similarity in dfPredicates.itertuples(index=False):
+            if predicate1 in predicateCodes and predicate2 in predicateCodes:
+                self.predicateSimilarityMatrix[predicateCodes[predicate1], predicateCodes[predicate2]] = similarity
+        if self.ANY_PREDICATE in predicateCodes:
+            self.predicateSimilarityMatrix[predicateCodes[self.ANY_PREDICATE], :] = 1
+            self.predicateSimilarityMatrix[:, predicateCodes[self.ANY_PREDICATE]] = 1
+
+    def caseProblemsFingerprint(self) -> str:
+        """
+        :return: Hash of the one hop columns of every case problem
+        """
+        digest = hashlib.sha256()
+        for row in sorted(self.cases[["CASE_ID", "N00_NODE_CATEGORY", "E00_EDGE_PREDICATE", "N01_NODE_CATEGORY"]].itertuples(index=False), key=lambda row: str(row[0])):
+            digest.update("\t".join(str(value) for value in row).encode())
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+    @staticmethod
+    def localSimilarityFingerprint(dfNodes: pd.DataFrame, dfPredicates: pd.DataFrame) -> str:
+        """
+        Hash of every local similarity row independently of their order, same as local_similarity_fingerprint of the agent's clsLocalSimilarityStore,
+        so keep both implementations in step
+        :return: Hex digest
+        """
+        def text(value) -> str:
+            if value is None or value != value:
+                return ""
+            return repr(float(value)) if not isinstance(value, str) else value
+
+        digest = hashlib.sha256()
+        for df in (dfNodes, dfPredicates):
+            for line in sorted("\t".join(text(value) for value in row) for row in df.itertuples(index=False)):
+                digest.update(line.encode())
+                digest.update(b"\n")
+            # an empty line ends each table
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+    def triplets(self) -> pd.DataFrame:
+        """
+        :return: DataFrame of the distinct (subject, predicate, object) codes of the case problems
+        """
+        triplets = pd.DataFrame({
+            "subject": self.subjectCodes,
+            "predicate": self.predicateCodes,
+            "object": self.objectCodes,
+        }).drop_duplicates()
+        # query triplets never have a null part, the agent computes those live
+        hasNull = np.array([self.nodeCategories[subjectCode] is None or self.predicates[predicateCode] is None or self.nodeCategories[objectCode] is None
+                            for subjectCode, predicateCode, objectCode in triplets.itertuples(index=False)], dtype=bool)
+        return triplets[~hasNull].reset_index(drop=True)
+
+    def tripletFingerprint(self, subjectCode: int, predicateCode: int, objectCode: int) -> str:
+        """
+        :return: Hash of the weights and of the local similarity rows a triplet's global similarities are computed from
+        """
+        digest = hashlib.sha256()
+        digest.update(np.array(self.weights + (self.weightSum,), dtype=np.float64).tobytes())
+        digest.update(self.nodeSimilarityMatrix[subjectCode].tobytes())
+        digest.update(self.predicateSimilarityMatrix[predicateCode].tobytes())
+        digest.update(self.nodeSimilarityMatrix[objectCode].tobytes())
+        return digest.hexdigest()
+
+    def globalSimilarity(self, subjectCode: int, predicateCode: int, objectCode: int) -> np.ndarray:
+        """
+        Global similarity of a triplet against every case problem, same expression as clsCaseProblemMatrix.global_similarity in the agent
+        :return: Float numpy array aligned with the case problems
+        """
+        subjectWeight, objectWeight, predicateWeight = self.weights
+        subjectLocalSim = self.nodeSimilarityMatrix[subjectCode][self.subjectCodes]
+        objectLocalSim = self.nodeSimilarityMatrix[objectCode][self.objectCodes]
+        predLocalSim = self.predicateSimilarityMatrix[predicateCode][self.predicateCodes]
+        return (subjectLocalSim * subjectWeight + objectLocalSim * objectWeight + predLocalSim * predicateWeight) / self.weightSum
+
+    def computeRows(self, triplets: pd.DataFrame, version: int) -> pd.DataFrame:
+        """
+        Scores the given triplets against every case problem and keeps the cases at or above the lowest query threshold
+        :param triplets: Rows of triplets()
+        :param version: Version stamped on the rows
+        :return: DataFrame in the "xARA_GlobalSimilarity" layout
+        """
+        caseIds = self.cases["CASE_ID"].to_numpy(dtype=object)
+        frames = []
+        for subjectCode, predicateCode, objectCode in tqdm(triplets[["subject", "predicate", "object"]].itertuples(index=False), total=len(triplets),
+                                                           unit="triplets", desc="Computing global similarity"):
+            globalSim = self.globalSimilarity(subjectCode, predicateCode, objectCode)
+            rows = np.flatnonzero(globalSim >= self.minThreshold)
+            frames.append(pd.DataFrame({
+                "SUBJECT": self.nodeCategories[subjectCode],
+                "PREDICATE": self.predicates[predicateCode],
+                "OBJECT": self.nodeCategories[objectCode],
+                "CASE_ID": caseIds[rows],
+                "GLOBAL_SIM": globalSim[rows],
+                "VERSION": version,
+            }))
+        if not frames:
+            return pd.DataFrame(columns=["SUBJECT", "PREDICATE", "OBJECT", "CASE_ID", "GLOBAL_SIM", "VERSION"])
+        return pd.concat(frames, ignore_index=True)
+
+    def labelTriplets(self, triplets: pd.DataFrame) -> pd.DataFrame:
+        """
+        :return: The triplets with their category and predicate names
+        """
+        return pd.DataFrame({
+            "SUBJECT": [self.nodeCategories[code] for code in triplets["subject"]],
+            "PREDICATE": [self.predicates[code] for code in triplets["predicate"]],
+            "OBJECT": [self.nodeCategories[code] for code in triplets["object"]],
+        })
+
+    def execute(self):
+
+        printAndLog("Starting Precomputed Global Similarity job")
+
+        printAndLog("Connecting to postgres host: " + modConfig.dbHost)
+        db = clsDatabase()
+        db.connect()
+
+        db.execute(sql=self.sqlCreateTables)
+        db.connection.commit()
+
+        printAndLog("Reading query weights, thresholds, local similarities and case problems")
+        self.loadWeightsAndThreshold(db)
+        dfNodes = db.execute(sql='select "NEW_CASE_NODE", "CANDIDATE_CASE_NODE", "SIMILARITY_SCORE" from "xARA_LocalSimNodes";', expectingReturn=True)
+        dfPredicates = db.execute(sql='select "NEW_CASE_PREDICATE", "CANDIDATE_CASE_PREDICATE", "SIMILARITY_SCORE" from "xARA_LocalSimPredicates";', expectingReturn=True)
+        dfCases = db.execute(sql='select "N00_NODE_CATEGORY", "N01_NODE_CATEGORY", "E00_EDGE_PREDICATE", "CASE_ID" from "xARA_CaseProblems";', expectingReturn=True)
+        self.encode(dfCases, dfNodes, dfPredicates)
+        caseProblemsFingerprint = self.caseProblemsFingerprint()
+        localSimilarityFingerprint = self.localSimilarityFingerprint(dfNodes, dfPredicates)
+
+        triplets = self.triplets()
+        triplets["FINGERPRINT"] = [self.tripletFingerprint(*triplet) for triplet in triplets[["subject", "predicate", "object"]].itertuples(index=False)]
+        printAndLog(f"{len(self.cases)} case problems with {len(triplets)} distinct triplets")
+
+        dfVersion = db.execute(sql=f'select * from "{self.tableVersion}" order by "VERSION" desc limit 1;', expectingReturn=True)
+        previous = None if dfVersion.empty else dfVersion.iloc[0]
+        version = 1 if previous is None else int(previous["VERSION"]) + 1
+        isIncremental = not self.fullRefresh and previous is not None \
+            and previous["CASE_PROBLEMS_FINGERPRINT"] == caseProblemsFingerprint \
+            and float(previous["MIN_THRESHOLD"]) == self.minThreshold \
+            and (float(previous["SUBJECT_NODE_WEIGHT"]), float(previous["OBJECT_NODE_WEIGHT"]), float(previous["PREDICATE_WEIGHT"])) == self.weights
+
+        labelled = self.labelTriplets(triplets)
+        keys = list(zip(labelled["SUBJECT"], labelled["PREDICATE"], labelled["OBJECT"]))
+        if isIncremental:
+            dfPrevious = db.execute(sql=f'select "SUBJECT", "PREDICATE", "OBJECT", "FINGERPRINT" from "{self.tableTriplets}";', expectingReturn=True)
+            previousFingerprints = {(row[0], row[1], row[2]): row[3] for row in dfPrevious.itertuples(index=False)}
+            changed = np.array([previousFingerprints.get(key) != fingerprint for key, fingerprint in zip(keys, triplets["FINGERPRINT"])], dtype=bool)
+            recompute = triplets[changed].reset_index(drop=True)
+            removed = set(previousFingerprints) - set(keys)
+            # rows of changed triplets are replaced, rows of triplets no longer in the case problems are dropped
+            stale = pd.DataFrame([key for key, isChanged in zip(keys, changed) if isChanged and key in previousFingerprints] + sorted(removed),
+                                 columns=["SUBJECT", "PREDICATE", "OBJECT"])
+            printAndLog(f"Incremental refresh to version {version}: {len(recompute)} triplets changed, {len(removed)} removed")
+        else:
+            recompute = triplets
+            stale = None
+            printAndLog(f"Full refresh to version {version}")
+
+        dfGlobalSimilarity = self.computeRows(recompute, version)
+        dfTriplets = pd.concat([self.labelTriplets(recompute), recompute[["FINGERPRINT"]].reset_index(drop=True)], axis=1)
+        dfTriplets["VERSION"] = version
+
+        printAndLog(f"Uploading {len(dfGlobalSimilarity)} rows to {self.tableGlobalSimilarity}")
+        # the agent sees either the previous version or this one, never a partial refresh
+        if stale is None:
+            db.execute(sql=f'delete from "{self.tableGlobalSimilarity}"; delete from "{self.tableTriplets}";')
+        elif len(stale):
+            db.execute(sql=self.sqlCreateStaleTripletsTable)
+            db.uploadTableViaStringIO(df=stale, tableName="tmpGlobalSimilarityTriplets", commit=False)
+            for tableName in (self.tableGlobalSimilarity, self.tableTriplets):
+                db.execute(sql=f'delete from "{tableName}" g using "tmpGlobalSimilarityTriplets" t '
+                               f'where g."SUBJECT" = t."SUBJECT" and g."PREDICATE" = t."PREDICATE" and g."OBJECT" = t."OBJECT";')
+        db.uploadTableViaStringIO(df=dfGlobalSimilarity, tableName=self.tableGlobalSimilarity, commit=False)
+        db.uploadTableViaStringIO(df=dfTriplets, tableName=self.tableTriplets, commit=False)
+        db.uploadTableViaStringIO(df=pd.DataFrame([{
+            "VERSION": version,
+            "CREATED_AT": datetime.utcnow(),
+            "IS_INCREMENTAL": isIncremental,
+            "MIN_THRESHOLD": self.minThreshold,
+            "SUBJECT_NODE_WEIGHT": self.weights[0],
+            "OBJECT_NODE_WEIGHT": self.weights[1],
+            "PREDICATE_WEIGHT": self.weights[2],
+            "CASE_PROBLEMS_FINGERPRINT": caseProblemsFingerprint,
+            "TRIPLETS_RECOMPUTED": len(recompute),
+            "LOCAL_SIM_FINGERPRINT": localSimilarityFingerprint,
+        }]), tableName=self.tableVersion, commit=False)
+        db.connection.commit()
+
+        printAndLog("Disconnecting from postgres")
+        db.disconnect()
+
+        printAndLog("Done!")
+
+
+if __name__ == '__main__':
+    job = clsPrecomputedGlobalSimilarityJob()
+    job.execute()
@@ -0,0 +1,13 @@
+-- Indexes of the literature tables searched by the agent's ExplanationX00002, in schema {schema}. The synonyms it searches are lower-cased, same as
+-- the stored tokens (checked by clsLiteratureIndexesJob), so plain B-tree indexes on the token columns serve its exact matches.
+
+-- cover the token lookup of ExplanationX00002.sqlFindEdgeReferences without reading the tables
+create index if not exists "ix_CHEM_TOKENS_TEXT_CHEM_TOKS" on {schema}."CHEM_TOKENS_TEXT" ("CHEM_TOKS", "Article_ID", "SENT_ID", "ID");
+create index if not exists "ix_GENE_TOKENS_TEXT_GENE_TOKS" on {schema}."GENE_TOKENS_TEXT" ("GENE_TOKS", "Article_ID", "SENT_ID", "ID");
+
+create index if not exists "ix_CHEM_TOKENS_TEXT_Article_ID_SENT_ID" on {schema}."CHEM_TOKENS_TEXT" ("Article_ID", "SENT_ID");
+create index if not exists "ix_GENE_TOKENS_TEXT_Article_ID_SENT_ID" on {schema}."GENE_TOKENS_TEXT" ("Article_ID", "SENT_ID");
+create index if not exists "ix_CHEM_TOKENS_TEXT_ID" on {schema}."CHEM_TOKENS_TEXT" ("ID");
+create index if not exists "ix_GENE_TOKENS_TEXT_ID" on {schema}."GENE_TOKENS_TEXT" ("ID");
+
+create index if not exists "ix_RAW_TEXT_Article_ID" on {schema}."RAW_TEXT" ("Article_ID");
@@ -1,6 +1,9 @@
 from jobs.v1_1.clsGlobalSimilarityJob import clsGlobalSimilarityJob
 from jobs.v1_1.clsKnowledgeProvidersJob import clsKnowledgeProvidersJob
 from jobs.v1_1.clsCaseSolutionsJob import clsCaseSolutionsJob
+from jobs.v1_1.clsPrecomputedGlobalSimilarityJob import clsPrecomputedGlobalSimilarityJob
+from jobs.v1_1.clsMeshNgdJob import clsMeshNgdJob
+from jobs.v1_1.clsLiteratureIndexesJob import clsLiteratureIndexesJob
 
 job1 = clsGlobalSimilarityJob()
 job1.execute()
@@ -10,3 +13,12 @@ job2.execute()
 
 job3 = clsCaseSolutionsJob()
 job3.execute()
+
+job4 = clsPrecomputedGlobalSimilarityJob()
+job4.execute()
+
+job5 = clsMeshNgdJob()
+job5.execute()
+
+job6 = clsLiteratureIndexesJob()
+job6.execute()